@@ -0,0 +1,152 @@
+# benchmarks/fake_bot_api.py
+
+"""
+Локальная заглушка Telegram Bot API: принимает запросы python-telegram-bot, отвечает
+правдоподобными объектами и запоминает последнюю клавиатуру в каждом чате -
+по ней сценарии "нажимают" кнопки, как живой пользователь.
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import re
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+# Методы, которые возвращают Message
+_MESSAGE_METHODS = {
+    'sendmessage', 'editmessagetext', 'editmessagereplymarkup', 'editmessagecaption',
+    'senddocument', 'sendphoto', 'sendmediagroup', 'copymessage', 'forwardmessage',
+}
+_MULTIPART_FIELD_RE = re.compile(rb'name="([^"]+)"\r\n\r\n(.*?)\r\n--', re.S)
+
+class FakeBotApi:
+    """HTTP-сервер на asyncio, совместимый с HTTPXRequest (keep-alive, form и multipart)"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000.0
+        self.calls: Counter = Counter()
+        # chat_id -> последняя inline-клавиатура (список callback_data)
+        self.keyboards: Dict[int, List[str]] = {}
+        self._message_ids = itertools.count(1000)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._writers = set()
+        self.port = 0
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self, port: int = 0) -> None:
+        self._server = await asyncio.start_server(self._handle_connection, '127.0.0.1', port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Заглушка Bot API слушает {self.base_url}")
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            # keep-alive соединения клиента иначе держат сервер открытым
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def buttons(self, chat_id: int) -> List[str]:
+        return list(self.keyboards.get(chat_id, []))
+
+    # --- HTTP ---
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0) or 0))
+
+                path = request_line.decode('latin-1').split()[1]
+                status, payload = await self._dispatch(path, headers.get('content-type', ''), body)
+                raw = json.dumps(payload).encode('utf-8')
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(raw)}\r\n\r\n".encode('latin-1') + raw
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            pass
+        except Exception as e:
+            logger.error(f"Ошибка заглушки Bot API: {e}")
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _parse_params(content_type: str, body: bytes) -> Dict[str, Any]:
+        if content_type.startswith('multipart/form-data'):
+            return {
+                name.decode(): value.decode('utf-8', 'replace')
+                for name, value in _MULTIPART_FIELD_RE.findall(body)
+                if len(value) < 4096
+            }
+        if content_type.startswith('application/json'):
+            return json.loads(body or b'{}')
+        return {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+
+    async def _dispatch(self, path: str, content_type: str, body: bytes):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        method = path.rsplit('/', 1)[-1].lower()
+        self.calls[method] += 1
+        params = self._parse_params(content_type, body)
+        return '200 OK', {'ok': True, 'result': self._result(method, params)}
+
+    def _result(self, method: str, params: Dict[str, Any]) -> Any:
+        if method == 'getme':
+            return {
+                'id': 100000001, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot',
+                'can_join_groups': False, 'can_read_all_group_messages': False, 'supports_inline_queries': False,
+            }
+        if method == 'getupdates':
+            return []
+        if method == 'getfile':
+            return {'file_id': params.get('file_id', 'file'), 'file_unique_id': 'bench', 'file_path': 'bench.xlsx'}
+        if method not in _MESSAGE_METHODS:
+            return True
+
+        chat_id = int(params.get('chat_id') or 0)
+        markup = params.get('reply_markup')
+        if markup is not None or method in ('sendmessage', 'editmessagetext'):
+            self.keyboards[chat_id] = self._callback_data(markup)
+        message_id = int(params.get('message_id') or next(self._message_ids))
+        return {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+
+    @staticmethod
+    def _callback_data(markup: Any) -> List[str]:
+        if not markup:
+            return []
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        return [
+            button['callback_data']
+            for row in markup.get('inline_keyboard', [])
+            for button in row
+            if button.get('callback_data')
+        ]
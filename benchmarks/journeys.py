@@ -0,0 +1,166 @@
+# benchmarks/journeys.py
+
+"""
+Сценарии пользователей для нагрузочного прогона.
+
+VirtualUser собирает апдейты так, как их прислал бы Telegram, и отдает их через
+application.update_processor (общий лимит параллельности, порядок внутри пользователя)
+в application.process_update - через все группы обработчиков, разговоры и persistence.
+Кнопки для следующего шага берутся из последней клавиатуры, которую бот отправил
+в чат пользователя (FakeBotApi.buttons).
+"""
+
+import asyncio
+import itertools
+import random
+import time
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from telegram import Update
+
+from benchmarks.fake_bot_api import FakeBotApi
+from bot.middleware.metrics import handler_key
+
+# Сколько ждать фоновую выгрузку Excel, прежде чем считать шаг неудачным
+EXPORT_TIMEOUT_SECONDS = 120
+EXPORT_POLL_SECONDS = 0.2
+
+_update_ids = itertools.count(1)
+
+class JourneyError(Exception):
+    """Бот ответил не так, как ожидает сценарий (нет нужной кнопки, пустая очередь и т.п.)"""
+
+class VirtualUser:
+    """Пользователь Telegram в личном чате с ботом"""
+
+    def __init__(self, application, api: FakeBotApi, user_id: int):
+        self.application = application
+        self.api = api
+        self.user_id = user_id
+        # handler_key -> длительности шагов этого сценария
+        self.steps: Dict[str, List[float]] = defaultdict(list)
+
+    def _user(self) -> Dict[str, Any]:
+        return {'id': self.user_id, 'is_bot': False, 'first_name': 'Бенч', 'language_code': 'ru'}
+
+    def _message(self, text: str = '', from_bot: bool = False) -> Dict[str, Any]:
+        message = {
+            'message_id': random.randint(1, 2 ** 31),
+            'date': int(time.time()),
+            'chat': {'id': self.user_id, 'type': 'private'},
+            'from': {'id': 100000001, 'is_bot': True, 'first_name': 'Bench'} if from_bot else self._user(),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return message
+
+    async def _send(self, data: Dict[str, Any]) -> None:
+        update = Update.de_json({'update_id': next(_update_ids), **data}, self.application.bot)
+        started = time.perf_counter()
+        await self.application.update_processor.process_update(update, self.application.process_update(update))
+        self.steps[handler_key(update)].append(time.perf_counter() - started)
+
+    async def command(self, text: str) -> None:
+        await self._send({'message': self._message(text)})
+
+    async def text(self, text: str) -> None:
+        await self._send({'message': self._message(text)})
+
+    async def tap(self, data: str) -> None:
+        await self._send({'callback_query': {
+            'id': str(next(_update_ids)),
+            'from': self._user(),
+            'chat_instance': str(self.user_id),
+            'message': self._message(from_bot=True),
+            'data': data,
+        }})
+
+    def buttons(self, prefix: str = '') -> List[str]:
+        return [data for data in self.api.buttons(self.user_id) if data.startswith(prefix)]
+
+    async def tap_any(self, prefix: str) -> str:
+        """Нажимает случайную кнопку с префиксом (разные пользователи не толкаются на одной строке)"""
+        options = self.buttons(prefix)
+        if not options:
+            raise JourneyError(f"нет кнопки {prefix}* (есть: {self.buttons()[:5]})")
+        data = random.choice(options)
+        await self.tap(data)
+        return data
+
+    def expect(self, prefix: str) -> None:
+        if not self.buttons(prefix):
+            raise JourneyError(f"после шага нет кнопки {prefix}* (есть: {self.buttons()[:5]})")
+
+# --- Сценарии ---
+
+async def roster_journey(user: VirtualUser) -> None:
+    """Утренний табель бригадира: меню, подача, +/- по ролям, сохранение"""
+    await user.command('/start')
+    await user.tap('submit_roster')
+    if user.buttons('roster_submit_new'):
+        # Табель на сегодня уже есть (повторный проход) - подаем заново
+        await user.tap('roster_submit_new')
+    roles = user.buttons('r+_')
+    if not roles:
+        raise JourneyError("нет кнопок ролей табеля")
+    for data in roles[:3]:
+        for _ in range(random.randint(1, 4)):
+            await user.tap(data)
+    await user.tap('r_save')
+
+async def report_journey(user: VirtualUser) -> None:
+    """Мастер создания отчета супервайзера: бригада, корпус, вид работ, данные, отправка"""
+    await user.tap('new_report')
+    await user.tap_any('select_brigade_')
+    await user.tap_any('select_corpus_')
+    await user.tap_any('select_work_')
+    await user.text(f"{random.choice((57, 89, 108, 159))}, {random.randint(5, 120)}.5, 2, 3")
+    user.expect('submit_report')
+    await user.tap('submit_report')
+    user.expect('back_to_start')
+
+async def master_journey(user: VirtualUser) -> None:
+    """Мастер: очередь на согласование, карточка отчета, подтверждение"""
+    await user.tap('approve_reports')
+    await user.tap_any('master_view_')
+    await user.tap_any('master_approve_')
+    user.expect('approve_reports')
+
+async def kiok_journey(user: VirtualUser) -> None:
+    """КИОК: очередь, карточка, согласование с номером проверки"""
+    await user.tap('kiok_review')
+    await user.tap_any('kiok_view_')
+    await user.tap_any('kiok_approve_final_')
+    await user.text(f"БЕНЧ-{random.randint(1, 10 ** 6)}")
+    user.expect('kiok_review')
+
+async def dashboards_journey(user: VirtualUser) -> None:
+    """Руководитель: сводка за вчера, график по дисциплине, общая статистика и дашборд дисциплины"""
+    await user.tap('report_overview')
+    await user.tap('report_overview_date_yesterday')
+    await user.tap_any('gen_overview_chart_')
+    await user.tap('report_historical')
+    await user.tap_any('gen_hist_report_')
+
+async def export_journey(user: VirtualUser) -> None:
+    """Выгрузка отчетов в Excel: фоновая задача до отправки файла"""
+    from services.export_job_service import ExportJobService
+
+    await user.tap('get_excel_report')
+    deadline = time.monotonic() + EXPORT_TIMEOUT_SECONDS
+    while ExportJobService.get_active_job(str(user.user_id)):
+        if time.monotonic() > deadline:
+            raise JourneyError(f"выгрузка не завершилась за {EXPORT_TIMEOUT_SECONDS} сек")
+        await asyncio.sleep(EXPORT_POLL_SECONDS)
+
+# имя -> (сценарий, таблицы ролей, из тестовых пользователей которых набираются участники)
+JOURNEYS = {
+    'roster': (roster_journey, ('brigades',)),
+    'report': (report_journey, ('supervisors',)),
+    'master': (master_journey, ('masters',)),
+    'kiok': (kiok_journey, ('kiok',)),
+    'dashboards': (dashboards_journey, ('admins', 'managers')),
+    'export': (export_journey, ('admins', 'managers')),
+}
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный прогон бота: заглушка Bot API + тестовые данные в PostgreSQL + сценарии пользователей
+
+    BENCH_DATABASE_URL=postgresql://... python -m benchmarks.run --seed
+    python -m benchmarks.run --concurrency 50 --iterations 300 --journeys roster,report
+    python -m benchmarks.run --json current.json --baseline baseline.json --tolerance 0.2
+    python -m benchmarks.run --max-p95 report=1500 --max-p95 master=800
+
+БД берется только из BENCH_DATABASE_URL (не из .env): прогон меняет данные - подает табели,
+создает и согласовывает отчеты. Тестовые строки помечены (benchmarks/seed.py), --reseed
+пересоздает их с нуля. Код выхода 1 - регрессия относительно baseline или порогов.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List
+
+from benchmarks.seed import BENCH_USER_PREFIX, OWNER_USER_ID, DEFAULT_VOLUMES
+
+DEFAULT_JOURNEYS = 'roster,report,master,kiok,dashboards,export'
+DEFAULT_CONCURRENCY = 20
+DEFAULT_ITERATIONS = 200
+DEFAULT_TOLERANCE = 0.2
+DEFAULT_MAX_ERROR_RATE = 0.01
+
+def _configure_environment() -> None:
+    """Переменные окружения для config.settings - до первого импорта модулей бота"""
+    bench_url = os.getenv('BENCH_DATABASE_URL')
+    if not bench_url:
+        raise RuntimeError("Не задан BENCH_DATABASE_URL - отдельная БД для прогона (ее данные будут изменены)")
+    os.environ.update({
+        'DATABASE_URL': bench_url,
+        'TOKEN': '100000001:BENCHMARK-TOKEN',
+        'WEB_APP_URL': os.getenv('WEB_APP_URL') or 'https://bench.invalid',
+        'OWNER_ID': str(OWNER_USER_ID),
+        'BOT_MODE': 'polling',
+        'METRICS_PORT': '0',
+    })
+
+def _p95_limit(value: str):
+    """'report=1500' -> ('report', 1500.0)"""
+    name, _, limit = value.partition('=')
+    try:
+        return name.strip(), float(limit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"ожидается СЦЕНАРИЙ=МС, получено '{value}'")
+
+def _parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон сценариев бота")
+    parser.add_argument('--seed', action='store_true', help="создать тестовые данные, если их нет")
+    parser.add_argument('--reseed', action='store_true', help="пересоздать тестовые данные")
+    parser.add_argument('--brigades', type=int, default=DEFAULT_VOLUMES['brigades'])
+    parser.add_argument('--reports', type=int, default=DEFAULT_VOLUMES['reports'])
+    parser.add_argument('--days', type=int, default=DEFAULT_VOLUMES['days'])
+    parser.add_argument('--journeys', default=DEFAULT_JOURNEYS, help=f"через запятую (по умолчанию {DEFAULT_JOURNEYS})")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="одновременных пользователей")
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS, help="прохождений каждого сценария")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="задержка ответа заглушки Bot API")
+    parser.add_argument('--json', help="сохранить результаты в файл (его же можно передать как --baseline)")
+    parser.add_argument('--baseline', help="результаты прошлого прогона для сравнения")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="допустимое ухудшение p95 и пропускной способности (доля)")
+    parser.add_argument('--max-p95', action='append', default=[], type=_p95_limit, metavar='СЦЕНАРИЙ=МС',
+                        help="абсолютный порог p95 сценария")
+    parser.add_argument('--max-error-rate', type=float, default=DEFAULT_MAX_ERROR_RATE,
+                        help="допустимая доля неудачных прохождений")
+    parser.add_argument('--verbose', action='store_true', help="логи бота уровня INFO")
+    return parser.parse_args(argv)
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """Квантиль по ближайшему рангу, в миллисекундах"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values), max(1, math.ceil(q * len(sorted_values)))) - 1
+    return sorted_values[index] * 1000
+
+def _latency_summary(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        'count': len(values),
+        'p50_ms': round(_percentile(values, 0.50), 1),
+        'p95_ms': round(_percentile(values, 0.95), 1),
+        'p99_ms': round(_percentile(values, 0.99), 1),
+    }
+
+# --- Подготовка БД ---
+
+async def _load_user_pools() -> Dict[str, List[int]]:
+    """Тестовые пользователи по таблицам ролей"""
+    from database.queries import db_transaction
+
+    pools = {}
+    async with db_transaction() as tx:
+        for table in ('brigades', 'supervisors', 'masters', 'kiok', 'admins', 'managers'):
+            rows = await tx.query(
+                f"SELECT user_id FROM {table} WHERE user_id LIKE %s ORDER BY user_id", (f"{BENCH_USER_PREFIX}%",)
+            )
+            pools[table] = [int(row[0]) for row in rows]
+    return pools
+
+async def _reset_today() -> None:
+    """Сегодняшний день тестовых пользователей - с чистого листа: табели, отчеты и состояние разговоров"""
+    from database.queries import db_transaction
+
+    prefix = f"{BENCH_USER_PREFIX}%"
+    async with db_transaction() as tx:
+        await tx.execute(
+            "DELETE FROM daily_rosters WHERE brigade_user_id LIKE %s AND roster_date = CURRENT_DATE", (prefix,)
+        )
+        await tx.execute(
+            "DELETE FROM reports WHERE supervisor_id LIKE %s AND report_date = CURRENT_DATE", (prefix,)
+        )
+        await tx.execute(
+            "DELETE FROM bot_persistence WHERE key LIKE %s OR key LIKE %s", (prefix, f"[{prefix}")
+        )
+
+# --- Прогон ---
+
+async def _run_journey(name: str, application, api, pool: List[int], concurrency: int,
+                       iterations: int) -> Dict[str, Any]:
+    from benchmarks.journeys import JOURNEYS, JourneyError, VirtualUser
+    from utils import metrics
+
+    journey = JOURNEYS[name][0]
+    # Один пользователь не проходит два сценария одновременно - как и живой человек
+    concurrency = max(1, min(concurrency, len(pool)))
+    user_locks = defaultdict(asyncio.Lock)
+    numbers = itertools.count()
+    durations: List[float] = []
+    steps: Dict[str, List[float]] = defaultdict(list)
+    errors: Counter = Counter()
+
+    async def worker() -> None:
+        while True:
+            number = next(numbers)
+            if number >= iterations:
+                return
+            user_id = pool[number % len(pool)]
+            async with user_locks[user_id]:
+                user = VirtualUser(application, api, user_id)
+                started = time.perf_counter()
+                try:
+                    await journey(user)
+                    durations.append(time.perf_counter() - started)
+                except JourneyError as e:
+                    errors[str(e)[:120]] += 1
+                except Exception as e:
+                    errors[f"{type(e).__name__}: {e}"[:120]] += 1
+                for key, values in user.steps.items():
+                    steps[key].extend(values)
+
+    metrics.reset()
+    api_calls_before = sum(api.calls.values())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    db_calls = {
+        labels['handler']: histogram.sum / histogram.count
+        for labels, histogram in metrics.snapshot(metrics.DB_CALLS_PER_UPDATE) if histogram.count
+    }
+    handler_errors = sum(value for _, value in metrics.snapshot(metrics.HANDLER_ERRORS))
+    updates = sum(len(values) for values in steps.values())
+
+    return {
+        'journey': name,
+        'concurrency': concurrency,
+        'iterations': iterations,
+        'ok': len(durations),
+        'failed': sum(errors.values()),
+        'handler_errors': handler_errors,
+        'seconds': round(elapsed, 2),
+        'journeys_per_second': round(len(durations) / elapsed, 2) if elapsed else 0.0,
+        'updates_per_second': round(updates / elapsed, 1) if elapsed else 0.0,
+        'bot_api_calls': sum(api.calls.values()) - api_calls_before,
+        **_latency_summary(durations),
+        'errors': dict(errors.most_common(5)),
+        'steps': {
+            key: {**_latency_summary(values), 'db_calls': round(db_calls.get(key, 0.0), 1)}
+            for key, values in sorted(steps.items())
+        },
+    }
+
+async def _run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    from benchmarks import seed
+    from benchmarks.fake_bot_api import FakeBotApi
+    from benchmarks.journeys import JOURNEYS
+    from bot.app import build_application
+    from database.connection import db_manager
+    from database.migrations import run_all_migrations
+    from services.export_job_service import ExportJobService
+    from services.reference_data_service import ReferenceDataService
+    from services.user_directory_service import UserDirectoryService
+
+    names = [name.strip() for name in args.journeys.split(',') if name.strip()]
+    unknown = [name for name in names if name not in JOURNEYS]
+    if unknown:
+        raise ValueError(f"Неизвестные сценарии: {', '.join(unknown)} (есть: {', '.join(JOURNEYS)})")
+
+    await db_manager.initialize()
+    api = FakeBotApi(latency_ms=args.latency_ms)
+    application = None
+    try:
+        if not await run_all_migrations():
+            raise RuntimeError("Миграции не применены")
+
+        pools = await _load_user_pools()
+        if args.reseed or (args.seed and not pools['brigades']):
+            print("🔄 Создание тестовых данных...")
+            volumes = {'brigades': args.brigades, 'reports': args.reports, 'days': args.days}
+            counts = await asyncio.to_thread(seed.seed, volumes)
+            print(f"✅ Тестовые данные: {counts}")
+            pools = await _load_user_pools()
+        if not pools['brigades']:
+            raise RuntimeError("Тестовых данных нет - запустите с --seed")
+
+        await _reset_today()
+        await UserDirectoryService.load_all()
+        await ReferenceDataService.load_all()
+
+        await api.start()
+        application = build_application(api.base_url)
+        await application.initialize()
+        await application.start()
+
+        results = []
+        for name in names:
+            pool = [user_id for table in JOURNEYS[name][1] for user_id in pools[table]]
+            if not pool:
+                raise RuntimeError(f"Для сценария {name} нет тестовых пользователей - запустите с --reseed")
+            print(f"▶️ {name}: {args.iterations} прохождений, до {args.concurrency} пользователей одновременно...")
+            results.append(await _run_journey(name, application, api, pool, args.concurrency, args.iterations))
+        return results
+    finally:
+        if application is not None:
+            await application.stop()
+            await application.shutdown()
+        ExportJobService.shutdown()
+        await api.stop()
+        await db_manager.close()
+
+# --- Отчет и контроль регрессий ---
+
+def _print_results(results: List[Dict[str, Any]]) -> None:
+    print()
+    print(f"{'Сценарий':<12} {'успешно':>9} {'ошибки':>7} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9} "
+          f"{'сцен/с':>8} {'апд/с':>8}")
+    for result in results:
+        print(f"{result['journey']:<12} {result['ok']:>4}/{result['iterations']:<4} {result['failed']:>7} "
+              f"{result['p50_ms']:>9} {result['p95_ms']:>9} {result['p99_ms']:>9} "
+              f"{result['journeys_per_second']:>8} {result['updates_per_second']:>8}")
+
+    for result in results:
+        print(f"\n📋 {result['journey']} - шаги (обработчик, число, p50/p95/p99 мс, запросов к БД на апдейт):")
+        for key, step in result['steps'].items():
+            print(f"   {key:<40} {step['count']:>6}  {step['p50_ms']:>8} {step['p95_ms']:>8} {step['p99_ms']:>8}"
+                  f"  {step['db_calls']:>5}")
+        if result['handler_errors']:
+            print(f"   ⚠️ Исключений в обработчиках: {result['handler_errors']}")
+        for error, count in result['errors'].items():
+            print(f"   ❌ {count} × {error}")
+
+def _check_gate(results: List[Dict[str, Any]], args: argparse.Namespace) -> List[str]:
+    """Список нарушений: доля ошибок, абсолютные пороги p95 и ухудшение относительно baseline"""
+    problems = []
+
+    limits = dict(args.max_p95)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = {result['journey']: result for result in json.load(f)['results']}
+
+    for result in results:
+        name = result['journey']
+        error_rate = result['failed'] / result['iterations'] if result['iterations'] else 0.0
+        if error_rate > args.max_error_rate:
+            problems.append(f"{name}: неудачных прохождений {error_rate:.1%} (допустимо {args.max_error_rate:.1%})")
+
+        if name in limits and result['p95_ms'] > limits[name]:
+            problems.append(f"{name}: p95 {result['p95_ms']} мс > порога {limits[name]} мс")
+
+        base = baseline.get(name)
+        if base:
+            if base['p95_ms'] and result['p95_ms'] > base['p95_ms'] * (1 + args.tolerance):
+                problems.append(f"{name}: p95 {result['p95_ms']} мс, в baseline {base['p95_ms']} мс")
+            if result['journeys_per_second'] < base['journeys_per_second'] * (1 - args.tolerance):
+                problems.append(f"{name}: {result['journeys_per_second']} сценариев/с, "
+                                f"в baseline {base['journeys_per_second']}")
+    return problems
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+
+    try:
+        _configure_environment()
+        results = asyncio.run(_run(args))
+    except (RuntimeError, ValueError) as e:
+        print(f"❌ {e}")
+        return 1
+    except Exception as e:
+        print(f"❌ Критическая ошибка: {e}")
+        return 1
+
+    _print_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'args': vars(args), 'results': results},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+    problems = _check_gate(results, args)
+    if problems:
+        print("\n❌ Регрессия производительности:")
+        for problem in problems:
+            print(f"   - {problem}")
+        return 1
+    print("\n✅ Порог производительности пройден")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+# benchmarks/seed.py
+
+"""
+Тестовые данные для нагрузочного прогона: сотни бригад, ~100 тысяч отчетов и табели за год.
+
+Все строки помечены: user_id начинаются с BENCH_USER_BASE, бригады, корпуса и виды работ -
+с префикса 'Бенч-'. clear() удаляет только их, поэтому сидировать можно в копию боевой БД.
+Вставка идет набором запросов по generate_series в одной транзакции (psycopg2).
+"""
+
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BENCH_USER_BASE = 990_000_000_000
+BENCH_USER_PREFIX = str(BENCH_USER_BASE)[:6]
+
+# Смещения id по ролям (к BENCH_USER_BASE)
+SUPERVISOR_OFFSET = 100_000
+MASTER_OFFSET = 200_000
+KIOK_OFFSET = 300_000
+ADMIN_OFFSET = 400_000
+MANAGER_OFFSET = 500_000
+# Владелец бота в прогоне - отдельный id, сценарии от его имени не ходят
+OWNER_USER_ID = BENCH_USER_BASE + 999_999
+
+BRIGADES_PER_SUPERVISOR = 10
+ROSTER_ROLES_PER_BRIGADE = 3
+
+DEFAULT_VOLUMES = {
+    'brigades': 300,
+    'reports': 100_000,
+    'days': 365,
+    'objects': 30,
+    'work_types': 12,
+    'masters_per_discipline': 3,
+    'kiok_per_discipline': 2,
+    'admins': 10,
+    'managers': 10,
+}
+
+_CLEAR_SQL = [
+    "DELETE FROM daily_rosters WHERE brigade_user_id LIKE %(prefix)s",
+    "DELETE FROM reports WHERE supervisor_id LIKE %(prefix)s OR brigade_name LIKE 'Бенч-бригада %%'",
+    "DELETE FROM daily_production_rollup WHERE brigade_name LIKE 'Бенч-бригада %%'",
+    "DELETE FROM brigades_reference WHERE brigade_name LIKE 'Бенч-бригада %%'",
+    "DELETE FROM brigades WHERE user_id LIKE %(prefix)s",
+    "DELETE FROM supervisors WHERE user_id LIKE %(prefix)s",
+    "DELETE FROM masters WHERE user_id LIKE %(prefix)s",
+    "DELETE FROM kiok WHERE user_id LIKE %(prefix)s",
+    "DELETE FROM admins WHERE user_id LIKE %(prefix)s",
+    "DELETE FROM managers WHERE user_id LIKE %(prefix)s",
+    "DELETE FROM work_types WHERE name LIKE 'Бенч-работа %%'",
+    "DELETE FROM construction_objects WHERE name LIKE 'Бенч-корпус %%'",
+    "DELETE FROM bot_persistence WHERE key LIKE %(prefix)s OR key LIKE %(conversation_prefix)s",
+]
+
+_SEED_SQL = [
+    # Справочники
+    """
+    INSERT INTO construction_objects (name, display_order)
+    SELECT 'Бенч-корпус ' || g, 1000 + g FROM generate_series(1, %(objects)s) AS g
+    ON CONFLICT (name) DO NOTHING
+    """,
+    """
+    INSERT INTO work_types (name, discipline_id, unit_of_measure, norm_per_unit, display_order)
+    SELECT 'Бенч-работа ' || w, d.id, 'м', 1.5 + w %% 5, w
+    FROM unnest(%(discipline_ids)s::int[]) AS d(id)
+    CROSS JOIN generate_series(1, %(work_types)s) AS w
+    """,
+    # Бригады идут пачками по BRIGADES_PER_SUPERVISOR: пачка = супервайзер = одна дисциплина
+    """
+    INSERT INTO brigades (user_id, brigade_name, discipline_id, first_name, last_name)
+    SELECT (%(base)s + g)::text, 'Бенч-бригада ' || g,
+           (%(discipline_ids)s::int[])[1 + ((g - 1) / %(per_supervisor)s) %% %(disciplines)s],
+           'Бригадир', g::text
+    FROM generate_series(1, %(brigades)s) AS g
+    """,
+    """
+    INSERT INTO supervisors (user_id, supervisor_name, discipline_id, brigade_ids)
+    SELECT (%(base)s + %(supervisor_offset)s + c)::text, 'Бенч-супервайзер ' || c,
+           (%(discipline_ids)s::int[])[1 + (c - 1) %% %(disciplines)s],
+           ARRAY(
+               SELECT 'Бенч-бригада ' || g
+               FROM generate_series((c - 1) * %(per_supervisor)s + 1,
+                                    LEAST(c * %(per_supervisor)s, %(brigades)s)) AS g
+           )
+    FROM generate_series(1, %(supervisors)s) AS c
+    """,
+    """
+    INSERT INTO brigades_reference (brigade_name, discipline_id, supervisor_id, brigade_size)
+    SELECT b.brigade_name, b.discipline_id,
+           (%(base)s + %(supervisor_offset)s + 1 + (b.user_id::bigint - %(base)s - 1) / %(per_supervisor)s)::text,
+           10 + b.user_id::bigint %% 15
+    FROM brigades b
+    WHERE b.user_id LIKE %(prefix)s
+    ON CONFLICT (brigade_name) DO NOTHING
+    """,
+    # Мастера и КИОК: id = база + смещение + номер дисциплины * 10 + номер в дисциплине
+    """
+    INSERT INTO masters (user_id, master_name, discipline_id)
+    SELECT (%(base)s + %(master_offset)s + d.n * 10 + k)::text, 'Бенч-мастер ' || d.n || '-' || k, d.id
+    FROM unnest(%(discipline_ids)s::int[]) WITH ORDINALITY AS d(id, n)
+    CROSS JOIN generate_series(1, %(masters_per_discipline)s) AS k
+    """,
+    """
+    INSERT INTO kiok (user_id, kiok_name, discipline_id)
+    SELECT (%(base)s + %(kiok_offset)s + d.n * 10 + k)::text, 'Бенч-КИОК ' || d.n || '-' || k, d.id
+    FROM unnest(%(discipline_ids)s::int[]) WITH ORDINALITY AS d(id, n)
+    CROSS JOIN generate_series(1, %(kiok_per_discipline)s) AS k
+    """,
+    """
+    INSERT INTO admins (user_id, first_name, last_name)
+    SELECT (%(base)s + %(admin_offset)s + g)::text, 'Админ', g::text
+    FROM generate_series(1, %(admins)s) AS g
+    """,
+    """
+    INSERT INTO managers (user_id, level, first_name, last_name)
+    SELECT (%(base)s + %(manager_offset)s + g)::text, 1, 'Менеджер', g::text
+    FROM generate_series(1, %(managers)s) AS g
+    """,
+    # Отчеты за год до вчерашнего дня; статусы как в проде: почти все согласованы, очереди короткие
+    """
+    INSERT INTO reports (
+        created_at, supervisor_id, report_date, brigade_name, corpus_name, discipline_id, work_type_name,
+        workflow_status, supervisor_signed_at, master_id, master_signed_at, kiok_id, kiok_signed_at,
+        kiok_inspection_number, people_count, volume, report_data
+    )
+    SELECT
+        s.report_date + INTERVAL '17 hours',
+        (%(base)s + %(supervisor_offset)s + s.chunk)::text,
+        s.report_date,
+        'Бенч-бригада ' || s.brigade,
+        'Бенч-корпус ' || (1 + g %% %(objects)s),
+        (%(discipline_ids)s::int[])[s.discipline_n],
+        'Бенч-работа ' || (1 + g %% %(work_types)s),
+        s.status,
+        s.report_date + INTERVAL '17 hours',
+        CASE WHEN s.status <> 'pending_master'
+             THEN (%(base)s + %(master_offset)s + s.discipline_n * 10 + 1 + g %% %(masters_per_discipline)s)::text END,
+        CASE WHEN s.status <> 'pending_master' THEN s.report_date + INTERVAL '19 hours' END,
+        CASE WHEN s.status = 'approved'
+             THEN (%(base)s + %(kiok_offset)s + s.discipline_n * 10 + 1 + g %% %(kiok_per_discipline)s)::text END,
+        CASE WHEN s.status = 'approved' THEN s.report_date + INTERVAL '22 hours' END,
+        CASE WHEN s.status = 'approved' THEN 'БЕНЧ-' || g END,
+        s.people_count,
+        s.volume,
+        jsonb_build_object(
+            'people_count', s.people_count,
+            'volume', s.volume,
+            'details', jsonb_build_object('pipe_diameter', 50 + 10 * (g %% 10), 'pipe_length', s.volume)
+        )
+    FROM generate_series(1, %(reports)s) AS g
+    CROSS JOIN LATERAL (SELECT 1 + g %% %(brigades)s AS brigade) b
+    CROSS JOIN LATERAL (
+        SELECT b.brigade,
+               1 + (b.brigade - 1) / %(per_supervisor)s AS chunk,
+               1 + ((b.brigade - 1) / %(per_supervisor)s) %% %(disciplines)s AS discipline_n,
+               CURRENT_DATE - 1 - (g %% %(days)s) AS report_date,
+               CASE WHEN g %% 100 < 2 THEN 'pending_master'
+                    WHEN g %% 100 < 4 THEN 'pending_kiok'
+                    WHEN g %% 100 < 6 THEN 'rejected'
+                    ELSE 'approved' END AS status,
+               1 + g %% 12 AS people_count,
+               (g %% 100) + 0.5 AS volume
+    ) s
+    """,
+    # Табели за каждый день года (кроме сегодняшнего - его подают сценарии)
+    """
+    INSERT INTO daily_rosters (brigade_user_id, roster_date, total_personnel, is_submitted, submitted_at)
+    SELECT (%(base)s + b)::text, CURRENT_DATE - d, 10 + (b + d) %% 15, true,
+           CURRENT_DATE - d + INTERVAL '8 hours'
+    FROM generate_series(1, %(brigades)s) AS b
+    CROSS JOIN generate_series(1, %(days)s) AS d
+    """,
+    """
+    INSERT INTO daily_roster_details (roster_id, role_id, personnel_count)
+    SELECT r.id, pr.id,
+           CASE WHEN pr.n = 1 THEN r.total_personnel - (%(roster_roles)s - 1) * (r.total_personnel / %(roster_roles)s)
+                ELSE r.total_personnel / %(roster_roles)s END
+    FROM daily_rosters r
+    JOIN brigades b ON b.user_id = r.brigade_user_id
+    CROSS JOIN LATERAL (
+        SELECT p.id, row_number() OVER (ORDER BY p.display_order, p.id) AS n
+        FROM personnel_roles p
+        WHERE p.discipline_id = b.discipline_id
+        ORDER BY p.display_order, p.id
+        LIMIT %(roster_roles)s
+    ) pr
+    WHERE r.brigade_user_id LIKE %(prefix)s
+    """,
+]
+
+def _params(volumes: Dict[str, int], discipline_ids: List[int]) -> Dict[str, Any]:
+    params = dict(volumes)
+    params.update({
+        'base': BENCH_USER_BASE,
+        'prefix': f"{BENCH_USER_PREFIX}%",
+        'conversation_prefix': f"[{BENCH_USER_PREFIX}%",
+        'discipline_ids': discipline_ids,
+        'disciplines': len(discipline_ids),
+        'per_supervisor': BRIGADES_PER_SUPERVISOR,
+        'supervisors': -(-volumes['brigades'] // BRIGADES_PER_SUPERVISOR),
+        'roster_roles': ROSTER_ROLES_PER_BRIGADE,
+        'supervisor_offset': SUPERVISOR_OFFSET,
+        'master_offset': MASTER_OFFSET,
+        'kiok_offset': KIOK_OFFSET,
+        'admin_offset': ADMIN_OFFSET,
+        'manager_offset': MANAGER_OFFSET,
+    })
+    return params
+
+def clear(cursor) -> None:
+    """Удаляет все тестовые строки (и состояние бота тестовых пользователей)"""
+    params = _params(DEFAULT_VOLUMES, [])
+    for sql in _CLEAR_SQL:
+        cursor.execute(sql, params)
+
+def seed(volumes: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+    """
+    [БЛОКИРУЮЩАЯ] Пересоздает тестовые данные одной транзакцией.
+    Возвращает число строк по таблицам.
+    """
+    from database.connection import db_manager
+    from services.production_rollup_service import ProductionRollupService
+
+    volumes = {**DEFAULT_VOLUMES, **(volumes or {})}
+    started = time.monotonic()
+    conn = db_manager.get_sync_connection()
+    try:
+        with conn.cursor() as cursor:
+            # Только дисциплины, для которых есть роли персонала: без них табель не подать
+            cursor.execute("""
+                SELECT DISTINCT discipline_id FROM personnel_roles
+                WHERE discipline_id IS NOT NULL ORDER BY discipline_id
+            """)
+            discipline_ids = [row[0] for row in cursor.fetchall()]
+            if not discipline_ids:
+                raise RuntimeError("Нет ролей персонала по дисциплинам - сначала примените миграции")
+
+            clear(cursor)
+            params = _params(volumes, discipline_ids)
+            for sql in _SEED_SQL:
+                cursor.execute(sql, params)
+
+            rollup_rows = ProductionRollupService.rebuild_sync(cursor)
+
+            counts = {}
+            for table, column in (('brigades', 'user_id'), ('reports', 'supervisor_id'),
+                                  ('daily_rosters', 'brigade_user_id')):
+                cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {column} LIKE %s", (params['prefix'],))
+                counts[table] = cursor.fetchone()[0]
+            counts['daily_production_rollup'] = rollup_rows
+
+            # Статистика планировщика по свежим данным, иначе первые запросы прогона идут мимо индексов
+            cursor.execute("ANALYZE")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    logger.info(f"✅ Тестовые данные созданы за {time.monotonic() - started:.1f} сек: {counts}")
+    return counts
@@ -7,11 +7,28 @@
 import logging
 import asyncio
 import sys
+from typing import Optional
 from telegram.ext import Application
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
-from config.settings import TOKEN, OWNER_ID, DATABASE_URL
+from config.settings import (
+    TOKEN, OWNER_ID, DATABASE_URL, NOTIFICATION_QUEUE_POLL_SECONDS, NOTIFICATION_CATCHUP_HOURS,
+    BOT_MODE, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+    PERSISTENCE_UPDATE_INTERVAL_SECONDS, METRICS_LISTEN, METRICS_PORT,
+    UPDATE_CONCURRENCY, UPDATE_USER_QUEUE_DEPTH, UPDATE_MAX_PENDING, BOT_TIMEZONE
+)
+from services.domain_event_service import DomainEventService
+from services.event_subscribers import register_event_subscribers
 from database.connection import db_manager
+from database.persistence import PostgresPersistence
+from services.user_directory_service import UserDirectoryService
+from services.reference_data_service import ReferenceDataService
+from services.roster_service import RosterService
+from services.export_job_service import ExportJobService
+from services.metrics_server import MetricsServer
+from utils.dates import local_now
+from bot.middleware.metrics import InstrumentedApplication, InstrumentedHTTPXRequest
+from bot.middleware.update_processor import PerUserUpdateProcessor
 from bot.handlers.common import register_common_handlers
 from bot.handlers.workflow import register_workflow_handlers, create_rejection_conversation
 from bot.handlers.approval import register_approval_handlers
@@ -25,20 +42,28 @@ from bot.handlers.data_import import register_import_handlers  # ADDED: Импо
 
 logger = logging.getLogger(__name__)
 
-async def run_bot():
-    """Запуск Telegram бота - ИСПРАВЛЕННАЯ ВЕРСИЯ с import handlers"""
-    logger.info("=" * 50)
-    logger.info("🚀 БОТ ЗАПУСКАЕТСЯ...")
-    logger.info(f"🗄️ База данных: {DATABASE_URL.split('@')[1] if '@' in DATABASE_URL else 'локальная'}")
-    logger.info(f"👑 Owner ID: {OWNER_ID}")
-    logger.info("=" * 50)
-
-    # Инициализируем БД сразу
-    await db_manager.initialize()
-    logger.info("✅ Database инициализирована")
-
-    # Создаем приложение
-    application = Application.builder().token(TOKEN).build()
+def build_application(base_url: Optional[str] = None) -> Application:
+    """
+    Собирает Application со всеми обработчиками.
+    base_url - другой адрес Bot API (локальная заглушка в benchmarks/), по умолчанию api.telegram.org.
+    """
+    # bot_data, user_data и состояния разговоров живут в PostgreSQL:
+    # переживают рестарт и общие для всех реплик
+    persistence = PostgresPersistence(update_interval=PERSISTENCE_UPDATE_INTERVAL_SECONDS)
+    # Замеры: время каждого апдейта и запросов к Bot API (пулы соединений - как у builder по умолчанию)
+    builder = (
+        Application.builder()
+        .application_class(InstrumentedApplication)
+        .token(TOKEN)
+        .persistence(persistence)
+        # Апдейты разных пользователей - параллельно, одного пользователя - по порядку
+        .concurrent_updates(PerUserUpdateProcessor(UPDATE_CONCURRENCY, UPDATE_USER_QUEUE_DEPTH, UPDATE_MAX_PENDING))
+        .request(InstrumentedHTTPXRequest(connection_pool_size=256))
+        .get_updates_request(InstrumentedHTTPXRequest(connection_pool_size=1))
+    )
+    if base_url:
+        builder = builder.base_url(f"{base_url}/bot").base_file_url(f"{base_url}/file/bot")
+    application = builder.build()
     
     # Регистрация обработчиков
     register_common_handlers(application)
@@ -57,27 +82,82 @@ async def run_bot():
     application.add_handler(create_admin_management_conversation())
     application.add_handler(create_db_restore_conversation())
     application.add_handler(create_hr_date_conversation())
+    return application
+
+async def run_bot():
+    """Запуск Telegram бота - ИСПРАВЛЕННАЯ ВЕРСИЯ с import handlers"""
+    logger.info("=" * 50)
+    logger.info("🚀 БОТ ЗАПУСКАЕТСЯ...")
+    logger.info(f"🗄️ База данных: {DATABASE_URL.split('@')[1] if '@' in DATABASE_URL else 'локальная'}")
+    logger.info(f"👑 Owner ID: {OWNER_ID}")
+    logger.info("=" * 50)
+
+    # Инициализируем БД сразу
+    await db_manager.initialize()
+    logger.info("✅ Database инициализирована")
+
+    # Справочник пользователей (язык, имя, дисциплина) загружаем одним запросом
+    await UserDirectoryService.load_all()
+    # Справочники дисциплин, объектов, видов работ и ролей - тоже в память
+    await ReferenceDataService.load_all()
+    # Кто уже подал табель сегодня - для кнопки табеля в главном меню
+    await RosterService.load_submitted_today()
+
+    application = build_application()
+    # Побочные эффекты согласования отчетов (уведомления, группа, сводка) - через outbox событий
+    register_event_subscribers()
 
     logger.info("✅ Все обработчики зарегистрированы (включая import/export)")
     
     # Настройка планировщика
-    scheduler = AsyncIOScheduler(timezone='Asia/Tashkent')
+    scheduler = AsyncIOScheduler(timezone=BOT_TIMEZONE)
     try:
         from services.notification_service import NotificationService
-        scheduler.add_job(NotificationService.process_scheduled_notifications, 'cron', hour=8, minute=0, args=[application])
-        scheduler.add_job(NotificationService.send_pending_report_reminders, 'cron', hour=10, minute=0, args=[application.bot])
+        # Cron-задачи только ставят уведомления в очередь (scheduled_notifications, с dedupe по дате),
+        # доставку делает периодический обработчик очереди - на каждой реплике, без дублей
+        scheduler.add_job(NotificationService.enqueue_roster_reminders, 'cron', hour=8, minute=0, args=[application])
+        scheduler.add_job(NotificationService.enqueue_pending_report_reminders, 'cron', hour=10, minute=0, args=[application.bot])
+        scheduler.add_job(
+            NotificationService.process_scheduled_notifications, 'interval',
+            seconds=NOTIFICATION_QUEUE_POLL_SECONDS, args=[application],
+            max_instances=1, coalesce=True
+        )
         scheduler.start()
+        
+        # Догоняем пропущенные за сегодня постановки, если бот перезапускался после времени запуска
+        now = local_now()
+        if 8 <= now.hour < 8 + NOTIFICATION_CATCHUP_HOURS:
+            await NotificationService.enqueue_roster_reminders(application)
+        if 10 <= now.hour < 10 + NOTIFICATION_CATCHUP_HOURS:
+            await NotificationService.enqueue_pending_report_reminders(application.bot)
         logger.info("✅ Планировщик уведомлений запущен")
     except Exception as e:
         logger.warning(f"⚠️ Ошибка запуска планировщика: {e}")
 
+    await MetricsServer.start(METRICS_LISTEN, METRICS_PORT)
+
     try:
         # FIXED: Правильное управление жизненным циклом
-        logger.info("🚀 Запускаем polling...")
-        
         await application.initialize()
         await application.start()
-        await application.updater.start_polling(drop_pending_updates=True)
+        # Доставка доменных событий, включая накопленные до рестарта
+        DomainEventService.start(application)
+        
+        if BOT_MODE == "webhook":
+            # Несколько реплик за балансировщиком слушают один и тот же путь.
+            # Очередь апдейтов не сбрасываем - иначе каждый деплой терял бы входящие сообщения
+            logger.info(f"🚀 Запускаем webhook на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}...")
+            await application.updater.start_webhook(
+                listen=WEBHOOK_LISTEN,
+                port=WEBHOOK_PORT,
+                url_path=WEBHOOK_PATH,
+                webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET,
+                drop_pending_updates=False
+            )
+        else:
+            logger.info("🚀 Запускаем polling...")
+            await application.updater.start_polling(drop_pending_updates=True)
         
         logger.info("✅ Бот запущен успешно!")
         
@@ -103,6 +183,11 @@ async def run_bot():
         except Exception as e:
             logger.warning(f"⚠️ Ошибка остановки планировщика: {e}")
         
+        try:
+            await DomainEventService.stop()
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка остановки диспетчера событий: {e}")
+        
         try:
             # 2. Останавливаем Application в правильном порядке
             await application.updater.stop()
@@ -113,7 +198,19 @@ async def run_bot():
             logger.warning(f"⚠️ Ошибка остановки Application: {e}")
         
         try:
-            # 3. Закрываем БД
+            # 3. Останавливаем процессы фоновых выгрузок
+            ExportJobService.shutdown()
+            logger.info("✅ Пул выгрузок остановлен")
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка остановки пула выгрузок: {e}")
+        
+        try:
+            await MetricsServer.stop()
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка остановки эндпоинта метрик: {e}")
+        
+        try:
+            # 4. Закрываем БД
             await db_manager.close()
             logger.info("✅ База данных отключена")
         except Exception as e:
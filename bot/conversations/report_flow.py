@@ -13,7 +13,6 @@ from telegram.ext import (
 
 from telegram.constants import ParseMode
 from services.workflow_service import WorkflowService
-from services.notification_service import NotificationService
 
 from utils.constants import (
     SELECTING_BRIGADE, GETTING_CORPUS_NEW, GETTING_WORK_TYPE_NEW,
@@ -21,6 +20,7 @@ from utils.constants import (
 )
 from utils.localization import get_user_language
 from database.queries import db_query
+from services.reference_data_service import ReferenceDataService
 from ..middleware.security import check_user_role
 
 logger = logging.getLogger(__name__)
@@ -60,7 +60,7 @@ async def start_report_creation(update: Update, context: ContextTypes.DEFAULT_TY
     await query.answer()
     
     user_id = str(update.effective_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     
     if not user_role.get('isSupervisor'):
         await query.answer("❌ Создание отчетов доступно только супервайзерам", show_alert=True)
@@ -119,15 +119,12 @@ async def show_corpus_selection(update: Update, context: ContextTypes.DEFAULT_TY
     """Показывает список корпусов с пагинацией, используя ID."""
     query = update.callback_query
     
-    # Теперь запрашиваем и ID, и имя
-    corpus_results = await db_query("SELECT id, name FROM construction_objects ORDER BY display_order, name")
+    # Список кортежей из кэша справочников: [(1, 'Корпус 1'), (2, 'Корпус 2')]
+    corpus_results = await ReferenceDataService.get_construction_objects()
     if not corpus_results:
         await query.edit_message_text("❌ Не найдены объекты строительства в базе данных.")
         return ConversationHandler.END
 
-    # corpus_list теперь список кортежей: [(1, 'Корпус 1'), (2, 'Корпус 2')]
-    context.user_data['corpus_list'] = corpus_results 
-
     keyboard = create_paginated_keyboard(corpus_results, page, item_prefix="select_corpus_")
     text = "🏢 <b>Выберите корпус/объект:</b>"
     
@@ -140,7 +137,7 @@ async def handle_corpus_pagination(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
     page = int(query.data.split('_')[1])
     
-    corpus_list = context.user_data.get('corpus_list', [])
+    corpus_list = await ReferenceDataService.get_construction_objects()
     if not corpus_list:
         return await show_corpus_selection(update, context, 0)
 
@@ -158,12 +155,10 @@ async def select_corpus(update: Update, context: ContextTypes.DEFAULT_TYPE):
     corpus_id = query.data.replace('select_corpus_', '')
     
     # Находим имя корпуса по его ID
-    corpus_info = await db_query("SELECT name FROM construction_objects WHERE id = %s", (corpus_id,))
-    if not corpus_info:
+    corpus_name = await ReferenceDataService.get_construction_object_name(corpus_id)
+    if not corpus_name:
         await query.edit_message_text("❌ Выбранный корпус не найден.")
         return ConversationHandler.END
-        
-    corpus_name = corpus_info[0][0]
     
     # Сохраняем и ID, и имя в контекст
     context.user_data['report_data']['corpus_id'] = corpus_id
@@ -185,18 +180,13 @@ async def show_work_types_for_discipline(update, context):
         return ConversationHandler.END
     
     # Получаем название дисциплины для отображения
-    discipline_info = await db_query("SELECT name FROM disciplines WHERE id = %s", (discipline_id,))
-    if not discipline_info:
+    discipline_name = await ReferenceDataService.get_discipline_name(discipline_id)
+    if not discipline_name:
         await query.edit_message_text("❌ Дисциплина не найдена.")
         return ConversationHandler.END
     
-    discipline_name = discipline_info[0][0]
-    
     # Получаем виды работ для дисциплины
-    work_types = db_query(
-        "SELECT id, name, unit_of_measure FROM work_types WHERE discipline_id = %s ORDER BY display_order, name",
-        (discipline_id,)
-    )
+    work_types = await ReferenceDataService.get_work_types(discipline_id)
     
     if not work_types:
         await query.edit_message_text(f"❌ Виды работ для дисциплины '{discipline_name}' не найдены.")
@@ -205,9 +195,10 @@ async def show_work_types_for_discipline(update, context):
     text = f"🔧 **Выберите вид работ ({discipline_name}):**"
     keyboard = []
     
-    for work_id, work_name, unit in work_types:
+    for work_type in work_types:
+        unit = work_type['unit_of_measure']
         unit_text = f" ({unit})" if unit else ""
-        keyboard.append([InlineKeyboardButton(f"{work_name}{unit_text}", callback_data=f"select_work_{work_id}")])
+        keyboard.append([InlineKeyboardButton(f"{work_type['name']}{unit_text}", callback_data=f"select_work_{work_type['id']}")])
     
     keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cancel_report")])
     
@@ -223,12 +214,12 @@ async def select_work_type(update: Update, context: ContextTypes.DEFAULT_TYPE):
     work_id = query.data.replace('select_work_', '')
     
     # Получаем информацию о виде работ
-    work_info = await db_query("SELECT name, unit_of_measure, norm_per_unit FROM work_types WHERE id = %s", (work_id,))
+    work_info = await ReferenceDataService.get_work_type(work_id)
     if not work_info:
         await query.edit_message_text("❌ Вид работ не найден.")
         return ConversationHandler.END
     
-    work_name, unit, norm = work_info[0]
+    work_name, unit, norm = work_info['name'], work_info['unit_of_measure'], work_info['norm_per_unit']
     
     context.user_data['report_data'].update({
         'work_type_id': work_id,
@@ -377,7 +368,9 @@ async def submit_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
             'brigade_name': report_data.get('selected_brigade'),
             'corpus_name': report_data.get('corpus_name'),
             'work_type_name': report_data.get('work_type_name'),
-            'details': { 'pipe_diameter': report_data.get('pipe_diameter') } # Пример
+            'people_count': report_data.get('total_people'),
+            'volume': report_data.get('pipe_length'),
+            'details': details_for_json
         }
         
         # # CHANGED: Вызываем обновленный метод WorkflowService
@@ -388,26 +381,7 @@ async def submit_report(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
         if report_id:
-            try:
-                # 1. Получаем имя дисциплины по ее ID
-                discipline_name_result = await db_query("SELECT name FROM disciplines WHERE id = %s", (discipline_id,))
-                
-                if discipline_name_result:
-                    discipline_name = discipline_name_result[0][0]
-                    
-                    # 2. Вызываем СУЩЕСТВУЮЩУЮ функцию с ИМЕНЕМ дисциплины
-                    masters = await NotificationService.get_users_for_discipline_notification(discipline_name, 'master')
-                    
-                    for master_id in masters:
-                        await NotificationService.notify_master_new_report(context, report_id, master_id)
-                    
-                    logger.info(f"Уведомления о новом отчете {report_id} отправлены {len(masters)} мастерам")
-                else:
-                    logger.warning(f"Не удалось найти имя дисциплины для ID {discipline_id}, уведомления не отправлены.")
-
-            except Exception as e:
-                logger.error(f"Ошибка отправки уведомлений мастерам: {e}")
-            
+            # Мастеров дисциплины уведомит диспетчер событий (report_created) - отвечаем сразу после записи
             success_text = f"✅ **Отчет создан!**\nID: {report_id}\nОтправлен мастеру на подтверждение."
             keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_start")]]
             await query.edit_message_text(success_text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
@@ -453,5 +427,5 @@ def create_report_conversation():
             CONFIRM_REPORT: [CallbackQueryHandler(submit_report, pattern="^submit_report$")]
         },
         fallbacks=[CallbackQueryHandler(cancel_report, pattern="^cancel_report$")],
-        per_user=True, allow_reentry=True, name="report_conversation"
+        per_user=True, allow_reentry=True, name="report_conversation", persistent=True
     )
@@ -25,7 +25,7 @@ async def start_roster_submission(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     
     # Проверяем, что пользователь - бригадир
     if not (user_role.get('isForeman') or user_role.get('isBrigade')):
@@ -210,7 +210,7 @@ async def save_interactive_roster(update: Update, context: ContextTypes.DEFAULT_
     
     # Сохраняем через RosterService
     roster_summary = RosterService.calculate_roster_summary(parsed_roles)
-    success = await RosterService.save_roster(user_id, roster_summary)
+    success = await RosterService.save_roster(user_id, roster_summary, available_roles)
     
     if success:
         total_people = roster_summary['total']
@@ -239,7 +239,7 @@ async def confirm_roster_save(update: Update, context: ContextTypes.DEFAULT_TYPE
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)  # FIXED: убираем await
+    user_role = await check_user_role(user_id)
     lang = await get_user_language(user_id)
     
     roster_summary = context.user_data.get('roster_summary')
@@ -298,7 +298,7 @@ async def force_save_roster(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)  # FIXED: убираем await
+    user_role = await check_user_role(user_id)
     lang = await get_user_language(user_id)
     
     roster_summary = context.user_data.get('roster_summary')
@@ -362,4 +362,6 @@ def create_roster_conversation() -> ConversationHandler:
             CommandHandler('start', lambda u, c: ConversationHandler.END)
         ],
         per_user=True,
+        name="roster_conversation",
+        persistent=True
     )
\ No newline at end of file
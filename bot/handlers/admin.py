@@ -2,10 +2,7 @@
 
 import logging
 import os
-from datetime import date
 from typing import Dict, Any, List, Optional
-import pandas as pd
-from sqlalchemy import create_engine, text
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
@@ -15,12 +12,16 @@ from telegram.ext import ConversationHandler
 from utils.constants import AWAITING_NEW_DISCIPLINE, AWAITING_NEW_LEVEL, AWAITING_RESTORE_FILE, GETTING_HR_DATE, SELECTING_OVERVIEW_ACTION, AWAITING_OVERVIEW_DATE, GETTING_HR_DATE
 
 
-from bot.middleware.security import check_user_role
+from bot.middleware.security import check_user_role, invalidate_user_role
 from utils.chat_utils import auto_clean
 from utils.localization import get_user_language, get_text
-from config.settings import OWNER_ID, DATABASE_URL
+from config.settings import OWNER_ID
 from database.queries import db_query, db_execute
+from services.export_job_service import ExportJobService
 from services.user_management_service import UserManagementService
+from services.user_directory_service import UserDirectoryService
+from services.reference_data_service import ReferenceDataService
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +35,7 @@ async def manage_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     lang = await get_user_language(user_id)
 
     # Проверяем права доступа
@@ -70,7 +71,7 @@ async def manage_users_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
 
     # Проверяем права доступа
     if not (user_role.get('isAdmin') or user_role.get('isManager')):
@@ -181,7 +182,7 @@ async def manage_directories_menu(update: Update, context: ContextTypes.DEFAULT_
     await query.answer()
 
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
 
     # Проверяем права доступа
     if not user_role.get('isAdmin'):
@@ -274,7 +275,7 @@ async def show_user_edit_menu(update: Update, context: ContextTypes.DEFAULT_TYPE
     user_id_to_edit = parts[3]
 
     viewer_id = str(query.from_user.id)
-    viewer_role = check_user_role(viewer_id)
+    viewer_role = await check_user_role(viewer_id)
     
     # Проверяем права доступа
     if not (viewer_role.get('isAdmin') or viewer_role.get('isManager')):
@@ -333,17 +334,17 @@ async def list_users(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
     query = update.callback_query
     await query.answer()
     
-    # Парсим данные из callback_data: list_users_[роль]_[страница]
+    # Парсим данные из callback_data: list_users_[роль]_[курсор страницы]
     parts = query.data.split('_')
     if len(parts) < 4:
         await query.edit_message_text("❌ Неверный формат данных для списка пользователей.")
         return
     
     role = parts[2]
-    page = int(parts[3])
+    page = parts[3]
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     
     # Проверяем права доступа
     if not (user_role.get('isAdmin') or user_role.get('isManager')):
@@ -358,57 +359,22 @@ async def download_db_backup(update: Update, context: ContextTypes.DEFAULT_TYPE)
     query = update.callback_query
     await query.answer()
     
-    if str(query.from_user.id) != OWNER_ID:
+    user_id = str(query.from_user.id)
+    if user_id != OWNER_ID:
         await query.edit_message_text("⛔️ Доступ к бэкапу БД имеет только владелец бота.")
         return
 
-    await query.edit_message_text("⏳ Формирую полную резервную копию... Это может занять некоторое время.")
-    
-    file_path = os.path.join(TEMP_DIR, f"full_backup_{date.today()}.xlsx")
-    
-    try:
-        # Список таблиц для бэкапа
-        table_names = [
-            'disciplines', 'construction_objects', 'work_types', 'admins', 'managers', 
-            'supervisors', 'masters', 'brigades', 'pto', 'kiok', 'reports', 'topic_mappings', 
-            'personnel_roles', 'daily_rosters', 'daily_roster_details'
-        ]
-        
-        engine = create_engine(DATABASE_URL)
-        with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-            with engine.connect() as connection:
-                for table_name in table_names:
-                    # Проверяем существование таблицы
-                    query_check_table = text("SELECT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename  = :table_name)")
-                    if connection.execute(query_check_table, {'table_name': table_name}).scalar():
-                        df = pd.read_sql_query(text(f"SELECT * FROM {table_name}"), connection)
-                        
-                        # Обработка специфичных полей с датами/временем
-                        if table_name == 'reports':
-                            timezone_cols = ['timestamp', 'kiok_approval_timestamp']
-                            for col in timezone_cols:
-                                if col in df.columns and pd.api.types.is_datetime64_any_dtype(df[col]):
-                                    if df[col].dt.tz is not None:
-                                        df[col] = df[col].dt.tz_localize(None)
-                        
-                        df.to_excel(writer, sheet_name=table_name, index=False)
-                    else:
-                        logger.warning(f"Таблица {table_name} не найдена в БД, пропущена в бэкапе.")
-        
-        # Отправляем файл владельцу
-        await context.bot.send_document(
-            chat_id=OWNER_ID,
-            document=open(file_path, 'rb'),
-            caption="✅ Полная резервная копия базы данных."
-        )
-        await query.delete_message()
-    except Exception as e:
-        logger.error(f"Ошибка при создании бэкапа: {e}")
-        await query.edit_message_text(f"❌ Произошла ошибка при создании резервной копии: {str(e)}")
-    finally:
-        # Удаляем временный файл
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    # Потоковая выгрузка всех таблиц в фоновом процессе, файл придет владельцу
+    await _start_export_job(
+        query, context, user_id, "Формирую полную резервную копию",
+        [{
+            'method': 'export_full_database_backup',
+            'args': (user_id,),
+            'chat_id': OWNER_ID,
+            'caption': "✅ Полная резервная копия базы данных."
+        }],
+        "✅ Резервная копия отправлена."
+    )
 
 
 async def export_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -417,44 +383,35 @@ async def export_all_users(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     await query.answer()
     
     user_id = str(query.from_user.id)
-    if user_id != OWNER_ID and not (check_user_role(user_id).get('isAdmin')):
+    if user_id != OWNER_ID and not (await check_user_role(user_id)).get('isAdmin'):
         await query.edit_message_text("⛔️ У вас нет прав для экспорта списка пользователей.")
         return
     
-    await query.edit_message_text("👥 Собираю всех пользователей в один список...")
-    file_path = os.path.join(TEMP_DIR, f"all_users_{date.today()}.xlsx")
+    await _start_export_job(
+        query, context, user_id, "Собираю всех пользователей в один список",
+        [{
+            'method': 'export_all_users',
+            'args': (user_id,),
+            'caption': "✅ Полный список зарегистрированных пользователей."
+        }],
+        "✅ Список пользователей отправлен."
+    )
 
-    try:
-        engine = create_engine(DATABASE_URL)
-        all_users_df = pd.DataFrame()
-        roles = ['admins', 'managers', 'supervisors', 'masters', 'brigades', 'pto', 'kiok']
-        
-        with engine.connect() as connection:
-            for role in roles:
-                # Проверяем существование таблицы
-                query_check_table = text("SELECT EXISTS (SELECT FROM pg_tables WHERE schemaname = 'public' AND tablename = :table_name)")
-                if connection.execute(query_check_table, {'table_name': role}).scalar():
-                    # Получаем общие поля для всех таблиц
-                    df = pd.read_sql_query(text(f"SELECT user_id, first_name, last_name, username, phone_number FROM {role}"), connection)
-                    df['role'] = role
-                    all_users_df = pd.concat([all_users_df, df], ignore_index=True)
-
-        all_users_df.to_excel(file_path, index=False)
-        
-        # Отправляем файл пользователю
-        await context.bot.send_document(
-            chat_id=query.message.chat_id,
-            document=open(file_path, 'rb'),
-            caption="✅ Полный список зарегистрированных пользователей."
+
+async def _start_export_job(query, context: ContextTypes.DEFAULT_TYPE, user_id: str, title: str,
+                            steps: list, done_text: str) -> None:
+    """Запускает фоновую выгрузку (ExportJobService) с прогрессом в текущем сообщении"""
+    back_markup = InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Назад в управление", callback_data="manage_menu")]])
+    await query.edit_message_text(f"⏳ {title}...")
+    job_id = await ExportJobService.start(
+        context.bot, user_id, query.message.chat_id, query.message.message_id,
+        title, steps, done_text, back_markup
+    )
+    if job_id is None:
+        await query.edit_message_text(
+            "⏳ У вас уже формируется выгрузка. Дождитесь ее завершения или отмените.",
+            reply_markup=back_markup
         )
-        await query.delete_message()
-    except Exception as e:
-        logger.error(f"Ошибка при экспорте пользователей: {e}")
-        await query.edit_message_text(f"❌ Произошла ошибка при экспорте пользователей: {str(e)}")
-    finally:
-        # Удаляем временный файл
-        if os.path.exists(file_path):
-            os.remove(file_path)
 
 
 async def db_backup_upload_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -488,6 +445,48 @@ async def db_backup_upload_prompt(update: Update, context: ContextTypes.DEFAULT_
     context.user_data['awaiting_db_backup'] = True
 
 
+def _format_perf_section(title: str, metric: str, label: str, limit: int = 10, scale: float = 1000.0) -> List[str]:
+    """Строки сводки по гистограмме: самые медленные серии по p95"""
+    series = [(labels.get(label, '-'), hist) for labels, hist in metrics.snapshot(metric) if hist.count]
+    if not series:
+        return []
+    series.sort(key=lambda item: item[1].quantile(0.95), reverse=True)
+    lines = [f"*{title}*", "```"]
+    for name, hist in series[:limit]:
+        lines.append(
+            f"{name[:28]:<28} n={hist.count:<6} p50={hist.quantile(0.5) * scale:.0f} "
+            f"p95={hist.quantile(0.95) * scale:.0f} p99={hist.quantile(0.99) * scale:.0f} max={hist.max * scale:.0f}"
+        )
+    lines.append("```")
+    return lines
+
+async def perf_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/perf - сводка задержек (мс) с момента запуска; /perf reset - обнулить"""
+    user_id = str(update.effective_user.id)
+    if user_id != OWNER_ID and not (await check_user_role(user_id)).get('isAdmin'):
+        await update.message.reply_text("⛔️ Команда доступна только администраторам.")
+        return
+
+    if context.args and context.args[0] == 'reset':
+        metrics.reset()
+        await update.message.reply_text("✅ Метрики производительности обнулены.")
+        return
+
+    lines = ["📈 *Производительность* (мс, с запуска или /perf reset)\n"]
+    lines += _format_perf_section("Обработчики", metrics.HANDLER_SECONDS, 'handler')
+    lines += _format_perf_section("Запросов к БД за апдейт (шт.)", metrics.DB_CALLS_PER_UPDATE, 'handler', scale=1)
+    lines += _format_perf_section("БД", metrics.DB_QUERY_SECONDS, 'operation')
+    lines += _format_perf_section("Ожидание соединения БД", metrics.DB_POOL_WAIT_SECONDS, 'pool')
+    lines += _format_perf_section("Ожидание в пуле потоков", metrics.EXECUTOR_WAIT_SECONDS, 'pool')
+    lines += _format_perf_section("Telegram API", metrics.TELEGRAM_API_SECONDS, 'method')
+
+    errors = sum(value for _, value in metrics.snapshot(metrics.HANDLER_ERRORS))
+    api_errors = sum(value for _, value in metrics.snapshot(metrics.TELEGRAM_API_ERRORS))
+    lines.append(f"Ошибок в обработчиках: {errors:.0f}, ошибок Telegram API: {api_errors:.0f}")
+
+    await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.MARKDOWN)
+
+
 def register_admin_handlers(application):
     """Регистрация админских обработчиков"""
     from telegram.ext import CallbackQueryHandler
@@ -517,6 +516,9 @@ def register_admin_handlers(application):
     # - change_level (смена уровня менеджера)
     # - reset_roster (сброс табеля)
     
+    # Сводка производительности
+    application.add_handler(CommandHandler("perf", perf_command))
+    
     logger.info("✅ Admin handlers зарегистрированы")
 
 
@@ -535,7 +537,7 @@ async def delete_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     user_id_to_delete = parts[3]
     
     admin_id = str(query.from_user.id)
-    admin_role = check_user_role(admin_id)
+    admin_role = await check_user_role(admin_id)
     
     # Проверяем права доступа (только админ)
     if not admin_role.get('isAdmin'):
@@ -600,7 +602,7 @@ async def confirm_reset_roster(update: Update, context: ContextTypes.DEFAULT_TYP
     user_id_to_reset = parts[2]
     
     admin_id = str(query.from_user.id)
-    admin_role = check_user_role(admin_id)
+    admin_role = await check_user_role(admin_id)
     
     # Проверяем права доступа
     if not (admin_role.get('isAdmin') or admin_role.get('managerLevel') == 2 or admin_role.get('isPto')):
@@ -648,7 +650,7 @@ async def execute_reset_roster(update: Update, context: ContextTypes.DEFAULT_TYP
     user_id_to_reset = parts[3]
     
     admin_id = str(query.from_user.id)
-    admin_role = check_user_role(admin_id)
+    admin_role = await check_user_role(admin_id)
     
     # Проверяем права доступа
     if not (admin_role.get('isAdmin') or admin_role.get('managerLevel') == 2 or admin_role.get('isPto')):
@@ -708,13 +710,13 @@ async def show_discipline_change_menu(update: Update, context: ContextTypes.DEFA
     context.user_data['edit_user_id'] = user_id_to_edit
     
     # Получаем список дисциплин
-    disciplines = db_query("SELECT id, name FROM disciplines ORDER BY name")
+    disciplines = await ReferenceDataService.get_disciplines()
     if not disciplines:
         await query.edit_message_text("❌ Дисциплины не найдены.")
         return ConversationHandler.END
     
     keyboard_buttons = []
-    for disc_id, disc_name in disciplines:
+    for disc_id, disc_name in ((d['id'], d['name']) for d in disciplines):
         keyboard_buttons.append([InlineKeyboardButton(
             disc_name, 
             callback_data=f"set_new_discipline_{disc_id}"
@@ -746,15 +748,16 @@ async def handle_discipline_change(update: Update, context: ContextTypes.DEFAULT
         return ConversationHandler.END
     
     # Обновляем дисциплину в БД
-    success = db_execute(
+    success = await db_execute(
         f"UPDATE {role} SET discipline_id = %s WHERE user_id = %s",
-        (new_discipline_id, user_id_to_edit)
+        (int(new_discipline_id), user_id_to_edit)
     )
+    invalidate_user_role(user_id_to_edit)
+    await UserDirectoryService.refresh_user(user_id_to_edit)
     
     if success:
         # Получаем название дисциплины для отображения
-        disc_name_raw = db_query("SELECT name FROM disciplines WHERE id = %s", (new_discipline_id,))
-        disc_name = disc_name_raw[0][0] if disc_name_raw else "Неизвестно"
+        disc_name = await ReferenceDataService.get_discipline_name(new_discipline_id) or "Неизвестно"
         
         # Уведомляем пользователя
         try:
@@ -823,10 +826,12 @@ async def handle_level_change(update: Update, context: ContextTypes.DEFAULT_TYPE
     
     # Если уровень 1, убираем привязку к дисциплине
     if new_level == 1:
-        success = db_execute(
+        success = await db_execute(
             "UPDATE managers SET level = %s, discipline = NULL WHERE user_id = %s",
             (new_level, user_id_to_edit)
         )
+        invalidate_user_role(user_id_to_edit)
+        await UserDirectoryService.refresh_user(user_id_to_edit)
         
         if success:
             try:
@@ -854,13 +859,13 @@ async def handle_level_change(update: Update, context: ContextTypes.DEFAULT_TYPE
         context.user_data['new_level'] = new_level
         
         # Показываем список дисциплин
-        disciplines = db_query("SELECT id, name FROM disciplines ORDER BY name")
+        disciplines = await ReferenceDataService.get_disciplines()
         if not disciplines:
             await query.edit_message_text("❌ Дисциплины не найдены.")
             return ConversationHandler.END
         
         keyboard_buttons = []
-        for disc_id, disc_name in disciplines:
+        for disc_id, disc_name in ((d['id'], d['name']) for d in disciplines):
             keyboard_buttons.append([InlineKeyboardButton(
                 disc_name, 
                 callback_data=f"set_level2_discipline_{disc_id}"
@@ -887,15 +892,16 @@ async def handle_level2_discipline(update: Update, context: ContextTypes.DEFAULT
     new_level = context.user_data.get('new_level')
     
     # Обновляем уровень и дисциплину
-    success = db_execute(
+    success = await db_execute(
         "UPDATE managers SET level = %s, discipline = %s WHERE user_id = %s",
-        (new_level, discipline_id, user_id_to_edit)
+        (new_level, int(discipline_id), user_id_to_edit)
     )
+    invalidate_user_role(user_id_to_edit)
+    await UserDirectoryService.refresh_user(user_id_to_edit)
     
     if success:
         # Получаем название дисциплины
-        disc_name_raw = db_query("SELECT name FROM disciplines WHERE id = %s", (discipline_id,))
-        disc_name = disc_name_raw[0][0] if disc_name_raw else "Неизвестно"
+        disc_name = await ReferenceDataService.get_discipline_name(discipline_id) or "Неизвестно"
         
         try:
             await context.bot.send_message(
@@ -953,6 +959,10 @@ async def handle_db_restore_file(update: Update, context: ContextTypes.DEFAULT_T
         
         # Восстанавливаем БД
         success = ImportService.restore_database_from_excel(file_path)
+        # Таблицы ролей и справочники могли измениться целиком
+        invalidate_user_role()
+        ReferenceDataService.invalidate()
+        await UserDirectoryService.load_all()
         
         if success:
             await update.message.reply_text(
@@ -1010,8 +1020,9 @@ def create_admin_management_conversation():
             CallbackQueryHandler(cancel_admin_operation, pattern="^cancel_admin_op$"),
         ],
         per_user=True,
-       
-        allow_reentry=True
+        allow_reentry=True,
+        name="admin_management_conversation",
+        persistent=True
     )
 
 def create_db_restore_conversation():
@@ -1035,8 +1046,9 @@ def create_db_restore_conversation():
             CallbackQueryHandler(cancel_admin_operation, pattern="^cancel_admin_op$"),
         ],
         per_user=True,
-        
-        allow_reentry=True
+        allow_reentry=True,
+        name="db_restore_conversation",
+        persistent=True
     )
 
 def create_hr_date_conversation():
@@ -1057,7 +1069,9 @@ def create_hr_date_conversation():
             CallbackQueryHandler(cancel_admin_operation, pattern="^cancel_admin_op$"),
         ],
         per_user=True,
-        allow_reentry=True
+        allow_reentry=True,
+        name="hr_date_conversation",
+        persistent=True
     )
 
 async def show_hr_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
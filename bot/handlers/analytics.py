@@ -10,7 +10,7 @@ from bot.middleware.security import check_user_role
 from services.analytics_service import AnalyticsService
 from utils.localization import get_user_language, get_text, get_data_translation
 from utils.constants import SELECTING_OVERVIEW_ACTION, AWAITING_OVERVIEW_DATE, GETTING_HR_DATE
-from database.queries import db_query
+from services.reference_data_service import ReferenceDataService
 
 logger = logging.getLogger(__name__)
 
@@ -21,7 +21,7 @@ async def show_historical_report_menu(update: Update, context: ContextTypes.DEFA
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)  # СИНХРОННЫЙ вызов
+    user_role = await check_user_role(user_id)
     lang = await get_user_language(user_id)  # АСИНХРОННЫЙ вызов
     
     await query.edit_message_text(f"⏳ {get_text('loading_please_wait', lang)}...", parse_mode=ParseMode.MARKDOWN)
@@ -66,11 +66,11 @@ async def show_historical_report_menu(update: Update, context: ContextTypes.DEFA
         final_text = "\n".join(message_parts)
         
         # Кнопки дисциплин
-        disciplines = await db_query("SELECT name FROM disciplines ORDER BY name") # FIXED: await
+        disciplines = await ReferenceDataService.get_disciplines()
         keyboard_buttons = []
         
         if disciplines:
-            for name, in disciplines:
+            for name in (d['name'] for d in disciplines):
                 translated_discipline = get_data_translation(name, lang)
                 button_text = f"📋 {translated_discipline}"
                 keyboard_buttons.append([InlineKeyboardButton(button_text, callback_data=f"gen_hist_report_{name}")])
@@ -105,7 +105,7 @@ async def generate_discipline_dashboard(update: Update, context: ContextTypes.DE
             discipline_name = query.data.split('_', 3)[-1]
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     lang = await get_user_language(user_id)
     
     await query.edit_message_text(
@@ -203,7 +203,7 @@ async def show_overview_dashboard_menu(update: Update, context: ContextTypes.DEF
                     selected_date = date.today()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     lang = await get_user_language(user_id)
     
     # Показываем индикатор загрузки
@@ -251,9 +251,9 @@ async def show_overview_dashboard_menu(update: Update, context: ContextTypes.DEF
     
     # Кнопки графиков по ролям
     if user_role.get('isAdmin') or user_role.get('managerLevel') == 1:
-        disciplines = await db_query("SELECT id, name FROM disciplines ORDER BY name") # FIXED: await
+        disciplines = await ReferenceDataService.get_disciplines()
         if disciplines:
-            for disc_id, disc_name in disciplines:
+            for disc_id, disc_name in ((d['id'], d['name']) for d in disciplines):
                 translated_name = get_data_translation(disc_name, lang)
                 keyboard_buttons.append([InlineKeyboardButton(
                     f"📊 {translated_name}", 
@@ -263,9 +263,9 @@ async def show_overview_dashboard_menu(update: Update, context: ContextTypes.DEF
     elif user_role.get('isPto') or user_role.get('managerLevel') == 2:
         user_discipline_name = user_role.get('discipline')
         if user_discipline_name:
-            discipline_id_raw = await db_query("SELECT id FROM disciplines WHERE name = %s", (user_discipline_name,)) # FIXED: await
-            if discipline_id_raw:
-                user_discipline_id = discipline_id_raw[0][0]
+            discipline_id = await ReferenceDataService.get_discipline_id(user_discipline_name)
+            if discipline_id:
+                user_discipline_id = discipline_id
                 keyboard_buttons.append([InlineKeyboardButton(
                     "📊 Показать мой график", 
                     callback_data=f"gen_overview_chart_{user_discipline_id}_{date_str_for_callback}"
@@ -372,8 +372,7 @@ async def generate_overview_chart(update: Update, context: ContextTypes.DEFAULT_
     chart_data = await AnalyticsService.get_chart_data(discipline_id, selected_date) # FIXED: await
   
     if not chart_data:
-        discipline_name_raw = await db_query("SELECT name FROM disciplines WHERE id = %s", (discipline_id,)) # FIXED: await
-        discipline_name = discipline_name_raw[0][0] if discipline_name_raw else "Неизвестная"
+        discipline_name = await ReferenceDataService.get_discipline_name(discipline_id) or "Неизвестная"
         
         await query.edit_message_text(
             f"Нет данных для построения графика\n\n"
@@ -427,7 +426,7 @@ async def show_hr_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     lang = await get_user_language(user_id)
     
     # Проверяем права доступа
@@ -437,10 +436,11 @@ async def show_hr_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     
     # Получаем дисциплины для выбора
     if user_role.get('isAdmin') or user_role.get('managerLevel') == 1:
-        disciplines = await db_query("SELECT id, name FROM disciplines ORDER BY name") # FIXED: await
+        disciplines = [(d['id'], d['name']) for d in await ReferenceDataService.get_disciplines()]
     else:
         user_discipline = user_role.get('discipline')
-        disciplines = await db_query("SELECT id, name FROM disciplines WHERE name = %s", (user_discipline,)) # FIXED: await
+        user_discipline_id = await ReferenceDataService.get_discipline_id(user_discipline)
+        disciplines = [(user_discipline_id, user_discipline)] if user_discipline_id else []
  
     if not disciplines:
         await query.edit_message_text("❌ Дисциплины не найдены.")
@@ -477,8 +477,7 @@ async def get_hr_date(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int
     lang = await get_user_language(str(query.from_user.id))
     
     # Получаем название дисциплины
-    disc_name_raw = await db_query("SELECT name FROM disciplines WHERE id = %s", (discipline_id,)) # FIXED: await
-    disc_name = disc_name_raw[0][0] if disc_name_raw else "Неизвестная"
+    disc_name = await ReferenceDataService.get_discipline_name(discipline_id) or "Неизвестная"
     translated_name = get_data_translation(disc_name, lang)
     
     keyboard = [
@@ -593,7 +592,7 @@ async def handle_problem_brigades_button(update: Update, context: ContextTypes.D
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     lang = await get_user_language(user_id)
     
     # Проверяем права доступа
@@ -620,7 +619,7 @@ async def generate_problem_brigades_report(update: Update, context: ContextTypes
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     lang = await get_user_language(user_id)
     
     # Определяем дату
@@ -686,7 +685,7 @@ async def show_foreman_performance(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     lang = await get_user_language(user_id)
     
     # Проверяем права доступа
@@ -758,7 +757,7 @@ def register_analytics_handlers(application):
         fallbacks=[
             CallbackQueryHandler(show_historical_report_menu, pattern="^report_menu_all$"),
         ],
-        per_user=True, allow_reentry=True
+        per_user=True, allow_reentry=True, name="overview_dashboard_conversation", persistent=True
     )
 
     hr_conv_handler = ConversationHandler(
@@ -769,7 +768,7 @@ def register_analytics_handlers(application):
         fallbacks=[
             CallbackQueryHandler(show_hr_menu, pattern="^show_hr_menu$"),
         ],
-        per_user=True, allow_reentry=True
+        per_user=True, allow_reentry=True, name="hr_report_conversation", persistent=True
     )
     application.add_handler(hr_conv_handler)
     
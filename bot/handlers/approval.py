@@ -7,7 +7,7 @@ from telegram.ext import CallbackQueryHandler, ContextTypes
 
 from config.settings import OWNER_ID
 from database.queries import db_query
-from ..middleware.security import check_user_role
+from ..middleware.security import check_user_role, invalidate_user_role
 from services.admin_service import AdminService
 
 logger = logging.getLogger(__name__)
@@ -15,11 +15,11 @@ logger = logging.getLogger(__name__)
 async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка одобрения/отклонения заявки с проверкой на дубликаты."""
     query = update.callback_query
-    print(f"DEBUG >>> КНОПКА НАЖАТА! ДАННЫЕ: {query.data}")
+    logger.debug(f"Кнопка одобрения: {query.data}")
    
     approver_id = str(query.from_user.id)
     
-    user_role = check_user_role(approver_id)
+    user_role = await check_user_role(approver_id)
     if not (user_role.get('isAdmin') or approver_id == OWNER_ID):
         await query.answer("❌ У вас нет прав для выполнения этого действия", show_alert=True)
         return
@@ -65,6 +65,7 @@ async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE):
         success = await AdminService.create_user_in_db(user_data, user_id)
         
         if success:
+            invalidate_user_role(user_id)
             admin_text = f"✅ <b>Заявка одобрена</b>\n\nПользователь {user_data.get('first_name', '')} добавлен с ролью «{role_text}»."
             await query.edit_message_text(admin_text, parse_mode=ParseMode.HTML)
             
@@ -108,6 +109,6 @@ async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 def register_approval_handlers(application):
     """Регистрация handlers для одобрения заявок"""
-    print("DEBUG >>> РЕГИСТРАЦИЯ ОБРАБОТЧИКА КНОПОК ОДОБРЕНИЯ...")
+    logger.debug("Регистрация обработчика кнопок одобрения")
     application.add_handler(CallbackQueryHandler(handle_approval, pattern="^(approve|reject)_"))
     logger.info("✅ Approval handlers зарегистрированы")
\ No newline at end of file
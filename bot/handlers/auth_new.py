@@ -9,8 +9,8 @@ from bot.middleware.state_manager import StateManager, UserState, StateDecorator
 from config.settings import OWNER_ID
 from utils.localization import get_text, get_user_language
 from utils.chat_utils import auto_clean
-from database.queries import db_query
 from services.admin_service import AdminService
+from services.reference_data_service import ReferenceDataService
 
 logger = logging.getLogger(__name__)
 
@@ -184,7 +184,7 @@ async def get_contact(update: Update, context: ContextTypes.DEFAULT_TYPE):
         current_data['phone_number'] = update.message.contact.phone_number
         StateManager.update_state_data(context, user_id, current_data)
 
-    logger.info(f"DEBUG >>> Сохранен телефон: {update.message.contact.phone_number}")
+    logger.debug(f"Телефон пользователя {user_id} сохранен")
 
     # Получаем роль и решаем, что делать дальше
     current_state_data = StateManager.get_state_data(context, user_id)
@@ -249,7 +249,7 @@ async def handle_discipline_selection(update: Update, context: ContextTypes.DEFA
     
     StateManager.set_state(context, user_id, UserState.SELECTING_DISCIPLINE)
     
-    disciplines = await db_query("SELECT id, name FROM disciplines ORDER BY name")
+    disciplines = await ReferenceDataService.get_disciplines()
     
     if not disciplines:
         await context.bot.send_message(
@@ -258,8 +258,8 @@ async def handle_discipline_selection(update: Update, context: ContextTypes.DEFA
         )
         return
     
-    keyboard = [[InlineKeyboardButton(name, callback_data=f"disc_{disc_id}")] 
-                for disc_id, name in disciplines]
+    keyboard = [[InlineKeyboardButton(d['name'], callback_data=f"disc_{d['id']}")] 
+                for d in disciplines]
     
     state_data = StateManager.get_state_data(context, user_id)
     role_key = state_data.get('selected_role', '')
@@ -314,7 +314,7 @@ async def finalize_registration(update: Update, context: ContextTypes.DEFAULT_TY
     
     # Получаем все данные
     user_data = StateManager.get_state_data(context, user_id)
-    logger.info(f"DEBUG >>> StateManager data: {user_data}")
+    logger.debug(f"Финализация регистрации {user_id}, поля: {list(user_data.keys())}")
 
     # Отправляем заявку админам
     success = await AdminService.send_approval_request(context, user_data, user_id)
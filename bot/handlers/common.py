@@ -64,7 +64,7 @@ async def show_profile(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = str(update.effective_user.id)
-    user_role = check_user_role(user_id)  # СИНХРОННЫЙ вызов
+    user_role = await check_user_role(user_id)
     lang = await get_user_language(user_id)  # АСИНХРОННЫЙ вызов
     
     user_info = await UserService.get_user_info(user_id)
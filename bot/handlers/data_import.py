@@ -11,6 +11,7 @@ from services.import_service import ImportService
 from utils.chat_utils import auto_clean
 from utils.localization import get_user_language, get_text
 from utils.constants import TEMP_DIR
+from utils.metrics import run_in_executor
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +25,7 @@ async def handle_directories_excel(update: Update, context: ContextTypes.DEFAULT
         return  # Игнорируем не-Excel файлы
     
     user_id = str(update.effective_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     
     # Проверяем права доступа
     if not user_role.get('isAdmin'):
@@ -50,8 +51,10 @@ async def handle_directories_excel(update: Update, context: ContextTypes.DEFAULT
         
         logger.info(f"Файл справочников загружен: {file_path}")
         
-        # Обрабатываем файл через сервис
-        result = ImportService.import_directories_from_excel(file_path)
+        # Обрабатываем файл через сервис (блокирующий psycopg2 - в пуле потоков)
+        result = await run_in_executor(
+            ImportService.import_directories_from_excel, file_path, pool='import'
+        )
         
         # Форматируем результат
         summary_text = ImportService.format_import_summary(result)
@@ -168,8 +171,10 @@ async def handle_restore_confirmation(update: Update, context: ContextTypes.DEFA
     )
     
     try:
-        # Выполняем восстановление
-        result = ImportService.restore_full_database_from_excel(file_path)
+        # Выполняем восстановление (блокирующий psycopg2 - в пуле потоков)
+        result = await run_in_executor(
+            ImportService.restore_full_database_from_excel, file_path, pool='import'
+        )
         
         # Форматируем результат
         summary_text = ImportService.format_restore_summary(result)
@@ -5,9 +5,10 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 from bot.middleware.security import check_user_role
-from services.export_service import ExportService
+from services.export_job_service import ExportJobService
 from utils.chat_utils import auto_clean
 from utils.localization import get_user_language, get_text
+from utils.metrics import run_in_executor
 from config.settings import OWNER_ID
 
 from datetime import date, timedelta
@@ -18,13 +19,28 @@ import gc
 logger = logging.getLogger(__name__)
 
 
+async def _start_export_job(query, context: ContextTypes.DEFAULT_TYPE, user_id: str, title: str,
+                            steps: list, done_text: str, done_markup: InlineKeyboardMarkup) -> None:
+    """Запускает фоновую выгрузку; файл придет отдельным сообщением, прогресс - в текущем."""
+    await query.edit_message_text(f"⏳ {title}...")
+    job_id = await ExportJobService.start(
+        context.bot, user_id, query.message.chat_id, query.message.message_id,
+        title, steps, done_text, done_markup
+    )
+    if job_id is None:
+        await query.edit_message_text(
+            "⏳ У вас уже формируется выгрузка. Дождитесь ее завершения или отмените.",
+            reply_markup=done_markup
+        )
+
+
 async def export_reports_to_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Экспорт отчетов в Excel (адаптировано из старого кода)"""
     query = update.callback_query
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     lang = get_user_language(user_id)
     
     # Проверяем права доступа
@@ -32,47 +48,27 @@ async def export_reports_to_excel(update: Update, context: ContextTypes.DEFAULT_
         await query.edit_message_text("⛔️ У вас нет прав для экспорта отчетов.")
         return
     
-    await query.edit_message_text("⏳ Формирую файл с отчетами... Это может занять некоторое время.")
-    
-    try:
-        # Определяем фильтры на основе роли пользователя
-        filter_params = {}
-        
-        # Если не админ и не менеджер 1 уровня, фильтруем по дисциплине
-        if not (user_role.get('isAdmin') or user_role.get('managerLevel') == 1):
-            discipline = user_role.get('discipline')
-            if discipline:
-                filter_params['discipline_name'] = discipline
-        
-        # Экспортируем данные
-        file_path = ExportService.export_reports_to_excel(user_id, filter_params)
-        
-        if file_path:
-            filename = f"Отчеты_{user_id}_{context.bot_data.get('current_date', 'export')}.xlsx"
-            
-            with open(file_path, 'rb') as file:
-                await context.bot.send_document(
-                    chat_id=query.message.chat_id,
-                    document=file,
-                    filename=filename,
-                    caption="📊 Экспорт отчетов завершен"
-                )
-            
-            # Очищаем временный файл
-            ExportService.cleanup_temp_file(file_path)
-            
-            # Возвращаемся в меню
-            keyboard = [[InlineKeyboardButton(get_text('back_button', lang), callback_data="report_menu_all")]]
-            await query.edit_message_text(
-                "✅ Файл с отчетами отправлен",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        else:
-            await query.edit_message_text("❌ Ошибка при формировании файла. Попробуйте позже.")
-            
-    except Exception as e:
-        logger.error(f"Ошибка экспорта отчетов для пользователя {user_id}: {e}")
-        await query.edit_message_text("❌ Произошла ошибка при формировании файла.")
+    # Определяем фильтры на основе роли пользователя
+    filter_params = {}
+    
+    # Если не админ и не менеджер 1 уровня, фильтруем по дисциплине
+    if not (user_role.get('isAdmin') or user_role.get('managerLevel') == 1):
+        discipline = user_role.get('discipline')
+        if discipline:
+            filter_params['discipline_name'] = discipline
+    
+    keyboard = [[InlineKeyboardButton(get_text('back_button', lang), callback_data="report_menu_all")]]
+    await _start_export_job(
+        query, context, user_id, "Формирую файл с отчетами",
+        [{
+            'method': 'export_reports_to_excel',
+            'args': (user_id, filter_params),
+            'filename': f"Отчеты_{user_id}_{context.bot_data.get('current_date', 'export')}.xlsx",
+            'caption': "📊 Экспорт отчетов завершен"
+        }],
+        "✅ Файл с отчетами отправлен",
+        InlineKeyboardMarkup(keyboard)
+    )
 
 
 async def download_db_backup(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -87,37 +83,18 @@ async def download_db_backup(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await query.answer("⛔️ Эта команда доступна только создателю бота.", show_alert=True)
         return
     
-    await query.edit_message_text("⏳ Формирую полную резервную копию... Это может занять до минуты...")
-    
-    try:
-        # Создаем полный бэкап
-        file_path = ExportService.export_full_database_backup(user_id)
-        
-        if file_path:
-            filename = f"Полный_бэкап_БД_{context.bot_data.get('current_date', 'backup')}.xlsx"
-            
-            with open(file_path, 'rb') as file:
-                await context.bot.send_document(
-                    chat_id=query.message.chat_id,
-                    document=file,
-                    filename=filename,
-                    caption="🗄️ Полная резервная копия БД"
-                )
-            
-            # Очищаем временный файл
-            ExportService.cleanup_temp_file(file_path)
-            
-            keyboard = [[InlineKeyboardButton("◀️ Назад в управление БД", callback_data="manage_db")]]
-            await query.edit_message_text(
-                "✅ Полный бэкап БД отправлен",
-                reply_markup=InlineKeyboardMarkup(keyboard)
-            )
-        else:
-            await query.edit_message_text("❌ Ошибка при создании бэкапа. Попробуйте позже.")
-            
-    except Exception as e:
-        logger.error(f"Ошибка создания бэкапа БД для пользователя {user_id}: {e}")
-        await query.edit_message_text("❌ Произошла ошибка при создании бэкапа.")
+    keyboard = [[InlineKeyboardButton("◀️ Назад в управление БД", callback_data="manage_db")]]
+    await _start_export_job(
+        query, context, user_id, "Формирую полную резервную копию",
+        [{
+            'method': 'export_full_database_backup',
+            'args': (user_id,),
+            'filename': f"Полный_бэкап_БД_{context.bot_data.get('current_date', 'backup')}.xlsx",
+            'caption': "🗄️ Полная резервная копия БД"
+        }],
+        "✅ Полный бэкап БД отправлен",
+        InlineKeyboardMarkup(keyboard)
+    )
 
   
 async def export_full_db_to_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -131,44 +108,30 @@ async def export_full_db_to_excel(update: Update, context: ContextTypes.DEFAULT_
         await query.answer("⛔️ Эта команда доступна только создателю бота.", show_alert=True)
         return
     
-    await query.edit_message_text("⏳ Начинаю полный экспорт. Это может занять до минуты...")
-    
-    try:
-        # Сначала отправляем сырой бэкап
-        raw_file_path = ExportService.export_full_database_backup(user_id)
-        if raw_file_path:
-            filename_raw = f"Полная_выгрузка_БД_raw_{context.bot_data.get('current_date', 'export')}.xlsx"
-            with open(raw_file_path, 'rb') as file:
-                await context.bot.send_document(
-                    chat_id=user_id,
-                    document=file,
-                    filename=filename_raw,
-                    caption="📊 Сырая выгрузка БД (все данные как есть)"
-                )
-            ExportService.cleanup_temp_file(raw_file_path)
-        
-        # Затем отправляем форматированный файл
-        formatted_file_path = ExportService.export_formatted_database(user_id)
-        if formatted_file_path:
-            filename_formatted = f"Полная_выгрузка_БД_формат_{context.bot_data.get('current_date', 'export')}.xlsx"
-            with open(formatted_file_path, 'rb') as file:
-                await context.bot.send_document(
-                    chat_id=user_id,
-                    document=file,
-                    filename=filename_formatted,
-                    caption="📋 Форматированная выгрузка БД (читаемые названия)"
-                )
-            ExportService.cleanup_temp_file(formatted_file_path)
-        
-        keyboard = [[InlineKeyboardButton("◀️ Назад в управление БД", callback_data="manage_db")]]
-        await query.edit_message_text(
-            "✅ Полный экспорт завершен. Отправлены 2 файла: сырой и форматированный.",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        
-    except Exception as e:
-        logger.error(f"Ошибка полного экспорта БД для пользователя {user_id}: {e}")
-        await query.edit_message_text("❌ Произошла ошибка при формировании файлов.")
+    current_date = context.bot_data.get('current_date', 'export')
+    keyboard = [[InlineKeyboardButton("◀️ Назад в управление БД", callback_data="manage_db")]]
+    await _start_export_job(
+        query, context, user_id, "Полный экспорт БД",
+        [
+            # Сначала сырой бэкап, затем форматированный файл
+            {
+                'method': 'export_full_database_backup',
+                'args': (user_id,),
+                'chat_id': user_id,
+                'filename': f"Полная_выгрузка_БД_raw_{current_date}.xlsx",
+                'caption': "📊 Сырая выгрузка БД (все данные как есть)"
+            },
+            {
+                'method': 'export_formatted_database',
+                'args': (user_id,),
+                'chat_id': user_id,
+                'filename': f"Полная_выгрузка_БД_формат_{current_date}.xlsx",
+                'caption': "📋 Форматированная выгрузка БД (читаемые названия)"
+            },
+        ],
+        "✅ Полный экспорт завершен. Отправлены 2 файла: сырой и форматированный.",
+        InlineKeyboardMarkup(keyboard)
+    )
 
 
 async def get_directories_template(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -177,49 +140,31 @@ async def get_directories_template(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     
     # Проверяем права (только админы)
     if not user_role.get('isAdmin'):
         await query.edit_message_text("⛔️ У вас нет прав для работы со справочниками.")
         return
     
-    await query.edit_message_text("⏳ Формирую шаблон справочников...")
-    
-    try:
-        file_path = ExportService.generate_directories_template()
-        
-        if file_path:
-            filename = f"Шаблон_справочников_{context.bot_data.get('current_date', 'template')}.xlsx"
-            
-            with open(file_path, 'rb') as file:
-                await context.bot.send_document(
-                    chat_id=query.message.chat_id,
-                    document=file,
-                    filename=filename,
-                    caption=(
-                        "📄 Шаблон справочников\n\n"
-                        "Инструкция:\n"
-                        "1. Отредактируйте данные в Excel\n"
-                        "2. Отправьте файл обратно боту\n"
-                        "3. Изменения будут применены автоматически"
-                    )
-                )
-            
-            # Очищаем временный файл
-            ExportService.cleanup_temp_file(file_path)
-            
-            keyboard = [[InlineKeyboardButton("◀️ Назад к справочникам", callback_data="manage_directories")]]
-            await query.edit_message_text(
-                "✅ Шаблон справочников отправлен",
-                reply_markup=InlineKeyboardMarkup(keyboard)
+    keyboard = [[InlineKeyboardButton("◀️ Назад к справочникам", callback_data="manage_directories")]]
+    await _start_export_job(
+        query, context, user_id, "Формирую шаблон справочников",
+        [{
+            'method': 'generate_directories_template',
+            'args': (),
+            'filename': f"Шаблон_справочников_{context.bot_data.get('current_date', 'template')}.xlsx",
+            'caption': (
+                "📄 Шаблон справочников\n\n"
+                "Инструкция:\n"
+                "1. Отредактируйте данные в Excel\n"
+                "2. Отправьте файл обратно боту\n"
+                "3. Изменения будут применены автоматически"
             )
-        else:
-            await query.edit_message_text("❌ Ошибка при создании шаблона. Попробуйте позже.")
-            
-    except Exception as e:
-        logger.error(f"Ошибка создания шаблона справочников для пользователя {user_id}: {e}")
-        await query.edit_message_text("❌ Произошла ошибка при создании шаблона.")
+        }],
+        "✅ Шаблон справочников отправлен",
+        InlineKeyboardMarkup(keyboard)
+    )
 
 
 async def export_all_users_to_excel(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -228,132 +173,37 @@ async def export_all_users_to_excel(update: Update, context: ContextTypes.DEFAUL
     await query.answer()
     
     user_id = str(query.from_user.id)
-    user_role = check_user_role(user_id)
+    user_role = await check_user_role(user_id)
     
     # Проверяем права (только админы)
     if not user_role.get('isAdmin'):
         await query.edit_message_text("⛔️ У вас нет прав для экспорта пользователей.")
         return
     
-    await query.edit_message_text("⏳ Формирую список всех пользователей...")
+    # Пользователи из всех таблиц ролей, по листу на таблицу (потоковая выгрузка)
+    keyboard = [[InlineKeyboardButton("◀️ Назад к управлению пользователями", callback_data="manage_users")]]
+    await _start_export_job(
+        query, context, user_id, "Формирую список всех пользователей",
+        [{
+            'method': 'export_all_users',
+            'args': (user_id,),
+            'filename': f"Все_пользователи_{context.bot_data.get('current_date', 'export')}.xlsx",
+            'caption': "👥 Список всех пользователей системы"
+        }],
+        "✅ Список пользователей отправлен",
+        InlineKeyboardMarkup(keyboard)
+    )
+
+
+async def cancel_export_job(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отмена фоновой выгрузки по кнопке"""
+    query = update.callback_query
+    job_id = query.data.replace("export_cancel_", "", 1)
     
-    try:
-        from sqlalchemy import create_engine, text
-        from config.settings import DATABASE_URL
-        import pandas as pd
-        import os
-        from utils.constants import TEMP_DIR
-        
-        ExportService.create_temp_directory()
-        
-        current_date_str = context.bot_data.get('current_date', 'export')
-        file_path = os.path.join(TEMP_DIR, f"all_users_{user_id}_{current_date_str}.xlsx")
-        
-        engine = create_engine(DATABASE_URL)
-        
-        # Собираем пользователей из всех таблиц ролей
-        user_tables = {
-            'Админы': 'SELECT user_id, first_name, last_name, username, phone_number, created_at FROM admins',
-            'Менеджеры': '''
-                SELECT m.user_id, m.first_name, m.last_name, m.username, m.phone_number, 
-                       m.level as "Уровень", d.name as "Дисциплина", m.created_at 
-                FROM managers m 
-                LEFT JOIN disciplines d ON m.discipline = d.id
-            ''',
-            'Супервайзеры': '''
-                SELECT s.user_id, s.first_name, s.last_name, s.username, s.phone_number,
-                       d.name as "Дисциплина", s.created_at
-                FROM supervisors s
-                LEFT JOIN disciplines d ON s.discipline_id = d.id  
-            ''',
-            'Мастера': '''
-                SELECT m.user_id, m.first_name, m.last_name, m.username, m.phone_number,
-                       d.name as "Дисциплина", m.created_at
-                FROM masters m
-                LEFT JOIN disciplines d ON m.discipline_id = d.id
-            ''',
-            'Бригадиры': '''
-                SELECT b.user_id, b.first_name, b.last_name, b.username, b.phone_number,
-                       b.brigade_name as "Бригада", d.name as "Дисциплина", b.created_at
-                FROM brigades b
-                LEFT JOIN disciplines d ON b.discipline_id = d.id
-            ''',
-            'ПТО': '''
-                SELECT p.user_id, p.first_name, p.last_name, p.username, p.phone_number,
-                       d.name as "Дисциплина", p.created_at
-                FROM pto p
-                LEFT JOIN disciplines d ON p.discipline_id = d.id
-            ''',
-            'КИОК': '''
-                SELECT k.user_id, k.first_name, k.last_name, k.username, k.phone_number,
-                       k.kiok_name as "Имя КИОК", d.name as "Дисциплина", k.created_at
-                FROM kiok k
-                LEFT JOIN disciplines d ON k.discipline_id = d.id
-            '''
-        }
-        
-        with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-            with engine.connect() as connection:
-                for sheet_name, query_text in user_tables.items():
-                    try:
-                        df = pd.read_sql_query(text(query_text), connection)
-                        
-                        if not df.empty:
-                            # Переименовываем стандартные колонки
-                            rename_map = {
-                                'user_id': 'ID пользователя',
-                                'first_name': 'Имя',
-                                'last_name': 'Фамилия',
-                                'username': 'Username',
-                                'phone_number': 'Телефон',
-                                'created_at': 'Дата регистрации'
-                            }
-                            df = df.rename(columns=rename_map)
-                            
-                            # Форматируем дату
-                            if 'Дата регистрации' in df.columns:
-                                df['Дата регистрации'] = pd.to_datetime(df['Дата регистрации'], errors='coerce')
-                                if df['Дата регистрации'].dt.tz is not None:
-                                    df['Дата регистрации'] = df['Дата регистрации'].dt.tz_localize(None)
-                            
-                            df.to_excel(writer, sheet_name=sheet_name, index=False)
-                            
-                            # Настраиваем ширину колонок
-                            worksheet = writer.sheets[sheet_name]
-                            for i, col in enumerate(df.columns):
-                                if not df[col].empty:
-                                    max_len = df[col].astype(str).map(len).max()
-                                else:
-                                    max_len = 0
-                                column_len = max(max_len, len(col)) + 2
-                                worksheet.set_column(i, i, min(column_len, 30))
-                        
-                    except Exception as table_error:
-                        logger.error(f"Ошибка экспорта таблицы {sheet_name}: {table_error}")
-                        continue
-        
-        filename = f"Все_пользователи_{current_date_str}.xlsx"
-        
-        with open(file_path, 'rb') as file:
-            await context.bot.send_document(
-                chat_id=query.message.chat_id,
-                document=file,
-                filename=filename,
-                caption="👥 Список всех пользователей системы"
-            )
-        
-        # Очищаем временный файл
-        ExportService.cleanup_temp_file(file_path)
-        
-        keyboard = [[InlineKeyboardButton("◀️ Назад к управлению пользователями", callback_data="manage_users")]]
-        await query.edit_message_text(
-            "✅ Список пользователей отправлен",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        
-    except Exception as e:
-        logger.error(f"Ошибка экспорта пользователей для {user_id}: {e}")
-        await query.edit_message_text("❌ Произошла ошибка при экспорте пользователей.")
+    if ExportJobService.cancel(job_id, str(query.from_user.id)):
+        await query.answer("Выгрузка будет остановлена")
+    else:
+        await query.answer("Выгрузка уже завершена.", show_alert=True)
 
 @auto_clean
 async def handle_db_restore_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -391,7 +241,9 @@ async def handle_db_restore_file(update: Update, context: ContextTypes.DEFAULT_T
        await file.download_to_drive(file_path)
        
        # Восстанавливаем БД через сервис
-       result = ImportService.restore_full_database_from_excel(file_path)
+       result = await run_in_executor(
+           ImportService.restore_full_database_from_excel, file_path, pool='import'
+       )
        
        if result.get('success', False):
             restored_tables = result.get('restored_tables', [])
@@ -494,6 +346,7 @@ def register_export_handlers(application):
     application.add_handler(CallbackQueryHandler(export_full_db_to_excel, pattern="^export_full_db$"))
     application.add_handler(CallbackQueryHandler(get_directories_template, pattern="^get_directories_template_button$"))
     application.add_handler(CallbackQueryHandler(export_all_users_to_excel, pattern="^export_all_users$"))
+    application.add_handler(CallbackQueryHandler(cancel_export_job, pattern="^export_cancel_"))
     
     # НОВЫЕ обработчики
     application.add_handler(MessageHandler(
@@ -6,38 +6,157 @@ from telegram.ext import (
     CallbackQueryHandler, ContextTypes, MessageHandler, filters, ConversationHandler
 )
 
-from bot.middleware.security import check_user_role  # СИНХРОННАЯ функция
+from bot.middleware.security import check_user_role
 from services.workflow_service import WorkflowService
-from services.notification_service import NotificationService
 from utils.chat_utils import auto_clean
 from utils.localization import get_text, get_user_language
 from utils.constants import (
-    AWAITING_MASTER_REJECTION, AWAITING_KIOK_INSPECTION_NUM, AWAITING_KIOK_REJECTION
+    AWAITING_MASTER_REJECTION, AWAITING_KIOK_INSPECTION_NUM, AWAITING_KIOK_REJECTION,
+    REPORT_STATUS_LABELS
 )
-from database.queries import db_query_single  # АСИНХРОННАЯ функция
+from utils.pagination import FIRST_PAGE
+from config.settings import BATCH_APPROVAL_MAX_REPORTS
 
 logger = logging.getLogger(__name__)
 
+def _callback_page(data: str, prefix: str) -> str:
+    """Курсор страницы из callback_data вида '<prefix>_page_<курсор>'"""
+    marker = f"{prefix}_page_"
+    return data[len(marker):] if data.startswith(marker) else FIRST_PAGE
+
+def _page_nav_row(prefix: str, page: dict) -> list:
+    """Кнопки листания keyset-страницы (курсоры лежат в callback_data)"""
+    nav_buttons = []
+    if page['prev']:
+        nav_buttons.append(InlineKeyboardButton("⬅️ Предыдущие", callback_data=f"{prefix}_page_{page['prev']}"))
+    if page['next']:
+        nav_buttons.append(InlineKeyboardButton("Следующие ➡️", callback_data=f"{prefix}_page_{page['next']}"))
+    return nav_buttons
+
+# Очереди с множественным выбором: callback_data меню, карточки отчета и кнопки пакетного согласования
+QUEUE_CALLBACKS = {
+    'master': {'menu': "approve_reports", 'view': "master_view_", 'approve': "master_approve_selected"},
+    'kiok': {'menu': "kiok_review", 'view': "kiok_view_", 'approve': "kiok_approve_selected"},
+}
+
+async def _check_queue_role(query, role: str, lang: str) -> bool:
+    """Отметки и пакетные действия очереди - только для мастера/КИОК, как и само меню очереди"""
+    user_role = await check_user_role(str(query.from_user.id))
+    if user_role.get('isMaster' if role == 'master' else 'isKiok'):
+        return True
+    await query.answer(get_text('batch_no_permission', lang), show_alert=True)
+    return False
+
+def _selected_reports(context: ContextTypes.DEFAULT_TYPE, role: str) -> list:
+    """Отмеченные в очереди отчеты (живут в user_data между страницами)"""
+    return context.user_data.setdefault(f"{role}_selected_reports", [])
+
+def _queue_keyboard(context: ContextTypes.DEFAULT_TYPE, role: str, view: dict) -> InlineKeyboardMarkup:
+    """Клавиатура страницы очереди: отметка + карточка отчета, листание, пакетные действия"""
+    callbacks = QUEUE_CALLBACKS[role]
+    lang = view['lang']
+    selected = _selected_reports(context, role)
+    keyboard = []
+    for report in view['reports']:
+        mark = "☑️" if report['id'] in selected else "⬜"
+        report_text = f"ID:{report['id']} - {report['brigade_name']} - {report['work_type_name']}"
+        keyboard.append([
+            InlineKeyboardButton(mark, callback_data=f"{role}_pick_{report['id']}"),
+            InlineKeyboardButton(report_text, callback_data=f"{callbacks['view']}{report['id']}")
+        ])
+    nav_buttons = _page_nav_row(callbacks['menu'], view)
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+    keyboard.append([InlineKeyboardButton(get_text('batch_select_page_button', lang), callback_data=f"{role}_pick_page")])
+    if selected:
+        keyboard.append([
+            InlineKeyboardButton(
+                get_text(f"{role}_batch_approve_button", lang).format(count=len(selected)),
+                callback_data=callbacks['approve']
+            ),
+            InlineKeyboardButton(get_text('batch_clear_button', lang), callback_data=f"{role}_pick_clear")
+        ])
+    keyboard.append([InlineKeyboardButton(get_text('back_button', lang), callback_data="back_to_start")])
+    return InlineKeyboardMarkup(keyboard)
+
+def _remember_queue_view(context: ContextTypes.DEFAULT_TYPE, role: str, text: str, page: dict, lang: str) -> dict:
+    """Запоминает показанную страницу: отметки перерисовывают ее без запросов к БД"""
+    view = {
+        'text': text,
+        'lang': lang,
+        'reports': [
+            {'id': r['id'], 'brigade_name': r['brigade_name'], 'work_type_name': r['work_type_name']}
+            for r in page['reports']
+        ],
+        'prev': page['prev'],
+        'next': page['next'],
+    }
+    context.user_data[f"{role}_queue_view"] = view
+    return view
+
 async def show_master_approval_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показывает список отчетов для подтверждения мастера"""
+    """Показывает страницу отчетов для подтверждения мастера"""
     query = update.callback_query
     await query.answer()
     
     user_id = str(query.from_user.id)
-    pending_reports = await WorkflowService.get_pending_reports_for_master(user_id)  # ASYNC
+    lang = await get_user_language(user_id)  # ASYNC
+    page_cursor = _callback_page(query.data, "approve_reports")
+    page = await WorkflowService.get_pending_reports_for_master(user_id, page_cursor)  # ASYNC
+    pending_reports = page['reports']
     
     if not pending_reports:
         text = "Нет отчетов для подтверждения."
-        keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="back_to_start")]]
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("◀️ Назад", callback_data="back_to_start")]])
     else:
-        text = f"Отчеты на подтверждение ({len(pending_reports)} шт.):"
-        keyboard = []
-        for report in pending_reports:
-            report_text = f"ID:{report['id']} - {report['brigade_name']} - {report['work_type_name']}"
-            keyboard.append([InlineKeyboardButton(report_text, callback_data=f"master_view_{report['id']}")])
-        keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_start")])
+        if page_cursor == FIRST_PAGE:
+            # Счетчик только на первой странице: листание не пересчитывает очередь
+            pending_count = await WorkflowService.count_pending_reports('master', user_id)
+            text = f"Отчеты на подтверждение ({pending_count} шт.):"
+        else:
+            text = "Отчеты на подтверждение:"
+        view = _remember_queue_view(context, 'master', text, page, lang)
+        reply_markup = _queue_keyboard(context, 'master', view)
+    
+    return await query.edit_message_text(text=text, reply_markup=reply_markup, parse_mode='Markdown')
+
+async def toggle_report_selection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отметка отчета в очереди мастера/КИОК: один отчет, вся страница или сброс"""
+    query = update.callback_query
+    role, _, target = query.data.split('_', 2)
+    view = context.user_data.get(f"{role}_queue_view")
+    lang = view['lang'] if view else await get_user_language(str(query.from_user.id))
+    if not await _check_queue_role(query, role, lang):
+        return
+    if not view:
+        # Страница не запомнена (например, после сброса user_data) - показываем очередь заново
+        if role == 'master':
+            return await show_master_approval_menu(update, context)
+        return await show_kiok_review_menu(update, context)
+    
+    selected = _selected_reports(context, role)
+    page_ids = [report['id'] for report in view['reports']]
+    if target == 'clear':
+        selected.clear()
+    elif target == 'page':
+        for report_id in page_ids:
+            if report_id not in selected and len(selected) < BATCH_APPROVAL_MAX_REPORTS:
+                selected.append(report_id)
+    else:
+        report_id = int(target)
+        if report_id in selected:
+            selected.remove(report_id)
+        elif len(selected) >= BATCH_APPROVAL_MAX_REPORTS:
+            return await query.answer(
+                get_text('batch_limit_reached', view['lang']).format(limit=BATCH_APPROVAL_MAX_REPORTS), show_alert=True
+            )
+        else:
+            selected.append(report_id)
     
-    return await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+    await query.answer()
+    return await query.edit_message_text(
+        text=view['text'], reply_markup=_queue_keyboard(context, role, view), parse_mode='Markdown'
+    )
 
 async def show_master_report_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает детали отчета для мастера"""
@@ -78,16 +197,12 @@ async def master_approve_report(update: Update, context: ContextTypes.DEFAULT_TY
     user_id = str(query.from_user.id)
     report_id = int(query.data.split('_')[-1])
     
-    success = await WorkflowService.master_approve(report_id, user_id)  # ASYNC
+    approved = await WorkflowService.master_approve_many([report_id], user_id)  # ASYNC
     
-    if success:
-        # FIXED: discipline_id получаем асинхронно
-        discipline_id = await db_query_single("SELECT discipline_id FROM reports WHERE id = %s", (report_id,))
-        if discipline_id:
-            kiok_users = await NotificationService.get_users_for_discipline_notification(discipline_id, 'kiok')  # ASYNC
-            for kiok_user in kiok_users:
-                await NotificationService.notify_kiok_new_report(context, report_id, kiok_user)
-        
+    if approved:
+        # Уведомление КИОК отправит диспетчер событий (master_approved) - отвечаем сразу
+        if report_id in context.user_data.get('master_selected_reports', []):
+            context.user_data['master_selected_reports'].remove(report_id)
         text = f"✅ Отчет ID:{report_id} подтвержден и отправлен в КИОК."
     else:
         text = "❌ Ошибка подтверждения отчета."
@@ -95,6 +210,33 @@ async def master_approve_report(update: Update, context: ContextTypes.DEFAULT_TY
     keyboard = [[InlineKeyboardButton("◀️ Назад", callback_data="approve_reports")]]
     return await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
 
+async def master_approve_selected(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Мастер подтверждает все отмеченные отчеты одним запросом"""
+    query = update.callback_query
+    user_id = str(query.from_user.id)
+    lang = await get_user_language(user_id)  # ASYNC
+    if not await _check_queue_role(query, 'master', lang):
+        return
+    report_ids = list(context.user_data.get('master_selected_reports', []))
+    if not report_ids:
+        return await query.answer(get_text('batch_nothing_selected', lang), show_alert=True)
+    await query.answer()
+    
+    approved = await WorkflowService.master_approve_many(report_ids, user_id)  # ASYNC
+    context.user_data.pop('master_selected_reports', None)
+    context.user_data.pop('master_queue_view', None)
+    
+    if approved:
+        # Сводное сообщение каждому КИОК отправит диспетчер событий
+        text = get_text('master_batch_approval_success', lang).format(count=len(approved))
+    else:
+        text = get_text('master_approval_error', lang)
+    if len(approved) < len(report_ids):
+        text += "\n" + get_text('batch_approval_skipped', lang).format(count=len(report_ids) - len(approved))
+    
+    keyboard = [[InlineKeyboardButton(get_text('back_button', lang), callback_data="approve_reports")]]
+    return await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard))
+
 async def master_reject_report_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Запрашивает причину отклонения у мастера"""
     query = update.callback_query
@@ -138,13 +280,10 @@ async def process_master_rejection_reason(update: Update, context: ContextTypes.
         except:
             pass
     
-    success = await WorkflowService.master_reject(report_id, user_id, reason)  # ASYNC
+    report = await WorkflowService.master_reject(report_id, user_id, reason)  # ASYNC
     
-    if success:
-        await NotificationService.notify_supervisor_status_change(
-            context, report_id, 'rejected', user_id, reason
-        )
-        
+    if report:
+        # Супервайзера уведомит диспетчер событий (report_rejected)
         text = get_text('master_rejection_success', lang).format(report_id=report_id)
     else:
         text = get_text('master_rejection_error', lang)
@@ -172,32 +311,31 @@ async def show_kiok_review_menu(update: Update, context: ContextTypes.DEFAULT_TY
     
     user_id = str(query.from_user.id)
     lang = await get_user_language(user_id)  # ASYNC
-    user_role = check_user_role(user_id)  # СИНХРОННЫЙ вызов
+    user_role = await check_user_role(user_id)
     
     if not user_role.get('isKiok'):
         await query.answer("❌ У вас нет прав КИОК", show_alert=True)
         return
     
-    pending_reports = await WorkflowService.get_pending_reports_for_kiok(user_id)  # ASYNC
+    page_cursor = _callback_page(query.data, "kiok_review")
+    page = await WorkflowService.get_pending_reports_for_kiok(user_id, page_cursor)  # ASYNC
+    pending_reports = page['reports']
     
     if not pending_reports:
         text = get_text('kiok_no_pending_reports', lang)
-        keyboard = [[InlineKeyboardButton(get_text('back_button', lang), callback_data="back_to_start")]]
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton(get_text('back_button', lang), callback_data="back_to_start")]])
     else:
-        text = get_text('kiok_pending_reports_title', lang).format(count=len(pending_reports))
-        keyboard = []
-        
-        for report in pending_reports:
-            report_text = f"ID:{report['id']} - {report['brigade_name']} - {report['work_type_name']}"
-            keyboard.append([
-                InlineKeyboardButton(report_text, callback_data=f"kiok_view_{report['id']}")
-            ])
-        
-        keyboard.append([InlineKeyboardButton(get_text('back_button', lang), callback_data="back_to_start")])
+        if page_cursor == FIRST_PAGE:
+            pending_count = await WorkflowService.count_pending_reports('kiok', user_id)
+            text = get_text('kiok_pending_reports_title', lang).format(count=pending_count)
+        else:
+            text = get_text('kiok_pending_reports_page_title', lang)
+        view = _remember_queue_view(context, 'kiok', text, page, lang)
+        reply_markup = _queue_keyboard(context, 'kiok', view)
     
     return await query.edit_message_text(
         text=text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=reply_markup,
         parse_mode='Markdown'
     )
 
@@ -248,6 +386,7 @@ async def kiok_approve_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE
     lang = await get_user_language(user_id)  # ASYNC
     report_id = int(query.data.split('_')[-1])
     
+    context.user_data.pop('approving_report_ids', None)
     context.user_data['approving_report_id'] = report_id
     
     text = get_text('kiok_inspection_number_prompt', lang)
@@ -262,6 +401,30 @@ async def kiok_approve_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE
     context.user_data['approval_message_id'] = message.message_id
     return AWAITING_KIOK_INSPECTION_NUM
 
+async def kiok_approve_selected_prompt(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Запрашивает один номер проверки для всех отмеченных КИОК отчетов"""
+    query = update.callback_query
+    user_id = str(query.from_user.id)
+    lang = await get_user_language(user_id)  # ASYNC
+    if not await _check_queue_role(query, 'kiok', lang):
+        return ConversationHandler.END
+    report_ids = list(context.user_data.get('kiok_selected_reports', []))
+    if not report_ids:
+        await query.answer(get_text('batch_nothing_selected', lang), show_alert=True)
+        return ConversationHandler.END
+    await query.answer()
+    
+    context.user_data.pop('approving_report_id', None)
+    context.user_data['approving_report_ids'] = report_ids
+    
+    text = get_text('kiok_batch_inspection_number_prompt', lang).format(count=len(report_ids))
+    keyboard = [[InlineKeyboardButton(get_text('cancel_button', lang), callback_data="kiok_review")]]
+    
+    message = await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard))
+    
+    context.user_data['approval_message_id'] = message.message_id
+    return AWAITING_KIOK_INSPECTION_NUM
+
 async def process_kiok_inspection_number(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обрабатывает номер проверки от КИОК"""
     user_id = str(update.effective_user.id)
@@ -269,7 +432,8 @@ async def process_kiok_inspection_number(update: Update, context: ContextTypes.D
     inspection_number = update.message.text.strip()
     
     report_id = context.user_data.get('approving_report_id')
-    if not report_id:
+    report_ids = context.user_data.get('approving_report_ids') or ([report_id] if report_id else [])
+    if not report_ids:
         return
     
     await update.message.delete()
@@ -281,19 +445,26 @@ async def process_kiok_inspection_number(update: Update, context: ContextTypes.D
         except:
             pass
     
-    success = await WorkflowService.kiok_approve(report_id, user_id, inspection_number)  # ASYNC
+    # Уведомления супервайзерам, публикация в группе и сводка выработки - в диспетчере событий (kiok_approved)
+    approved = await WorkflowService.kiok_approve_many(report_ids, user_id, inspection_number)  # ASYNC
     
-    if success:
-        await NotificationService.notify_supervisor_status_change(
-            context, report_id, 'approved', user_id
-        )
-        
+    if not approved:
+        text = get_text('kiok_approval_error', lang)
+    elif len(report_ids) == 1:
         text = get_text('kiok_approval_success', lang).format(
-            report_id=report_id, 
+            report_id=report_id or approved[0], 
             inspection_number=inspection_number
         )
     else:
-        text = get_text('kiok_approval_error', lang)
+        text = get_text('kiok_batch_approval_success', lang).format(
+            count=len(approved), inspection_number=inspection_number
+        )
+    if approved and len(approved) < len(report_ids):
+        text += "\n" + get_text('batch_approval_skipped', lang).format(count=len(report_ids) - len(approved))
+    
+    selected = context.user_data.get('kiok_selected_reports', [])
+    context.user_data['kiok_selected_reports'] = [rid for rid in selected if rid not in approved]
+    context.user_data.pop('kiok_queue_view', None)
     
     keyboard = [[InlineKeyboardButton(get_text('back_button', lang), callback_data="kiok_review")]]
     
@@ -305,6 +476,7 @@ async def process_kiok_inspection_number(update: Update, context: ContextTypes.D
     )
     
     context.user_data.pop('approving_report_id', None)
+    context.user_data.pop('approving_report_ids', None)
     context.user_data.pop('approval_message_id', None)
     return ConversationHandler.END
 
@@ -351,13 +523,10 @@ async def process_kiok_rejection_reason(update: Update, context: ContextTypes.DE
         except:
             pass
     
-    success = await WorkflowService.kiok_reject(report_id, user_id, reason)  # ASYNC
+    report = await WorkflowService.kiok_reject(report_id, user_id, reason)  # ASYNC
     
-    if success:
-        await NotificationService.notify_supervisor_status_change(
-            context, report_id, 'rejected', user_id, reason
-        )
-        
+    if report:
+        # Супервайзера уведомит диспетчер событий (report_rejected)
         text = get_text('kiok_rejection_success', lang).format(report_id=report_id)
     else:
         text = get_text('kiok_rejection_error', lang)
@@ -376,6 +545,36 @@ async def process_kiok_rejection_reason(update: Update, context: ContextTypes.DE
     context.user_data.pop('rejection_message_id', None)
     return ConversationHandler.END
 
+# ===== ИСТОРИЯ ОТЧЕТОВ СУПЕРВАЙЗЕРА =====
+
+async def show_my_reports(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает историю отчетов супервайзера постранично, новые сверху"""
+    query = update.callback_query
+    await query.answer()
+    
+    user_id = str(query.from_user.id)
+    page = await WorkflowService.get_supervisor_reports(user_id, _callback_page(query.data, "my_reports"))  # ASYNC
+    
+    if not page['reports']:
+        text = "У вас пока нет отчетов."
+    else:
+        text_lines = ["📋 *Мои отчеты:*\n"]
+        for report in page['reports']:
+            status = REPORT_STATUS_LABELS.get(report['workflow_status'], report['workflow_status'])
+            text_lines.append(
+                f"ID:{report['id']} - {report['report_date'].strftime('%d.%m.%Y')} - "
+                f"{report['brigade_name']} - {report['work_type_name']} - _{status}_"
+            )
+        text = "\n".join(text_lines)
+    
+    keyboard = []
+    nav_buttons = _page_nav_row("my_reports", page)
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+    keyboard.append([InlineKeyboardButton("◀️ Назад", callback_data="back_to_start")])
+    
+    return await query.edit_message_text(text=text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+
 async def cancel_rejection_flow(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Отмена процесса ввода причины/номера."""
     query = update.callback_query
@@ -385,6 +584,7 @@ async def cancel_rejection_flow(update: Update, context: ContextTypes.DEFAULT_TY
     context.user_data.pop('rejecting_role', None)
     context.user_data.pop('rejection_message_id', None)
     context.user_data.pop('approving_report_id', None)
+    context.user_data.pop('approving_report_ids', None)
     context.user_data.pop('approval_message_id', None)
     
     if "master" in query.data:
@@ -400,6 +600,7 @@ def create_rejection_conversation():
         entry_points=[
             CallbackQueryHandler(master_reject_report_prompt, pattern="^master_reject_\\d+$"),
             CallbackQueryHandler(kiok_approve_prompt, pattern="^kiok_approve_final_"),
+            CallbackQueryHandler(kiok_approve_selected_prompt, pattern="^kiok_approve_selected$"),
             CallbackQueryHandler(kiok_reject_prompt, pattern="^kiok_reject_final_"),
         ],
         states={
@@ -413,16 +614,21 @@ def create_rejection_conversation():
         ],
         per_user=True,
         allow_reentry=True,
-        name="rejection_conversation"
+        name="rejection_conversation",
+        persistent=True
     )
 
 def register_workflow_handlers(application):
     """Регистрация workflow handlers"""
-    application.add_handler(CallbackQueryHandler(show_master_approval_menu, pattern="^approve_reports$"))
+    application.add_handler(CallbackQueryHandler(show_master_approval_menu, pattern="^approve_reports(_page_[ab]\\d+)?$"))
     application.add_handler(CallbackQueryHandler(show_master_report_details, pattern="^master_view_"))
     application.add_handler(CallbackQueryHandler(master_approve_report, pattern="^master_approve_\\d+$"))
+    application.add_handler(CallbackQueryHandler(master_approve_selected, pattern="^master_approve_selected$"))
+    application.add_handler(CallbackQueryHandler(toggle_report_selection, pattern="^(master|kiok)_pick_(\\d+|page|clear)$"))
 
-    application.add_handler(CallbackQueryHandler(show_kiok_review_menu, pattern="^kiok_review$"))
+    application.add_handler(CallbackQueryHandler(show_kiok_review_menu, pattern="^kiok_review(_page_[ab]\\d+)?$"))
     application.add_handler(CallbackQueryHandler(show_kiok_report_details, pattern="^kiok_view_"))
+
+    application.add_handler(CallbackQueryHandler(show_my_reports, pattern="^my_reports(_page_[ab]\\d+)?$"))
     
     logger.info("✅ Workflow handlers зарегистрированы")
\ No newline at end of file
@@ -2,6 +2,6 @@
 Middleware для Telegram бота
 """
 
-from .security import security_gateway, check_user_role
+from .security import security_gateway, check_user_role, invalidate_user_role
 
-__all__ = ['security_gateway', 'check_user_role']
\ No newline at end of file
+__all__ = ['security_gateway', 'check_user_role', 'invalidate_user_role']
\ No newline at end of file
@@ -0,0 +1,103 @@
+# bot/middleware/metrics.py
+
+"""
+Замеры горячего пути бота: время обработки каждого апдейта по ключу обработчика,
+число запросов к БД за апдейт и задержки запросов к Telegram Bot API.
+Сами метрики хранятся в utils/metrics.py.
+"""
+
+import logging
+import time
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import HTTPXRequest
+
+from config.settings import PERF_SLOW_UPDATE_SECONDS, PERF_DB_CALLS_WARN
+from utils.logging_setup import log_context
+from utils.metrics import (
+    observe, inc, track_update,
+    HANDLER_SECONDS, HANDLER_ERRORS, DB_CALLS_PER_UPDATE, TELEGRAM_API_SECONDS, TELEGRAM_API_ERRORS
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_KEY_LENGTH = 48
+
+def _callback_prefix(data: str) -> str:
+    """'master_view_15' -> 'master_view', 'list_users_admins_a42' -> 'list_users_admins'"""
+    parts = []
+    for part in data.split('_'):
+        # id, даты и курсоры страниц в метку не попадают
+        if any(char.isdigit() for char in part):
+            break
+        parts.append(part)
+    return '_'.join(parts)[:MAX_KEY_LENGTH] or 'data'
+
+def handler_key(update: object) -> str:
+    """Ключ обработчика для метрик: callback:<префикс>, command:/<команда>, message:<тип>"""
+    if not isinstance(update, Update):
+        return 'other'
+    if update.callback_query:
+        return f"callback:{_callback_prefix(update.callback_query.data or '')}"
+
+    message = update.effective_message
+    if message is None:
+        return 'update:other'
+    if message.text and message.text.startswith('/'):
+        command = message.text.split(maxsplit=1)[0].split('@', 1)[0]
+        return f"command:{command[:MAX_KEY_LENGTH]}"
+    for kind in ('text', 'document', 'photo', 'contact', 'location'):
+        if getattr(message, kind, None):
+            return f"message:{kind}"
+    return 'message:other'
+
+class InstrumentedApplication(Application):
+    """
+    Application, который замеряет обработку каждого апдейта (всеми группами обработчиков).
+    Перед обработкой подтягивает изменения состояния от других реплик (persistence.sync).
+    """
+
+    async def process_update(self, update: object) -> None:
+        key = handler_key(update)
+        started = time.perf_counter()
+        user = update.effective_user if isinstance(update, Update) else None
+        # update_id, пользователь и обработчик попадают во все записи лога этого апдейта
+        fields = dict(update_id=getattr(update, 'update_id', None), user_id=user.id if user else None, handler=key)
+        with log_context(**fields), track_update() as stats:
+            try:
+                sync = getattr(self.persistence, 'sync', None)
+                if sync is not None:
+                    await sync(self)
+                await super().process_update(update)
+            finally:
+                elapsed = time.perf_counter() - started
+                observe(HANDLER_SECONDS, elapsed, handler=key)
+                observe(DB_CALLS_PER_UPDATE, stats['db_calls'], handler=key)
+                if elapsed >= PERF_SLOW_UPDATE_SECONDS or stats['db_calls'] >= PERF_DB_CALLS_WARN:
+                    logger.warning(
+                        f"🐢 Медленный апдейт {key}: {elapsed:.2f} сек, "
+                        f"запросов к БД {stats['db_calls']} ({stats['db_seconds']:.2f} сек)"
+                    )
+
+    async def process_error(self, update, error, job=None, coroutine=None) -> bool:
+        inc(HANDLER_ERRORS, handler=handler_key(update) if update is not None else 'job')
+        return await super().process_error(update, error, job=job, coroutine=coroutine)
+
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """HTTP-клиент Bot API с замером каждого запроса по методу (sendMessage, editMessageText, ...)"""
+
+    async def do_request(self, url: str, method: str, *args, **kwargs):
+        # Скачивание файлов идет по пути файла - в метку его не пишем
+        api_method = 'file_download' if '/file/bot' in url else url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception as e:
+            inc(TELEGRAM_API_ERRORS, method=api_method, reason=type(e).__name__)
+            raise
+        finally:
+            observe(TELEGRAM_API_SECONDS, time.perf_counter() - started, method=api_method)
+        if code >= 400:
+            inc(TELEGRAM_API_ERRORS, method=api_method, reason=str(code))
+        return code, payload
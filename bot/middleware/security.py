@@ -1,19 +1,105 @@
 # bot/middleware/security.py
 
+import copy
 import logging
+import time
 from functools import wraps
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from telegram import Update
 from telegram.ext import ContextTypes
 
-from config.settings import OWNER_ID
-from database.queries import db_query_sync  # FIXED: используем синхронную версию
+from config.settings import OWNER_ID, ROLE_CACHE_TTL_SECONDS
+from database.queries import db_query
 from utils.localization import get_user_language
 
 logger = logging.getLogger(__name__)
 
-def check_user_role(user_id: str) -> Dict[str, Any]:
-    """СИНХРОННАЯ проверка роли пользователя (ИСПРАВЛЕНО)"""
+# Кэш ролей: user_id -> (время загрузки, роль)
+_role_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+# Все роли пользователя одним запросом (user_id - первичный ключ в каждой таблице ролей)
+_USER_ROLE_QUERY = """
+    SELECT
+        a.user_id IS NOT NULL AS is_admin,
+        mg.user_id IS NOT NULL AS is_manager, mg.level AS manager_level,
+        mg.discipline AS manager_discipline_id, dmg.name AS manager_discipline,
+        s.user_id IS NOT NULL AS is_supervisor, s.supervisor_name, s.brigade_ids,
+        s.discipline_id AS supervisor_discipline_id, ds.name AS supervisor_discipline,
+        ms.user_id IS NOT NULL AS is_master, ms.master_name,
+        ms.discipline_id AS master_discipline_id, dms.name AS master_discipline,
+        b.user_id IS NOT NULL AS is_foreman, b.brigade_name,
+        b.discipline_id AS foreman_discipline_id, db.name AS foreman_discipline,
+        p.user_id IS NOT NULL AS is_pto, dp.name AS pto_discipline,
+        k.user_id IS NOT NULL AS is_kiok, dk.name AS kiok_discipline
+    FROM (SELECT %s::varchar AS user_id) u
+    LEFT JOIN admins a ON a.user_id = u.user_id
+    LEFT JOIN managers mg ON mg.user_id = u.user_id
+    LEFT JOIN disciplines dmg ON mg.discipline = dmg.id
+    LEFT JOIN supervisors s ON s.user_id = u.user_id
+    LEFT JOIN disciplines ds ON s.discipline_id = ds.id
+    LEFT JOIN masters ms ON ms.user_id = u.user_id
+    LEFT JOIN disciplines dms ON ms.discipline_id = dms.id
+    LEFT JOIN brigades b ON b.user_id = u.user_id
+    LEFT JOIN disciplines db ON b.discipline_id = db.id
+    LEFT JOIN pto p ON p.user_id = u.user_id
+    LEFT JOIN disciplines dp ON p.discipline_id = dp.id
+    LEFT JOIN kiok k ON k.user_id = u.user_id
+    LEFT JOIN disciplines dk ON k.discipline_id = dk.id
+"""
+
+async def _load_user_role(user_id_str: str) -> Optional[Dict[str, Any]]:
+    """Загружает роли пользователя из БД одним запросом. None - если запрос не удался."""
+    rows = await db_query(_USER_ROLE_QUERY, (user_id_str,), as_dict=True)
+    if rows is None:
+        return None
+
+    user_role = {'userId': user_id_str}
+    if not rows:
+        return user_role
+    row = rows[0]
+
+    # Порядок важен: при нескольких ролях дисциплину задает последняя (как и раньше)
+    if row['is_admin']:
+        user_role['isAdmin'] = True
+
+    if row['is_manager']:
+        user_role['isManager'] = True
+        user_role['managerLevel'] = row['manager_level']
+        user_role['disciplineId'] = row['manager_discipline_id']
+        user_role['discipline'] = row['manager_discipline']
+
+    if row['is_supervisor']:
+        user_role['isSupervisor'] = True
+        user_role['supervisorName'] = row['supervisor_name']
+        user_role['disciplineId'] = row['supervisor_discipline_id']
+        user_role['discipline'] = row['supervisor_discipline']
+        user_role['assignedBrigades'] = list(row['brigade_ids'] or [])
+
+    if row['is_master']:
+        user_role['isMaster'] = True
+        user_role['masterName'] = row['master_name']
+        user_role['disciplineId'] = row['master_discipline_id']
+        user_role['discipline'] = row['master_discipline']
+
+    if row['is_foreman']:
+        user_role['isForeman'] = True
+        user_role['isBrigade'] = True  # Для совместимости
+        user_role['brigadeName'] = row['brigade_name']
+        user_role['disciplineId'] = row['foreman_discipline_id']
+        user_role['discipline'] = row['foreman_discipline']
+
+    if row['is_pto']:
+        user_role['isPto'] = True
+        user_role['discipline'] = row['pto_discipline']
+
+    if row['is_kiok']:
+        user_role['isKiok'] = True
+        user_role['discipline'] = row['kiok_discipline']
+
+    return user_role
+
+async def check_user_role(user_id: str) -> Dict[str, Any]:
+    """Асинхронная проверка роли пользователя (один запрос + кэш с TTL)"""
     user_id_str = str(user_id)
     
     if user_id_str == OWNER_ID:
@@ -24,86 +110,31 @@ def check_user_role(user_id: str) -> Dict[str, Any]:
             'userId': user_id_str
         }
     
-    user_role = {'userId': user_id_str}
+    cached = _role_cache.get(user_id_str)
+    if cached and time.monotonic() - cached[0] < ROLE_CACHE_TTL_SECONDS:
+        return copy.deepcopy(cached[1])
     
     try:
-        # Админы
-        admin_check = db_query_sync("SELECT user_id FROM admins WHERE user_id = %s", (user_id_str,))
-        if admin_check:
-            user_role['isAdmin'] = True
-        
-        # Менеджеры - используем 'discipline', не 'discipline_id'
-        manager_check = db_query_sync(
-            "SELECT level, discipline, d.name FROM managers m LEFT JOIN disciplines d ON m.discipline = d.id WHERE m.user_id = %s", 
-            (user_id_str,)
-        )
-        if manager_check:
-            user_role['isManager'] = True
-            user_role['managerLevel'] = manager_check[0][0]
-            user_role['disciplineId'] = manager_check[0][1]
-            user_role['discipline'] = manager_check[0][2]
-        
-        # Супервайзеры - используем 'discipline_id'
-        supervisor_check = db_query_sync(
-            """SELECT supervisor_name, discipline_id, brigade_ids, d.name as discipline_name 
-               FROM supervisors s LEFT JOIN disciplines d ON s.discipline_id = d.id 
-               WHERE s.user_id = %s""", 
-            (user_id_str,)
-        )
-        if supervisor_check:
-            user_role['isSupervisor'] = True
-            user_role['supervisorName'] = supervisor_check[0][0]
-            user_role['disciplineId'] = supervisor_check[0][1]
-            user_role['discipline'] = supervisor_check[0][3]
-            user_role['assignedBrigades'] = supervisor_check[0][2] or []
-        
-        # Мастера - используем 'discipline_id'
-        master_check = db_query_sync(
-            """SELECT master_name, discipline_id, d.name as discipline_name 
-               FROM masters m LEFT JOIN disciplines d ON m.discipline_id = d.id 
-               WHERE m.user_id = %s""", 
-            (user_id_str,)
-        )
-        if master_check:
-            user_role['isMaster'] = True
-            user_role['masterName'] = master_check[0][0]
-            user_role['disciplineId'] = master_check[0][1]
-            user_role['discipline'] = master_check[0][2]
-        
-        # Бригадиры - используем 'discipline_id'
-        foreman_check = db_query_sync(
-            "SELECT brigade_name, discipline_id, d.name FROM brigades b LEFT JOIN disciplines d ON b.discipline_id = d.id WHERE b.user_id = %s", 
-            (user_id_str,)
-        )
-        if foreman_check:
-            user_role['isForeman'] = True
-            user_role['isBrigade'] = True  # Для совместимости
-            user_role['brigadeName'] = foreman_check[0][0]
-            user_role['disciplineId'] = foreman_check[0][1]
-            user_role['discipline'] = foreman_check[0][2]
-        
-        # ПТО - используем 'discipline_id'
-        pto_check = db_query_sync(
-            "SELECT d.name FROM pto p LEFT JOIN disciplines d ON p.discipline_id = d.id WHERE p.user_id = %s", 
-            (user_id_str,)
-        )
-        if pto_check:
-            user_role['isPto'] = True
-            user_role['discipline'] = pto_check[0][0]
-        
-        # КИОК - используем 'discipline_id'
-        kiok_check = db_query_sync(
-            "SELECT d.name FROM kiok k LEFT JOIN disciplines d ON k.discipline_id = d.id WHERE k.user_id = %s", 
-            (user_id_str,)
-        )
-        if kiok_check:
-            user_role['isKiok'] = True
-            user_role['discipline'] = kiok_check[0][0]
-            
+        user_role = await _load_user_role(user_id_str)
     except Exception as e:
         logger.error(f"Ошибка проверки роли для пользователя {user_id_str}: {e}")
+        user_role = None
     
-    return user_role
+    if user_role is None:
+        # Ошибку БД не кэшируем, чтобы следующий запрос попробовал снова
+        return {'userId': user_id_str}
+    
+    _role_cache[user_id_str] = (time.monotonic(), user_role)
+    return copy.deepcopy(user_role)
+
+def invalidate_user_role(user_id: Optional[str] = None) -> None:
+    """Сбрасывает кэш ролей пользователя (или всех, если user_id не указан)"""
+    if user_id is None:
+        _role_cache.clear()
+        logger.debug("Кэш ролей полностью сброшен")
+    else:
+        _role_cache.pop(str(user_id), None)
+        logger.debug(f"Кэш ролей сброшен для пользователя {user_id}")
 
 async def security_gateway(func):
     """Декоратор для проверки прав доступа"""
@@ -114,7 +145,7 @@ async def security_gateway(func):
             return
 
         user_id = str(user.id)
-        user_role = check_user_role(user_id)  # СИНХРОННЫЙ вызов
+        user_role = await check_user_role(user_id)
         
         context.user_data['user_role'] = user_role
         
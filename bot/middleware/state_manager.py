@@ -43,40 +43,41 @@ class StateManager:
     """Надежный менеджер состояний пользователей - ИСПРАВЛЕННАЯ ВЕРСИЯ"""
     
     @staticmethod
-    def _ensure_user_states(context) -> Dict:
-        """Инициализирует хранилище состояний если его нет"""
-        if 'user_states' not in context.bot_data:
-            context.bot_data['user_states'] = {}
-        return context.bot_data['user_states']
+    def _state_key(user_id: str) -> str:
+        """
+        Ключ состояния пользователя в bot_data. Каждый пользователь - отдельный ключ,
+        чтобы PostgresPersistence хранил и синхронизировал между репликами их независимо.
+        """
+        return f"user_state:{user_id}"
     
     @staticmethod
     def set_state(context, user_id: str, state: UserState, data: Optional[Dict[str, Any]] = None) -> None:
         """Устанавливает состояние пользователя с данными - ИСПРАВЛЕНО"""
-        user_states = StateManager._ensure_user_states(context)
+        key = StateManager._state_key(user_id)
+        user_state = context.bot_data.get(key)
         
-        if user_id in user_states:
+        if user_state:
             # FIXED: Сохраняем существующие данные при смене состояния
-            user_states[user_id]['current_state'] = state.value
-            user_states[user_id]['updated_at'] = context.bot_data.get('current_time', 'unknown')
+            user_state['current_state'] = state.value
+            user_state['updated_at'] = context.bot_data.get('current_time', 'unknown')
             
             # FIXED: Обновляем данные только если переданы новые
             if data:
-                user_states[user_id]['data'].update(data)
+                user_state['data'].update(data)
         else:
             # Создаем новую запись
-            user_states[user_id] = {
+            user_state = context.bot_data[key] = {
                 'current_state': state.value,
                 'data': data or {},
                 'updated_at': context.bot_data.get('current_time', 'unknown')
             }
         
-        logger.debug(f"Set state for user {user_id}: {state.value}, data keys: {list(user_states[user_id]['data'].keys())}")
+        logger.debug(f"Set state for user {user_id}: {state.value}, data keys: {list(user_state['data'].keys())}")
     
     @staticmethod
     def get_state(context, user_id: str) -> Optional[Dict[str, Any]]:
         """Получает текущее состояние пользователя"""
-        user_states = StateManager._ensure_user_states(context)
-        return user_states.get(user_id)
+        return context.bot_data.get(StateManager._state_key(user_id))
     
     @staticmethod
     def get_current_state(context, user_id: str) -> Optional[UserState]:
@@ -100,13 +101,14 @@ class StateManager:
     @staticmethod
     def update_state_data(context, user_id: str, new_data: Dict[str, Any]) -> None:
         """Обновляет данные состояния без смены состояния - ИСПРАВЛЕНО"""
-        user_states = StateManager._ensure_user_states(context)
-        if user_id in user_states:
-            user_states[user_id]['data'].update(new_data)
-            logger.debug(f"Updated state data for user {user_id}: {list(user_states[user_id]['data'].keys())}")
+        key = StateManager._state_key(user_id)
+        user_state = context.bot_data.get(key)
+        if user_state:
+            user_state['data'].update(new_data)
+            logger.debug(f"Updated state data for user {user_id}: {list(user_state['data'].keys())}")
         else:
             # FIXED: Если пользователя нет, создаем запись
-            user_states[user_id] = {
+            context.bot_data[key] = {
                 'current_state': 'unknown',
                 'data': new_data,
                 'updated_at': context.bot_data.get('current_time', 'unknown')
@@ -116,9 +118,7 @@ class StateManager:
     @staticmethod
     def clear_state(context, user_id: str) -> None:
         """Очищает состояние пользователя"""
-        user_states = StateManager._ensure_user_states(context)
-        if user_id in user_states:
-            del user_states[user_id]
+        if context.bot_data.pop(StateManager._state_key(user_id), None) is not None:
             logger.debug(f"Cleared state for user {user_id}")
     
     @staticmethod
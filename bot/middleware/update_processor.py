@@ -0,0 +1,84 @@
+# bot/middleware/update_processor.py
+
+"""
+Параллельная обработка апдейтов с порядком внутри пользователя.
+
+Апдейты разных пользователей выполняются одновременно (не больше UPDATE_CONCURRENCY),
+апдейты одного пользователя - строго в порядке поступления: ConversationHandler,
+StateManager и user_data видят их так же, как при последовательной обработке.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Dict, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from utils.metrics import observe, inc, UPDATE_WAIT_SECONDS, UPDATES_DROPPED
+
+logger = logging.getLogger(__name__)
+
+def _order_key(update: object) -> Optional[int]:
+    """Чьи апдейты нельзя переставлять: пользователь, иначе чат (None - порядок не важен)"""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return None
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    max_concurrent - сколько апдейтов выполняется одновременно,
+    max_user_queue - сколько апдейтов одного пользователя может ждать своей очереди (лишние отбрасываются),
+    max_pending - сколько апдейтов всего принято в работу (включая ждущих), дальше PTB не читает новые.
+    """
+
+    def __init__(self, max_concurrent: int, max_user_queue: int, max_pending: int):
+        # Семафор базового класса ограничивает все принятые апдейты, а не только выполняющиеся:
+        # иначе пачка нажатий одного пользователя заняла бы все слоты в ожидании своей очереди
+        super().__init__(max_concurrent_updates=max(max_pending, max_concurrent))
+        self._running = asyncio.Semaphore(max_concurrent)
+        self._max_user_queue = max_user_queue
+        # пользователь -> замок очереди и число его апдейтов в работе (замок удаляется вместе с очередью)
+        self._user_locks: Dict[int, asyncio.Lock] = {}
+        self._user_pending: Dict[int, int] = {}
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        key = _order_key(update)
+        if key is None:
+            await self._run(coroutine, time.perf_counter())
+            return
+
+        pending = self._user_pending.get(key, 0)
+        if pending >= self._max_user_queue:
+            coroutine.close()
+            inc(UPDATES_DROPPED)
+            logger.warning(f"⚠️ Очередь пользователя {key} переполнена ({pending}), апдейт отброшен")
+            return
+
+        self._user_pending[key] = pending + 1
+        lock = self._user_locks.setdefault(key, asyncio.Lock())
+        submitted = time.perf_counter()
+        try:
+            async with lock:
+                await self._run(coroutine, submitted)
+        finally:
+            self._user_pending[key] -= 1
+            if not self._user_pending[key]:
+                del self._user_pending[key]
+                del self._user_locks[key]
+
+    async def _run(self, coroutine: Awaitable, submitted: float) -> None:
+        async with self._running:
+            observe(UPDATE_WAIT_SECONDS, time.perf_counter() - submitted)
+            await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
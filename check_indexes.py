@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Проверка планов горячих запросов к reports: каждый должен идти по своему индексу
+
+    python check_indexes.py            # 50 000 тестовых отчетов
+    python check_indexes.py 200000     # свой объем
+
+Тестовые данные вставляются в транзакции, которая в конце откатывается, - база не меняется.
+Перед запуском схема должна быть актуальной (python migrate.py).
+"""
+
+import sys
+import json
+import logging
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+
+DEFAULT_SEED_ROWS = 50000
+SEED_DISCIPLINES = 5
+SEED_BRIGADES = 200
+SEED_DAYS = 365
+
+# Распределение статусов похоже на боевое: почти все отчеты согласованы, очереди короткие
+_SEED_SQL = """
+    INSERT INTO reports (
+        created_at, report_date, brigade_name, corpus_name, discipline_id, work_type_name,
+        workflow_status, master_signed_at, people_count, volume
+    )
+    SELECT
+        CASE WHEN s.status = 'pending_master' THEN NOW() - (g %% 5) * INTERVAL '1 day'
+             ELSE s.report_date + INTERVAL '18 hours' END,
+        s.report_date,
+        'Бригада проверки ' || (g %% %(brigades)s),
+        'Корпус ' || (g %% 10),
+        (%(discipline_ids)s::int[])[1 + g %% %(disciplines)s],
+        'Вид работ ' || (g %% 20),
+        s.status,
+        CASE WHEN s.status IN ('pending_kiok', 'approved')
+             THEN s.report_date + INTERVAL '20 hours' END,
+        1 + g %% 12,
+        g %% 100
+    FROM generate_series(1, %(rows)s) AS g
+    CROSS JOIN LATERAL (
+        SELECT CURRENT_DATE - (g %% %(days)s) AS report_date,
+               CASE WHEN g %% 100 < 2 THEN 'pending_master'
+                    WHEN g %% 100 < 4 THEN 'pending_kiok'
+                    WHEN g %% 100 < 6 THEN 'rejected'
+                    ELSE 'approved' END AS status
+    ) s
+"""
+
+# (название, запрос, параметры, допустимые индексы)
+def _hot_queries(discipline_id: int, brigade_name: str, report_date: str):
+    return [
+        (
+            "Очередь мастера",
+            "SELECT id, created_at FROM reports WHERE workflow_status = %s AND discipline_id = %s "
+            "ORDER BY created_at ASC, id ASC LIMIT 11",
+            ('pending_master', discipline_id),
+            {'idx_reports_master_queue'},
+        ),
+        (
+            "Очередь КИОК",
+            "SELECT id, master_signed_at FROM reports WHERE workflow_status = %s AND discipline_id = %s "
+            "ORDER BY master_signed_at ASC, id ASC LIMIT 11",
+            ('pending_kiok', discipline_id),
+            {'idx_reports_kiok_queue'},
+        ),
+        (
+            "Проверка табеля (людей в отчетах бригады за день)",
+            "SELECT COALESCE(SUM(people_count), 0)::integer FROM reports "
+            "WHERE brigade_name = %s AND report_date = %s",
+            (brigade_name, report_date),
+            {'idx_reports_brigade_date'},
+        ),
+        (
+            "Удаление отчетов бригады за день",
+            "DELETE FROM reports WHERE brigade_name = %s AND report_date = %s",
+            (brigade_name, report_date),
+            {'idx_reports_brigade_date'},
+        ),
+        (
+            "Согласованные отчеты за день (сводка/дашборд)",
+            "SELECT discipline_id, brigade_name, work_type_name FROM reports "
+            "WHERE report_date = %s AND workflow_status = %s",
+            (report_date, 'approved'),
+            {'idx_reports_date_status'},
+        ),
+        (
+            "Напоминания о зависших отчетах",
+            "SELECT id FROM reports WHERE workflow_status = 'pending_master' "
+            "AND created_at <= NOW() - INTERVAL '2 days'",
+            (),
+            {'idx_reports_pending_master_created', 'idx_reports_master_queue'},
+        ),
+    ]
+
+def _plan_indexes(node: dict) -> set:
+    """Индексы, которые использует план (рекурсивно по всем узлам)"""
+    indexes = set()
+    if node.get('Index Name'):
+        indexes.add(node['Index Name'])
+    for child in node.get('Plans', []):
+        indexes |= _plan_indexes(child)
+    return indexes
+
+def _plan_root(raw) -> dict:
+    plan = json.loads(raw) if isinstance(raw, str) else raw
+    return plan[0]['Plan']
+
+def main():
+    try:
+        from database.connection import db_manager
+
+        rows = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_SEED_ROWS
+        conn = db_manager.get_sync_connection()
+        failed = 0
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO disciplines (name)
+                    SELECT 'Проверка индексов ' || g FROM generate_series(1, %s) AS g
+                    ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+                    RETURNING id
+                """, (SEED_DISCIPLINES,))
+                discipline_ids = [row[0] for row in cursor.fetchall()]
+
+                print(f"🔄 Вставка {rows} тестовых отчетов...")
+                cursor.execute(_SEED_SQL, {
+                    'rows': rows, 'days': SEED_DAYS, 'brigades': SEED_BRIGADES,
+                    'disciplines': SEED_DISCIPLINES, 'discipline_ids': discipline_ids,
+                })
+                cursor.execute("ANALYZE reports")
+
+                cursor.execute("SELECT CURRENT_DATE - 7")
+                report_date = cursor.fetchone()[0].isoformat()
+                queries = _hot_queries(discipline_ids[0], 'Бригада проверки 7', report_date)
+
+                for title, sql, params, expected in queries:
+                    cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+                    plan = _plan_root(cursor.fetchone()[0])
+                    used = _plan_indexes(plan)
+                    if used & expected:
+                        print(f"✅ {title}: {plan['Node Type']} по {', '.join(sorted(used & expected))}")
+                    else:
+                        failed += 1
+                        found = ', '.join(sorted(used)) or 'без индекса'
+                        print(f"❌ {title}: {plan['Node Type']} ({found}), "
+                              f"ожидался {' или '.join(sorted(expected))}")
+        finally:
+            # Тестовые данные не сохраняем
+            conn.rollback()
+            conn.close()
+
+        if failed:
+            print(f"❌ Запросов без нужного индекса: {failed}")
+            return 1
+        print("✅ Все горячие запросы используют индексы")
+        return 0
+
+    except ValueError as e:
+        print(f"❌ Неверное число строк: {e}")
+        return 1
+    except Exception as e:
+        print(f"❌ Критическая ошибка: {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,10 +15,24 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 WEB_APP_URL = os.getenv("WEB_APP_URL")
 REPORTS_GROUP_URL = "https://t.me/+OdHnUNt1WaZiMDY6"
 
+# Режим получения апдейтов: polling (один процесс) или webhook (несколько реплик за балансировщиком)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
 # Проверка обязательных переменных
 if not TOKEN or not DATABASE_URL or not WEB_APP_URL:
     raise ValueError("КРИТИЧЕСКАЯ ОШИБКА: Переменные TOKEN, DATABASE_URL или WEB_APP_URL не заданы в .env файле!")
 
+if BOT_MODE not in ("polling", "webhook"):
+    raise ValueError(f"КРИТИЧЕСКАЯ ОШИБКА: Неизвестный BOT_MODE '{BOT_MODE}' (ожидается polling или webhook)")
+
+if BOT_MODE == "webhook" and not WEBHOOK_URL:
+    raise ValueError("КРИТИЧЕСКАЯ ОШИБКА: Для BOT_MODE=webhook нужна переменная WEBHOOK_URL!")
+
 # Таймауты и лимиты
 SESSION_TIMEOUT_SECONDS = 300
 REPORTS_PER_PAGE = 5
@@ -26,6 +40,88 @@ NORM_PER_PERSON = 5
 USERS_PER_PAGE = 10
 ELEMENTS_PER_PAGE = 10
 BACKUP_RETENTION_DAYS = 7
+ROLE_CACHE_TTL_SECONDS = 60
+# Справочники (дисциплины, объекты, виды работ, роли) сбрасываются при изменении; TTL - для других экземпляров бота
+REFERENCE_CACHE_TTL_SECONDS = 300
+# Справочник пользователей: запись перечитывается из БД после TTL (изменения с других экземпляров бота),
+# отсутствие пользователя помнится недолго - новый пользователь с другого экземпляра появится быстро
+USER_DIRECTORY_TTL_SECONDS = 300
+USER_DIRECTORY_MISS_TTL_SECONDS = 30
+# Главное меню без запросов к БД: поданные за день табели (перечитываются для других экземпляров бота),
+# счетчики очередей мастера/КИОК на кнопках и число готовых вариантов меню в кэше
+ROSTER_STATUS_TTL_SECONDS = 60
+PENDING_COUNT_CACHE_TTL_SECONDS = 30
+MENU_CACHE_MAX_ENTRIES = 256
+# Как часто bot_data/user_data/разговоры сбрасываются в bot_persistence
+PERSISTENCE_UPDATE_INTERVAL_SECONDS = 5
+# Версия bot_persistence берется до коммита: строки моложе этого окна перечитываются при следующей синхронизации,
+# пока не станет ясно, что записи с меньшими версиями других реплик уже закоммичены
+PERSISTENCE_SYNC_OVERLAP_SECONDS = 30
+# Общий SQLAlchemy engine (pandas/экспорт) и размер порции строк при потоковой выгрузке в Excel
+SQLALCHEMY_POOL_SIZE = 2
+SQLALCHEMY_MAX_OVERFLOW = 3
+EXPORT_FETCH_CHUNK_ROWS = 2000
+# Фоновые выгрузки: число процессов и как часто обновлять сообщение с прогрессом
+EXPORT_JOB_WORKERS = 2
+EXPORT_PROGRESS_INTERVAL_SECONDS = 3
+# Пакетное согласование: сколько отчетов можно отметить за раз и сколько строк показать в сводном уведомлении
+BATCH_APPROVAL_MAX_REPORTS = 50
+BATCH_NOTIFICATION_MAX_LINES = 15
+
+# Массовые рассылки (лимиты Telegram: ~30 сообщений/сек на бота, ~1 сообщение/сек в один чат)
+BROADCAST_MESSAGES_PER_SECOND = 25
+BROADCAST_PER_CHAT_INTERVAL_SECONDS = 1.0
+BROADCAST_WORKERS = 8
+BROADCAST_MAX_ATTEMPTS = 4
+
+# Фоновая очистка чата: deleteMessages удаляет до 100 сообщений за вызов; сколько id помнить на пользователя и повторы при сбоях
+CHAT_CLEANUP_BATCH_SIZE = 100
+CHAT_TRACKED_MESSAGES_MAX = 50
+CHAT_CLEANUP_MAX_ATTEMPTS = 3
+CHAT_CLEANUP_RETRY_SECONDS = 2.0
+
+# Логирование: запись на диск идет в отдельном потоке (QueueListener), файл - JSON-строки с ротацией.
+# LOG_LEVELS - уровни отдельных логгеров через запятую: "httpx=WARNING,services.roster_service=DEBUG"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+LOG_LEVELS = os.getenv("LOG_LEVELS", "httpx=WARNING,httpcore=WARNING,apscheduler=WARNING,telegram.ext=INFO")
+# Частые события: с одного места в коде не больше LOG_SAMPLE_BURST записей за окно (ERROR и выше - всегда)
+LOG_SAMPLE_WINDOW_SECONDS = 60
+LOG_SAMPLE_BURST = 20
+
+# Метрики производительности: эндпоинт Prometheus (порт 0 - выключен) и пороги предупреждений в логе
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+PERF_SLOW_UPDATE_SECONDS = 2.0
+PERF_DB_CALLS_WARN = 25
+
+# Параллельная обработка апдейтов: разные пользователи - одновременно, один пользователь - строго по очереди.
+# Общий лимит держим ниже размера пула asyncpg (20), лишние апдейты ждут в очереди
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "16"))
+UPDATE_USER_QUEUE_DEPTH = int(os.getenv("UPDATE_USER_QUEUE_DEPTH", "10"))
+UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "1024"))
+
+# Часовой пояс планировщика; по нему же считается "сегодня" для табелей и ежедневных напоминаний
+BOT_TIMEZONE = 'Asia/Tashkent'
+
+# Очередь уведомлений (таблица scheduled_notifications)
+NOTIFICATION_QUEUE_POLL_SECONDS = 5
+NOTIFICATION_QUEUE_BATCH_SIZE = 50
+NOTIFICATION_MAX_ATTEMPTS = 5
+NOTIFICATION_LEASE_SECONDS = 300
+NOTIFICATION_SPREAD_SECONDS = 120
+NOTIFICATION_CATCHUP_HOURS = 2
+
+# Outbox доменных событий (таблица domain_events): побочные эффекты согласования отчетов - в фоне
+DOMAIN_EVENTS_POLL_SECONDS = 5
+DOMAIN_EVENTS_BATCH_SIZE = 100
+DOMAIN_EVENTS_MAX_ATTEMPTS = 8
+DOMAIN_EVENTS_LEASE_SECONDS = 300
+DOMAIN_EVENTS_RETRY_SECONDS = 30
+# Группа отчетов для публикации согласованных отчетов в темы дисциплин (topic_mappings); пусто - не публикуем
+REPORTS_GROUP_CHAT_ID = os.getenv("REPORTS_GROUP_CHAT_ID")
 
 # Класс для объединения всех настроек
 class Settings:
@@ -3,9 +3,9 @@ Database layer для Telegram бота
 """
 
 from .connection import DatabaseManager
-from .queries import db_query, db_execute, db_query_single
+from .queries import db_query, db_execute, db_query_single, db_transaction
 
 # Глобальный экземпляр менеджера БД
 db_manager = DatabaseManager()
 
-__all__ = ['db_manager', 'db_query', 'db_execute', 'db_query_single']
\ No newline at end of file
+__all__ = ['db_manager', 'db_query', 'db_execute', 'db_query_single', 'db_transaction']
\ No newline at end of file
@@ -1,28 +1,60 @@
 # database/connection.py
+import json
 import asyncpg
 import psycopg2
 import logging
-from config.settings import DATABASE_URL
+import threading
+from datetime import date, datetime
+from config.settings import DATABASE_URL, SQLALCHEMY_POOL_SIZE, SQLALCHEMY_MAX_OVERFLOW
 
 logger = logging.getLogger(__name__)
 
+def _encode_date(value) -> str:
+    """Кодирует дату для asyncpg: принимает date/datetime и строки 'YYYY-MM-DD' (как psycopg2)."""
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+def _encode_json(value) -> str:
+    """Кодирует JSON для asyncpg: строки (json.dumps) передаются как есть, остальное сериализуется."""
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
+
+async def _init_connection(conn):
+    """Настраивает кодеки соединения пула, чтобы типы совпадали с psycopg2."""
+    # psycopg2 отдает JSON/JSONB как dict/list - делаем так же
+    for json_type in ('json', 'jsonb'):
+        await conn.set_type_codec(
+            json_type, encoder=_encode_json, decoder=json.loads,
+            schema='pg_catalog', format='text'
+        )
+    # Большинство запросов передают дату строкой 'YYYY-MM-DD'
+    await conn.set_type_codec(
+        'date', encoder=_encode_date, decoder=date.fromisoformat,
+        schema='pg_catalog', format='text'
+    )
+
 class DatabaseManager:
     """
     Универсальный менеджер для управления соединениями PostgreSQL (ASYNC + SYNC).
     """
     _async_pool = None
+    _sqlalchemy_engine = None
+    _engine_lock = threading.Lock()
 
     @classmethod
     async def initialize(cls):
         """Инициализирует асинхронный пул соединений."""
         if cls._async_pool:
-            logger.warning("Асинхронный пул соединений уже инициализирован.")
+            logger.debug("Асинхронный пул соединений уже инициализирован.")
             return
         try:
             cls._async_pool = await asyncpg.create_pool(
                 dsn=DATABASE_URL,
                 min_size=5,
-                max_size=20
+                max_size=20,
+                init=_init_connection
             )
             logger.info("✅ Асинхронный пул соединений с БД успешно создан.")
         except Exception as e:
@@ -45,6 +77,25 @@ class DatabaseManager:
             logger.error(f"Ошибка создания синхронного соединения: {e}")
             raise
 
+    @classmethod
+    def get_sqlalchemy_engine(cls):
+        """
+        Возвращает общий SQLAlchemy engine с пулом соединений (pandas, экспорт в Excel).
+        Вызывается и из потоков пула, поэтому создание под блокировкой.
+        """
+        if cls._sqlalchemy_engine is None:
+            with cls._engine_lock:
+                if cls._sqlalchemy_engine is None:
+                    from sqlalchemy import create_engine
+                    cls._sqlalchemy_engine = create_engine(
+                        DATABASE_URL,
+                        pool_size=SQLALCHEMY_POOL_SIZE,
+                        max_overflow=SQLALCHEMY_MAX_OVERFLOW,
+                        pool_pre_ping=True
+                    )
+                    logger.info("✅ SQLAlchemy engine создан.")
+        return cls._sqlalchemy_engine
+
     @classmethod
     async def close(cls):
         """Закрывает все пулы соединений."""
@@ -52,6 +103,9 @@ class DatabaseManager:
             await cls._async_pool.close()
             cls._async_pool = None
             logger.info("✅ Асинхронный пул соединений с БД закрыт.")
+        if cls._sqlalchemy_engine is not None:
+            cls._sqlalchemy_engine.dispose()
+            cls._sqlalchemy_engine = None
 
 # Создаем единый экземпляр для всего приложения
 db_manager = DatabaseManager()
\ No newline at end of file
@@ -1,462 +1,725 @@
 import logging
-from database.queries import db_execute, db_query
+import time
+
+import asyncpg
+
+from database.queries import db_transaction
 
 logger = logging.getLogger(__name__)
 
-async def create_initial_tables():
-    """Создает все необходимые таблицы с унифицированной схемой."""
+# Ключ advisory-блокировки: реплики, стартующие одновременно, применяют миграции по очереди
+_MIGRATION_LOCK_KEY = 720_001
+
+_INITIAL_TABLES_SQL = [
+    # Дисциплины
+    """
+    CREATE TABLE IF NOT EXISTS disciplines (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
     
-    tables_sql = [
-        # ... (все ваши таблицы до 'reports' остаются без изменений) ...
-        
-        # Дисциплины
-        """
-        CREATE TABLE IF NOT EXISTS disciplines (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL UNIQUE,
-            description TEXT,
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # Объекты строительства
-        """
-        CREATE TABLE IF NOT EXISTS construction_objects (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL UNIQUE,
-            display_order INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # Типы работ
-        """
-        CREATE TABLE IF NOT EXISTS work_types (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL,
-            discipline_id INTEGER NOT NULL REFERENCES disciplines(id),
-            unit_of_measure TEXT,
-            norm_per_unit REAL,
-            display_order INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # Админы
-        """
-        CREATE TABLE IF NOT EXISTS admins (
-            user_id VARCHAR(255) PRIMARY KEY,
-            first_name TEXT,
-            last_name TEXT,
-            username TEXT,
-            phone_number TEXT,
-            language_code VARCHAR(2) DEFAULT 'ru',
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # Менеджеры
-        """
-        CREATE TABLE IF NOT EXISTS managers (
-            user_id VARCHAR(255) PRIMARY KEY,
-            level INTEGER NOT NULL,
-            discipline INTEGER REFERENCES disciplines(id),
-            first_name TEXT,
-            last_name TEXT,
-            username TEXT,
-            phone_number TEXT,
-            language_code VARCHAR(2) DEFAULT 'ru',
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # Бригады
-        """
-        CREATE TABLE IF NOT EXISTS brigades (
-            user_id VARCHAR(255) PRIMARY KEY,
-            brigade_name TEXT NOT NULL,
-            discipline_id INTEGER REFERENCES disciplines(id),
-            first_name TEXT,
-            last_name TEXT,
-            username TEXT,
-            phone_number TEXT,
-            language_code VARCHAR(2) DEFAULT 'ru',
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # ПТО
-        """
-        CREATE TABLE IF NOT EXISTS pto (
-            user_id VARCHAR(255) PRIMARY KEY,
-            discipline_id INTEGER REFERENCES disciplines(id),
-            first_name TEXT,
-            last_name TEXT,
-            username TEXT,
-            phone_number TEXT,
-            language_code VARCHAR(2) DEFAULT 'ru',
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # Супервайзеры
-        """
-        CREATE TABLE IF NOT EXISTS supervisors (
-            user_id VARCHAR(255) PRIMARY KEY,
-            supervisor_name TEXT NOT NULL,
-            discipline_id INTEGER REFERENCES disciplines(id),
-            brigade_ids TEXT[],
-            phone_number TEXT,
-            language_code VARCHAR(2) DEFAULT 'ru',
-            is_active BOOLEAN DEFAULT true,
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # Мастера
-        """
-        CREATE TABLE IF NOT EXISTS masters (
-            user_id VARCHAR(255) PRIMARY KEY,
-            master_name TEXT NOT NULL,
-            discipline_id INTEGER REFERENCES disciplines(id),
-            can_approve_reports BOOLEAN DEFAULT true,
-            signature_template TEXT,
-            phone_number TEXT,
-            language_code VARCHAR(2) DEFAULT 'ru',
-            is_active BOOLEAN DEFAULT true,
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # КИОК
-        """
-        CREATE TABLE IF NOT EXISTS kiok (
-            user_id VARCHAR(255) PRIMARY KEY,
-            kiok_name TEXT NOT NULL,
-            discipline_id INTEGER REFERENCES disciplines(id),
-            inspection_permissions TEXT[],
-            phone_number TEXT,
-            language_code VARCHAR(2) DEFAULT 'ru',
-            is_active BOOLEAN DEFAULT true,
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # Отчеты (FIXED)
-        """
-        CREATE TABLE IF NOT EXISTS reports (
-            id SERIAL PRIMARY KEY,
-            created_at TIMESTAMP DEFAULT NOW(),
-            supervisor_id VARCHAR(255) REFERENCES supervisors(user_id),
+    # Объекты строительства
+    """
+    CREATE TABLE IF NOT EXISTS construction_objects (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        display_order INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # Типы работ
+    """
+    CREATE TABLE IF NOT EXISTS work_types (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL,
+        discipline_id INTEGER NOT NULL REFERENCES disciplines(id),
+        unit_of_measure TEXT,
+        norm_per_unit REAL,
+        display_order INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # Админы
+    """
+    CREATE TABLE IF NOT EXISTS admins (
+        user_id VARCHAR(255) PRIMARY KEY,
+        first_name TEXT,
+        last_name TEXT,
+        username TEXT,
+        phone_number TEXT,
+        language_code VARCHAR(2) DEFAULT 'ru',
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # Менеджеры
+    """
+    CREATE TABLE IF NOT EXISTS managers (
+        user_id VARCHAR(255) PRIMARY KEY,
+        level INTEGER NOT NULL,
+        discipline INTEGER REFERENCES disciplines(id),
+        first_name TEXT,
+        last_name TEXT,
+        username TEXT,
+        phone_number TEXT,
+        language_code VARCHAR(2) DEFAULT 'ru',
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # Бригады
+    """
+    CREATE TABLE IF NOT EXISTS brigades (
+        user_id VARCHAR(255) PRIMARY KEY,
+        brigade_name TEXT NOT NULL,
+        discipline_id INTEGER REFERENCES disciplines(id),
+        first_name TEXT,
+        last_name TEXT,
+        username TEXT,
+        phone_number TEXT,
+        language_code VARCHAR(2) DEFAULT 'ru',
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # ПТО
+    """
+    CREATE TABLE IF NOT EXISTS pto (
+        user_id VARCHAR(255) PRIMARY KEY,
+        discipline_id INTEGER REFERENCES disciplines(id),
+        first_name TEXT,
+        last_name TEXT,
+        username TEXT,
+        phone_number TEXT,
+        language_code VARCHAR(2) DEFAULT 'ru',
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # Супервайзеры
+    """
+    CREATE TABLE IF NOT EXISTS supervisors (
+        user_id VARCHAR(255) PRIMARY KEY,
+        supervisor_name TEXT NOT NULL,
+        discipline_id INTEGER REFERENCES disciplines(id),
+        brigade_ids TEXT[],
+        phone_number TEXT,
+        language_code VARCHAR(2) DEFAULT 'ru',
+        is_active BOOLEAN DEFAULT true,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # Мастера
+    """
+    CREATE TABLE IF NOT EXISTS masters (
+        user_id VARCHAR(255) PRIMARY KEY,
+        master_name TEXT NOT NULL,
+        discipline_id INTEGER REFERENCES disciplines(id),
+        can_approve_reports BOOLEAN DEFAULT true,
+        signature_template TEXT,
+        phone_number TEXT,
+        language_code VARCHAR(2) DEFAULT 'ru',
+        is_active BOOLEAN DEFAULT true,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # КИОК
+    """
+    CREATE TABLE IF NOT EXISTS kiok (
+        user_id VARCHAR(255) PRIMARY KEY,
+        kiok_name TEXT NOT NULL,
+        discipline_id INTEGER REFERENCES disciplines(id),
+        inspection_permissions TEXT[],
+        phone_number TEXT,
+        language_code VARCHAR(2) DEFAULT 'ru',
+        is_active BOOLEAN DEFAULT true,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # Отчеты (FIXED)
+    """
+    CREATE TABLE IF NOT EXISTS reports (
+        id SERIAL PRIMARY KEY,
+        created_at TIMESTAMP DEFAULT NOW(),
+        supervisor_id VARCHAR(255) REFERENCES supervisors(user_id),
+        report_date DATE NOT NULL,
+        brigade_name TEXT NOT NULL,
+        corpus_name TEXT NOT NULL,
+        discipline_id INTEGER REFERENCES disciplines(id),
+        work_type_name TEXT NOT NULL,
+        workflow_status VARCHAR(50) DEFAULT 'pending_master',
+        supervisor_signed_at TIMESTAMP,
+        master_id VARCHAR(255) REFERENCES masters(user_id),
+        master_signed_at TIMESTAMP,
+        master_signature_path TEXT,
+        kiok_id VARCHAR(255) REFERENCES kiok(user_id),
+        kiok_signed_at TIMESTAMP,
+        kiok_inspection_number TEXT,
+        kiok_attachments JSONB DEFAULT '[]',
+        kiok_remark_document TEXT,
+        kiok_notes TEXT,
+        report_data JSONB DEFAULT '{}'
+    )
+    """,
+    
+    # Справочник бригад
+    """
+    CREATE TABLE IF NOT EXISTS brigades_reference (
+        id SERIAL PRIMARY KEY,
+        brigade_name TEXT NOT NULL UNIQUE,
+        discipline_id INTEGER REFERENCES disciplines(id),
+        supervisor_id VARCHAR(255) REFERENCES supervisors(user_id),
+        brigade_size INTEGER DEFAULT 0,
+        is_active BOOLEAN DEFAULT true,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # Topic mappings
+    """
+    CREATE TABLE IF NOT EXISTS topic_mappings (
+        id SERIAL PRIMARY KEY,
+        telegram_topic_id INTEGER,
+        discipline_id INTEGER REFERENCES disciplines(id),
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # Personnel roles
+    """
+    CREATE TABLE IF NOT EXISTS personnel_roles (
+        id SERIAL PRIMARY KEY,
+        role_name TEXT NOT NULL UNIQUE,
+        category TEXT,
+        display_order INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    
+    # Daily rosters
+    """
+    CREATE TABLE IF NOT EXISTS daily_rosters (
+        id SERIAL PRIMARY KEY,
+        brigade_user_id VARCHAR(255) NOT NULL,
+        roster_date DATE NOT NULL,
+        total_personnel INTEGER DEFAULT 0,
+        is_submitted BOOLEAN DEFAULT false,
+        submitted_at TIMESTAMP,
+        created_at TIMESTAMP DEFAULT NOW(),
+        UNIQUE(brigade_user_id, roster_date)
+    )
+    """,
+    
+    # Daily roster details
+    """
+    CREATE TABLE IF NOT EXISTS daily_roster_details (
+        id SERIAL PRIMARY KEY,
+        roster_id INTEGER REFERENCES daily_rosters(id) ON DELETE CASCADE,
+        role_id INTEGER REFERENCES personnel_roles(id),
+        personnel_count INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT NOW(),
+        UNIQUE(roster_id, role_id)
+    )
+    """,
+
+    """
+    CREATE TABLE IF NOT EXISTS scheduled_notifications (
+        id SERIAL PRIMARY KEY,
+        user_id VARCHAR(20) NOT NULL,
+        notification_type VARCHAR(50) NOT NULL,
+        scheduled_time TIMESTAMP WITH TIME ZONE NOT NULL,
+        message_text TEXT NOT NULL,
+        is_sent BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+_INDEXES_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_reports_supervisor ON reports(supervisor_id)",
+    "CREATE INDEX IF NOT EXISTS idx_reports_date ON reports(report_date)",
+    "CREATE INDEX IF NOT EXISTS idx_reports_status ON reports(workflow_status)",
+    # # FIXED: Индекс для discipline_id
+    "CREATE INDEX IF NOT EXISTS idx_reports_discipline ON reports(discipline_id)",
+    "CREATE INDEX IF NOT EXISTS idx_daily_rosters_date ON daily_rosters(roster_date)",
+    "CREATE INDEX IF NOT EXISTS idx_daily_rosters_brigade ON daily_rosters(brigade_user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_work_types_discipline ON work_types(discipline_id)",
+    "CREATE INDEX IF NOT EXISTS idx_reports_master ON reports(master_id)",
+    "CREATE INDEX IF NOT EXISTS idx_reports_kiok ON reports(kiok_id)",
+    # # FIXED: Индексы для discipline_id в таблицах ролей
+    "CREATE INDEX IF NOT EXISTS idx_supervisors_discipline ON supervisors(discipline_id)",
+    "CREATE INDEX IF NOT EXISTS idx_masters_discipline ON masters(discipline_id)",
+    "CREATE INDEX IF NOT EXISTS idx_kiok_discipline ON kiok(discipline_id)",
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_notifications_user_id ON scheduled_notifications(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_notifications_scheduled_time ON scheduled_notifications(scheduled_time)",
+    "CREATE INDEX IF NOT EXISTS idx_scheduled_notifications_is_sent ON scheduled_notifications(is_sent)"
+]
+
+_NOTIFICATION_QUEUE_SQL = [
+    "ALTER TABLE scheduled_notifications ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'pending'",
+    "ALTER TABLE scheduled_notifications ADD COLUMN IF NOT EXISTS payload JSONB DEFAULT '{}'",
+    "ALTER TABLE scheduled_notifications ADD COLUMN IF NOT EXISTS dedupe_key TEXT",
+    "ALTER TABLE scheduled_notifications ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE scheduled_notifications ADD COLUMN IF NOT EXISTS max_attempts INTEGER NOT NULL DEFAULT 5",
+    "ALTER TABLE scheduled_notifications ADD COLUMN IF NOT EXISTS last_error TEXT",
+    "ALTER TABLE scheduled_notifications ADD COLUMN IF NOT EXISTS locked_by TEXT",
+    "ALTER TABLE scheduled_notifications ADD COLUMN IF NOT EXISTS locked_at TIMESTAMP WITH TIME ZONE",
+    "ALTER TABLE scheduled_notifications ADD COLUMN IF NOT EXISTS sent_at TIMESTAMP WITH TIME ZONE",
+    # Старые записи, уже отправленные до появления статусов
+    "UPDATE scheduled_notifications SET status = 'sent' WHERE is_sent = true AND status = 'pending'",
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_scheduled_notifications_dedupe_key ON scheduled_notifications(dedupe_key)",
+    """CREATE INDEX IF NOT EXISTS idx_scheduled_notifications_due
+       ON scheduled_notifications(scheduled_time) WHERE status IN ('pending', 'sending')""",
+]
+
+_BOT_PERSISTENCE_SQL = [
+    "CREATE SEQUENCE IF NOT EXISTS bot_persistence_version_seq",
+    """
+    CREATE TABLE IF NOT EXISTS bot_persistence (
+        kind VARCHAR(100) NOT NULL,
+        key TEXT NOT NULL,
+        data BYTEA,
+        version BIGINT NOT NULL,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (kind, key)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_bot_persistence_version ON bot_persistence(kind, version)",
+]
+
+_BASE_DISCIPLINES = [
+    'Механомонтаж', 'Бетонные работы', 'КИПиА', 'Металлоконструкция',
+    'Отделочные работы', 'Трубопровод', 'Земляные работы', 'Электромонтажные работы'
+]
+
+_ROLES_BY_DISCIPLINE = {
+    'Механомонтаж': [
+        'Слесарь-монтажник 6 разряда',
+        'Слесарь-монтажник 5 разряда', 
+        'Слесарь-монтажник 4 разряда',
+        'Помощник слесаря',
+        'Крановщик',
+        'Стропальщик',
+        'Монтажник оборудования',
+        'Мастер участка'
+    ],
+    'Бетонные работы': [
+        'Бетонщик 6 разряда',
+        'Бетонщик 5 разряда',
+        'Бетонщик 4 разряда',
+        'Арматурщик 6 разряда',
+        'Арматурщик 5 разряда',
+        'Помощник бетонщика',
+        'Машинист бетононасоса',
+        'Мастер участка'
+    ],
+    'КИПиА': [
+        'Слесарь КИПиА 6 разряда',
+        'Слесарь КИПиА 5 разряда',
+        'Электромонтер КИПиА 6 разряда',
+        'Электромонтер КИПиА 5 разряда',
+        'Наладчик КИПиА',
+        'Помощник монтажника',
+        'Мастер участка'
+    ],
+    'Металлоконструкция': [
+        'Сварщик 6 разряда',
+        'Сварщик 5 разряда',
+        'Сварщик 4 разряда',
+        'Слесарь по сборке 6 разряда',
+        'Слесарь по сборке 5 разряда',
+        'Помощник сварщика',
+        'Крановщик',
+        'Стропальщик',
+        'Мастер участка'
+    ],
+    'Отделочные работы': [
+        'Маляр 6 разряда',
+        'Маляр 5 разряда',
+        'Штукатур 6 разряда',
+        'Штукатур 5 разряда',
+        'Плиточник 6 разряда',
+        'Плиточник 5 разряда',
+        'Помощник отделочника',
+        'Мастер участка'
+    ],
+    'Трубопровод': [
+        'Сварщик труб 6 разряда',
+        'Сварщик труб 5 разряда',
+        'Монтажник труб 6 разряда',
+        'Монтажник труб 5 разряда',
+        'Слесарь-трубопроводчик 6 разряда',
+        'Слесарь-трубопроводчик 5 разряда',
+        'Помощник монтажника',
+        'Изолировщик',
+        'Мастер участка'
+    ],
+    'Земляные работы': [
+        'Машинист экскаватора 6 разряда',
+        'Машинист экскаватора 5 разряда',
+        'Машинист бульдозера 6 разряда',
+        'Машинист бульдозера 5 разряда',
+        'Тракторист',
+        'Землекоп',
+        'Стропальщик',
+        'Мастер участка'
+    ],
+    'Электромонтажные работы': [
+        'Электромонтажник 6 разряда',
+        'Электромонтажник 5 разряда',
+        'Электромонтажник 4 разряда',
+        'Кабельщик-спайщик 6 разряда',
+        'Кабельщик-спайщик 5 разряда',
+        'Электрик 6 разряда',
+        'Электрик 5 разряда',
+        'Помощник электрика',
+        'Мастер участка'
+    ]
+}
+
+
+async def _add_discipline_to_personnel_roles(tx):
+    """Добавляет поле discipline_id в таблицу personnel_roles"""
+    await tx.execute(
+        "ALTER TABLE personnel_roles ADD COLUMN IF NOT EXISTS discipline_id INTEGER REFERENCES disciplines(id)"
+    )
+
+async def _seed_personnel_roles(tx):
+    """Базовые дисциплины и роли персонала - только в пустой БД, по одному INSERT на таблицу"""
+    await tx.execute("""
+        INSERT INTO disciplines (name)
+        SELECT unnest(%s::text[])
+        WHERE NOT EXISTS (SELECT 1 FROM disciplines)
+        ON CONFLICT (name) DO NOTHING
+    """, (_BASE_DISCIPLINES,))
+
+    role_names, discipline_names, display_orders = [], [], []
+    for discipline_name, discipline_roles in _ROLES_BY_DISCIPLINE.items():
+        for i, role_name in enumerate(discipline_roles, 1):
+            role_names.append(role_name)
+            discipline_names.append(discipline_name)
+            display_orders.append(i)
+
+    # role_name уникален, поэтому общие роли ('Мастер участка', 'Крановщик'...) достаются первой дисциплине
+    created = await tx.execute("""
+        INSERT INTO personnel_roles (role_name, discipline_id, display_order, category)
+        SELECT r.role_name, d.id, r.display_order, 'Основной персонал'
+        FROM unnest(%s::text[], %s::text[], %s::int[]) WITH ORDINALITY AS r(role_name, discipline_name, display_order, n)
+        JOIN disciplines d ON d.name = r.discipline_name
+        WHERE NOT EXISTS (SELECT 1 FROM personnel_roles)
+        ORDER BY d.name, r.n
+        ON CONFLICT (role_name) DO NOTHING
+    """, (role_names, discipline_names, display_orders))
+
+    if created:
+        logger.info(f"✅ Создано {created} ролей персонала по дисциплинам")
+
+async def _create_production_rollup(tx):
+    """Дневная сводка выработки для дашбордов и ее первичное заполнение из согласованных отчетов"""
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS daily_production_rollup (
             report_date DATE NOT NULL,
+            discipline_id INTEGER NOT NULL,
             brigade_name TEXT NOT NULL,
-            corpus_name TEXT NOT NULL,
-            discipline_id INTEGER REFERENCES disciplines(id),
             work_type_name TEXT NOT NULL,
-            workflow_status VARCHAR(50) DEFAULT 'pending_master',
-            supervisor_signed_at TIMESTAMP,
-            master_id VARCHAR(255) REFERENCES masters(user_id),
-            master_signed_at TIMESTAMP,
-            master_signature_path TEXT,
-            kiok_id VARCHAR(255) REFERENCES kiok(user_id),
-            kiok_signed_at TIMESTAMP,
-            kiok_inspection_number TEXT,
-            kiok_attachments JSONB DEFAULT '[]',
-            kiok_remark_document TEXT,
-            kiok_notes TEXT,
-            report_data JSONB DEFAULT '{}'
-        )
-        """,
-        
-        # Справочник бригад
-        """
-        CREATE TABLE IF NOT EXISTS brigades_reference (
-            id SERIAL PRIMARY KEY,
-            brigade_name TEXT NOT NULL UNIQUE,
-            discipline_id INTEGER REFERENCES disciplines(id),
-            supervisor_id VARCHAR(255) REFERENCES supervisors(user_id),
-            brigade_size INTEGER DEFAULT 0,
-            is_active BOOLEAN DEFAULT true,
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # Topic mappings
-        """
-        CREATE TABLE IF NOT EXISTS topic_mappings (
-            id SERIAL PRIMARY KEY,
-            telegram_topic_id INTEGER,
-            discipline_id INTEGER REFERENCES disciplines(id),
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # Personnel roles
-        """
-        CREATE TABLE IF NOT EXISTS personnel_roles (
-            id SERIAL PRIMARY KEY,
-            role_name TEXT NOT NULL UNIQUE,
-            category TEXT,
-            display_order INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT NOW()
-        )
-        """,
-        
-        # Daily rosters
-        """
-        CREATE TABLE IF NOT EXISTS daily_rosters (
-            id SERIAL PRIMARY KEY,
-            brigade_user_id VARCHAR(255) NOT NULL,
-            roster_date DATE NOT NULL,
-            total_personnel INTEGER DEFAULT 0,
-            is_submitted BOOLEAN DEFAULT false,
-            submitted_at TIMESTAMP,
-            created_at TIMESTAMP DEFAULT NOW(),
-            UNIQUE(brigade_user_id, roster_date)
-        )
-        """,
-        
-        # Daily roster details
-        """
-        CREATE TABLE IF NOT EXISTS daily_roster_details (
-            id SERIAL PRIMARY KEY,
-            roster_id INTEGER REFERENCES daily_rosters(id) ON DELETE CASCADE,
-            role_id INTEGER REFERENCES personnel_roles(id),
-            personnel_count INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT NOW(),
-            UNIQUE(roster_id, role_id)
-        )
-        """,
-
-        """
-        CREATE TABLE IF NOT EXISTS scheduled_notifications (
-            id SERIAL PRIMARY KEY,
-            user_id VARCHAR(20) NOT NULL,
-            notification_type VARCHAR(50) NOT NULL,
-            scheduled_time TIMESTAMP WITH TIME ZONE NOT NULL,
-            message_text TEXT NOT NULL,
-            is_sent BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            work_type_id INTEGER,
+            norm_per_unit REAL,
+            report_count INTEGER NOT NULL DEFAULT 0,
+            people_count NUMERIC NOT NULL DEFAULT 0,
+            volume NUMERIC NOT NULL DEFAULT 0,
+            planned_volume NUMERIC NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (report_date, discipline_id, brigade_name, work_type_name)
         )
-        """,
-    ]
-    
-    try:
-        for sql in tables_sql:
-            await db_execute(sql)
-        
-        logger.info("✅ Все таблицы созданы успешно")
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ Критическая ошибка при создании таблиц: {e}")
-        return False
+    """)
+    await tx.execute(
+        "CREATE INDEX IF NOT EXISTS idx_production_rollup_discipline ON daily_production_rollup(discipline_id, report_date)"
+    )
 
-async def create_indexes():
-    """Создает индексы для оптимизации производительности с исправленными именами столбцов."""
-    try:
-        # # FIXED: Упрощенная и надежная логика создания индексов.
-        # Все проверки на существование делает сам SQL с помощью "IF NOT EXISTS".
-        all_indexes = [
-            "CREATE INDEX IF NOT EXISTS idx_reports_supervisor ON reports(supervisor_id)",
-            "CREATE INDEX IF NOT EXISTS idx_reports_date ON reports(report_date)",
-            "CREATE INDEX IF NOT EXISTS idx_reports_status ON reports(workflow_status)",
-            # # FIXED: Индекс для discipline_id
-            "CREATE INDEX IF NOT EXISTS idx_reports_discipline ON reports(discipline_id)",
-            "CREATE INDEX IF NOT EXISTS idx_daily_rosters_date ON daily_rosters(roster_date)",
-            "CREATE INDEX IF NOT EXISTS idx_daily_rosters_brigade ON daily_rosters(brigade_user_id)",
-            "CREATE INDEX IF NOT EXISTS idx_work_types_discipline ON work_types(discipline_id)",
-            "CREATE INDEX IF NOT EXISTS idx_reports_master ON reports(master_id)",
-            "CREATE INDEX IF NOT EXISTS idx_reports_kiok ON reports(kiok_id)",
-            # # FIXED: Индексы для discipline_id в таблицах ролей
-            "CREATE INDEX IF NOT EXISTS idx_supervisors_discipline ON supervisors(discipline_id)",
-            "CREATE INDEX IF NOT EXISTS idx_masters_discipline ON masters(discipline_id)",
-            "CREATE INDEX IF NOT EXISTS idx_kiok_discipline ON kiok(discipline_id)",
-            "CREATE INDEX IF NOT EXISTS idx_scheduled_notifications_user_id ON scheduled_notifications(user_id)",
-            "CREATE INDEX IF NOT EXISTS idx_scheduled_notifications_scheduled_time ON scheduled_notifications(scheduled_time)",
-            "CREATE INDEX IF NOT EXISTS idx_scheduled_notifications_is_sent ON scheduled_notifications(is_sent)"
-        ]    
-        for index_sql in all_indexes:
-            await db_execute(index_sql)
-            
-        logger.info("✅ Индексы созданы успешно")
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка создания индексов: {e}")
-        return False
+    rows = await tx.execute(_ROLLUP_FROM_REPORT_DATA_SQL)
+    logger.info(f"✅ Сводка выработки заполнена: {rows} строк")
 
-async def add_discipline_to_personnel_roles():
-    """Добавляет поле discipline_id в таблицу personnel_roles"""
+# Заполнение сводки в том виде, в каком шаг 7 применялся (числа из report_data - колонок еще нет).
+# Копия, а не ProductionRollupService.fill: сервис с тех пор читает числовые колонки reports
+_ROLLUP_NUMBER_RE = "'^[[:space:]]*-?[0-9]+([.,][0-9]+)?[[:space:]]*$'"
+
+def _rollup_json_number(field: str) -> str:
+    value = f"r.report_data->>'{field}'"
+    return f"CASE WHEN {value} ~ {_ROLLUP_NUMBER_RE} THEN replace(btrim({value}), ',', '.')::numeric ELSE 0 END"
+
+_ROLLUP_FROM_REPORT_DATA_SQL = f"""
+    INSERT INTO daily_production_rollup (
+        report_date, discipline_id, brigade_name, work_type_name, work_type_id, norm_per_unit,
+        report_count, people_count, volume, planned_volume, updated_at
+    )
+    SELECT report_date, discipline_id, brigade_name, work_type_name,
+           MAX(wt.id), MAX(wt.norm_per_unit),
+           COUNT(*),
+           SUM({_rollup_json_number('people_count')}),
+           SUM({_rollup_json_number('volume')}),
+           COALESCE(SUM({_rollup_json_number('people_count')} * wt.norm_per_unit), 0),
+           NOW()
+    FROM reports r
+    LEFT JOIN LATERAL (
+        SELECT w.id, w.norm_per_unit FROM work_types w
+        WHERE w.discipline_id = r.discipline_id AND w.name = r.work_type_name
+        ORDER BY w.id LIMIT 1
+    ) wt ON true
+    WHERE r.workflow_status = 'approved' AND r.discipline_id IS NOT NULL
+    GROUP BY report_date, discipline_id, brigade_name, work_type_name
+    ON CONFLICT (report_date, discipline_id, brigade_name, work_type_name) DO NOTHING
+"""
+
+# Числа в report_data вводились вручную: нечисловое значение - NULL, запятая - десятичная точка
+_JSON_NUMBER_RE = "'^[[:space:]]*-?[0-9]+([.,][0-9]+)?[[:space:]]*$'"
+
+def _json_number_sql(field: str) -> str:
+    value = f"report_data->>'{field}'"
+    return f"CASE WHEN {value} ~ {_JSON_NUMBER_RE} THEN replace(btrim({value}), ',', '.')::numeric END"
+
+# Заполняет people_count/volume из report_data там, где колонки пустые (миграция, восстановление из старых бэкапов)
+REPORT_NUMBERS_BACKFILL_SQL = f"""
+    UPDATE reports
+    SET people_count = COALESCE(people_count, {_json_number_sql('people_count')}),
+        volume = COALESCE(volume, {_json_number_sql('volume')})
+    WHERE (people_count IS NULL AND report_data ? 'people_count')
+       OR (volume IS NULL AND report_data ? 'volume')
+"""
+
+# Полный пересчет сводки по числовым колонкам reports (шаги 8 и 14). Копия ProductionRollupService
+# на момент этих шагов: примененный шаг не должен меняться вместе с сервисом
+_ROLLUP_DELETE_ALL_SQL = "DELETE FROM daily_production_rollup"
+
+_ROLLUP_FROM_REPORT_COLUMNS_SQL = """
+    INSERT INTO daily_production_rollup (
+        report_date, discipline_id, brigade_name, work_type_name, work_type_id, norm_per_unit,
+        report_count, people_count, volume, planned_volume, updated_at
+    )
+    SELECT report_date, discipline_id, brigade_name, work_type_name,
+           MAX(wt.id), MAX(wt.norm_per_unit),
+           COUNT(*),
+           COALESCE(SUM(r.people_count), 0),
+           COALESCE(SUM(r.volume), 0),
+           COALESCE(SUM(r.people_count * wt.norm_per_unit), 0),
+           NOW()
+    FROM reports r
+    LEFT JOIN LATERAL (
+        SELECT w.id, w.norm_per_unit FROM work_types w
+        WHERE w.discipline_id = r.discipline_id AND w.name = r.work_type_name
+        ORDER BY w.id LIMIT 1
+    ) wt ON true
+    WHERE r.workflow_status = 'approved' AND r.discipline_id IS NOT NULL
+    GROUP BY report_date, discipline_id, brigade_name, work_type_name
+"""
+
+async def _fill_rollup_from_report_columns(tx) -> int:
+    await tx.execute(_ROLLUP_DELETE_ALL_SQL)
+    return await tx.execute(_ROLLUP_FROM_REPORT_COLUMNS_SQL)
+
+async def _add_report_number_columns(tx):
+    """people_count и volume - обычные колонки reports вместо разбора JSONB в каждом запросе"""
+    await tx.execute("ALTER TABLE reports ADD COLUMN IF NOT EXISTS people_count NUMERIC")
+    await tx.execute("ALTER TABLE reports ADD COLUMN IF NOT EXISTS volume NUMERIC")
+    filled = await tx.execute(REPORT_NUMBERS_BACKFILL_SQL)
+    logger.info(f"✅ Числовые поля перенесены из report_data: {filled} отчетов")
+
+    # Сводка по дням бригады (проверка табеля) и по дисциплине за день (графики, сводка выработки)
+    await tx.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reports_brigade_date ON reports(brigade_name, report_date) INCLUDE (people_count)"
+    )
+    await tx.execute("""
+        CREATE INDEX IF NOT EXISTS idx_reports_discipline_date
+        ON reports(discipline_id, report_date) INCLUDE (work_type_name, workflow_status, people_count, volume)
+    """)
+
+    rows = await _fill_rollup_from_report_columns(tx)
+    logger.info(f"✅ Сводка выработки заполнена: {rows} строк")
+
+# Составные и частичные индексы под реальные запросы (проверка: python check_indexes.py).
+# brigade_name + report_date (проверка табеля, удаление отчетов за день) покрыт idx_reports_brigade_date из шага 8
+_QUERY_PATTERN_INDEXES_SQL = [
+    # Очередь мастера: workflow_status = 'pending_master' AND discipline_id = ? ORDER BY created_at
+    """
+    CREATE INDEX IF NOT EXISTS idx_reports_master_queue
+    ON reports(discipline_id, created_at) WHERE workflow_status = 'pending_master'
+    """,
+    # Очередь КИОК: workflow_status = 'pending_kiok' AND discipline_id = ? ORDER BY master_signed_at
+    """
+    CREATE INDEX IF NOT EXISTS idx_reports_kiok_queue
+    ON reports(discipline_id, master_signed_at) WHERE workflow_status = 'pending_kiok'
+    """,
+    # Дашборды и пересборка сводки за день/период: report_date + workflow_status
+    "CREATE INDEX IF NOT EXISTS idx_reports_date_status ON reports(report_date, workflow_status)",
+    # Напоминания: pending_master AND created_at <= NOW() - 2 дня
+    """
+    CREATE INDEX IF NOT EXISTS idx_reports_pending_master_created
+    ON reports(created_at) WHERE workflow_status = 'pending_master'
+    """,
+    # Статус в одиночку малоселективен, а все запросы по нему покрыты индексами выше
+    "DROP INDEX IF EXISTS idx_reports_status",
+]
+
+# Индексы под keyset-пагинацию (utils/pagination.py): сортировка списка + уникальный хвост
+_KEYSET_PAGINATION_INDEXES_SQL = [
+    # Очереди мастера и КИОК листаются по (дата, id) - пересоздаем частичные индексы шага 9 с id
+    "DROP INDEX IF EXISTS idx_reports_master_queue",
+    """
+    CREATE INDEX idx_reports_master_queue
+    ON reports(discipline_id, created_at, id) WHERE workflow_status = 'pending_master'
+    """,
+    "DROP INDEX IF EXISTS idx_reports_kiok_queue",
+    """
+    CREATE INDEX idx_reports_kiok_queue
+    ON reports(discipline_id, master_signed_at, id) WHERE workflow_status = 'pending_kiok'
+    """,
+    # История отчетов супервайзера (новые сверху - обратный проход индекса)
+    "CREATE INDEX IF NOT EXISTS idx_reports_supervisor_created ON reports(supervisor_id, created_at, id)",
+] + [
+    # Списки пользователей по ролям (у supervisors/masters/kiok нет first_name/last_name)
+    f"""
+    CREATE INDEX IF NOT EXISTS idx_{role}_name_order
+    ON {role}((COALESCE(last_name, '')), (COALESCE(first_name, '')), user_id)
+    """
+    for role in ('admins', 'managers', 'brigades', 'pto')
+]
+
+# Журнал переходов статусов отчетов: пишется тем же запросом, что меняет статус (WorkflowService._transition)
+_REPORT_TRANSITIONS_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS report_transitions (
+        id BIGSERIAL PRIMARY KEY,
+        report_id INTEGER NOT NULL REFERENCES reports(id) ON DELETE CASCADE,
+        from_status VARCHAR(50),
+        to_status VARCHAR(50) NOT NULL,
+        actor_id VARCHAR(255),
+        actor_role VARCHAR(20),
+        details JSONB DEFAULT '{}',
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_report_transitions_report ON report_transitions(report_id, created_at)",
+]
+
+# Outbox доменных событий: пишется тем же запросом, что меняет отчет; доставку делает DomainEventService
+_DOMAIN_EVENTS_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS domain_events (
+        id BIGSERIAL PRIMARY KEY,
+        event_type VARCHAR(50) NOT NULL,
+        report_id INTEGER,
+        payload JSONB NOT NULL DEFAULT '{}',
+        status VARCHAR(20) NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        done_subscribers TEXT[] NOT NULL DEFAULT '{}',
+        last_error TEXT,
+        available_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        locked_by TEXT,
+        locked_at TIMESTAMP WITH TIME ZONE,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+        processed_at TIMESTAMP WITH TIME ZONE
+    )
+    """,
+    """CREATE INDEX IF NOT EXISTS idx_domain_events_due
+       ON domain_events(available_at, id) WHERE status IN ('pending', 'processing')""",
+]
+
+async def _refill_production_rollup(tx):
+    """Сводка считается так же, как ее обновляет ProductionRollupService, - из people_count/volume"""
+    rows = await _fill_rollup_from_report_columns(tx)
+    logger.info(f"✅ Сводка выработки пересчитана: {rows} строк")
+
+# Реплики на каждом апдейте сверяют MAX(version) по всей таблице
+_BOT_PERSISTENCE_VERSION_INDEX_SQL = [
+    "CREATE INDEX IF NOT EXISTS idx_bot_persistence_global_version ON bot_persistence(version)",
+]
+
+# Нумерованные шаги схемы. Каждый шаг - список SQL или async-функция(tx).
+# Новые изменения добавляются только в конец со следующим номером; примененные шаги не редактируются.
+MIGRATIONS = [
+    (1, "Базовые таблицы", _INITIAL_TABLES_SQL),
+    (2, "Индексы", _INDEXES_SQL),
+    (3, "discipline_id в personnel_roles", _add_discipline_to_personnel_roles),
+    (4, "Базовые дисциплины и роли персонала", _seed_personnel_roles),
+    (5, "Очередь уведомлений на базе scheduled_notifications", _NOTIFICATION_QUEUE_SQL),
+    (6, "Общее состояние бота (bot_persistence)", _BOT_PERSISTENCE_SQL),
+    (7, "Дневная сводка выработки (daily_production_rollup)", _create_production_rollup),
+    (8, "Числовые колонки people_count/volume в reports", _add_report_number_columns),
+    (9, "Составные и частичные индексы reports под горячие запросы", _QUERY_PATTERN_INDEXES_SQL),
+    (10, "Индексы для keyset-пагинации очередей, истории отчетов и списков пользователей", _KEYSET_PAGINATION_INDEXES_SQL),
+    (11, "Журнал переходов статусов отчетов (report_transitions)", _REPORT_TRANSITIONS_SQL),
+    (12, "Outbox доменных событий (domain_events)", _DOMAIN_EVENTS_SQL),
+    (13, "Индекс bot_persistence по version для проверки изменений", _BOT_PERSISTENCE_VERSION_INDEX_SQL),
+    (14, "Пересчет сводки выработки по числовым колонкам reports", _refill_production_rollup),
+]
+
+LATEST_SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+async def get_schema_version() -> int:
+    """Текущая версия схемы одним запросом (0 - чистая БД или схема до появления schema_version)."""
     try:
-        # Проверяем есть ли уже поле discipline_id
-        column_exists = await db_query("""
-            SELECT EXISTS (
-                SELECT 1 FROM information_schema.columns 
-                WHERE table_name = 'personnel_roles' AND column_name = 'discipline_id'
-            )
-        """)
-        
-        if not column_exists or not column_exists[0][0]:
-            # Добавляем поле discipline_id
-            await db_execute("""
-                ALTER TABLE personnel_roles 
-                ADD COLUMN discipline_id INTEGER REFERENCES disciplines(id)
-            """)
-            logger.info("✅ Добавлено поле discipline_id в personnel_roles")
+        async with db_transaction() as tx:
+            return await tx.query_single("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    except asyncpg.exceptions.UndefinedTableError:
+        return 0
+
+async def _apply_migrations(tx) -> int:
+    """Применяет недостающие шаги внутри транзакции tx. Возвращает число примененных шагов."""
+    # Вторая реплика ждет здесь, пока первая не закончит, и затем видит уже обновленную версию
+    await tx.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK_KEY,))
+    await tx.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    current_version = await tx.query_single("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+
+    applied = 0
+    for version, description, step in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        logger.info(f"🔄 Миграция {version}: {description}")
+        if callable(step):
+            await step(tx)
         else:
-            logger.info("✅ Поле discipline_id уже существует в personnel_roles")
-            
-    except Exception as e:
-        logger.error(f"❌ Ошибка добавления discipline_id: {e}")
+            for sql in step:
+                await tx.execute(sql)
 
-async def create_personnel_roles_by_disciplines():
-    """Создает роли ТОЛЬКО ОДИН РАЗ - при первом запуске"""
-    try:
-        # Проверяем есть ли уже роли
-        existing_roles_count = await db_query("SELECT COUNT(*) FROM personnel_roles")
-        
-        if existing_roles_count and existing_roles_count[0][0] > 0:
-            logger.info(f"✅ Роли персонала уже существуют ({existing_roles_count[0][0]} шт.), пропускаем создание")
-            return
-        
-        logger.info("🔄 Создаем роли персонала (первый запуск)...")
-        
-        # Получаем дисциплины или создаем базовые
-        disciplines = await db_query("SELECT id, name FROM disciplines ORDER BY name")
-        if not disciplines:
-            logger.info("🔄 Создаем базовые дисциплины...")
-            base_disciplines = [
-                'Механомонтаж', 'Бетонные работы', 'КИПиА', 'Металлоконструкция',
-                'Отделочные работы', 'Трубопровод', 'Земляные работы', 'Электромонтажные работы'
-            ]
-            for disc_name in base_disciplines:
-                await db_execute(
-                    "INSERT INTO disciplines (name) VALUES (%s) ON CONFLICT (name) DO NOTHING",
-                    (disc_name,)
-                )
-            disciplines = await db_query("SELECT id, name FROM disciplines ORDER BY name")
-        
-        # Роли по дисциплинам
-        roles_by_discipline = {
-            'Механомонтаж': [
-                'Слесарь-монтажник 6 разряда',
-                'Слесарь-монтажник 5 разряда', 
-                'Слесарь-монтажник 4 разряда',
-                'Помощник слесаря',
-                'Крановщик',
-                'Стропальщик',
-                'Монтажник оборудования',
-                'Мастер участка'
-            ],
-            'Бетонные работы': [
-                'Бетонщик 6 разряда',
-                'Бетонщик 5 разряда',
-                'Бетонщик 4 разряда',
-                'Арматурщик 6 разряда',
-                'Арматурщик 5 разряда',
-                'Помощник бетонщика',
-                'Машинист бетононасоса',
-                'Мастер участка'
-            ],
-            'КИПиА': [
-                'Слесарь КИПиА 6 разряда',
-                'Слесарь КИПиА 5 разряда',
-                'Электромонтер КИПиА 6 разряда',
-                'Электромонтер КИПиА 5 разряда',
-                'Наладчик КИПиА',
-                'Помощник монтажника',
-                'Мастер участка'
-            ],
-            'Металлоконструкция': [
-                'Сварщик 6 разряда',
-                'Сварщик 5 разряда',
-                'Сварщик 4 разряда',
-                'Слесарь по сборке 6 разряда',
-                'Слесарь по сборке 5 разряда',
-                'Помощник сварщика',
-                'Крановщик',
-                'Стропальщик',
-                'Мастер участка'
-            ],
-            'Отделочные работы': [
-                'Маляр 6 разряда',
-                'Маляр 5 разряда',
-                'Штукатур 6 разряда',
-                'Штукатур 5 разряда',
-                'Плиточник 6 разряда',
-                'Плиточник 5 разряда',
-                'Помощник отделочника',
-                'Мастер участка'
-            ],
-            'Трубопровод': [
-                'Сварщик труб 6 разряда',
-                'Сварщик труб 5 разряда',
-                'Монтажник труб 6 разряда',
-                'Монтажник труб 5 разряда',
-                'Слесарь-трубопроводчик 6 разряда',
-                'Слесарь-трубопроводчик 5 разряда',
-                'Помощник монтажника',
-                'Изолировщик',
-                'Мастер участка'
-            ],
-            'Земляные работы': [
-                'Машинист экскаватора 6 разряда',
-                'Машинист экскаватора 5 разряда',
-                'Машинист бульдозера 6 разряда',
-                'Машинист бульдозера 5 разряда',
-                'Тракторист',
-                'Землекоп',
-                'Стропальщик',
-                'Мастер участка'
-            ],
-            'Электромонтажные работы': [
-                'Электромонтажник 6 разряда',
-                'Электромонтажник 5 разряда',
-                'Электромонтажник 4 разряда',
-                'Кабельщик-спайщик 6 разряда',
-                'Кабельщик-спайщик 5 разряда',
-                'Электрик 6 разряда',
-                'Электрик 5 разряда',
-                'Помощник электрика',
-                'Мастер участка'
-            ]
-        }
-        
-        # Создаем роли для каждой дисциплины
-        total_created = 0
-        for disc_id, disc_name in disciplines:
-            if disc_name in roles_by_discipline:
-                for i, role_name in enumerate(roles_by_discipline[disc_name], 1):
-                    await db_execute("""
-                        INSERT INTO personnel_roles (role_name, discipline_id, display_order, category)
-                        VALUES (%s, %s, %s, %s)
-                    """, (role_name, disc_id, i, 'Основной персонал'))
-                    total_created += 1
-                    
-                logger.info(f"✅ Создано {len(roles_by_discipline[disc_name])} ролей для {disc_name}")
-        
-        logger.info(f"✅ Всего создано {total_created} ролей персонала по дисциплинам")
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка создания ролей по дисциплинам: {e}")
+        await tx.execute(
+            "INSERT INTO schema_version (version, description) VALUES (%s, %s)",
+            (version, description)
+        )
+        applied += 1
+    return applied
 
 async def run_all_migrations():
-    """Запускает все миграции - ДОПОЛНЕНО РОЛЯМИ ПО ДИСЦИПЛИНАМ"""
+    """Применяет недостающие миграции одной транзакцией на одном соединении"""
+    started = time.monotonic()
+
+    if await get_schema_version() >= LATEST_SCHEMA_VERSION:
+        logger.info(f"✅ Схема БД актуальна (версия {LATEST_SCHEMA_VERSION}), "
+                    f"проверка за {(time.monotonic() - started) * 1000:.0f} мс")
+        return True
+
     logger.info("🔄 Запуск миграций БД...")
-    
-    if not await create_initial_tables():
-        logger.critical("❌ Не удалось создать базовые таблицы")
+    try:
+        async with db_transaction() as tx:
+            applied = await _apply_migrations(tx)
+    except Exception as e:
+        # Транзакция откатилась целиком - схема осталась в прежней версии
+        logger.critical(f"❌ Ошибка миграции БД, изменения откатены: {e}")
         return False
-    
-    if not await create_indexes():
-        logger.warning("⚠️ Не удалось создать индексы, но миграция продолжается")
-    
-    # ADDED: Добавляем поле discipline_id в personnel_roles
-    await add_discipline_to_personnel_roles()
-    
-    # ADDED: Создаем роли по дисциплинам
-    await create_personnel_roles_by_disciplines()
-    
-    logger.info("✅ Миграции успешно завершены!")
-    return True
\ No newline at end of file
+
+    logger.info(f"✅ Миграции успешно завершены! Применено шагов: {applied}, "
+                f"версия {LATEST_SCHEMA_VERSION}, за {time.monotonic() - started:.2f} сек")
+    return True
@@ -0,0 +1,234 @@
+# database/persistence.py
+
+"""
+PostgreSQL-хранилище состояния бота (bot_data, user_data, состояния ConversationHandler).
+
+Каждая запись - отдельная строка bot_persistence с номером версии из общей последовательности.
+Изменения пишутся раз в update_interval. Перед обработкой апдейта sync() одним запросом
+сверяет MAX(version) и только при изменениях подтягивает новые строки других реплик:
+bot_data, user_data и состояния разговоров. Удаление - строка с data = NULL.
+
+Версия выдается до коммита, поэтому строка с меньшей версией может стать видна позже большей.
+Порог чтения (_version) сдвигается только до строк старше PERSISTENCE_SYNC_OVERLAP_SECONDS:
+более свежие перечитываются, пока не "устоятся", а уже примененные отсеиваются через _written.
+"""
+
+import json
+import logging
+import pickle
+from typing import Any, Dict, Optional, Tuple
+
+from telegram.ext import BasePersistence, ConversationHandler, PersistenceInput
+
+from config.settings import PERSISTENCE_SYNC_OVERLAP_SECONDS
+from database.queries import db_query, db_query_single
+
+logger = logging.getLogger(__name__)
+
+_UPSERT_QUERY = """
+    INSERT INTO bot_persistence (kind, key, data, version, updated_at)
+    VALUES (%s, %s, %s, nextval('bot_persistence_version_seq'), NOW())
+    ON CONFLICT (kind, key) DO UPDATE
+    SET data = EXCLUDED.data, version = EXCLUDED.version, updated_at = EXCLUDED.updated_at
+    RETURNING version
+"""
+
+# Строка старше окна перекрытия: версии меньше ее уже закоммичены
+_SETTLED_SQL = "updated_at < clock_timestamp() - make_interval(secs => %s) AS settled"
+
+class PostgresPersistence(BasePersistence):
+    """Хранит bot_data, user_data и разговоры в PostgreSQL, чтобы их видели все реплики и рестарты"""
+
+    def __init__(self, update_interval: float = 60):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval
+        )
+        # Последняя записанная/прочитанная сериализация каждой строки - пишем только изменения
+        self._written: Dict[Tuple[str, str], Optional[bytes]] = {}
+        # Порог чтения: все строки с версией не выше уже прочитаны (общий для всех видов данных)
+        self._version = 0
+        # Максимальная версия, которую видел этот процесс (может быть выше порога)
+        self._seen_version = 0
+        # Состояния разговоров ConversationHandler по имени (заполняется при первом sync)
+        self._conversation_states: Optional[Dict[str, Any]] = None
+
+    # --- Низкоуровневые операции ---
+
+    async def _load(self, kind: str) -> Dict[str, Tuple[Optional[bytes], int]]:
+        rows = await db_query(
+            f"SELECT key, data, version, {_SETTLED_SQL} FROM bot_persistence WHERE kind = %s",
+            (PERSISTENCE_SYNC_OVERLAP_SECONDS, kind)
+        )
+        loaded = {}
+        for key, data, version, settled in (rows or []):
+            data = bytes(data) if data is not None else None
+            self._track_version(version, settled)
+            self._written[(kind, key)] = data
+            loaded[key] = (data, version)
+        return loaded
+
+    def _track_version(self, version: int, settled: bool) -> None:
+        """
+        Устоявшаяся строка (старше окна) сдвигает порог: все версии меньше ее выданы раньше
+        и к этому моменту закоммичены, то есть уже видны в том же чтении.
+        """
+        self._seen_version = max(self._seen_version, version)
+        if settled:
+            self._version = max(self._version, version)
+
+    async def _store(self, kind: str, key: str, data: Optional[bytes]) -> Optional[int]:
+        """Пишет строку, если ее содержимое изменилось. Возвращает новую версию."""
+        if (kind, key) in self._written and self._written[(kind, key)] == data:
+            return None
+        result = await db_query(_UPSERT_QUERY, (kind, key, data))
+        if not result:
+            logger.error(f"❌ Не удалось сохранить состояние {kind}/{key}")
+            return None
+        self._written[(kind, key)] = data
+        return result[0][0]
+
+    # --- Изменения других реплик ---
+
+    def _find_conversation_states(self, application) -> Dict[str, Any]:
+        """Словари состояний персистентных ConversationHandler (PTB хранит их в _conversations)"""
+        if self._conversation_states is None:
+            self._conversation_states = {
+                handler.name: handler._conversations
+                for handlers in application.handlers.values() for handler in handlers
+                if isinstance(handler, ConversationHandler) and handler.persistent and handler.name
+            }
+        return self._conversation_states
+
+    async def sync(self, application) -> None:
+        """
+        Подтягивает изменения других реплик перед обработкой апдейта (до проверки ConversationHandler).
+        Один запрос MAX(version); строки читаются, только если появилась новая версия.
+        Свои записи пропускаются: в памяти может быть состояние новее последнего сброса.
+        """
+        latest = await db_query_single("SELECT MAX(version) FROM bot_persistence")
+        # Ничего нового и нет неустоявшихся строк, под которыми могла появиться чужая запись
+        if not latest or (latest <= self._seen_version and self._version >= self._seen_version):
+            return
+        rows = await db_query(
+            f"SELECT kind, key, data, version, {_SETTLED_SQL} FROM bot_persistence "
+            "WHERE version > %s ORDER BY version",
+            (PERSISTENCE_SYNC_OVERLAP_SECONDS, self._version)
+        )
+        if rows is None:
+            return
+
+        conversation_states = self._find_conversation_states(application)
+        for kind, key, data, version, settled in rows:
+            self._track_version(version, settled)
+            data = bytes(data) if data is not None else None
+            if (kind, key) in self._written and self._written[(kind, key)] == data:
+                continue
+            self._written[(kind, key)] = data
+
+            if kind == 'bot_data':
+                if data is None:
+                    for original_key in [k for k in application.bot_data if repr(k) == key]:
+                        del application.bot_data[original_key]
+                else:
+                    original_key, value = pickle.loads(data)
+                    application.bot_data[original_key] = value
+            elif kind == 'user_data':
+                if data is not None:
+                    user_data = application.user_data[int(key)]
+                    user_data.clear()
+                    user_data.update(pickle.loads(data))
+                elif int(key) in application.user_data:
+                    application.user_data[int(key)].clear()
+            elif kind.startswith('conversation:'):
+                states = conversation_states.get(kind[len('conversation:'):])
+                if states is None:
+                    continue
+                # Без отметки записи: иначе PTB записал бы чужое состояние обратно
+                if data is None:
+                    states.data.pop(tuple(json.loads(key)), None)
+                else:
+                    states.update_no_track({tuple(json.loads(key)): pickle.loads(data)})
+
+    # --- bot_data ---
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        bot_data = {}
+        for data, _version in (await self._load('bot_data')).values():
+            if data is not None:
+                original_key, value = pickle.loads(data)
+                bot_data[original_key] = value
+        logger.info(f"✅ bot_data восстановлен: {len(bot_data)} ключей")
+        return bot_data
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        # Каждый ключ bot_data - отдельная строка: реплики не затирают чужие ключи
+        current_keys = set()
+        for original_key, value in data.items():
+            key = repr(original_key)
+            current_keys.add(key)
+            await self._store('bot_data', key, pickle.dumps((original_key, value)))
+
+        for kind, key in list(self._written):
+            if kind == 'bot_data' and key not in current_keys and self._written[(kind, key)] is not None:
+                await self._store('bot_data', key, None)
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        # Изменения других реплик уже применены в sync - без запросов на каждый апдейт
+        pass
+
+    # --- user_data ---
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        user_data = {}
+        for key, (data, _version) in (await self._load('user_data')).items():
+            if data is not None:
+                user_data[int(key)] = pickle.loads(data)
+        return user_data
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        await self._store('user_data', str(user_id), pickle.dumps(data))
+
+    async def drop_user_data(self, user_id: int) -> None:
+        await self._store('user_data', str(user_id), None)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        # См. refresh_bot_data
+        pass
+
+    # --- Разговоры ---
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        conversations = {}
+        for key, (data, _version) in (await self._load(f'conversation:{name}')).items():
+            if data is not None:
+                conversations[tuple(json.loads(key))] = pickle.loads(data)
+        return conversations
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        data = pickle.dumps(new_state) if new_state is not None else None
+        await self._store(f'conversation:{name}', json.dumps(list(key)), data)
+
+    # --- Не используются ботом ---
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        return {}
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def flush(self) -> None:
+        # Все записи уходят в БД сразу в update_*, буфера нет
+        pass
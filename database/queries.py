@@ -1,11 +1,14 @@
 # database/queries.py
 
 import logging
-import asyncio
-from functools import partial
+import time
+from contextlib import asynccontextmanager
 from typing import List, Any, Optional, Tuple, Dict, Union
 
+import asyncpg
+
 from .connection import db_manager
+from utils.metrics import observe, run_in_executor, timed_db_call, DB_POOL_WAIT_SECONDS
 
 logger = logging.getLogger(__name__)
 
@@ -67,25 +70,148 @@ def _query_single_sync(query: str, params: tuple) -> Any:
         if conn:
             conn.close()
 
-# --- АСИНХРОННЫЕ ОБЕРТКИ (для использования в боте) ---
+# --- НАТИВНЫЙ ASYNCPG (через пул DatabaseManager) ---
+
+def _to_asyncpg_query(query: str, params: tuple) -> str:
+    """Переводит плейсхолдеры psycopg2 (%s) в нумерованные ($1, $2, ...) для asyncpg.
+
+    Правила те же, что у psycopg2: без параметров запрос не меняется, с параметрами
+    '%%' везде (и внутри литералов) становится '%', любой другой '%' - ошибка ValueError.
+    """
+    if not params:
+        return query
+
+    result = []
+    index = 0
+    i = 0
+    length = len(query)
+    while i < length:
+        char = query[i]
+        if char != '%':
+            result.append(char)
+            i += 1
+            continue
+        next_char = query[i + 1] if i + 1 < length else ''
+        if next_char == 's':
+            index += 1
+            result.append(f"${index}")
+        elif next_char == '%':
+            result.append('%')
+        else:
+            raise ValueError(f"неподдерживаемый плейсхолдер '%{next_char}' в позиции {i}: используйте %s или %%")
+        i += 2
+    return ''.join(result)
+
+def _rowcount_from_status(status: str) -> int:
+    """Достает количество строк из статуса команды asyncpg ('UPDATE 3', 'INSERT 0 1')."""
+    try:
+        return int(status.rsplit(' ', 1)[-1])
+    except (AttributeError, ValueError):
+        return 0
+
+def _is_argument_error(error: Exception) -> bool:
+    """Ошибка кодирования аргумента на стороне клиента (тип Python не подходит для asyncpg)."""
+    return type(error) is asyncpg.exceptions.DataError
+
+async def _run_in_thread(func, *args):
+    """Выполняет блокирующую psycopg2-версию в пуле потоков (резервный путь)."""
+    return await run_in_executor(func, *args, pool='db_fallback')
+
+@asynccontextmanager
+async def _acquire():
+    """Соединение из пула с учетом времени ожидания свободного соединения"""
+    pool = await db_manager.get_async_pool()
+    started = time.perf_counter()
+    async with pool.acquire() as conn:
+        observe(DB_POOL_WAIT_SECONDS, time.perf_counter() - started, pool='asyncpg')
+        yield conn
+
+# --- АСИНХРОННЫЕ ВЕРСИИ (для использования в боте) ---
 
 async def db_execute(query: str, params: tuple = ()) -> int:
     """Асинхронно выполняет запрос (INSERT, UPDATE, DELETE) и возвращает количество затронутых строк."""
-    loop = asyncio.get_running_loop()
-    func = partial(_execute_sync, query, params)
-    return await loop.run_in_executor(None, func)
+    try:
+        async with _acquire() as conn:
+            with timed_db_call('execute'):
+                if params:
+                    status = await conn.execute(_to_asyncpg_query(query, params), *params)
+                else:
+                    status = await conn.execute(query)
+        return _rowcount_from_status(status)
+    except Exception as e:
+        if _is_argument_error(e):
+            logger.warning(f"⚠️ asyncpg не принял параметры, запрос повторяется через psycopg2: {e}\nЗапрос: {query}")
+            return await _run_in_thread(_execute_sync, query, params)
+        logger.error(f"Ошибка выполнения DB execute: {e}\nЗапрос: {query}")
+        return 0
 
 async def db_query(query: str, params: tuple = (), as_dict: bool = False) -> Optional[List[Union[Tuple, Dict]]]:
     """Асинхронно выполняет SELECT и возвращает все строки."""
-    loop = asyncio.get_running_loop()
-    func = partial(_query_sync, query, params, as_dict)
-    return await loop.run_in_executor(None, func)
+    try:
+        async with _acquire() as conn:
+            with timed_db_call('query'):
+                records = await conn.fetch(_to_asyncpg_query(query, params), *params)
+        if as_dict:
+            return [dict(record) for record in records]
+        return [tuple(record) for record in records]
+    except Exception as e:
+        if _is_argument_error(e):
+            logger.warning(f"⚠️ asyncpg не принял параметры, запрос повторяется через psycopg2: {e}\nЗапрос: {query}")
+            return await _run_in_thread(_query_sync, query, params, as_dict)
+        logger.error(f"Ошибка выполнения DB query: {e}\nЗапрос: {query}")
+        return None
 
 async def db_query_single(query: str, params: tuple = ()) -> Any:
     """Асинхронно выполняет SELECT и возвращает одно значение."""
-    loop = asyncio.get_running_loop()
-    func = partial(_query_single_sync, query, params)
-    return await loop.run_in_executor(None, func)
+    try:
+        async with _acquire() as conn:
+            with timed_db_call('query_single'):
+                return await conn.fetchval(_to_asyncpg_query(query, params), *params)
+    except Exception as e:
+        if _is_argument_error(e):
+            logger.warning(f"⚠️ asyncpg не принял параметры, запрос повторяется через psycopg2: {e}\nЗапрос: {query}")
+            return await _run_in_thread(_query_single_sync, query, params)
+        logger.error(f"Ошибка выполнения DB query single: {e}\nЗапрос: {query}")
+        return None
+
+# --- ТРАНЗАКЦИИ (несколько запросов на одном соединении) ---
+
+class DbTransaction:
+    """
+    Соединение пула внутри открытой транзакции. Плейсхолдеры те же (%s), что у db_*,
+    но ошибки не глотаются: исключение выходит из db_transaction() и откатывает транзакцию.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def execute(self, query: str, params: tuple = ()) -> int:
+        with timed_db_call('execute'):
+            status = await self.conn.execute(_to_asyncpg_query(query, params), *params)
+        return _rowcount_from_status(status)
+
+    async def executemany(self, query: str, params_list: List[tuple]) -> None:
+        if params_list:
+            with timed_db_call('executemany'):
+                await self.conn.executemany(_to_asyncpg_query(query, params_list[0]), params_list)
+
+    async def query(self, query: str, params: tuple = (), as_dict: bool = False) -> List[Union[Tuple, Dict]]:
+        with timed_db_call('query'):
+            records = await self.conn.fetch(_to_asyncpg_query(query, params), *params)
+        if as_dict:
+            return [dict(record) for record in records]
+        return [tuple(record) for record in records]
+
+    async def query_single(self, query: str, params: tuple = ()) -> Any:
+        with timed_db_call('query_single'):
+            return await self.conn.fetchval(_to_asyncpg_query(query, params), *params)
+
+@asynccontextmanager
+async def db_transaction():
+    """Открывает транзакцию на одном соединении пула: async with db_transaction() as tx: ..."""
+    async with _acquire() as conn:
+        async with conn.transaction():
+            yield DbTransaction(conn)
 
 # --- СИНХРОННЫЕ ОБЕРТКИ (для частых простых запросов) ---
 
@@ -14,15 +14,9 @@ from pathlib import Path
 current_dir = Path(__file__).parent
 sys.path.insert(0, str(current_dir))
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Настройка логирования: запись в файл и консоль - в отдельном потоке, файл с ротацией
+from utils.logging_setup import setup_logging
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
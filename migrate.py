@@ -4,6 +4,7 @@
 """
 
 import sys
+import asyncio
 import logging
 
 # Настройка логирования
@@ -15,10 +16,17 @@ logging.basicConfig(
 def main():
     try:
         from database.migrations import run_all_migrations
+        from database.connection import db_manager
         
         print("🔄 Запуск миграций базы данных...")
         
-        if run_all_migrations():
+        async def _migrate():
+            try:
+                return await run_all_migrations()
+            finally:
+                await db_manager.close()
+        
+        if asyncio.run(_migrate()):
             print("✅ Все миграции выполнены успешно!")
             return 0
         else:
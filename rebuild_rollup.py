@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Пересборка дневной сводки выработки (daily_production_rollup)
+
+    python rebuild_rollup.py                          # вся история
+    python rebuild_rollup.py 2024-05-01               # с даты по сегодня
+    python rebuild_rollup.py 2024-05-01 2024-05-31    # за период
+"""
+
+import sys
+import asyncio
+import logging
+from datetime import date
+
+# Настройка логирования
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+
+def main():
+    try:
+        from services.production_rollup_service import ProductionRollupService
+        from database.connection import db_manager
+
+        args = [date.fromisoformat(arg) for arg in sys.argv[1:3]]
+        date_from = args[0] if args else None
+        date_to = args[1] if len(args) > 1 else (date.today() if date_from else None)
+
+        period = f"{date_from} - {date_to}" if date_from else "вся история"
+        print(f"🔄 Пересборка сводки выработки ({period})...")
+
+        async def _rebuild():
+            try:
+                return await ProductionRollupService.rebuild(date_from, date_to)
+            finally:
+                await db_manager.close()
+
+        rows = asyncio.run(_rebuild())
+        print(f"✅ Сводка пересобрана, строк: {rows}")
+        return 0
+
+    except ValueError as e:
+        print(f"❌ Неверная дата (ожидается ГГГГ-ММ-ДД): {e}")
+        return 1
+    except Exception as e:
+        print(f"❌ Критическая ошибка: {e}")
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
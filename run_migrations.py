@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from database.migrations import run_all_migrations
 from database import db_manager # <--- ИСПРАВЛЕНО ЗДЕСЬ
@@ -7,4 +8,4 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 
 if __name__ == "__main__":
     # Запускаем все миграции
-    run_all_migrations()
\ No newline at end of file
+    asyncio.run(run_all_migrations())
\ No newline at end of file
@@ -8,6 +8,8 @@ from telegram.ext import ContextTypes
 
 from config.settings import OWNER_ID
 from database.queries import db_query, db_execute
+from services.user_directory_service import UserDirectoryService
+from services.reference_data_service import ReferenceDataService
 
 logger = logging.getLogger(__name__)
 
@@ -29,22 +31,19 @@ class AdminService:
     ) -> bool:
         """Отправка запроса на одобрение админам - ИСПРАВЛЕНО для StateManager"""
         try:
-            # FIXED: Детальное логирование для отладки
-            logger.info(f"DEBUG >>> ПОЛУЧИЛИ user_data: {user_data}")
-            logger.info(f"DEBUG >>> Ключи в user_data: {list(user_data.keys())}")
+            # Сами данные (имя, телефон) в лог не пишем - только ключи
+            logger.debug(f"Заявка пользователя {user_id}, поля: {list(user_data.keys())}")
             
             # FIXED: Проверяем обязательные поля
             required_fields = ['selected_role', 'first_name', 'last_name', 'phone_number']
             missing_fields = [field for field in required_fields if not user_data.get(field)]
             
             if missing_fields:
-                logger.error(f"DEBUG >>> ОТСУТСТВУЮТ ОБЯЗАТЕЛЬНЫЕ ПОЛЯ: {missing_fields}")
-                logger.error(f"DEBUG >>> ПОЛНЫЕ ДАННЫЕ: {user_data}")
+                logger.error(f"Заявка пользователя {user_id}: отсутствуют обязательные поля {missing_fields}")
                 return False
             
             # FIXED: Сохраняем данные в правильном месте для обработчика одобрения
             context.bot_data[user_id] = user_data
-            logger.info(f"DEBUG >>> СОХРАНИЛИ в context.bot_data[{user_id}]: {context.bot_data.get(user_id)}")
             
             # FIXED: Добавлены новые роли для корректного отображения
             role_map = {
@@ -56,9 +55,9 @@ class AdminService:
             
             discipline_text = ""
             if user_data.get('discipline_id'):
-                disc_result = await db_query("SELECT name FROM disciplines WHERE id = %s", (user_data['discipline_id'],))
-                if disc_result:
-                    discipline_text = f"\n📋 Дисциплина: {disc_result[0][0]}"
+                disc_name = await ReferenceDataService.get_discipline_name(user_data['discipline_id'])
+                if disc_name:
+                    discipline_text = f"\n📋 Дисциплина: {disc_name}"
             
             level_text = ""
             if user_data.get('manager_level'):
@@ -66,7 +65,6 @@ class AdminService:
             
             # FIXED: Проверяем наличие телефона и выводим его корректно
             phone_number = user_data.get('phone_number', 'Не указан')
-            logger.info(f"DEBUG >>> Номер телефона для отправки: {phone_number}")
             
             request_text = (
                 f"🔐 <b>Запрос на авторизацию</b>\n\n"
@@ -94,7 +92,7 @@ class AdminService:
                         reply_markup=InlineKeyboardMarkup(keyboard),
                         parse_mode=ParseMode.HTML
                     )
-                    logger.info(f"DEBUG >>> Запрос отправлен админу {admin_id}")
+                    logger.debug(f"Запрос пользователя {user_id} отправлен админу {admin_id}")
                 except Exception as e:
                     logger.error(f"Не удалось отправить запрос админу {admin_id}: {e}")
             
@@ -191,6 +189,8 @@ class AdminService:
                 return False
             
             logger.info(f"Пользователь {user_id} создан с ролью {role}, затронуто строк: {result}")
+            if result > 0:
+                await UserDirectoryService.refresh_user(user_id)
             return result > 0
             
         except Exception as e:
@@ -2,14 +2,14 @@
 
 import logging
 import pandas as pd
-import asyncio
 from datetime import date
 from typing import Dict, Any, Optional, List
-from functools import partial
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 
-from config.settings import DATABASE_URL
-from database.queries import db_query, db_execute
+from database.connection import db_manager
+from database.queries import db_query, db_execute, db_query_single
+from services.reference_data_service import ReferenceDataService
+from utils.metrics import run_in_executor
 
 logger = logging.getLogger(__name__)
 
@@ -18,8 +18,7 @@ logger = logging.getLogger(__name__)
 def _run_pandas_query(query: str, params: dict) -> pd.DataFrame:
     """[БЛОКИРУЮЩАЯ] Выполняет SQL-запрос и возвращает DataFrame."""
     try:
-        engine = create_engine(DATABASE_URL)
-        with engine.connect() as connection:
+        with db_manager.get_sqlalchemy_engine().connect() as connection:
             df = pd.read_sql_query(text(query), connection, params=params)
         return df
     except Exception as e:
@@ -36,8 +35,7 @@ class AnalyticsService:
         """Асинхронно собирает данные для дашборда дисциплины."""
         try:
             params = (discipline_name,)
-            discipline_id_raw = await db_query("SELECT id FROM disciplines WHERE name = %s", params)
-            disc_id = discipline_id_raw[0][0] if discipline_id_raw else None
+            disc_id = await ReferenceDataService.get_discipline_id(discipline_name)
 
             user_counts = {'brigades': 0, 'pto': 0, 'kiok': 0}
             if disc_id:
@@ -91,8 +89,8 @@ class AnalyticsService:
         """Асинхронно собирает данные для HR-отчета."""
         date_str = selected_date.strftime('%Y-%m-%d')
 
-        disc_name_raw = await db_query("SELECT name FROM disciplines WHERE id = %s", (discipline_id,))
-        if not disc_name_raw: return None
+        disc_name = await ReferenceDataService.get_discipline_name(discipline_id)
+        if not disc_name: return None
 
         summary_q = await db_query("""
             SELECT pr.role_name, SUM(drd.personnel_count) as total_by_role
@@ -114,7 +112,7 @@ class AnalyticsService:
         total_people = sum(item[1] for item in (summary_q or []))
 
         return {
-            "discipline_name": disc_name_raw[0][0],
+            "discipline_name": disc_name,
             "roster_data": summary_q or [],
             "total_people": total_people,
             "brigades_count": brigades_count_q[0][0] if brigades_count_q else 0
@@ -134,61 +132,49 @@ class AnalyticsService:
     
     @staticmethod
     async def _calculate_work_performance(discipline_name: str) -> Dict[str, Any]:
-        """Асинхронный расчет статистики выработки."""
-        loop = asyncio.get_running_loop()
-        pd_query = """
-            SELECT r.work_type_name, r.report_data->>'volume' as volume, 
-                   r.report_data->>'people_count' as people_count, wt.norm_per_unit 
-            FROM reports r 
-            JOIN disciplines d ON r.discipline_id = d.id
-            JOIN work_types wt ON d.id = wt.discipline_id AND r.work_type_name = wt.name 
-            WHERE d.name = :discipline_name AND r.workflow_status = 'approved'
-        """
-        func = partial(_run_pandas_query, pd_query, {'discipline_name': discipline_name})
-        df = await loop.run_in_executor(None, func)
-
-        if df.empty:
+        """Статистика выработки по видам работ из сводки daily_production_rollup."""
+        rows = await db_query("""
+            SELECT p.work_type_name, SUM(p.volume)::float8, SUM(p.planned_volume)::float8
+            FROM daily_production_rollup p
+            JOIN disciplines d ON p.discipline_id = d.id
+            WHERE d.name = %s AND p.work_type_id IS NOT NULL
+            GROUP BY p.work_type_name
+        """, (discipline_name,))
+        if not rows:
             return {'overall_output_percent': 0, 'work_analysis': []}
-        
-        df['volume'] = pd.to_numeric(df['volume'], errors='coerce').fillna(0)
-        df['people_count'] = pd.to_numeric(df['people_count'], errors='coerce').fillna(0)
-        df['norm_per_unit'] = pd.to_numeric(df['norm_per_unit'], errors='coerce').fillna(0)
-        df['planned_volume'] = df['people_count'] * df['norm_per_unit']
-        
-        overall_output_percent = (df['volume'].sum() / df['planned_volume'].sum()) * 100 if df['planned_volume'].sum() > 0 else 0
-        
-        work_summary = df.groupby('work_type_name').agg(
-            total_volume=('volume', 'sum'), total_planned=('planned_volume', 'sum')
-        ).reset_index()
-        work_summary['avg_output'] = (work_summary['total_volume'] / work_summary['total_planned'].replace(0, 1)) * 100
-        
-        work_analysis = [row.to_dict() for _, row in work_summary.sort_values(by='avg_output', ascending=False).iterrows()]
-        
+
+        total_volume = sum(volume for _, volume, _ in rows)
+        total_planned = sum(planned for _, _, planned in rows)
+        overall_output_percent = total_volume / total_planned * 100 if total_planned > 0 else 0
+
+        work_analysis = [
+            {
+                'work_type': name,
+                'work_type_name': name,
+                'total_volume': volume,
+                'total_planned': planned,
+                'avg_output': volume / (planned or 1) * 100
+            }
+            for name, volume, planned in rows
+        ]
+        work_analysis.sort(key=lambda work: work['avg_output'], reverse=True)
+
         return {'overall_output_percent': overall_output_percent, 'work_analysis': work_analysis}
 
     @staticmethod
     async def _get_low_performance_brigade_count(discipline_name: str) -> int:
-        """Асинхронный подсчет бригад с низкой выработкой."""
-        loop = asyncio.get_running_loop()
-        pd_query = """
-            SELECT r.brigade_name, 
-                   SUM(CAST(r.report_data->>'volume' AS NUMERIC)) as total_volume,
-                   SUM(CAST(r.report_data->>'people_count' AS NUMERIC) * wt.norm_per_unit) as total_planned
-            FROM reports r
-            JOIN disciplines d ON r.discipline_id = d.id  
-            JOIN work_types wt ON d.id = wt.discipline_id AND r.work_type_name = wt.name
-            WHERE d.name = :discipline_name AND r.workflow_status = 'approved'
-            GROUP BY r.brigade_name
-            HAVING SUM(CAST(r.report_data->>'people_count' AS NUMERIC) * wt.norm_per_unit) > 0
-        """
-        func = partial(_run_pandas_query, pd_query, {'discipline_name': discipline_name})
-        df = await loop.run_in_executor(None, func)
-
-        if df.empty:
-            return 0
-        
-        df['performance'] = (df['total_volume'] / df['total_planned']) * 100
-        return len(df[df['performance'] < 100])
+        """Количество бригад с выработкой ниже плана (по сводке daily_production_rollup)."""
+        count = await db_query_single("""
+            SELECT COUNT(*) FROM (
+                SELECT p.brigade_name
+                FROM daily_production_rollup p
+                JOIN disciplines d ON p.discipline_id = d.id
+                WHERE d.name = %s AND p.work_type_id IS NOT NULL
+                GROUP BY p.brigade_name
+                HAVING SUM(p.planned_volume) > 0 AND SUM(p.volume) < SUM(p.planned_volume)
+            ) low
+        """, (discipline_name,))
+        return count or 0
 
     @staticmethod
     async def get_overall_statistics() -> Dict[str, Any]:
@@ -222,98 +208,89 @@ class AnalyticsService:
 
     @staticmethod
     async def _calculate_overall_discipline_performance() -> Dict[str, Any]:
-        """Асинхронный расчет средней выработки по всем дисциплинам."""
-        loop = asyncio.get_running_loop()
-        pd_query = """
-            SELECT d.name as discipline_name, 
-                   CAST(r.report_data->>'volume' AS NUMERIC) as volume,
-                   CAST(r.report_data->>'people_count' AS NUMERIC) as people_count, 
-                   wt.norm_per_unit
-            FROM reports r 
-            JOIN disciplines d ON r.discipline_id = d.id
-            JOIN work_types wt ON d.id = wt.discipline_id AND r.work_type_name = wt.name
-            WHERE r.workflow_status = 'approved'
-        """
-        func = partial(_run_pandas_query, pd_query, {})
-        df = await loop.run_in_executor(None, func)
-
-        if df.empty:
+        """Средняя выработка по всем дисциплинам из сводки daily_production_rollup."""
+        rows = await db_query("""
+            SELECT d.name, SUM(p.volume)::float8, SUM(p.planned_volume)::float8
+            FROM daily_production_rollup p
+            JOIN disciplines d ON p.discipline_id = d.id
+            WHERE p.work_type_id IS NOT NULL
+            GROUP BY d.name
+        """)
+        if not rows:
             return {'overall_output_percent': 0, 'discipline_summary': []}
-        
-        df['planned_volume'] = pd.to_numeric(df['people_count']) * pd.to_numeric(df['norm_per_unit'])
-        df['volume'] = pd.to_numeric(df['volume'])
-        
-        overall_output_percent = (df['volume'].sum() / df['planned_volume'].sum()) * 100 if df['planned_volume'].sum() > 0 else 0
-        
-        discipline_summary = df.groupby('discipline_name').apply(
-            lambda x: (x['volume'].sum() / x['planned_volume'].sum()) * 100 if x['planned_volume'].sum() > 0 else 0
-        ).reset_index(name='avg_output')
-        
-        return {
-            'overall_output_percent': overall_output_percent,
-            'discipline_summary': [row.to_dict() for _, row in discipline_summary.sort_values(by='avg_output', ascending=False).iterrows()]
-        }
+
+        total_volume = sum(volume for _, volume, _ in rows)
+        total_planned = sum(planned for _, _, planned in rows)
+        overall_output_percent = total_volume / total_planned * 100 if total_planned > 0 else 0
+
+        discipline_summary = [
+            {
+                'name': name,
+                'discipline_name': name,
+                'avg_output': volume / planned * 100 if planned > 0 else 0
+            }
+            for name, volume, planned in rows
+        ]
+        discipline_summary.sort(key=lambda disc: disc['avg_output'], reverse=True)
+
+        return {'overall_output_percent': overall_output_percent, 'discipline_summary': discipline_summary}
 
     @staticmethod
     async def get_overview_dashboard_data(selected_date: date) -> Dict[str, Any]:
-        """Асинхронное получение данных для обзорного дашборда."""
-        loop = asyncio.get_running_loop()
-        date_str = selected_date.strftime('%Y-%m-%d')
-        pd_query = """
-            SELECT d.name as discipline_name,
-                   CAST(r.report_data->>'people_count' AS NUMERIC) as people_count,
-                   CAST(r.report_data->>'volume' AS NUMERIC) as volume,
-                   wt.norm_per_unit,
-                   CASE WHEN LOWER(r.work_type_name) LIKE '%прочие%' OR wt.norm_per_unit IS NULL 
-                        THEN true ELSE false END as is_other
-            FROM reports r
-            JOIN disciplines d ON r.discipline_id = d.id
-            LEFT JOIN work_types wt ON d.id = wt.discipline_id AND r.work_type_name = wt.name
-            WHERE r.report_date = :report_date AND r.workflow_status = 'approved'
-        """
-        func = partial(_run_pandas_query, pd_query, {'report_date': date_str})
-        df = await loop.run_in_executor(None, func)
-
-        discipline_data = []
-        if not df.empty:
-            for discipline in df['discipline_name'].unique():
-                disc_df = df[df['discipline_name'] == discipline]
-                main_df = disc_df[~disc_df['is_other']]
-                other_df = disc_df[disc_df['is_other']]
-                
-                plan_volume = (main_df['people_count'] * main_df['norm_per_unit']).sum() if not main_df.empty else 0
-                
-                discipline_data.append({
-                    'name': discipline,
-                    'main_people': int(main_df['people_count'].sum()),
-                    'other_people': int(other_df['people_count'].sum()),
-                    'performance': (main_df['volume'].sum() / plan_volume * 100) if plan_volume > 0 else 0,
-                    'fact_volume': main_df['volume'].sum() if not main_df.empty else 0
-                })
-        
+        """Обзорный дашборд за день из сводки daily_production_rollup."""
+        rows = await db_query("""
+            SELECT d.name, p.work_type_name, p.norm_per_unit,
+                   SUM(p.people_count)::float8, SUM(p.volume)::float8, SUM(p.planned_volume)::float8
+            FROM daily_production_rollup p
+            JOIN disciplines d ON p.discipline_id = d.id
+            WHERE p.report_date = %s
+            GROUP BY d.name, p.work_type_name, p.norm_per_unit
+            ORDER BY d.name
+        """, (selected_date.strftime('%Y-%m-%d'),))
+
+        summary: Dict[str, Dict[str, float]] = {}
+        for discipline, work_type_name, norm, people, volume, planned in (rows or []):
+            disc = summary.setdefault(discipline, {'main_people': 0, 'other_people': 0, 'fact': 0, 'plan': 0})
+            # "Прочие" работы и работы без нормы в выработку не входят
+            if norm is None or 'прочие' in work_type_name.lower():
+                disc['other_people'] += people
+            else:
+                disc['main_people'] += people
+                disc['fact'] += volume
+                disc['plan'] += planned
+
+        discipline_data = [
+            {
+                'name': discipline,
+                'main_people': int(disc['main_people']),
+                'other_people': int(disc['other_people']),
+                'performance': (disc['fact'] / disc['plan'] * 100) if disc['plan'] > 0 else 0,
+                'fact_volume': disc['fact']
+            }
+            for discipline, disc in summary.items()
+        ]
+
         return {'selected_date': selected_date, 'discipline_data': discipline_data}
 
     @staticmethod
     async def get_chart_data(discipline_id: int, selected_date: date) -> Optional[Dict[str, Any]]:
         """Асинхронное получение данных для графика."""
-        discipline_name_raw = await db_query("SELECT name FROM disciplines WHERE id = %s", (discipline_id,))
-        if not discipline_name_raw:
+        discipline_name = await ReferenceDataService.get_discipline_name(discipline_id)
+        if not discipline_name:
             return None
         
-        loop = asyncio.get_running_loop()
         date_str = selected_date.strftime('%Y-%m-%d')
         pd_query = """
             SELECT r.work_type_name, 
-                   CAST(r.report_data->>'people_count' AS NUMERIC) as people_count, 
-                   CAST(r.report_data->>'volume' AS NUMERIC) as volume, 
+                   r.people_count::float8 as people_count, 
+                   r.volume::float8 as volume, 
                    wt.norm_per_unit
             FROM reports r
             LEFT JOIN work_types wt ON r.work_type_name = wt.name AND r.discipline_id = wt.discipline_id
             WHERE r.report_date = :report_date AND r.discipline_id = :discipline_id
         """
         params = {'report_date': date_str, 'discipline_id': discipline_id}
-        func = partial(_run_pandas_query, pd_query, params)
-        df = await loop.run_in_executor(None, func)
+        df = await run_in_executor(_run_pandas_query, pd_query, params, pool='pandas')
 
         if df.empty or df['norm_per_unit'].isnull().all():
             return None
@@ -328,7 +305,7 @@ class AnalyticsService:
         ).reset_index()
         
         return {
-            'discipline_name': discipline_name_raw[0][0],
+            'discipline_name': discipline_name,
             'selected_date': selected_date,
             'chart_data': [row.to_dict() for _, row in df_chart.iterrows()]
         }
\ No newline at end of file
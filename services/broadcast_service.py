@@ -0,0 +1,172 @@
+# services/broadcast_service.py
+
+"""
+Массовая отправка сообщений с соблюдением лимитов Telegram
+"""
+
+import asyncio
+import logging
+from typing import Dict, Any, List
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError, TimedOut
+
+from config.settings import (
+    BROADCAST_MESSAGES_PER_SECOND, BROADCAST_PER_CHAT_INTERVAL_SECONDS,
+    BROADCAST_WORKERS, BROADCAST_MAX_ATTEMPTS
+)
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повтором при сетевых ошибках: 1, 2, 4... секунд
+_BACKOFF_BASE_SECONDS = 1.0
+# Сколько ошибок выводить в лог
+_MAX_ERRORS_IN_LOG = 20
+
+class _RateLimiter:
+    """Раздает слоты отправки: не чаще rate в секунду на бота и interval на один чат."""
+
+    def __init__(self, rate: float, per_chat_interval: float):
+        self._global_interval = 1.0 / rate
+        self._per_chat_interval = per_chat_interval
+        self._next_global = 0.0
+        self._next_by_chat: Dict[Any, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, chat_id) -> None:
+        """Ждет своего слота для отправки в chat_id."""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            slot = max(now, self._next_global, self._next_by_chat.get(chat_id, 0.0))
+            self._next_global = slot + self._global_interval
+            self._next_by_chat[chat_id] = slot + self._per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def pause(self, seconds: float) -> None:
+        """Сдвигает все слоты (Telegram вернул 429 - флуд-контроль действует на весь бот)."""
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            self._next_global = max(self._next_global, loop.time() + seconds)
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    """retry_after бывает int или timedelta в зависимости от версии PTB."""
+    retry_after = error.retry_after
+    if hasattr(retry_after, 'total_seconds'):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class BroadcastService:
+    """Сервис массовых рассылок: пул воркеров, лимиты Telegram, повторы и сводка доставки"""
+
+    @staticmethod
+    async def _deliver(bot, message: Dict[str, Any], limiter: _RateLimiter, summary: Dict[str, Any]) -> None:
+        """Отправляет одно сообщение с повторами. Результат пишет в summary."""
+        chat_id = message['chat_id']
+        send_kwargs = {key: value for key, value in message.items() if key != 'key'}
+
+        for attempt in range(1, BROADCAST_MAX_ATTEMPTS + 1):
+            await limiter.wait(chat_id)
+            try:
+                await bot.send_message(**send_kwargs)
+                summary['sent'] += 1
+                summary['delivered'].append(message.get('key', chat_id))
+                return
+            except RetryAfter as e:
+                delay = _retry_after_seconds(e)
+                summary['retries'] += 1
+                logger.warning(f"Broadcast: флуд-контроль, пауза {delay} сек (чат {chat_id})")
+                await limiter.pause(delay)
+            except Forbidden as e:
+                # Пользователь заблокировал бота - повторять бессмысленно
+                summary['blocked'] += 1
+                BroadcastService._add_failure(summary, message, e, permanent=True)
+                return
+            except BadRequest as e:
+                summary['failed'] += 1
+                BroadcastService._add_failure(summary, message, e, permanent=True)
+                return
+            except TimedOut:
+                # Запрос мог дойти до Telegram - повтор рискует продублировать сообщение
+                summary['timed_out'] += 1
+                summary['uncertain'].append(message.get('key', chat_id))
+                return
+            except NetworkError:
+                if attempt == BROADCAST_MAX_ATTEMPTS:
+                    break
+                summary['retries'] += 1
+                await asyncio.sleep(_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1))
+            except TelegramError as e:
+                summary['failed'] += 1
+                BroadcastService._add_failure(summary, message, e, permanent=False)
+                return
+
+        summary['failed'] += 1
+        BroadcastService._add_failure(
+            summary, message, f"не доставлено за {BROADCAST_MAX_ATTEMPTS} попыток", permanent=False
+        )
+
+    @staticmethod
+    def _add_failure(summary: Dict[str, Any], message: Dict[str, Any], error, permanent: bool) -> None:
+        """Запоминает недоставленное сообщение. permanent - повтор не поможет (бот заблокирован и т.п.)"""
+        summary['failures'].append({
+            'key': message.get('key', message.get('chat_id')),
+            'chat_id': message.get('chat_id'),
+            'error': str(error),
+            'permanent': permanent
+        })
+
+    @staticmethod
+    async def send_bulk(bot, messages: List[Dict[str, Any]], name: str = "broadcast") -> Dict[str, Any]:
+        """
+        Рассылает сообщения пулом воркеров.
+
+        Каждое сообщение - dict с аргументами bot.send_message (chat_id, text, reply_markup, parse_mode)
+        и необязательным 'key', который попадает в summary['delivered'] при успешной отправке.
+        При таймауте сообщение не повторяется (оно могло дойти): key попадает в summary['uncertain'].
+        Возвращает сводку: total, sent, failed, blocked, timed_out, retries, elapsed, delivered, uncertain, failures.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        summary = {
+            'name': name, 'total': len(messages), 'sent': 0, 'failed': 0, 'blocked': 0, 'timed_out': 0,
+            'retries': 0, 'elapsed': 0.0, 'delivered': [], 'uncertain': [], 'failures': []
+        }
+        if not messages:
+            return summary
+
+        limiter = _RateLimiter(BROADCAST_MESSAGES_PER_SECOND, BROADCAST_PER_CHAT_INTERVAL_SECONDS)
+        queue: asyncio.Queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+
+        async def worker():
+            while True:
+                try:
+                    message = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    await BroadcastService._deliver(bot, message, limiter, summary)
+                except Exception as e:
+                    summary['failed'] += 1
+                    BroadcastService._add_failure(summary, message, e, permanent=False)
+
+        workers_count = min(BROADCAST_WORKERS, len(messages))
+        await asyncio.gather(*(worker() for _ in range(workers_count)))
+
+        summary['elapsed'] = loop.time() - started
+        BroadcastService.log_summary(summary)
+        return summary
+
+    @staticmethod
+    def log_summary(summary: Dict[str, Any]) -> None:
+        """Пишет сводку рассылки в лог"""
+        logger.info(
+            f"Broadcast '{summary['name']}': всего {summary['total']}, отправлено {summary['sent']}, "
+            f"ошибок {summary['failed']}, заблокировали бота {summary['blocked']}, "
+            f"таймаутов (доставка неизвестна) {summary['timed_out']}, "
+            f"повторов {summary['retries']}, за {summary['elapsed']:.1f} сек"
+        )
+        for failure in summary['failures'][:_MAX_ERRORS_IN_LOG]:
+            logger.warning(f"Broadcast '{summary['name']}': чат {failure['chat_id']} - {failure['error']}")
@@ -0,0 +1,210 @@
+# services/domain_event_service.py
+
+"""
+Outbox доменных событий на таблице domain_events.
+
+WorkflowService пишет событие (report_created, master_approved, kiok_approved, report_rejected)
+тем же SQL-запросом, что меняет отчет, поэтому событие есть ровно тогда, когда есть изменение.
+Фоновый диспетчер забирает события пачками (FOR UPDATE SKIP LOCKED - реплики не пересекаются)
+и передает их подписчикам: уведомления, публикация в группу, сводка выработки.
+
+Доставка "хотя бы один раз": подписчик, который уже отработал, сразу записывается в done_subscribers
+и при повторе события (в том числе после падения реплики посреди пачки) не вызывается; упавший подписчик повторяется с backoff до DOMAIN_EVENTS_MAX_ATTEMPTS.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.settings import (
+    DOMAIN_EVENTS_POLL_SECONDS, DOMAIN_EVENTS_BATCH_SIZE, DOMAIN_EVENTS_MAX_ATTEMPTS,
+    DOMAIN_EVENTS_LEASE_SECONDS, DOMAIN_EVENTS_RETRY_SECONDS
+)
+from database.queries import db_query, db_execute
+
+logger = logging.getLogger(__name__)
+
+REPORT_CREATED = 'report_created'
+REPORT_SUBMITTED = 'report_submitted'
+MASTER_APPROVED = 'master_approved'
+KIOK_APPROVED = 'kiok_approved'
+REPORT_REJECTED = 'report_rejected'
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Подписчик получает context (Application или CallbackContext - нужен .bot) и пачку событий одного типа.
+# Исключение - повторить всю пачку; список id - повторить только эти события
+Subscriber = Callable[[Any, List[Dict[str, Any]]], Awaitable[Optional[List[int]]]]
+
+class DomainEventService:
+    """Подписка на доменные события и их фоновая доставка"""
+
+    # тип события -> [(имя подписчика, обработчик)]; имя хранится в done_subscribers
+    _subscribers: Dict[str, List[Tuple[str, Subscriber]]] = {}
+    _wakeup: Optional[asyncio.Event] = None
+    _task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def subscribe(event_type: str, name: str, handler: Subscriber) -> None:
+        """Регистрирует подписчика; name должен быть стабильным между рестартами"""
+        DomainEventService._subscribers.setdefault(event_type, []).append((name, handler))
+
+    @staticmethod
+    def wake() -> None:
+        """Будит диспетчер сразу после коммита, не дожидаясь очередного опроса"""
+        if DomainEventService._wakeup is not None:
+            DomainEventService._wakeup.set()
+
+    @staticmethod
+    async def _release_stale_leases() -> None:
+        """
+        События в processing дольше lease - реплика упала посреди доставки.
+        Возвращаем их в очередь: подписчики, успевшие отработать, записаны в done_subscribers
+        сразу после своего вызова и не повторятся; повторится только прерванный подписчик.
+        """
+        released = await db_execute("""
+            UPDATE domain_events
+            SET status = 'pending', locked_by = NULL, locked_at = NULL
+            WHERE status = 'processing' AND locked_at < NOW() - make_interval(secs => %s)
+        """, (DOMAIN_EVENTS_LEASE_SECONDS,))
+        if released:
+            logger.warning(f"⚠️ Outbox: {released} событий с истекшим lease возвращены в очередь")
+
+    @staticmethod
+    async def claim_batch(limit: int = DOMAIN_EVENTS_BATCH_SIZE) -> List[Dict[str, Any]]:
+        """Захватывает пачку наступивших событий для этой реплики (в порядке записи)"""
+        events = await db_query("""
+            UPDATE domain_events
+            SET status = 'processing', locked_by = %s, locked_at = NOW(), attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM domain_events
+                WHERE status = 'pending' AND available_at <= NOW()
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, event_type, report_id, payload, attempts, done_subscribers
+        """, (WORKER_ID, limit), as_dict=True)
+        for event in events or []:
+            if isinstance(event['payload'], str):
+                event['payload'] = json.loads(event['payload'])
+            event['payload'] = event['payload'] or {}
+            event['done_subscribers'] = list(event['done_subscribers'] or [])
+        return sorted(events or [], key=lambda event: event['id'])
+
+    @staticmethod
+    async def _mark_subscriber_done(name: str, event_ids: List[int]) -> None:
+        """Сохраняет, что подписчик отработал эти события (до перехода к следующему подписчику)"""
+        if event_ids:
+            await db_execute("""
+                UPDATE domain_events
+                SET done_subscribers = array_append(done_subscribers, %s)
+                WHERE id = ANY(%s) AND status = 'processing' AND locked_by = %s AND NOT (%s = ANY(done_subscribers))
+            """, (name, event_ids, WORKER_ID, name))
+
+    @staticmethod
+    async def _mark_done(event_ids: List[int]) -> None:
+        if event_ids:
+            await db_execute("""
+                UPDATE domain_events
+                SET status = 'done', processed_at = NOW(), locked_by = NULL, locked_at = NULL, last_error = NULL
+                WHERE id = ANY(%s) AND status = 'processing'
+            """, (event_ids,))
+
+    @staticmethod
+    async def _mark_failed(event: Dict[str, Any], error: str) -> None:
+        """Возвращает событие в очередь с backoff (или в dead); отработавшие подписчики уже сохранены"""
+        await db_execute("""
+            UPDATE domain_events
+            SET status = CASE WHEN attempts >= %s THEN 'dead' ELSE 'pending' END,
+                available_at = NOW() + make_interval(secs => %s * power(2, GREATEST(attempts - 1, 0))),
+                last_error = %s, locked_by = NULL, locked_at = NULL
+            WHERE id = %s AND status = 'processing'
+        """, (DOMAIN_EVENTS_MAX_ATTEMPTS, DOMAIN_EVENTS_RETRY_SECONDS, error, event['id']))
+        if event['attempts'] >= DOMAIN_EVENTS_MAX_ATTEMPTS:
+            logger.error(f"❌ Outbox: событие {event['id']} ({event['event_type']}) перенесено в dead: {error}")
+
+    @staticmethod
+    async def dispatch_pending(context) -> int:
+        """Доставляет одну пачку событий подписчикам; возвращает размер пачки"""
+        await DomainEventService._release_stale_leases()
+
+        events = await DomainEventService.claim_batch()
+        if not events:
+            return 0
+
+        by_type: Dict[str, List[Dict[str, Any]]] = {}
+        for event in events:
+            by_type.setdefault(event['event_type'], []).append(event)
+
+        errors: Dict[int, str] = {}
+        for event_type, typed_events in by_type.items():
+            for name, handler in DomainEventService._subscribers.get(event_type, []):
+                todo = [event for event in typed_events if name not in event['done_subscribers']]
+                if not todo:
+                    continue
+                try:
+                    failed_ids = set(await handler(context, todo) or [])
+                except Exception as e:
+                    logger.error(f"❌ Outbox: подписчик {name} не обработал {len(todo)} событий {event_type}: {e}")
+                    failed_ids, error = {event['id'] for event in todo}, f"{name}: {e}"
+                else:
+                    error = f"{name}: delivery failed"
+                done_ids = []
+                for event in todo:
+                    if event['id'] in failed_ids:
+                        errors[event['id']] = error
+                    else:
+                        event['done_subscribers'].append(name)
+                        done_ids.append(event['id'])
+                await DomainEventService._mark_subscriber_done(name, done_ids)
+
+        await DomainEventService._mark_done([event['id'] for event in events if event['id'] not in errors])
+        for event in events:
+            if event['id'] in errors:
+                await DomainEventService._mark_failed(event, errors[event['id']])
+
+        logger.debug(f"Outbox: обработано {len(events)} событий, с ошибками {len(errors)}")
+        return len(events)
+
+    @staticmethod
+    async def _run(context) -> None:
+        """Цикл диспетчера: пачки подряд, пока есть события, затем ожидание wake() или опроса"""
+        wakeup = DomainEventService._wakeup
+        while True:
+            try:
+                while await DomainEventService.dispatch_pending(context) >= DOMAIN_EVENTS_BATCH_SIZE:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработки outbox: {e}")
+
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=DOMAIN_EVENTS_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+
+    @staticmethod
+    def start(application) -> None:
+        """Запускает диспетчер в фоне (события других реплик подхватываются опросом)"""
+        if DomainEventService._task is not None:
+            return
+        DomainEventService._wakeup = asyncio.Event()
+        DomainEventService._task = asyncio.create_task(DomainEventService._run(application), name="domain_events")
+        logger.info("✅ Диспетчер доменных событий запущен")
+
+    @staticmethod
+    async def stop() -> None:
+        task, DomainEventService._task = DomainEventService._task, None
+        DomainEventService._wakeup = None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,76 @@
+# services/event_subscribers.py
+
+"""
+Подписчики доменных событий: все побочные эффекты согласования отчетов.
+Обработчики кнопок только меняют статус и сразу отвечают, остальное делает диспетчер outbox.
+"""
+
+import logging
+from typing import Any, Dict, List
+
+from services.domain_event_service import (
+    DomainEventService, REPORT_CREATED, REPORT_SUBMITTED, MASTER_APPROVED, KIOK_APPROVED, REPORT_REJECTED
+)
+from services.notification_service import NotificationService
+from services.production_rollup_service import ProductionRollupService
+from services.reference_data_service import ReferenceDataService
+
+logger = logging.getLogger(__name__)
+
+async def notify_masters(context, events: List[Dict[str, Any]]) -> List[int]:
+    """Новый отчет - мастерам его дисциплины; повторяем, только если не дошло ни одному"""
+    failed = []
+    for event in events:
+        discipline_name = await ReferenceDataService.get_discipline_name(event['payload'].get('discipline_id'))
+        if not discipline_name:
+            logger.warning(f"Не удалось найти дисциплину отчета {event['report_id']}, мастера не уведомлены")
+            continue
+        masters = await NotificationService.get_users_for_discipline_notification(discipline_name, 'master')
+        sent = 0
+        for master_id in masters:
+            sent += await NotificationService.notify_master_new_report(context, event['report_id'], master_id)
+        if masters and not sent:
+            failed.append(event['id'])
+        logger.info(f"Уведомления о новом отчете {event['report_id']} отправлены {sent} из {len(masters)} мастерам")
+    return failed
+
+def _events_for_reports(events: List[Dict[str, Any]], report_ids: List[int]) -> List[int]:
+    """id событий по id отчетов, которые подписчик не обработал"""
+    failed = set(report_ids)
+    return [event['id'] for event in events if event['report_id'] in failed]
+
+async def notify_kiok(context, events: List[Dict[str, Any]]) -> List[int]:
+    """Подтвержденные мастером отчеты - одно сводное сообщение каждому КИОК"""
+    failed = await NotificationService.notify_kiok_new_reports(context, [event['report_id'] for event in events])
+    return _events_for_reports(events, failed)
+
+async def notify_supervisor(context, events: List[Dict[str, Any]]) -> List[int]:
+    """Согласование или отклонение - супервайзеру отчета"""
+    failed = []
+    for event in events:
+        new_status = 'approved' if event['event_type'] == KIOK_APPROVED else 'rejected'
+        if not await NotificationService.notify_supervisor_status_change(
+            context, event['report_id'], new_status, event['payload'].get('actor_id'), event['payload'].get('reason')
+        ):
+            failed.append(event['id'])
+    return failed
+
+async def publish_to_group(context, events: List[Dict[str, Any]]) -> List[int]:
+    """Согласованные отчеты - в темы дисциплин группы отчетов"""
+    failed = await NotificationService.publish_approved_reports(context, [event['report_id'] for event in events])
+    return _events_for_reports(events, failed)
+
+async def refresh_rollup(context, events: List[Dict[str, Any]]) -> None:
+    """Согласованные отчеты попадают в сводку выработки для дашбордов (пересчет идемпотентный)"""
+    if not await ProductionRollupService.refresh_reports([event['report_id'] for event in events]):
+        raise RuntimeError("сводка выработки не обновлена")
+
+def register_event_subscribers() -> None:
+    """Регистрация подписчиков (один раз при запуске бота)"""
+    DomainEventService.subscribe(REPORT_CREATED, 'notify_masters', notify_masters)
+    DomainEventService.subscribe(REPORT_SUBMITTED, 'notify_masters', notify_masters)
+    DomainEventService.subscribe(MASTER_APPROVED, 'notify_kiok', notify_kiok)
+    DomainEventService.subscribe(KIOK_APPROVED, 'refresh_rollup', refresh_rollup)
+    DomainEventService.subscribe(KIOK_APPROVED, 'notify_supervisor', notify_supervisor)
+    DomainEventService.subscribe(KIOK_APPROVED, 'publish_to_group', publish_to_group)
+    DomainEventService.subscribe(REPORT_REJECTED, 'notify_supervisor', notify_supervisor)
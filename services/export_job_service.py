@@ -0,0 +1,175 @@
+# services/export_job_service.py
+
+"""
+Фоновые выгрузки в Excel: выполняются в пуле процессов, не блокируя event loop бота.
+
+У каждой задачи есть id; прогресс показывается правкой сообщения в Telegram,
+задачу можно отменить кнопкой, у одного пользователя одновременно не больше одной задачи.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
+
+from config.settings import EXPORT_JOB_WORKERS, EXPORT_PROGRESS_INTERVAL_SECONDS
+from services.export_service import ExportService, ExportCancelled
+
+logger = logging.getLogger(__name__)
+
+def _run_export_step(method_name: str, args: tuple, state) -> Optional[str]:
+    """[ДОЧЕРНИЙ ПРОЦЕСС] Выполняет один метод ExportService. state - общий dict менеджера процессов."""
+    def progress(label: str) -> None:
+        if state.get('cancelled'):
+            raise ExportCancelled()
+        state['progress'] = label
+
+    try:
+        return getattr(ExportService, method_name)(*args, progress=progress)
+    except ExportCancelled:
+        return None
+
+class ExportJobService:
+    """Реестр фоновых выгрузок"""
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _manager = None
+    # job_id -> задача; user_id -> job_id активной задачи
+    _jobs: Dict[str, Dict[str, Any]] = {}
+    _active_by_user: Dict[str, str] = {}
+
+    @staticmethod
+    def _get_executor() -> ProcessPoolExecutor:
+        # spawn: дочерние процессы не наследуют event loop, пул asyncpg и потоки бота
+        if ExportJobService._executor is None:
+            context = multiprocessing.get_context('spawn')
+            ExportJobService._manager = context.Manager()
+            ExportJobService._executor = ProcessPoolExecutor(max_workers=EXPORT_JOB_WORKERS, mp_context=context)
+        return ExportJobService._executor
+
+    @staticmethod
+    def get_active_job(user_id: str) -> Optional[Dict[str, Any]]:
+        job_id = ExportJobService._active_by_user.get(str(user_id))
+        return ExportJobService._jobs.get(job_id) if job_id else None
+
+    @staticmethod
+    async def start(bot, user_id: str, chat_id, message_id: int, title: str, steps: List[Dict[str, Any]],
+                    done_text: str, done_markup: Optional[InlineKeyboardMarkup] = None) -> Optional[str]:
+        """
+        Запускает выгрузку. steps - файлы по порядку: dict с method (имя метода ExportService),
+        args и необязательными filename, caption, chat_id получателя.
+        Возвращает job_id или None, если у пользователя уже идет выгрузка.
+        """
+        user_id = str(user_id)
+        if ExportJobService.get_active_job(user_id):
+            return None
+
+        executor = ExportJobService._get_executor()
+        job_id = uuid.uuid4().hex[:8]
+        job = {
+            'id': job_id,
+            'user_id': user_id,
+            'chat_id': chat_id,
+            'message_id': message_id,
+            'title': title,
+            'steps': steps,
+            'done_text': done_text,
+            'done_markup': done_markup,
+            'state': ExportJobService._manager.dict(progress='', cancelled=False),
+        }
+        ExportJobService._jobs[job_id] = job
+        ExportJobService._active_by_user[user_id] = job_id
+
+        job['task'] = asyncio.create_task(ExportJobService._run(bot, job, executor))
+        logger.info(f"Выгрузка {job_id} ({title}) запущена для пользователя {user_id}")
+        return job_id
+
+    @staticmethod
+    def cancel(job_id: str, user_id: str) -> bool:
+        """Просит задачу остановиться. Отменить можно только свою задачу."""
+        job = ExportJobService._jobs.get(job_id)
+        if not job or job['user_id'] != str(user_id):
+            return False
+        job['state']['cancelled'] = True
+        return True
+
+    @staticmethod
+    async def _edit(bot, job: Dict[str, Any], text: str, reply_markup=None) -> None:
+        try:
+            await bot.edit_message_text(
+                chat_id=job['chat_id'], message_id=job['message_id'], text=text, reply_markup=reply_markup
+            )
+        except BadRequest as e:
+            # "Message is not modified" и удаленное сообщение не мешают выгрузке
+            logger.debug(f"Выгрузка {job['id']}: не удалось обновить сообщение: {e}")
+
+    @staticmethod
+    async def _run(bot, job: Dict[str, Any], executor: ProcessPoolExecutor) -> None:
+        loop = asyncio.get_running_loop()
+        state = job['state']
+        cancel_markup = InlineKeyboardMarkup([[
+            InlineKeyboardButton("✖️ Отменить", callback_data=f"export_cancel_{job['id']}")
+        ]])
+        sent = 0
+        try:
+            for index, step in enumerate(job['steps'], 1):
+                future = loop.run_in_executor(executor, _run_export_step, step['method'], tuple(step['args']), state)
+                last_text = None
+                while not future.done():
+                    await asyncio.wait({future}, timeout=EXPORT_PROGRESS_INTERVAL_SECONDS)
+                    if future.done():
+                        break
+                    progress = await loop.run_in_executor(None, state.get, 'progress')
+                    text = f"⏳ {job['title']} ({index}/{len(job['steps'])})\n{progress or 'Подготовка...'}"
+                    if text != last_text:
+                        await ExportJobService._edit(bot, job, text, cancel_markup)
+                        last_text = text
+
+                file_path = future.result()
+                if await loop.run_in_executor(None, state.get, 'cancelled'):
+                    ExportService.cleanup_temp_file(file_path)
+                    await ExportJobService._edit(bot, job, f"✖️ {job['title']}: выгрузка отменена.", job['done_markup'])
+                    return
+                if not file_path:
+                    await ExportJobService._edit(bot, job, "❌ Ошибка при формировании файла. Попробуйте позже.", job['done_markup'])
+                    return
+
+                try:
+                    with open(file_path, 'rb') as file:
+                        await bot.send_document(
+                            chat_id=step.get('chat_id', job['chat_id']),
+                            document=file,
+                            filename=step.get('filename'),
+                            caption=step.get('caption')
+                        )
+                    sent += 1
+                finally:
+                    ExportService.cleanup_temp_file(file_path)
+
+            await ExportJobService._edit(bot, job, job['done_text'], job['done_markup'])
+            logger.info(f"Выгрузка {job['id']} завершена, отправлено файлов: {sent}")
+
+        except Exception as e:
+            logger.error(f"Ошибка выгрузки {job['id']}: {e}")
+            await ExportJobService._edit(bot, job, "❌ Произошла ошибка при формировании файла.", job['done_markup'])
+        finally:
+            ExportJobService._jobs.pop(job['id'], None)
+            if ExportJobService._active_by_user.get(job['user_id']) == job['id']:
+                del ExportJobService._active_by_user[job['user_id']]
+
+    @staticmethod
+    def shutdown() -> None:
+        """Останавливает пул процессов (при остановке бота)"""
+        for job in ExportJobService._jobs.values():
+            job['task'].cancel()
+        if ExportJobService._executor is not None:
+            ExportJobService._executor.shutdown(wait=False, cancel_futures=True)
+            ExportJobService._executor = None
+        if ExportJobService._manager is not None:
+            ExportJobService._manager.shutdown()
+            ExportJobService._manager = None
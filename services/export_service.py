@@ -1,180 +1,301 @@
 # services/export_service.py
 
+import json
 import logging
 import os
-import pandas as pd
-from datetime import date
-from typing import Dict, List, Any, Optional
-from sqlalchemy import create_engine, text
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Callable, Dict, List, Any, Optional
 
-from config.settings import DATABASE_URL
+import xlsxwriter
+from sqlalchemy import text
+
+from config.settings import EXPORT_FETCH_CHUNK_ROWS
+from database.connection import db_manager
 from utils.constants import ALL_TABLE_NAMES_FOR_BACKUP, TEMP_DIR
 
 logger = logging.getLogger(__name__)
 
+# Пользователи по таблицам ролей. Колонки приведены к общему виду, имена - к first_name/last_name
+_ALL_USERS_QUERIES = {
+    'Админы': """
+        SELECT user_id, first_name, last_name, username, phone_number, created_at FROM admins
+    """,
+    'Менеджеры': """
+        SELECT m.user_id, m.first_name, m.last_name, m.username, m.phone_number,
+               m.level as "Уровень", d.name as "Дисциплина", m.created_at
+        FROM managers m
+        LEFT JOIN disciplines d ON m.discipline = d.id
+    """,
+    'Супервайзеры': """
+        SELECT s.user_id, s.supervisor_name as first_name, s.phone_number,
+               d.name as "Дисциплина", s.created_at
+        FROM supervisors s
+        LEFT JOIN disciplines d ON s.discipline_id = d.id
+    """,
+    'Мастера': """
+        SELECT m.user_id, m.master_name as first_name, m.phone_number,
+               d.name as "Дисциплина", m.created_at
+        FROM masters m
+        LEFT JOIN disciplines d ON m.discipline_id = d.id
+    """,
+    'Бригадиры': """
+        SELECT b.user_id, b.first_name, b.last_name, b.username, b.phone_number,
+               b.brigade_name as "Бригада", d.name as "Дисциплина", b.created_at
+        FROM brigades b
+        LEFT JOIN disciplines d ON b.discipline_id = d.id
+    """,
+    'ПТО': """
+        SELECT p.user_id, p.first_name, p.last_name, p.username, p.phone_number,
+               d.name as "Дисциплина", p.created_at
+        FROM pto p
+        LEFT JOIN disciplines d ON p.discipline_id = d.id
+    """,
+    'КИОК': """
+        SELECT k.user_id, k.kiok_name as first_name, k.phone_number,
+               d.name as "Дисциплина", k.created_at
+        FROM kiok k
+        LEFT JOIN disciplines d ON k.discipline_id = d.id
+    """
+}
+
+_USER_COLUMN_TITLES = {
+    'user_id': 'ID пользователя',
+    'first_name': 'Имя',
+    'last_name': 'Фамилия',
+    'username': 'Username',
+    'phone_number': 'Телефон',
+    'created_at': 'Дата регистрации'
+}
+
+# Колбэк прогресса: получает строку для пользователя, может бросить ExportCancelled
+ProgressCallback = Callable[[str], None]
+
+class ExportCancelled(Exception):
+    """Выгрузка отменена пользователем (бросается из колбэка прогресса)"""
+
+class _ExcelStreamWriter:
+    """
+    Книга xlsxwriter в режиме constant_memory: строки пишутся на диск по мере поступления,
+    в памяти держится только текущая строка. Данные читаются серверным курсором порциями.
+    """
+
+    def __init__(self, file_path: str, progress: Optional[ProgressCallback] = None):
+        self._progress = progress
+        self.workbook = xlsxwriter.Workbook(file_path, {
+            'constant_memory': True,
+            'remove_timezone': True,
+            'default_date_format': 'yyyy-mm-dd hh:mm:ss'
+        })
+        self._date_format = self.workbook.add_format({'num_format': 'yyyy-mm-dd'})
+        self._header_format = self.workbook.add_format({'bold': True})
+
+    @staticmethod
+    def _cell_value(value):
+        """Приводит значение из БД к типу, который понимает xlsxwriter."""
+        if isinstance(value, Decimal):
+            return float(value)
+        if isinstance(value, (dict, list)):
+            return json.dumps(value, ensure_ascii=False, default=str)
+        if value is None or isinstance(value, (str, int, float, bool, date)):
+            return value
+        return str(value)
+
+    def write_query(self, connection, sheet_name: str, query: str, params: Dict[str, Any] = None,
+                    column_titles: Dict[str, str] = None, column_width: Optional[int] = None) -> int:
+        """
+        Выгружает результат запроса на новый лист. Возвращает количество строк.
+        column_width=None - ширина по самому длинному значению (не больше 30).
+        """
+        result = connection.execution_options(
+            stream_results=True, max_row_buffer=EXPORT_FETCH_CHUNK_ROWS
+        ).execute(text(query), params or {})
+
+        columns = [(column_titles or {}).get(key, key) for key in result.keys()]
+        worksheet = self.workbook.add_worksheet(sheet_name)
+        worksheet.write_row(0, 0, columns, self._header_format)
+        widths = [len(str(column)) for column in columns]
+
+        row_index = 0
+        while True:
+            chunk = result.fetchmany(EXPORT_FETCH_CHUNK_ROWS)
+            if not chunk:
+                break
+            if self._progress:
+                self._progress(f"{sheet_name}: {row_index + len(chunk)} строк")
+            for row in chunk:
+                row_index += 1
+                for col_index, raw_value in enumerate(row):
+                    value = self._cell_value(raw_value)
+                    if isinstance(value, date) and not isinstance(value, datetime):
+                        worksheet.write_datetime(row_index, col_index, value, self._date_format)
+                    else:
+                        worksheet.write(row_index, col_index, value)
+                    if column_width is None and value is not None:
+                        widths[col_index] = max(widths[col_index], len(str(value)))
+        result.close()
+
+        for col_index, width in enumerate(widths):
+            worksheet.set_column(col_index, col_index, column_width or min(width + 2, 30))
+        return row_index
+
+    def close(self):
+        self.workbook.close()
+
 class ExportService:
     """Сервис для экспорта данных в Excel (ИСПРАВЛЕННАЯ ВЕРСИЯ)"""
-    
+
     @staticmethod
     def create_temp_directory():
         """Создает временную директорию если не существует"""
         if not os.path.exists(TEMP_DIR):
             os.makedirs(TEMP_DIR)
-    
+
     @staticmethod
-    def generate_directories_template() -> Optional[str]:
+    def generate_directories_template(progress: Optional[ProgressCallback] = None) -> Optional[str]:
         """Создает шаблон Excel для справочников с ID"""
         try:
             ExportService.create_temp_directory()
-            
+
             current_date_str = date.today().strftime('%Y-%m-%d')
             file_path = os.path.join(TEMP_DIR, f"directories_template_{current_date_str}.xlsx")
-            
-            engine = create_engine(DATABASE_URL)
-            
-            with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-                with engine.connect() as connection:
+
+            writer = _ExcelStreamWriter(file_path, progress)
+            try:
+                with db_manager.get_sqlalchemy_engine().connect() as connection:
                     # Дисциплины с ID
-                    disciplines_df = pd.read_sql_query(
-                        text("SELECT id, name, description FROM disciplines ORDER BY id"), 
-                        connection
+                    writer.write_query(
+                        connection, 'Дисциплины',
+                        "SELECT id, name, description FROM disciplines ORDER BY id",
+                        column_width=20
                     )
-                    disciplines_df.to_excel(writer, sheet_name='Дисциплины', index=False)
-                    
-                    # Корпуса с ID  
-                    objects_df = pd.read_sql_query(
-                        text("SELECT id, name, display_order FROM construction_objects ORDER BY display_order"), 
-                        connection
+
+                    # Корпуса с ID
+                    writer.write_query(
+                        connection, 'Корпуса',
+                        "SELECT id, name, display_order FROM construction_objects ORDER BY display_order",
+                        column_width=20
                     )
-                    objects_df.to_excel(writer, sheet_name='Корпуса', index=False)
-                    
+
                     # Виды работ с ID и discipline_name
-                    work_types_df = pd.read_sql_query(
-                        text("""
-                            SELECT wt.id, wt.name, d.name as discipline_name, 
+                    writer.write_query(
+                        connection, 'Виды работ',
+                        """
+                            SELECT wt.id, wt.name, d.name as discipline_name,
                                    wt.unit_of_measure, wt.norm_per_unit, wt.display_order
-                            FROM work_types wt 
-                            JOIN disciplines d ON wt.discipline_id = d.id 
+                            FROM work_types wt
+                            JOIN disciplines d ON wt.discipline_id = d.id
                             ORDER BY d.name, wt.display_order
-                        """), 
-                        connection
+                        """,
+                        column_width=20
                     )
-                    work_types_df.to_excel(writer, sheet_name='Виды работ', index=False)
-                    
-                    # Инструкции
-                    workbook = writer.book
-                    instructions_sheet = workbook.add_worksheet('Инструкция')
-                    instructions = [
-                        "ИНСТРУКЦИЯ ПО ИМПОРТУ СПРАВОЧНИКОВ:",
-                        "",
-                        "1. ID - если указан, будет использован; если пустой - автогенерация",
-                        "2. Строки не в файле будут УДАЛЕНЫ из БД",
-                        "3. Столбцы читаются по заголовкам из этого файла",
-                        "",
-                        "Дисциплины: id, name, description",
-                        "Корпуса: id, name, display_order", 
-                        "Виды работ: id, name, discipline_name, unit_of_measure, norm_per_unit, display_order",
-                        "",
-                        "ВАЖНО: Сохраните файл и отправьте боту для применения изменений."
-                    ]
-                    for i, instruction in enumerate(instructions):
-                        instructions_sheet.write(i, 0, instruction)
-                                        
-                    # Настраиваем ширину колонок
-                    for sheet_name in writer.sheets:
-                        worksheet = writer.sheets[sheet_name]
-                        for i in range(10):
-                            worksheet.set_column(i, i, 20)
-            
+
+                # Инструкции
+                instructions_sheet = writer.workbook.add_worksheet('Инструкция')
+                instructions = [
+                    "ИНСТРУКЦИЯ ПО ИМПОРТУ СПРАВОЧНИКОВ:",
+                    "",
+                    "1. ID - если указан, будет использован; если пустой - автогенерация",
+                    "2. Строки не в файле будут УДАЛЕНЫ из БД",
+                    "3. Столбцы читаются по заголовкам из этого файла",
+                    "",
+                    "Дисциплины: id, name, description",
+                    "Корпуса: id, name, display_order",
+                    "Виды работ: id, name, discipline_name, unit_of_measure, norm_per_unit, display_order",
+                    "",
+                    "ВАЖНО: Сохраните файл и отправьте боту для применения изменений."
+                ]
+                instructions_sheet.set_column(0, 0, 20)
+                for i, instruction in enumerate(instructions):
+                    instructions_sheet.write(i, 0, instruction)
+            finally:
+                writer.close()
+
             logger.info(f"Шаблон справочников создан: {file_path}")
             return file_path
-            
+
+        except ExportCancelled:
+            ExportService.cleanup_temp_file(file_path)
+            raise
         except Exception as e:
             logger.error(f"Ошибка создания шаблона справочников: {e}")
             return None
 
     @staticmethod
-    def export_full_database_backup(user_id: str) -> Optional[str]:
+    def export_full_database_backup(user_id: str, progress: Optional[ProgressCallback] = None) -> Optional[str]:
         """Полный экспорт БД с ID для восстановления"""
         try:
             ExportService.create_temp_directory()
-            
+
             current_date_str = date.today().strftime('%Y-%m-%d')
             file_path = os.path.join(TEMP_DIR, f"full_db_backup_{user_id}_{current_date_str}.xlsx")
-            
-            engine = create_engine(DATABASE_URL)
-            
-            with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-                with engine.connect() as connection:
-                    
+
+            writer = _ExcelStreamWriter(file_path, progress)
+            try:
+                with db_manager.get_sqlalchemy_engine().connect() as connection:
+                    # Какие таблицы есть и у каких есть столбец id - одним запросом
+                    existing = connection.execute(text("""
+                        SELECT t.tablename,
+                               EXISTS (
+                                   SELECT 1 FROM information_schema.columns c
+                                   WHERE c.table_schema = 'public' AND c.table_name = t.tablename
+                                     AND c.column_name = 'id'
+                               ) AS has_id
+                        FROM pg_tables t
+                        WHERE t.schemaname = 'public' AND t.tablename = ANY(:table_names)
+                    """), {'table_names': list(ALL_TABLE_NAMES_FOR_BACKUP)}).fetchall()
+                    tables = {row[0]: row[1] for row in existing}
+
                     for table_name in ALL_TABLE_NAMES_FOR_BACKUP:
+                        if table_name not in tables:
+                            logger.warning(f"Таблица {table_name} не найдена в БД, пропущена в бэкапе")
+                            continue
+
+                        # Экспортируем с ID как первый столбец (если есть)
+                        order_by = " ORDER BY id" if tables[table_name] else ""
                         try:
-                            # Проверяем существование таблицы
-                            query_check_table = text("""
-                                SELECT EXISTS (
-                                    SELECT FROM pg_tables 
-                                    WHERE schemaname = 'public' AND tablename = :table_name
-                                )
-                            """)
-                            
-                            if connection.execute(query_check_table, {'table_name': table_name}).scalar():
-                                # Экспортируем с ID как первый столбец (если есть)
-                                try:
-                                    df = pd.read_sql_query(text(f"SELECT * FROM {table_name} ORDER BY id"), connection)
-                                except Exception:
-                                    # Если нет столбца id, экспортируем как есть
-                                    df = pd.read_sql_query(text(f"SELECT * FROM {table_name}"), connection)
-                                
-                                # Обработка специфичных полей с датами/временем
-                                if table_name == 'reports':
-                                    timezone_cols = ['created_at', 'supervisor_signed_at', 'master_signed_at', 'kiok_signed_at']
-                                    for col in timezone_cols:
-                                        if col in df.columns and pd.api.types.is_datetime64_any_dtype(df[col]):
-                                            if df[col].dt.tz is not None:
-                                                df[col] = df[col].dt.tz_localize(None)
-                                
-                                df.to_excel(writer, sheet_name=table_name, index=False)
-                                logger.info(f"Экспортирована таблица {table_name}: {len(df)} записей")
-                            else:
-                                logger.warning(f"Таблица {table_name} не найдена в БД, пропущена в бэкапе")
-                            
+                            rows_count = writer.write_query(
+                                connection, table_name, f"SELECT * FROM {table_name}{order_by}", column_width=15
+                            )
+                            logger.info(f"Экспортирована таблица {table_name}: {rows_count} записей")
+                        except ExportCancelled:
+                            raise
                         except Exception as e:
                             logger.error(f"Ошибка экспорта таблицы {table_name}: {e}")
-                    
-                    # Настраиваем ширину колонок
-                    for sheet_name in writer.sheets:
-                        worksheet = writer.sheets[sheet_name]
-                        for i in range(20):
-                            worksheet.set_column(i, i, 15)
-            
+                            connection.rollback()
+            finally:
+                writer.close()
+
             logger.info(f"Полный экспорт БД создан: {file_path}")
             return file_path
-            
+
+        except ExportCancelled:
+            ExportService.cleanup_temp_file(file_path)
+            raise
         except Exception as e:
             logger.error(f"Ошибка полного экспорта БД: {e}")
             return None
 
-    @staticmethod 
-    def export_reports_to_excel(user_id: str, filter_params: Dict[str, Any] = None) -> Optional[str]:
+    @staticmethod
+    def export_reports_to_excel(user_id: str, filter_params: Dict[str, Any] = None,
+                                progress: Optional[ProgressCallback] = None) -> Optional[str]:
         """Экспорт отчетов в Excel"""
         try:
             ExportService.create_temp_directory()
-            
+
             current_date_str = date.today().strftime('%Y-%m-%d')
             file_path = os.path.join(TEMP_DIR, f"reports_export_{user_id}_{current_date_str}.xlsx")
-            
-            engine = create_engine(DATABASE_URL)
-            
+
             base_query = """
-                SELECT 
+                SELECT
                     r.id as "ID отчета",
                     r.report_date as "Дата",
-                    r.brigade_name as "Бригада", 
+                    r.brigade_name as "Бригада",
                     r.corpus_name as "Корпус",
                     d.name as "Дисциплина",
                     r.work_type_name as "Вид работ",
-                    r.report_data->>'people_count' as "Кол-во людей",
-                    r.report_data->>'volume' as "Объем",
+                    r.people_count as "Кол-во людей",
+                    r.volume as "Объем",
                     r.report_data->>'notes' as "Примечания",
                     CASE r.workflow_status
                         WHEN 'approved' THEN 'Утвержден'
@@ -191,86 +312,117 @@ class ExportService:
                 LEFT JOIN disciplines d ON r.discipline_id = d.id
                 WHERE 1=1
             """
-            
+
             params = {}
             if filter_params:
                 if filter_params.get('discipline_name'):
-                    base_query += " AND d.name = %(discipline_name)s"
+                    base_query += " AND d.name = :discipline_name"
                     params['discipline_name'] = filter_params['discipline_name']
-            
+
             base_query += " ORDER BY r.created_at DESC"
-            
-            with engine.connect() as connection:
-                df = pd.read_sql_query(text(base_query), connection, params=params)
-                
-                with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-                    df.to_excel(writer, sheet_name='Отчеты', index=False)
-                    
-                    # Настройка форматирования
-                    workbook = writer.book
-                    worksheet = writer.sheets['Отчеты']
-                    
-                    for i in range(len(df.columns)):
-                        worksheet.set_column(i, i, 20)
-            
-            logger.info(f"Экспорт отчетов создан: {file_path}, записей: {len(df)}")
+
+            writer = _ExcelStreamWriter(file_path, progress)
+            try:
+                with db_manager.get_sqlalchemy_engine().connect() as connection:
+                    rows_count = writer.write_query(connection, 'Отчеты', base_query, params, column_width=20)
+            finally:
+                writer.close()
+
+            logger.info(f"Экспорт отчетов создан: {file_path}, записей: {rows_count}")
             return file_path
-            
+
+        except ExportCancelled:
+            ExportService.cleanup_temp_file(file_path)
+            raise
         except Exception as e:
             logger.error(f"Ошибка экспорта отчетов: {e}")
             return None
 
     @staticmethod
-    def export_formatted_database(user_id: str) -> Optional[str]:
+    def export_formatted_database(user_id: str, progress: Optional[ProgressCallback] = None) -> Optional[str]:
         """Экспорт БД с читаемыми названиями"""
         try:
             ExportService.create_temp_directory()
-            
+
             current_date_str = date.today().strftime('%Y-%m-%d')
             file_path = os.path.join(TEMP_DIR, f"formatted_db_{user_id}_{current_date_str}.xlsx")
-            
-            engine = create_engine(DATABASE_URL)
-            
+
             queries = {
-                'Пользователи_Админы': "SELECT user_id as 'ID', first_name as 'Имя', last_name as 'Фамилия', username as 'Username', phone_number as 'Телефон', created_at as 'Создан' FROM admins",
+                'Пользователи_Админы': 'SELECT user_id as "ID", first_name as "Имя", last_name as "Фамилия", username as "Username", phone_number as "Телефон", created_at as "Создан" FROM admins',
                 'Пользователи_Менеджеры': """
-                    SELECT m.user_id as 'ID', m.first_name as 'Имя', m.last_name as 'Фамилия', 
-                           m.username as 'Username', m.phone_number as 'Телефон',
-                           m.level as 'Уровень', d.name as 'Дисциплина', m.created_at as 'Создан'
-                    FROM managers m 
+                    SELECT m.user_id as "ID", m.first_name as "Имя", m.last_name as "Фамилия",
+                           m.username as "Username", m.phone_number as "Телефон",
+                           m.level as "Уровень", d.name as "Дисциплина", m.created_at as "Создан"
+                    FROM managers m
                     LEFT JOIN disciplines d ON m.discipline = d.id
                 """,
                 'Отчеты': """
-                    SELECT r.id as 'ID', r.report_date as 'Дата', r.brigade_name as 'Бригада',
-                           r.corpus_name as 'Корпус', d.name as 'Дисциплина', r.work_type_name as 'Вид работ',
-                           r.workflow_status as 'Статус', r.created_at as 'Создан'
+                    SELECT r.id as "ID", r.report_date as "Дата", r.brigade_name as "Бригада",
+                           r.corpus_name as "Корпус", d.name as "Дисциплина", r.work_type_name as "Вид работ",
+                           r.workflow_status as "Статус", r.created_at as "Создан"
                     FROM reports r
                     LEFT JOIN disciplines d ON r.discipline_id = d.id
+                    ORDER BY r.id
                 """
             }
-            
-            with pd.ExcelWriter(file_path, engine='xlsxwriter') as writer:
-                with engine.connect() as connection:
+
+            writer = _ExcelStreamWriter(file_path, progress)
+            try:
+                with db_manager.get_sqlalchemy_engine().connect() as connection:
                     for sheet_name, query in queries.items():
                         try:
-                            df = pd.read_sql_query(text(query), connection)
-                            df.to_excel(writer, sheet_name=sheet_name, index=False)
-                            
-                            # Форматирование
-                            worksheet = writer.sheets[sheet_name]
-                            for i in range(len(df.columns)):
-                                worksheet.set_column(i, i, 18)
-                                
+                            writer.write_query(connection, sheet_name, query, column_width=18)
+                        except ExportCancelled:
+                            raise
                         except Exception as e:
                             logger.error(f"Ошибка экспорта листа {sheet_name}: {e}")
-            
+                            connection.rollback()
+            finally:
+                writer.close()
+
             logger.info(f"Форматированный экспорт БД создан: {file_path}")
             return file_path
-            
+
+        except ExportCancelled:
+            ExportService.cleanup_temp_file(file_path)
+            raise
         except Exception as e:
             logger.error(f"Ошибка форматированного экспорта БД: {e}")
             return None
 
+    @staticmethod
+    def export_all_users(user_id: str, progress: Optional[ProgressCallback] = None) -> Optional[str]:
+        """Экспорт всех пользователей: по листу на каждую таблицу ролей"""
+        try:
+            ExportService.create_temp_directory()
+
+            current_date_str = date.today().strftime('%Y-%m-%d')
+            file_path = os.path.join(TEMP_DIR, f"all_users_{user_id}_{current_date_str}.xlsx")
+
+            writer = _ExcelStreamWriter(file_path, progress)
+            try:
+                with db_manager.get_sqlalchemy_engine().connect() as connection:
+                    for sheet_name, query in _ALL_USERS_QUERIES.items():
+                        try:
+                            writer.write_query(connection, sheet_name, query, column_titles=_USER_COLUMN_TITLES)
+                        except ExportCancelled:
+                            raise
+                        except Exception as e:
+                            logger.error(f"Ошибка экспорта таблицы {sheet_name}: {e}")
+                            connection.rollback()
+            finally:
+                writer.close()
+
+            logger.info(f"Экспорт пользователей создан: {file_path}")
+            return file_path
+
+        except ExportCancelled:
+            ExportService.cleanup_temp_file(file_path)
+            raise
+        except Exception as e:
+            logger.error(f"Ошибка экспорта пользователей: {e}")
+            return None
+
     @staticmethod
     def cleanup_temp_file(file_path: str):
         """Удаляет временный файл"""
@@ -279,4 +431,4 @@ class ExportService:
                 os.remove(file_path)
                 logger.info(f"Временный файл удален: {file_path}")
         except Exception as e:
-            logger.error(f"Ошибка удаления временного файла {file_path}: {e}")
\ No newline at end of file
+            logger.error(f"Ошибка удаления временного файла {file_path}: {e}")
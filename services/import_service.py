@@ -1,7 +1,9 @@
 # services/import_service.py
 
+import io
 import logging
 import os
+import time
 import pandas as pd
 from typing import Dict, List, Any, Optional
 import psycopg2
@@ -9,6 +11,9 @@ from psycopg2.extras import RealDictCursor
 from sqlalchemy import create_engine
 
 from config.settings import DATABASE_URL
+from database.migrations import REPORT_NUMBERS_BACKFILL_SQL
+from services.production_rollup_service import ProductionRollupService
+from services.reference_data_service import ReferenceDataService
 from utils.constants import TEMP_DIR, ALL_TABLE_NAMES_FOR_BACKUP
 
 logger = logging.getLogger(__name__)
@@ -34,127 +39,145 @@ class ImportService:
         except Exception as e:
             return {'valid': False, 'error': f'Ошибка чтения файла: {str(e)}'}
 
-# В services/import_service.py найти и заменить метод _sync_table_from_dataframe:
+    @staticmethod
+    def _column_expression(column: str, column_type: str) -> str:
+        """SQL-выражение, приводящее текстовую колонку staging-таблицы к типу целевой колонки"""
+        value = f"NULLIF(btrim(s.\"{column}\"), '')"
+        if column_type.startswith(('text', 'character')):
+            return value
+        if column_type in ('smallint', 'integer', 'bigint'):
+            # pandas пишет целые с пропусками как float ("5.0")
+            return f"{value}::numeric::{column_type}"
+        return f"{value}::{column_type}"
+
+    @staticmethod
+    def _sync_table_from_dataframe(cursor, table_name: str, df: pd.DataFrame,
+                                   id_column: str = 'id') -> Dict[str, Any]:
+        """
+        Синхронизирует таблицу с DataFrame набором SQL-операций вместо построчных запросов:
+        COPY листа во временную staging-таблицу, INSERT ... ON CONFLICT DO UPDATE по id,
+        INSERT строк без id и DELETE записей, которых нет в файле (anti-join).
+        Выполняется в транзакции вызывающего кода под SAVEPOINT: ошибка откатывает только эту таблицу.
+        """
+        started = time.perf_counter()
+        result = {'inserted': 0, 'updated': 0, 'deleted': 0, 'seconds': 0.0}
+
+        cursor.execute("SAVEPOINT sync_table")
+        try:
+            if df.empty:
+                cursor.execute(f"DELETE FROM {table_name}")
+                result['deleted'] = cursor.rowcount
+            else:
+                ImportService._sync_table_set_based(cursor, table_name, df, id_column, result)
+            cursor.execute("RELEASE SAVEPOINT sync_table")
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT sync_table")
+            raise
 
-# В services/import_service.py заменить метод _sync_table_from_dataframe:
+        result['seconds'] = round(time.perf_counter() - started, 2)
+        return result
 
     @staticmethod
-    def _sync_table_from_dataframe(cursor, table_name: str, df: pd.DataFrame, 
-                                id_column: str = 'id') -> Dict[str, int]:
-     """Универсальная синхронизация таблицы из DataFrame"""
-     result = {'inserted': 0, 'updated': 0, 'deleted': 0}
-    
-     if df.empty:
-         cursor.execute(f"DELETE FROM {table_name}")
-         result['deleted'] = cursor.rowcount
-         return result
-    
-     # FIXED: Получаем информацию о столбцах таблицы
-     cursor.execute("""
-         SELECT column_name, data_type 
-         FROM information_schema.columns 
-         WHERE table_name = %s AND table_schema = 'public'
-     """, (table_name,))
-    
-     table_columns = {row[0]: row[1] for row in cursor.fetchall()}
-     if id_column not in table_columns:
-         logger.warning(f"Столбец {id_column} не найден в таблице {table_name}, пропускаем")
-         return result
-    
-     # Получаем тип ID столбца
-     id_column_type = table_columns[id_column]
-     is_integer_id = 'integer' in id_column_type or 'serial' in id_column_type
-    
-      # Получаем список колонок из DataFrame
-     df_columns = [col for col in df.columns if col in table_columns]
-    
-     # Получаем существующие ID из БД
-     cursor.execute(f"SELECT {id_column} FROM {table_name}")
-     if is_integer_id:
-         existing_ids = {int(row[0]) for row in cursor.fetchall()}
-     else:
-         existing_ids = {str(row[0]) for row in cursor.fetchall()}
-    
-     # ID из файла
-     file_ids = set()
-     for _, row in df.iterrows():
-         if id_column in df.columns and pd.notna(row[id_column]):
-             if is_integer_id:
-                 file_ids.add(int(row[id_column]))
-             else:
-                 file_ids.add(str(row[id_column]))
-    
-     # Удаляем записи, которых нет в файле
-     ids_to_delete = existing_ids - file_ids
-     if ids_to_delete:
-         if is_integer_id:
-             cursor.execute(f"DELETE FROM {table_name} WHERE {id_column} = ANY(%s)", 
-                           (list(ids_to_delete),))
-         else:
-             cursor.execute(f"DELETE FROM {table_name} WHERE {id_column} = ANY(%s)", 
-                           (list(ids_to_delete),))
-         result['deleted'] = cursor.rowcount
-    
-     # Обрабатываем каждую строку
-     for _, row in df.iterrows():
-         has_data = any(pd.notna(row[col]) and str(row[col]).strip() 
-                       for col in df_columns if col != id_column)
-        
-         if not has_data:
-             continue
-            
-         data = {}
-         specified_id = None
-        
-         for col in df_columns:
-             if col == id_column:
-                 if pd.notna(row[col]):
-                     if is_integer_id:
-                         specified_id = int(row[col])
-                     else:
-                         specified_id = str(row[col])
-                     data[col] = specified_id
-             else:
-                 if pd.notna(row[col]):
-                     # FIXED: Приводим к правильному типу
-                     col_type = table_columns.get(col, 'text')
-                     if 'integer' in col_type or 'serial' in col_type:
-                         try:
-                             data[col] = int(row[col])
-                         except:
-                             data[col] = None
-                     elif 'boolean' in col_type:
-                         data[col] = bool(row[col])
-                     else:
-                         data[col] = str(row[col]).strip()
-                 else:
-                     data[col] = None
-        
-         if not data:
-             continue
-            
-         columns = list(data.keys())
-         values = list(data.values())
-         placeholders = ', '.join(['%s'] * len(values))
-        
-         if specified_id and specified_id in existing_ids:
-             # UPDATE
-             set_clause = ', '.join([f"{col} = %s" for col in columns if col != id_column])
-             if set_clause:
-                 update_values = [v for k, v in data.items() if k != id_column]
-                 update_values.append(specified_id)
-                 cursor.execute(f"UPDATE {table_name} SET {set_clause} WHERE {id_column} = %s", 
-                              update_values)
-                 if cursor.rowcount > 0:
-                     result['updated'] += 1
-         else:
-             # INSERT
-             columns_str = ', '.join(columns)
-             cursor.execute(f"INSERT INTO {table_name} ({columns_str}) VALUES ({placeholders})", 
-                          values)
-             result['inserted'] += 1
-    
-     return result
+    def _sync_table_set_based(cursor, table_name: str, df: pd.DataFrame, id_column: str,
+                              result: Dict[str, Any]) -> None:
+        cursor.execute("""
+            SELECT a.attname, format_type(a.atttypid, a.atttypmod)
+            FROM pg_attribute a
+            WHERE a.attrelid = %s::regclass AND a.attnum > 0 AND NOT a.attisdropped
+        """, (f"public.{table_name}",))
+        table_columns = dict(cursor.fetchall())
+        if id_column not in table_columns:
+            logger.warning(f"Столбец {id_column} не найден в таблице {table_name}, пропускаем")
+            return
+
+        columns = [col for col in df.columns if col in table_columns]
+        data_columns = [col for col in columns if col != id_column]
+        has_id = id_column in columns
+
+        # 1. Лист целиком во временную таблицу (все колонки текстом, типы приводит PostgreSQL)
+        stage = f"import_stage_{table_name}"
+        stage_columns = ', '.join(f'"{col}" text' for col in columns)
+        cursor.execute(f"DROP TABLE IF EXISTS {stage}")
+        cursor.execute(f"CREATE TEMP TABLE {stage} (_row bigserial, {stage_columns}) ON COMMIT DROP")
+        buffer = io.StringIO()
+        df[columns].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        columns_str = ', '.join(f'"{col}"' for col in columns)
+        cursor.copy_expert(f"COPY {stage} ({columns_str}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+        expressions = {col: ImportService._column_expression(col, table_columns[col]) for col in columns}
+        # Пустые строки (только id или все ячейки пустые) не импортируются
+        has_data = ' OR '.join(f"{expressions[col]} IS NOT NULL" for col in data_columns) or 'FALSE'
+
+        # 2. Удаляем записи, которых нет в файле
+        if has_id:
+            cursor.execute(f"""
+                DELETE FROM {table_name} t
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {stage} s WHERE {expressions[id_column]} = t.{id_column}
+                )
+            """)
+        else:
+            cursor.execute(f"DELETE FROM {table_name}")
+        result['deleted'] = cursor.rowcount
+
+        if not data_columns:
+            cursor.execute(f"DROP TABLE {stage}")
+            return
+
+        # 3. Строки с id: вставка или обновление одной командой; при повторах id побеждает последняя строка файла
+        if has_id:
+            select_list = ', '.join(expressions[col] for col in columns)
+            update_list = ', '.join(f'"{col}" = EXCLUDED."{col}"' for col in data_columns)
+            cursor.execute(f"""
+                WITH upserted AS (
+                    INSERT INTO {table_name} ({columns_str})
+                    SELECT DISTINCT ON ({expressions[id_column]}) {select_list}
+                    FROM {stage} s
+                    WHERE {expressions[id_column]} IS NOT NULL AND ({has_data})
+                    ORDER BY {expressions[id_column]}, s._row DESC
+                    ON CONFLICT ({id_column}) DO UPDATE SET {update_list}
+                    RETURNING (xmax = 0) AS inserted
+                )
+                SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM upserted
+            """)
+            inserted, updated = cursor.fetchone()
+            result['inserted'] += inserted
+            result['updated'] += updated
+
+        # 4. Строки без id получают значение по умолчанию (serial)
+        data_columns_str = ', '.join(f'"{col}"' for col in data_columns)
+        without_id = f"{expressions[id_column]} IS NULL AND " if has_id else ""
+        cursor.execute(f"""
+            INSERT INTO {table_name} ({data_columns_str})
+            SELECT {', '.join(expressions[col] for col in data_columns)}
+            FROM {stage} s
+            WHERE {without_id}({has_data})
+            ORDER BY s._row
+        """)
+        result['inserted'] += cursor.rowcount
+
+        # Явно вставленные id не двигают последовательность serial - выравниваем ее
+        if has_id and table_columns[id_column] in ('integer', 'bigint'):
+            cursor.execute(f"""
+                SELECT setval(pg_get_serial_sequence(%s, %s), COALESCE(MAX({id_column}), 0) + 1, false)
+                FROM {table_name}
+            """, (table_name, id_column))
+
+        cursor.execute(f"DROP TABLE {stage}")
+
+    @staticmethod
+    def _rebuild_production_rollup(cursor) -> None:
+        """Пересобирает сводку выработки в транзакции импорта: отчеты и нормы могли измениться"""
+        cursor.execute("SAVEPOINT rebuild_rollup")
+        try:
+            rows = ProductionRollupService.rebuild_sync(cursor)
+            cursor.execute("RELEASE SAVEPOINT rebuild_rollup")
+            logger.info(f"Сводка выработки пересобрана: {rows} строк")
+        except Exception as e:
+            # Импорт важнее сводки - ее можно пересобрать позже через rebuild_rollup.py
+            cursor.execute("ROLLBACK TO SAVEPOINT rebuild_rollup")
+            logger.error(f"Ошибка пересборки сводки выработки: {e}")
 
     @staticmethod
     def import_directories_from_excel(file_path: str) -> Dict[str, Any]:
@@ -171,11 +194,7 @@ class ImportService:
             if not validation['valid']:
                 return {'success': False, 'error': validation['error']}
             
-            # Подключение к БД
-            conn = psycopg2.connect(DATABASE_URL)
-            cursor = conn.cursor()
-            
-            # Читаем все листы
+            # Читаем все листы до открытия транзакции, чтобы не держать ее на время разбора Excel
             try:
                 xls = pd.ExcelFile(file_path)
                 sheet_names = xls.sheet_names
@@ -183,18 +202,29 @@ class ImportService:
             except Exception as e:
                 return {'success': False, 'error': f'Ошибка чтения Excel файла: {str(e)}'}
             
-            # 1. Обработка дисциплин
             disciplines_sheets = [s for s in sheet_names if 'дисциплин' in s.lower()]
+            objects_sheets = [s for s in sheet_names if 'корпус' in s.lower()]
+            work_types_sheets = [s for s in sheet_names if 'вид' in s.lower() and 'работ' in s.lower()]
+            frames = {
+                sheet: pd.read_excel(xls, sheet_name=sheet)
+                for sheet in disciplines_sheets[:1] + objects_sheets[:1] + work_types_sheets[:1]
+            }
+            
+            # Подключение к БД
+            conn = psycopg2.connect(DATABASE_URL)
+            cursor = conn.cursor()
+            
+            # 1. Обработка дисциплин
             if disciplines_sheets:
                 try:
-                    df = pd.read_excel(xls, sheet_name=disciplines_sheets[0])
+                    df = frames[disciplines_sheets[0]]
                     logger.info(f"Обрабатываем дисциплины из листа '{disciplines_sheets[0]}', строк: {len(df)}")
                     
                     # Синхронизируем с БД
                     result = ImportService._sync_table_from_dataframe(cursor, 'disciplines', df)
                     counters['disciplines'] = result['inserted'] + result['updated']
                     
-                    logger.info(f"Дисциплины: добавлено {result['inserted']}, обновлено {result['updated']}, удалено {result['deleted']}")
+                    logger.info(f"Дисциплины: добавлено {result['inserted']}, обновлено {result['updated']}, удалено {result['deleted']} за {result['seconds']} с")
                     
                 except Exception as e:
                     error_msg = f"Ошибка обработки дисциплин: {str(e)}"
@@ -202,16 +232,15 @@ class ImportService:
                     logger.error(error_msg)
             
             # 2. Обработка корпусов
-            objects_sheets = [s for s in sheet_names if 'корпус' in s.lower()]
             if objects_sheets:
                 try:
-                    df = pd.read_excel(xls, sheet_name=objects_sheets[0])
+                    df = frames[objects_sheets[0]]
                     logger.info(f"Обрабатываем корпуса из листа '{objects_sheets[0]}', строк: {len(df)}")
                     
                     result = ImportService._sync_table_from_dataframe(cursor, 'construction_objects', df)
                     counters['objects'] = result['inserted'] + result['updated']
                     
-                    logger.info(f"Корпуса: добавлено {result['inserted']}, обновлено {result['updated']}, удалено {result['deleted']}")
+                    logger.info(f"Корпуса: добавлено {result['inserted']}, обновлено {result['updated']}, удалено {result['deleted']} за {result['seconds']} с")
                     
                 except Exception as e:
                     error_msg = f"Ошибка обработки корпусов: {str(e)}"
@@ -219,10 +248,9 @@ class ImportService:
                     logger.error(error_msg)
             
             # 3. Обработка видов работ (с проверкой дисциплин)
-            work_types_sheets = [s for s in sheet_names if 'вид' in s.lower() and 'работ' in s.lower()]
             if work_types_sheets:
                 try:
-                    df = pd.read_excel(xls, sheet_name=work_types_sheets[0])
+                    df = frames[work_types_sheets[0]]
                     logger.info(f"Обрабатываем виды работ из листа '{work_types_sheets[0]}', строк: {len(df)}")
                     
                     # Получаем маппинг дисциплин
@@ -248,7 +276,7 @@ class ImportService:
                         result = ImportService._sync_table_from_dataframe(cursor, 'work_types', df_valid)
                         counters['work_types'] = result['inserted'] + result['updated']
                         
-                        logger.info(f"Виды работ: добавлено {result['inserted']}, обновлено {result['updated']}, удалено {result['deleted']}")
+                        logger.info(f"Виды работ: добавлено {result['inserted']}, обновлено {result['updated']}, удалено {result['deleted']} за {result['seconds']} с")
                     else:
                         error_msg = f"Не найден столбец discipline_name в листе {work_types_sheets[0]}"
                         errors.append(error_msg)
@@ -259,9 +287,12 @@ class ImportService:
                     errors.append(error_msg)
                     logger.error(error_msg)
             
+            ImportService._rebuild_production_rollup(cursor)
+            
             # Коммитим изменения
             conn.commit()
             logger.info("Транзакция успешно закоммичена")
+            ReferenceDataService.invalidate()
             
             return {
                 'success': True,
@@ -299,14 +330,6 @@ class ImportService:
             if not validation['valid']:
                 return {'success': False, 'error': validation['error']}
             
-            # Подключение к БД
-            conn = psycopg2.connect(DATABASE_URL)
-            cursor = conn.cursor()
-            
-            # FIXED: Отключаем проверки внешних ключей
-            cursor.execute("SET session_replication_role = replica;")
-            logger.info("Проверки внешних ключей отключены")
-            
             # Читаем все листы
             try:
                 xls = pd.ExcelFile(file_path)
@@ -334,11 +357,25 @@ class ImportService:
                 'kiok': 'user_id'
             }
             
+            # Разбираем Excel до открытия транзакции - она длится только время SQL-операций
+            frames = {
+                table_name: pd.read_excel(xls, sheet_name=table_name)
+                for table_name in table_order if table_name in sheet_names
+            }
+            
+            # Подключение к БД
+            conn = psycopg2.connect(DATABASE_URL)
+            cursor = conn.cursor()
+            
+            # FIXED: Отключаем проверки внешних ключей
+            cursor.execute("SET session_replication_role = replica;")
+            logger.info("Проверки внешних ключей отключены")
+            
             # Обрабатываем таблицы в правильном порядке
             for table_name in table_order:
-                if table_name in sheet_names:
+                if table_name in frames:
                     try:
-                        df = pd.read_excel(xls, sheet_name=table_name)
+                        df = frames[table_name]
                         logger.info(f"Восстанавливаем таблицу {table_name}, строк: {len(df)}")
                         
                         # Специальная обработка для work_types (заменяем discipline_name на discipline_id)
@@ -359,10 +396,11 @@ class ImportService:
                             'table': table_name,
                             'inserted': result['inserted'],
                             'updated': result['updated'], 
-                            'deleted': result['deleted']
+                            'deleted': result['deleted'],
+                            'seconds': result['seconds']
                         })
                         
-                        logger.info(f"Таблица {table_name}: добавлено {result['inserted']}, обновлено {result['updated']}, удалено {result['deleted']}")
+                        logger.info(f"Таблица {table_name}: добавлено {result['inserted']}, обновлено {result['updated']}, удалено {result['deleted']} за {result['seconds']} с")
                         
                     except Exception as e:
                         error_msg = f"Ошибка восстановления таблицы {table_name}: {str(e)}"
@@ -373,9 +411,15 @@ class ImportService:
             cursor.execute("SET session_replication_role = DEFAULT;")
             logger.info("Проверки внешних ключей включены обратно")
             
+            # Бэкапы до появления колонок people_count/volume хранят их только в report_data
+            if 'reports' in frames:
+                cursor.execute(REPORT_NUMBERS_BACKFILL_SQL)
+            ImportService._rebuild_production_rollup(cursor)
+            
             # Коммитим изменения
             conn.commit()
             logger.info("Полное восстановление БД успешно завершено")
+            ReferenceDataService.invalidate()
             
             return {
                 'success': True,
@@ -458,20 +502,26 @@ class ImportService:
         ]
         
         total_operations = 0
+        total_seconds = 0.0
         for table_info in restored_tables:
             table_name = table_info['table']
             inserted = table_info['inserted']
             updated = table_info['updated']
             deleted = table_info['deleted']
+            seconds = table_info.get('seconds', 0)
             total = inserted + updated
             total_operations += total
+            total_seconds += seconds
             
-            if total > 0:
-                summary_lines.append(f"  ▪️ {table_name}: **{total}** записей (добавлено: {inserted}, обновлено: {updated}, удалено: {deleted})")
+            if total > 0 or deleted > 0:
+                summary_lines.append(
+                    f"  ▪️ {table_name}: **{total}** записей (добавлено: {inserted}, обновлено: {updated}, "
+                    f"удалено: {deleted}) за {seconds:.1f} с"
+                )
         
         summary_lines.extend([
             "",
-            f"**Всего обработано записей: {total_operations}**"
+            f"**Всего обработано записей: {total_operations}** за {total_seconds:.1f} с"
         ])
         
         if errors:
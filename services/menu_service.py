@@ -5,13 +5,13 @@
 """
 
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from telegram import InlineKeyboardButton
 
 from bot.middleware.security import check_user_role
-from config.settings import OWNER_ID, REPORTS_GROUP_URL
+from config.settings import OWNER_ID, REPORTS_GROUP_URL, MENU_CACHE_MAX_ENTRIES
 from utils.localization import get_text, get_user_language
-from database.queries import db_query
+from services.roster_service import RosterService
 
 try:
     from services.workflow_service import WorkflowService
@@ -21,19 +21,72 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+# Готовые меню: (вид меню, язык, состояние кнопки) -> (текст, кнопки).
+# Состояние - подан ли табель (бригадир) или размер очереди (мастер, КИОК), у остальных None
+_menu_cache: Dict[Tuple[str, str, Any], Tuple[str, List[List[InlineKeyboardButton]]]] = {}
+
 class MenuService:
     """Сервис для создания меню в зависимости от роли пользователя"""
     
     @staticmethod
     async def get_main_menu_text_and_buttons(user_id: str):
-        """Получает текст и кнопки главного меню для пользователя"""
-        user_role = check_user_role(user_id)
+        """
+        Получает текст и кнопки главного меню для пользователя.
+        Роль и язык берутся из кэшей в памяти, статус табеля - из набора поданных за день,
+        сами кнопки собираются один раз на каждый вариант меню.
+        """
+        user_role = await check_user_role(user_id)
         lang =  await get_user_language(user_id)
         
-        welcome_text = get_text('welcome_message', lang)
-        keyboard_buttons = await MenuService._build_menu_buttons(user_id, user_role, lang)
-
-        return welcome_text, keyboard_buttons
+        menu_kind = MenuService._get_menu_kind(user_id, user_role)
+        state = await MenuService._get_menu_state(user_id, menu_kind)
+        cache_key = (menu_kind, lang, state)
+        
+        cached = _menu_cache.get(cache_key)
+        if cached is None:
+            cached = (get_text('welcome_message', lang), MenuService._build_menu_buttons(menu_kind, state, lang))
+            if len(_menu_cache) >= MENU_CACHE_MAX_ENTRIES:
+                _menu_cache.clear()
+            _menu_cache[cache_key] = cached
+        
+        welcome_text, keyboard_buttons = cached
+        # Копия строк: вызывающий код может дописать свои кнопки
+        return welcome_text, [list(row) for row in keyboard_buttons]
+    
+    @staticmethod
+    def _get_menu_kind(user_id: str, user_role: Dict[str, Any]) -> str:
+        """Вид меню по ролям: при нескольких ролях - первая по приоритету, как раньше"""
+        # Список ключей, которые отвечают за реальные роли доступа
+        role_keys = ['isSupervisor', 'isMaster', 'isForeman', 'isBrigade', 'isManager', 'isPto', 'isKiok', 'isAdmin']
+        
+        if user_id == OWNER_ID:
+            return 'owner'
+        if not any(user_role.get(key) for key in role_keys):
+            return 'guest'
+        if user_role.get('isSupervisor'):
+            return 'supervisor'
+        if user_role.get('isMaster'):
+            return 'master'
+        if user_role.get('isForeman') or user_role.get('isBrigade'):
+            return 'brigade'
+        if user_role.get('isKiok'):
+            return 'kiok'
+        if user_role.get('isManager') or user_role.get('isPto'):
+            return 'manager'
+        return 'admin'
+    
+    @staticmethod
+    async def _get_menu_state(user_id: str, menu_kind: str) -> Optional[Any]:
+        """Изменчивая часть меню: статус табеля или счетчик очереди на кнопке"""
+        if menu_kind == 'brigade':
+            return await RosterService.is_submitted_today(user_id)
+        if menu_kind in ('master', 'kiok') and WORKFLOW_AVAILABLE:
+            try:
+                return await WorkflowService.get_cached_pending_count(menu_kind, user_id)
+            except Exception as e:
+                logger.error(f"Ошибка получения счетчика для {menu_kind}: {e}")
+                return 0
+        return None
     
     @staticmethod
     def _get_user_role_info(user_role: Dict[str, Any], lang: str) -> str:
@@ -92,106 +145,67 @@ class MenuService:
         return " | ".join(role_parts)
     
     @staticmethod
-    async def _build_menu_buttons(user_id: str, user_role: Dict[str, Any], lang: str) -> List[List[InlineKeyboardButton]]:
-        """Строит кнопки меню в зависимости от роли пользователя"""
+    def _build_menu_buttons(menu_kind: str, state: Optional[Any], lang: str) -> List[List[InlineKeyboardButton]]:
+        """Строит кнопки меню для вида меню и состояния кнопки (без обращений к БД)"""
         buttons = []
-        
-        # Список ключей, которые отвечают за реальные роли доступа
-        role_keys = ['isSupervisor', 'isMaster', 'isForeman', 'isBrigade', 'isManager', 'isPto', 'isKiok', 'isAdmin']
-        
-        # Проверяем, есть ли у пользователя хотя бы одна из этих ролей
-        is_authorized = any(user_role.get(key) for key in role_keys)
-
-        # --- Меню для АВТОРИЗОВАННЫХ (включая Owner) ---
-        if is_authorized or user_id == OWNER_ID:
-            # Кнопки по ролям
-            if user_id == OWNER_ID:
-                buttons.extend([
-                    [InlineKeyboardButton("📝 Создать отчет", callback_data="new_report")],
-                    [InlineKeyboardButton("📊 Просмотр отчетов", callback_data="report_menu_all")],
-                    [InlineKeyboardButton("📈 Аналитика", callback_data="report_historical")],  # ADDED
-                    [InlineKeyboardButton("📋 Экспорт данных", callback_data="get_excel_report")],  # ADDED
-                    [InlineKeyboardButton("⚙️ Управление", callback_data="manage_menu")]
-                ])
-            elif user_role.get('isSupervisor'):
-                buttons.extend([
-                    [InlineKeyboardButton("📝 Создать отчет", callback_data="new_report")],
-                    [InlineKeyboardButton("📋 Мои отчеты", callback_data="my_reports")]
-                ])
-            elif user_role.get('isMaster'):
-                # Получаем количество ожидающих отчетов
-                pending_count = 0
-                if WORKFLOW_AVAILABLE:
-                    try:
-                        pending_reports = await WorkflowService.get_pending_reports_for_master(user_id)  # FIXED: добавлен await
-                        pending_count = len(pending_reports)
-                    except Exception as e:
-                        logger.error(f"Ошибка получения счетчика для мастера: {e}")
-                
-                master_button_text = f"✅ Подтвердить отчеты ({pending_count})" if pending_count > 0 else "✅ Подтвердить отчеты"
-                buttons.extend([
-                    [InlineKeyboardButton(master_button_text, callback_data="approve_reports")],
-                    [InlineKeyboardButton("📊 Просмотр отчетов", callback_data="report_menu_all")]
-                ])
-            elif user_role.get('isForeman') or user_role.get('isBrigade'):
-                # Динамически получаем текст для кнопки табеля
-                roster_button_text = await MenuService._get_roster_button_text(user_id, lang)
-                buttons.extend([
-                    [InlineKeyboardButton(roster_button_text, callback_data="submit_roster")]
-                ])
-            elif user_role.get('isKiok'):
-                # Получаем количество ожидающих отчетов для КИОК
-                pending_count = 0
-                if WORKFLOW_AVAILABLE:
-                    try:
-                        pending_reports = await WorkflowService.get_pending_reports_for_kiok(user_id)  # FIXED: добавлен await
-                        pending_count = len(pending_reports)
-                    except Exception as e:
-                        logger.error(f"Ошибка получения счетчика для КИОК: {e}")
-                
-                kiok_button_text = f"🔍 КИОК проверка ({pending_count})" if pending_count > 0 else "🔍 КИОК проверка"
-                buttons.extend([
-                    [InlineKeyboardButton(kiok_button_text, callback_data="kiok_review")],
-                    [InlineKeyboardButton("📊 Просмотр отчетов", callback_data="report_menu_all")],
-                    [InlineKeyboardButton("📋 Экспорт данных", callback_data="get_excel_report")]  # ADDED
-                ])
-            elif user_role.get('isManager') or user_role.get('isPto'):
-                buttons.extend([
-                    [InlineKeyboardButton("📊 Просмотр отчетов", callback_data="report_menu_all")],
-                    [InlineKeyboardButton("📈 Обзорная аналитика", callback_data="report_overview")],  # ADDED
-                    [InlineKeyboardButton("📋 Исторические отчеты", callback_data="report_historical")],  # ADDED
-                    [InlineKeyboardButton("📋 Экспорт данных", callback_data="get_excel_report")]  # ADDED
-                ])
-            elif user_role.get('isAdmin'):
-                buttons.extend([
-                    [InlineKeyboardButton("📊 Просмотр отчетов", callback_data="report_menu_all")],
-                    [InlineKeyboardButton("📈 Полная аналитика", callback_data="report_historical")],  # ADDED
-                    [InlineKeyboardButton("📋 Экспорт данных", callback_data="get_excel_report")],  # ADDED
-                    [InlineKeyboardButton("⚙️ Управление", callback_data="manage_menu")]
-                ])
-            
-            # Общие кнопки для всех авторизованных
-            buttons.append([InlineKeyboardButton("👤 Профиль", callback_data="show_profile")])
-            if REPORTS_GROUP_URL:
-                buttons.append([InlineKeyboardButton("➡️ Группа отчетов", url=REPORTS_GROUP_URL)])
 
         # --- Меню для НЕАВТОРИЗОВАННЫХ ---
-        else:
-            buttons.extend([
+        if menu_kind == 'guest':
+            return [
                 [InlineKeyboardButton("🔐 Авторизация", callback_data="start_auth")],
                 [InlineKeyboardButton("ℹ️ Информация", callback_data="show_info")]
+            ]
+
+        # --- Меню для АВТОРИЗОВАННЫХ (включая Owner) ---
+        if menu_kind == 'owner':
+            buttons.extend([
+                [InlineKeyboardButton("📝 Создать отчет", callback_data="new_report")],
+                [InlineKeyboardButton("📊 Просмотр отчетов", callback_data="report_menu_all")],
+                [InlineKeyboardButton("📈 Аналитика", callback_data="report_historical")],  # ADDED
+                [InlineKeyboardButton("📋 Экспорт данных", callback_data="get_excel_report")],  # ADDED
+                [InlineKeyboardButton("⚙️ Управление", callback_data="manage_menu")]
             ])
+        elif menu_kind == 'supervisor':
+            buttons.extend([
+                [InlineKeyboardButton("📝 Создать отчет", callback_data="new_report")],
+                [InlineKeyboardButton("📋 Мои отчеты", callback_data="my_reports")]
+            ])
+        elif menu_kind == 'master':
+            master_button_text = f"✅ Подтвердить отчеты ({state})" if state else "✅ Подтвердить отчеты"
+            buttons.extend([
+                [InlineKeyboardButton(master_button_text, callback_data="approve_reports")],
+                [InlineKeyboardButton("📊 Просмотр отчетов", callback_data="report_menu_all")]
+            ])
+        elif menu_kind == 'brigade':
+            roster_button_text = "✅ Табель подан" if state else "📋 Подать табель"
+            buttons.extend([
+                [InlineKeyboardButton(roster_button_text, callback_data="submit_roster")]
+            ])
+        elif menu_kind == 'kiok':
+            kiok_button_text = f"🔍 КИОК проверка ({state})" if state else "🔍 КИОК проверка"
+            buttons.extend([
+                [InlineKeyboardButton(kiok_button_text, callback_data="kiok_review")],
+                [InlineKeyboardButton("📊 Просмотр отчетов", callback_data="report_menu_all")],
+                [InlineKeyboardButton("📋 Экспорт данных", callback_data="get_excel_report")]  # ADDED
+            ])
+        elif menu_kind == 'manager':
+            buttons.extend([
+                [InlineKeyboardButton("📊 Просмотр отчетов", callback_data="report_menu_all")],
+                [InlineKeyboardButton("📈 Обзорная аналитика", callback_data="report_overview")],  # ADDED
+                [InlineKeyboardButton("📋 Исторические отчеты", callback_data="report_historical")],  # ADDED
+                [InlineKeyboardButton("📋 Экспорт данных", callback_data="get_excel_report")]  # ADDED
+            ])
+        elif menu_kind == 'admin':
+            buttons.extend([
+                [InlineKeyboardButton("📊 Просмотр отчетов", callback_data="report_menu_all")],
+                [InlineKeyboardButton("📈 Полная аналитика", callback_data="report_historical")],  # ADDED
+                [InlineKeyboardButton("📋 Экспорт данных", callback_data="get_excel_report")],  # ADDED
+                [InlineKeyboardButton("⚙️ Управление", callback_data="manage_menu")]
+            ])
+        
+        # Общие кнопки для всех авторизованных
+        buttons.append([InlineKeyboardButton("👤 Профиль", callback_data="show_profile")])
+        if REPORTS_GROUP_URL:
+            buttons.append([InlineKeyboardButton("➡️ Группа отчетов", url=REPORTS_GROUP_URL)])
 
         return buttons
-    
-    @staticmethod
-    async def _get_roster_button_text(user_id: str, lang: str) -> str:
-        """Получает текст кнопки табеля в зависимости от статуса"""
-        from datetime import date
-        try:
-            today_str = date.today().strftime('%Y-%m-%d')
-            if  await db_query("SELECT id FROM daily_rosters WHERE brigade_user_id = %s AND roster_date = %s", (user_id, today_str)):
-                return "✅ Табель подан"
-            return "📋 Подать табель"
-        except Exception:
-            return "📋 Подать табель"
\ No newline at end of file
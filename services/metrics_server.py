@@ -0,0 +1,61 @@
+# services/metrics_server.py
+
+import asyncio
+import logging
+from typing import Optional
+
+from utils.metrics import render_prometheus
+
+logger = logging.getLogger(__name__)
+
+class MetricsServer:
+    """Минимальный HTTP-эндпоинт /metrics для Prometheus на локальном порту (без сторонних зависимостей)"""
+
+    _server: Optional[asyncio.AbstractServer] = None
+
+    @staticmethod
+    async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Заголовки запроса не нужны, но их надо дочитать
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b'\r\n', b'\n', b''):
+                pass
+
+            parts = request_line.decode('latin-1').split()
+            path = parts[1].split('?', 1)[0] if len(parts) > 1 else ''
+            if path == '/metrics':
+                status, body = '200 OK', render_prometheus().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            else:
+                status, body, content_type = '404 Not Found', b'Not Found\n', 'text/plain'
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode('latin-1') + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.debug(f"Ошибка ответа на запрос метрик: {e}")
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def start(host: str, port: int) -> bool:
+        """Запускает эндпоинт. port = 0 - метрики по HTTP не отдаются."""
+        if not port:
+            return False
+        try:
+            MetricsServer._server = await asyncio.start_server(MetricsServer._handle, host, port)
+            logger.info(f"✅ Метрики Prometheus: http://{host}:{port}/metrics")
+            return True
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось открыть порт метрик {host}:{port}: {e}")
+            return False
+
+    @staticmethod
+    async def stop() -> None:
+        server = MetricsServer._server
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+            MetricsServer._server = None
@@ -0,0 +1,190 @@
+# services/notification_queue_service.py
+
+"""
+Персистентная очередь уведомлений на таблице scheduled_notifications.
+
+Жизненный цикл записи: pending -> sending -> sent | pending (повтор) | dead.
+Захват через SELECT ... FOR UPDATE SKIP LOCKED, поэтому несколько реплик бота
+разбирают очередь без пересечений, а dedupe_key не дает поставить одно уведомление дважды.
+"""
+
+import json
+import logging
+import os
+import socket
+from typing import Dict, Any, List, Optional
+
+from telegram import InlineKeyboardMarkup
+
+from config.settings import (
+    NOTIFICATION_QUEUE_BATCH_SIZE, NOTIFICATION_MAX_ATTEMPTS, NOTIFICATION_LEASE_SECONDS
+)
+from database.queries import db_query, db_execute
+from services.broadcast_service import BroadcastService
+from utils.dates import local_today
+
+logger = logging.getLogger(__name__)
+
+# Пауза перед повторной попыткой: 1, 2, 4... минуты
+_RETRY_BASE_SECONDS = 60
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+class NotificationQueueService:
+    """Постановка уведомлений в очередь и их доставка"""
+
+    @staticmethod
+    async def enqueue_many(notifications: List[Dict[str, Any]]) -> int:
+        """
+        Ставит уведомления в очередь одним запросом.
+
+        Каждое уведомление - dict: user_id, notification_type, message_text и необязательные
+        payload (reply_markup/parse_mode), dedupe_key, delay_seconds (сдвиг от текущего момента).
+        Уведомления с уже существующим dedupe_key пропускаются. Возвращает число добавленных.
+        """
+        if not notifications:
+            return 0
+
+        user_ids, types, delays, texts, payloads, keys = [], [], [], [], [], []
+        for notification in notifications:
+            user_ids.append(str(notification['user_id']))
+            types.append(notification['notification_type'])
+            delays.append(float(notification.get('delay_seconds', 0)))
+            texts.append(notification['message_text'])
+            payloads.append(json.dumps(notification.get('payload') or {}))
+            keys.append(notification.get('dedupe_key'))
+
+        inserted = await db_execute("""
+            INSERT INTO scheduled_notifications
+                (user_id, notification_type, scheduled_time, message_text, payload, dedupe_key, max_attempts)
+            SELECT u, t, NOW() + make_interval(secs => d), m, p::jsonb, k, %s
+            FROM unnest(%s::varchar[], %s::varchar[], %s::float8[], %s::text[], %s::text[], %s::text[])
+                 AS n(u, t, d, m, p, k)
+            ON CONFLICT (dedupe_key) DO NOTHING
+        """, (NOTIFICATION_MAX_ATTEMPTS, user_ids, types, delays, texts, payloads, keys))
+
+        logger.info(f"Очередь уведомлений: добавлено {inserted} из {len(notifications)}")
+        return inserted
+
+    @staticmethod
+    async def enqueue(user_id: str, notification_type: str, message_text: str,
+                      payload: Optional[Dict[str, Any]] = None, dedupe_key: Optional[str] = None,
+                      delay_seconds: float = 0) -> bool:
+        """Ставит в очередь одно уведомление"""
+        return bool(await NotificationQueueService.enqueue_many([{
+            'user_id': user_id, 'notification_type': notification_type, 'message_text': message_text,
+            'payload': payload, 'dedupe_key': dedupe_key, 'delay_seconds': delay_seconds
+        }]))
+
+    @staticmethod
+    async def _expire_stale_leases() -> None:
+        """
+        Записи в статусе sending дольше lease - реплика упала во время отправки.
+        Отправлено ли сообщение, неизвестно, поэтому не повторяем, а отправляем в dead-letter.
+        """
+        expired = await db_execute("""
+            UPDATE scheduled_notifications
+            SET status = 'dead', last_error = 'lease expired: delivery outcome unknown',
+                locked_by = NULL, locked_at = NULL
+            WHERE status = 'sending' AND locked_at < NOW() - make_interval(secs => %s)
+        """, (NOTIFICATION_LEASE_SECONDS,))
+        if expired:
+            logger.warning(f"Очередь уведомлений: {expired} записей с истекшим lease перенесены в dead-letter")
+
+    @staticmethod
+    async def claim_batch(limit: int = NOTIFICATION_QUEUE_BATCH_SIZE) -> List[Dict[str, Any]]:
+        """Захватывает пачку наступивших уведомлений для этой реплики"""
+        jobs = await db_query("""
+            UPDATE scheduled_notifications
+            SET status = 'sending', locked_by = %s, locked_at = NOW(), attempts = attempts + 1
+            WHERE id IN (
+                SELECT id FROM scheduled_notifications
+                WHERE status = 'pending' AND scheduled_time <= NOW()
+                ORDER BY scheduled_time
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id, user_id, notification_type, message_text, payload
+        """, (WORKER_ID, limit), as_dict=True)
+        return jobs or []
+
+    @staticmethod
+    async def mark_sent(job_ids: List[int]) -> None:
+        if job_ids:
+            await db_execute("""
+                UPDATE scheduled_notifications
+                SET status = 'sent', is_sent = true, sent_at = NOW(), locked_by = NULL, locked_at = NULL,
+                    last_error = NULL
+                WHERE id = ANY(%s) AND status = 'sending'
+            """, (job_ids,))
+
+    @staticmethod
+    async def mark_cancelled(job_ids: List[int], reason: str) -> None:
+        if job_ids:
+            await db_execute("""
+                UPDATE scheduled_notifications
+                SET status = 'cancelled', last_error = %s, locked_by = NULL, locked_at = NULL
+                WHERE id = ANY(%s) AND status = 'sending'
+            """, (reason, job_ids))
+
+    @staticmethod
+    async def mark_failed(job_id: int, error: str, permanent: bool = False) -> None:
+        """Возвращает запись в очередь с backoff или переносит в dead-letter"""
+        await db_execute("""
+            UPDATE scheduled_notifications
+            SET status = CASE WHEN %s OR attempts >= max_attempts THEN 'dead' ELSE 'pending' END,
+                scheduled_time = NOW() + make_interval(secs => %s * power(2, GREATEST(attempts - 1, 0))),
+                last_error = %s, locked_by = NULL, locked_at = NULL
+            WHERE id = %s AND status = 'sending'
+        """, (permanent, _RETRY_BASE_SECONDS, error, job_id))
+
+    @staticmethod
+    async def _filter_obsolete(jobs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Отменяет напоминания о табеле тем, кто уже подал табель после постановки в очередь"""
+        roster_jobs = [job for job in jobs if job['notification_type'] == 'roster_reminder']
+        if not roster_jobs:
+            return jobs
+
+        submitted_raw = await db_query(
+            "SELECT brigade_user_id FROM daily_rosters WHERE roster_date = %s AND brigade_user_id = ANY(%s)",
+            (local_today(), [job['user_id'] for job in roster_jobs])
+        )
+        submitted = {row[0] for row in (submitted_raw or [])}
+        if not submitted:
+            return jobs
+
+        obsolete_ids = [job['id'] for job in roster_jobs if job['user_id'] in submitted]
+        await NotificationQueueService.mark_cancelled(obsolete_ids, 'roster already submitted')
+        return [job for job in jobs if job['id'] not in obsolete_ids]
+
+    @staticmethod
+    async def dispatch_due(bot) -> Optional[Dict[str, Any]]:
+        """Доставляет наступившие уведомления (вызывается периодически на каждой реплике)"""
+        await NotificationQueueService._expire_stale_leases()
+
+        jobs = await NotificationQueueService.claim_batch()
+        if not jobs:
+            return None
+
+        jobs = await NotificationQueueService._filter_obsolete(jobs)
+
+        messages = []
+        for job in jobs:
+            payload = job['payload'] or {}
+            if isinstance(payload, str):
+                payload = json.loads(payload)
+            message = {'key': job['id'], 'chat_id': job['user_id'], 'text': job['message_text']}
+            if payload.get('reply_markup'):
+                message['reply_markup'] = InlineKeyboardMarkup.de_json(payload['reply_markup'], bot)
+            if payload.get('parse_mode'):
+                message['parse_mode'] = payload['parse_mode']
+            messages.append(message)
+
+        summary = await BroadcastService.send_bulk(bot, messages, name='notification_queue')
+
+        # После таймаута сообщение могло дойти: не повторяем, чтобы не прислать его дважды
+        await NotificationQueueService.mark_sent(summary['delivered'] + summary['uncertain'])
+        for failure in summary['failures']:
+            await NotificationQueueService.mark_failed(failure['key'], failure['error'], failure['permanent'])
+
+        return summary
@@ -3,82 +3,100 @@
 """
 
 import logging
-from datetime import date, datetime
-from typing import List
-from telegram.ext import ContextTypes
+from typing import Dict, Any, List
+from telegram.ext import ContextTypes, ExtBot
 # FIXED: Импортируем нужные константы и хелперы
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, TelegramError
 from telegram.helpers import escape_markdown
 
-from database.queries import db_query, db_execute
+from config.settings import NOTIFICATION_SPREAD_SECONDS, BATCH_NOTIFICATION_MAX_LINES, REPORTS_GROUP_CHAT_ID
+from database.queries import db_query
+from utils.dates import local_today
 from utils.localization import get_text, get_user_language
-
-from telegram.ext import ExtBot
-from telegram.constants import ParseMode
-from telegram.helpers import escape_markdown
+from services.user_directory_service import UserDirectoryService
+from services.notification_queue_service import NotificationQueueService
 
 logger = logging.getLogger(__name__)
 
 class NotificationService:
     """Сервис для управления уведомлениями"""
     
+    @staticmethod
+    def _build_roster_reminder(user_id: str, first_name: str, lang: str) -> Dict[str, Any]:
+        """Формирует сообщение-напоминание о табеле (аргументы для bot.send_message)"""
+        text = get_text('roster_morning_reminder', lang).format(
+            name=first_name,
+            date=local_today().strftime('%d.%m.%Y')
+        )
+        
+        keyboard = [
+            [InlineKeyboardButton(get_text('submit_roster_button', lang), callback_data="submit_roster")],
+            [InlineKeyboardButton(get_text('remind_later_button', lang), callback_data="remind_later")]
+        ]
+        
+        return {
+            'chat_id': user_id,
+            'text': text,
+            'reply_markup': InlineKeyboardMarkup(keyboard),
+            'parse_mode': 'Markdown'
+        }
+    
+    @staticmethod
+    def _queued(message: Dict[str, Any], notification_type: str, dedupe_key: str,
+                delay_seconds: float = 0) -> Dict[str, Any]:
+        """Превращает аргументы send_message в запись для очереди уведомлений"""
+        payload = {}
+        if message.get('reply_markup'):
+            payload['reply_markup'] = message['reply_markup'].to_dict()
+        if message.get('parse_mode'):
+            payload['parse_mode'] = str(message['parse_mode'])
+        return {
+            'user_id': message['chat_id'],
+            'notification_type': notification_type,
+            'message_text': message['text'],
+            'payload': payload,
+            'dedupe_key': dedupe_key,
+            'delay_seconds': delay_seconds
+        }
+    
+    @staticmethod
+    def _spread(index: int, total: int) -> float:
+        """Сдвиг отправки, чтобы пачка уведомлений не уходила одним залпом"""
+        return NOTIFICATION_SPREAD_SECONDS * index / total if total > 1 else 0
+    
     @staticmethod
     async def send_roster_reminder(context: ContextTypes.DEFAULT_TYPE, user_id: str) -> bool:
-        """Отправляет утреннее напоминание о подаче табеля"""
+        """Ставит в очередь утреннее напоминание о подаче табеля одному бригадиру"""
         try:
             lang = await get_user_language(user_id)
-            today_str = date.today().strftime('%Y-%m-%d')
             
             # Проверяем, подан ли уже табель
             roster_check = await db_query(
                 "SELECT id FROM daily_rosters WHERE brigade_user_id = %s AND roster_date = %s",
-                (user_id, today_str)
+                (user_id, local_today())
             )
             
             if roster_check:
                 return True  # Табель уже подан, напоминание не нужно
             
-            # Получаем информацию о бригадире
-            brigade_info = await db_query(
-                "SELECT first_name, last_name FROM brigades WHERE user_id = %s",
-                (user_id,)
-            )
+            # Получаем информацию о бригадире из справочника пользователей
+            brigade_info = await UserDirectoryService.get_user(user_id)
             
             if not brigade_info:
                 return False
             
-            first_name = brigade_info[0][0] or ""
+            message = NotificationService._build_roster_reminder(user_id, brigade_info['first_name'] or "", lang)
+            await NotificationQueueService.enqueue_many([NotificationService._queued(
+                message, 'roster_reminder', f"roster_reminder:{user_id}:{local_today().isoformat()}"
+            )])
             
-            text = get_text('roster_morning_reminder', lang).format(
-                name=first_name,
-                date=date.today().strftime('%d.%m.%Y')
-            )
-            
-            from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-            keyboard = [
-                [InlineKeyboardButton(get_text('submit_roster_button', lang), callback_data="submit_roster")],
-                [InlineKeyboardButton(get_text('remind_later_button', lang), callback_data="remind_later")]
-            ]
-            
-            await context.bot.send_message(
-                chat_id=user_id,
-                text=text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode='Markdown'
-            )
-            
-            # Обновляем запись о последней отправке
-            await db_execute(
-                "UPDATE scheduled_notifications SET last_sent = %s WHERE user_id = %s AND notification_type = 'roster_reminder'",
-                (date.today(), user_id)
-            )
-            
-            logger.info(f"Отправлено напоминание о табеле пользователю {user_id}")
+            logger.info(f"Напоминание о табеле для {user_id} поставлено в очередь")
             return True
             
         except Exception as e:
-            logger.error(f"Ошибка отправки напоминания о табеле: {e}")
+            logger.error(f"Ошибка постановки напоминания о табеле: {e}")
             return False
     
     @staticmethod
@@ -169,12 +187,75 @@ class NotificationService:
             logger.error(f"Ошибка уведомления КИОК: {e}")
             return False
     
+    @staticmethod
+    async def notify_kiok_new_reports(context: ContextTypes.DEFAULT_TYPE, report_ids: List[int]) -> List[int]:
+        """
+        Одно сводное уведомление каждому КИОК о подтвержденных мастером отчетах его дисциплины.
+        Получатели и данные отчетов берутся одним запросом. Возвращает id отчетов, уведомление о которых
+        не дошло ни одному КИОК из-за временной ошибки (их повторит outbox, как notify_masters);
+        заблокированный бот и т.п. не повторяются.
+        """
+        if not report_ids:
+            return []
+        rows = await db_query("""
+            SELECT k.user_id, r.id, r.brigade_name, r.work_type_name, r.report_date, m.master_name
+            FROM reports r
+            JOIN kiok k ON k.discipline_id = r.discipline_id AND k.is_active = true
+            LEFT JOIN masters m ON r.master_id = m.user_id
+            WHERE r.id = ANY(%s)
+            ORDER BY k.user_id, r.id
+        """, (list(report_ids),), as_dict=True)
+        if rows is None:
+            return list(report_ids)
+
+        reports_by_kiok: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows:
+            reports_by_kiok.setdefault(row['user_id'], []).append(row)
+
+        sent, delivered, failed = 0, set(), set()
+        for kiok_id, reports in reports_by_kiok.items():
+            lang = await get_user_language(kiok_id)
+            lines = [
+                f"📋 ID:{r['id']} - {r['brigade_name']} - {r['work_type_name']} ({r['report_date'].strftime('%d.%m.%Y')})"
+                for r in reports[:BATCH_NOTIFICATION_MAX_LINES]
+            ]
+            if len(reports) > BATCH_NOTIFICATION_MAX_LINES:
+                lines.append(get_text('batch_more_reports', lang).format(count=len(reports) - BATCH_NOTIFICATION_MAX_LINES))
+
+            # В пачке могут быть отчеты разных мастеров
+            masters = ", ".join(dict.fromkeys(r['master_name'] for r in reports if r['master_name'])) or "-"
+            text = get_text('kiok_new_reports_batch_notification', lang).format(
+                count=len(reports), master=masters, reports="\n".join(lines)
+            )
+            keyboard = [[InlineKeyboardButton(get_text('kiok_open_queue_button', lang), callback_data="kiok_review")]]
+
+            try:
+                # Без разметки: названия бригад и работ не нужно экранировать
+                await context.bot.send_message(chat_id=kiok_id, text=text, reply_markup=InlineKeyboardMarkup(keyboard))
+                sent += 1
+                delivered.update(r['id'] for r in reports)
+            except (Forbidden, BadRequest) as e:
+                logger.warning(f"Уведомление КИОК {kiok_id} не доставлено (повтор не поможет): {e}")
+            except TelegramError as e:
+                logger.error(f"Ошибка уведомления КИОК {kiok_id}: {e}")
+                failed.update(r['id'] for r in reports)
+
+        logger.info(f"Сводное уведомление о {len(report_ids)} отчетах отправлено {sent} КИОК")
+        return sorted(failed - delivered)
+
     @staticmethod
     async def notify_supervisor_status_change(context: ContextTypes.DEFAULT_TYPE, report_id: int, 
-                                            new_status: str, approver_id: str, reason: str = None) -> bool:
-        """Уведомляет супервайзера об изменении статуса отчета"""
+                                            new_status: str, approver_id: str, reason: str = None,
+                                            report: Dict[str, Any] = None) -> bool:
+        """
+        Уведомляет супервайзера об изменении статуса отчета.
+        report - строка reports, которую уже вернул переход статуса (тогда отчет заново не читается).
+        """
         try:
-            report_info = await db_query("SELECT supervisor_id, brigade_name, work_type_name, report_date FROM reports WHERE id = %s", (report_id,))
+            if report:
+                report_info = [(report['supervisor_id'], report['brigade_name'], report['work_type_name'], report['report_date'])]
+            else:
+                report_info = await db_query("SELECT supervisor_id, brigade_name, work_type_name, report_date FROM reports WHERE id = %s", (report_id,))
             if not report_info: return False
             
             supervisor_id, brigade_name, work_type, report_date = report_info[0]
@@ -209,56 +290,97 @@ class NotificationService:
             return False
     
     @staticmethod
-    async def setup_daily_reminders():
-        """Настраивает ежедневные напоминания для всех бригадиров"""
-        try:
-            # Получаем всех активных бригадиров
-            brigades = await db_query("SELECT user_id FROM brigades WHERE is_active = true")
-            
-            if not brigades:
-                return
-            
-            for (user_id,) in brigades:
-                # Проверяем, есть ли уже запись для этого пользователя
-                existing = await db_query(
-                    "SELECT id FROM scheduled_notifications WHERE user_id = %s AND notification_type = 'roster_reminder'",
-                    (user_id,)
+    async def publish_approved_reports(context: ContextTypes.DEFAULT_TYPE, report_ids: List[int]) -> List[int]:
+        """
+        Публикует согласованные отчеты в группу отчетов: одно сообщение на тему дисциплины (topic_mappings),
+        отчеты дисциплин без темы - в общий чат группы. Возвращает id отчетов, не опубликованных
+        из-за временной ошибки (их повторит outbox).
+        """
+        if not REPORTS_GROUP_CHAT_ID or not report_ids:
+            return []
+        rows = await db_query("""
+            SELECT r.id, r.brigade_name, r.work_type_name, r.report_date, r.kiok_inspection_number,
+                   d.name AS discipline_name, tm.telegram_topic_id
+            FROM reports r
+            LEFT JOIN disciplines d ON d.id = r.discipline_id
+            LEFT JOIN topic_mappings tm ON tm.discipline_id = r.discipline_id
+            WHERE r.id = ANY(%s)
+            ORDER BY r.id
+        """, (list(report_ids),), as_dict=True)
+        if rows is None:
+            return list(report_ids)
+
+        reports_by_topic: Dict[Any, List[Dict[str, Any]]] = {}
+        for row in rows:
+            reports_by_topic.setdefault(row['telegram_topic_id'], []).append(row)
+
+        sent, failed = 0, set()
+        for topic_id, reports in reports_by_topic.items():
+            lines = [
+                f"✅ ID:{r['id']} - {r['discipline_name'] or '-'} - {r['brigade_name']} - {r['work_type_name']} "
+                f"({r['report_date'].strftime('%d.%m.%Y')}, инсп. {r['kiok_inspection_number'] or '-'})"
+                for r in reports[:BATCH_NOTIFICATION_MAX_LINES]
+            ]
+            if len(reports) > BATCH_NOTIFICATION_MAX_LINES:
+                lines.append(get_text('batch_more_reports', 'ru').format(count=len(reports) - BATCH_NOTIFICATION_MAX_LINES))
+            try:
+                await context.bot.send_message(
+                    chat_id=REPORTS_GROUP_CHAT_ID, message_thread_id=topic_id,
+                    text=f"📋 Согласовано КИОК: {len(reports)}\n" + "\n".join(lines)
                 )
-                
-                if not existing:
-                    # Создаем запись для напоминания в 8:00
-                    await db_execute("""
-                        INSERT INTO scheduled_notifications (user_id, notification_type, scheduled_time, is_active)
-                        VALUES (%s, 'roster_reminder', '08:00:00', true)
-                    """, (user_id,))
-            
-            logger.info("Настройка ежедневных напоминаний завершена")
+                sent += 1
+            except (Forbidden, BadRequest) as e:
+                logger.warning(f"Публикация в тему {topic_id} не удалась (повтор не поможет): {e}")
+            except TelegramError as e:
+                logger.error(f"Ошибка публикации отчетов в тему {topic_id}: {e}")
+                failed.update(r['id'] for r in reports)
+
+        logger.info(f"Согласованные отчеты {list(report_ids)} опубликованы в группе ({sent} сообщений)")
+        return sorted(failed)
+
+    @staticmethod
+    async def enqueue_roster_reminders(context: ContextTypes.DEFAULT_TYPE = None) -> int:
+        """
+        Ставит в очередь утренние напоминания бригадирам без поданного табеля.
+        Повторный вызов в тот же день (рестарт, вторая реплика) ничего не добавит - dedupe_key по дате.
+        """
+        try:
+            current_date = local_today()
+            
+            # Все получатели одним запросом: бригадиры без поданного табеля на сегодня
+            recipients = await db_query("""
+                SELECT b.user_id, b.first_name
+                FROM brigades b
+                LEFT JOIN daily_rosters dr ON dr.brigade_user_id = b.user_id AND dr.roster_date = %s
+                WHERE dr.id IS NULL
+                ORDER BY b.user_id
+            """, (current_date,))
+            
+            if not recipients:
+                return 0
+            
+            notifications = []
+            for index, (user_id, first_name) in enumerate(recipients):
+                lang = await get_user_language(user_id)
+                message = NotificationService._build_roster_reminder(user_id, first_name or "", lang)
+                notifications.append(NotificationService._queued(
+                    message, 'roster_reminder', f"roster_reminder:{user_id}:{current_date.isoformat()}",
+                    NotificationService._spread(index, len(recipients))
+                ))
+            
+            return await NotificationQueueService.enqueue_many(notifications)
             
         except Exception as e:
-            logger.error(f"Ошибка настройки ежедневных напоминаний: {e}")
+            logger.error(f"Ошибка постановки напоминаний о табеле: {e}")
+            return 0
     
     @staticmethod
     async def process_scheduled_notifications(context: ContextTypes.DEFAULT_TYPE):
-        """Обрабатывает запланированные уведомления (вызывается по расписанию)"""
+        """Доставляет наступившие уведомления из очереди (вызывается по расписанию на каждой реплике)"""
         try:
-            current_time = datetime.now().time()
-            current_date = date.today()
-            
-            # Находим уведомления, которые нужно отправить
-            notifications = await db_query("""
-                SELECT user_id, notification_type 
-                FROM scheduled_notifications 
-                WHERE scheduled_time <= %s 
-                AND is_active = true 
-                AND (last_sent IS NULL OR last_sent < %s)
-            """, (current_time, current_date))
-            
-            for user_id, notification_type in notifications:
-                if notification_type == 'roster_reminder':
-                    await NotificationService.send_roster_reminder(context, user_id)
-            
+            await NotificationQueueService.dispatch_due(context.bot)
         except Exception as e:
-            logger.error(f"Ошибка обработки запланированных уведомлений: {e}")
+            logger.error(f"Ошибка обработки очереди уведомлений: {e}")
     
     @staticmethod
     async def get_users_for_discipline_notification(discipline_name: str, role: str) -> List[str]:
@@ -286,61 +408,56 @@ class NotificationService:
             logger.error(f"Ошибка получения пользователей для уведомлений: {e}")
             return []
         
-        # --- > НОВАЯ ФУНКЦИЯ ДЛЯ НАПОМИНАНИЙ <---
-   
-    # --- > ДОБАВЬТЕ ЭТУ ФУНКЦИЮ В КОНЕЦ КЛАССА <---
     @staticmethod
-    async def send_pending_report_reminders(bot: ExtBot):
+    async def enqueue_pending_report_reminders(bot: ExtBot = None) -> int:
         """
         Находит отчеты, ожидающие подтверждения мастером более 2 дней,
-        и отправляет напоминания соответствующим мастерам.
+        и ставит в очередь напоминания соответствующим мастерам (не чаще раза в день на отчет).
         """
         logger.info("Scheduler: Запуск проверки зависших отчетов для мастеров...")
         try:
-            overdue_reports = await db_query("""
-                SELECT id, discipline_id, supervisor_id, brigade_name, work_type_name
-                FROM reports
-                WHERE workflow_status = 'pending_master'
-                  AND created_at <= NOW() - INTERVAL '2 days';
+            # Матрица отчет x мастер дисциплины одним запросом
+            reminders = await db_query("""
+                SELECT r.id, m.user_id, r.brigade_name, r.work_type_name,
+                       COALESCE(s.supervisor_name, 'ID: ' || r.supervisor_id) AS supervisor_name
+                FROM reports r
+                JOIN masters m ON m.discipline_id = r.discipline_id AND m.is_active = true
+                LEFT JOIN supervisors s ON s.user_id = r.supervisor_id
+                WHERE r.workflow_status = 'pending_master'
+                  AND r.created_at <= NOW() - INTERVAL '2 days'
+                ORDER BY r.id
             """)
 
-            if not overdue_reports:
+            if not reminders:
                 logger.info("Scheduler: Зависших отчетов не найдено.")
-                return
+                return 0
 
-            logger.info(f"Scheduler: Найдено {len(overdue_reports)} зависших отчетов.")
-            
-            for report_id, discipline_id, supervisor_id, brigade_name, work_type in overdue_reports:
-                masters = await db_query(
-                    "SELECT user_id FROM masters WHERE discipline_id = %s AND is_active = true",
-                    (discipline_id,)
+            logger.info(f"Scheduler: Найдено {len({row[0] for row in reminders})} зависших отчетов.")
+            
+            today = local_today().isoformat()
+            notifications = []
+            for index, (report_id, master_id, brigade_name, work_type, supervisor_name) in enumerate(reminders):
+                lang = await get_user_language(master_id)
+                text = get_text('master_report_reminder_notification', lang).format(
+                    report_id=report_id,
+                    supervisor=escape_markdown(supervisor_name, version=2),
+                    brigade=escape_markdown(brigade_name, version=2),
+                    work_type=escape_markdown(work_type, version=2)
                 )
-                if not masters:
-                    continue
-
-                supervisor_name_res = await db_query("SELECT supervisor_name FROM supervisors WHERE user_id = %s", (supervisor_id,))
-                supervisor_name = supervisor_name_res[0][0] if supervisor_name_res else f"ID: {supervisor_id}"
-                
-                for (master_id,) in masters:
-                    lang = await get_user_language(master_id)
-                    text = get_text('master_report_reminder_notification', lang).format(
-                        report_id=report_id,
-                        supervisor=escape_markdown(supervisor_name, version=2),
-                        brigade=escape_markdown(brigade_name, version=2),
-                        work_type=escape_markdown(work_type, version=2)
-                    )
-                    keyboard = [[InlineKeyboardButton(get_text('view_details_button', lang), callback_data=f"master_view_{report_id}")]]
-                    
-                    try:
-                        await bot.send_message(
-                            chat_id=master_id,
-                            text=text,
-                            reply_markup=InlineKeyboardMarkup(keyboard),
-                            parse_mode=ParseMode.MARKDOWN_V2
-                        )
-                        logger.info(f"Отправлено напоминание по отчету {report_id} мастеру {master_id}")
-                    except Exception as e:
-                        logger.error(f"Не удалось отправить напоминание мастеру {master_id}: {e}")
+                keyboard = [[InlineKeyboardButton(get_text('view_details_button', lang), callback_data=f"master_view_{report_id}")]]
+                message = {
+                    'chat_id': master_id,
+                    'text': text,
+                    'reply_markup': InlineKeyboardMarkup(keyboard),
+                    'parse_mode': ParseMode.MARKDOWN_V2
+                }
+                notifications.append(NotificationService._queued(
+                    message, 'pending_report_reminder', f"pending_report:{report_id}:{master_id}:{today}",
+                    NotificationService._spread(index, len(reminders))
+                ))
+            
+            return await NotificationQueueService.enqueue_many(notifications)
 
         except Exception as e:
-            logger.error(f"Ошибка в процессе отправки напоминаний о зависших отчетах: {e}")
\ No newline at end of file
+            logger.error(f"Ошибка в процессе постановки напоминаний о зависших отчетах: {e}")
+            return 0
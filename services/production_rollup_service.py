@@ -0,0 +1,127 @@
+# services/production_rollup_service.py
+
+"""
+Дневная сводка выработки (daily_production_rollup): дата × дисциплина × бригада × вид работ.
+
+Строка сводки всегда пересчитывается целиком из согласованных отчетов своего ключа,
+поэтому обновление идемпотентно: его можно повторить после любой правки отчетов.
+"""
+
+import logging
+import time
+from datetime import date
+from typing import Iterable, Optional
+
+from database.queries import db_transaction
+
+logger = logging.getLogger(__name__)
+
+# {where} - условие по колонкам ключа (report_date, discipline_id, brigade_name, work_type_name),
+# они называются одинаково в reports и в сводке
+_DELETE_SQL = "DELETE FROM daily_production_rollup WHERE {where}"
+
+_INSERT_SQL = """
+    INSERT INTO daily_production_rollup (
+        report_date, discipline_id, brigade_name, work_type_name, work_type_id, norm_per_unit,
+        report_count, people_count, volume, planned_volume, updated_at
+    )
+    SELECT report_date, discipline_id, brigade_name, work_type_name,
+           MAX(wt.id), MAX(wt.norm_per_unit),
+           COUNT(*),
+           COALESCE(SUM(r.people_count), 0),
+           COALESCE(SUM(r.volume), 0),
+           COALESCE(SUM(r.people_count * wt.norm_per_unit), 0),
+           NOW()
+    FROM reports r
+    -- Вид работ сопоставляется по имени внутри дисциплины; дубли имен не размножают строки
+    LEFT JOIN LATERAL (
+        SELECT w.id, w.norm_per_unit FROM work_types w
+        WHERE w.discipline_id = r.discipline_id AND w.name = r.work_type_name
+        ORDER BY w.id LIMIT 1
+    ) wt ON true
+    WHERE r.workflow_status = 'approved' AND r.discipline_id IS NOT NULL AND {where}
+    GROUP BY report_date, discipline_id, brigade_name, work_type_name
+    ON CONFLICT (report_date, discipline_id, brigade_name, work_type_name) DO UPDATE SET
+        work_type_id = EXCLUDED.work_type_id,
+        norm_per_unit = EXCLUDED.norm_per_unit,
+        report_count = EXCLUDED.report_count,
+        people_count = EXCLUDED.people_count,
+        volume = EXCLUDED.volume,
+        planned_volume = EXCLUDED.planned_volume,
+        updated_at = EXCLUDED.updated_at
+"""
+
+_REPORT_KEYS_WHERE = """
+    (report_date, discipline_id, brigade_name, work_type_name) IN (
+        SELECT report_date, discipline_id, brigade_name, work_type_name FROM reports WHERE id = ANY(%s)
+    )
+"""
+
+class ProductionRollupService:
+    """Поддержка таблицы daily_production_rollup, по которой считаются дашборды выработки"""
+
+    @staticmethod
+    async def _refresh_in(tx, where: str, params: tuple) -> int:
+        await tx.execute(_DELETE_SQL.format(where=where), params)
+        return await tx.execute(_INSERT_SQL.format(where=where), params)
+
+    @staticmethod
+    async def _refresh(where: str, params: tuple) -> int:
+        """Пересчитывает строки сводки, попадающие под условие, в одной транзакции"""
+        async with db_transaction() as tx:
+            return await ProductionRollupService._refresh_in(tx, where, params)
+
+    @staticmethod
+    async def fill(tx) -> int:
+        """Полное заполнение сводки в уже открытой транзакции (миграция)"""
+        return await ProductionRollupService._refresh_in(tx, "TRUE", ())
+
+    @staticmethod
+    async def refresh_reports(report_ids: Iterable[int]) -> bool:
+        """Обновляет сводку по ключам указанных отчетов (после смены статуса)"""
+        report_ids = [int(report_id) for report_id in report_ids]
+        if not report_ids:
+            return True
+        try:
+            await ProductionRollupService._refresh(_REPORT_KEYS_WHERE, (report_ids,))
+            return True
+        except Exception as e:
+            # Сводку можно восстановить командой rebuild_rollup.py, поэтому не роняем согласование
+            logger.error(f"Ошибка обновления сводки выработки для отчетов {report_ids}: {e}")
+            return False
+
+    @staticmethod
+    async def refresh_brigade_day(brigade_name: str, report_date: str) -> bool:
+        """Обновляет сводку бригады за день (после удаления ее отчетов)"""
+        try:
+            await ProductionRollupService._refresh(
+                "brigade_name = %s AND report_date = %s::date", (brigade_name, report_date)
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка обновления сводки выработки {brigade_name} за {report_date}: {e}")
+            return False
+
+    @staticmethod
+    async def refresh_brigade_day_in(tx, brigade_name: str, report_date: date) -> int:
+        """То же внутри уже открытой транзакции (удаление отчетов и сводка меняются вместе)"""
+        return await ProductionRollupService._refresh_in(
+            tx, "brigade_name = %s AND report_date = %s::date", (brigade_name, report_date)
+        )
+
+    @staticmethod
+    async def rebuild(date_from: Optional[date] = None, date_to: Optional[date] = None) -> int:
+        """Пересобирает сводку за период (или целиком). Возвращает число строк сводки."""
+        started = time.monotonic()
+        where = "report_date BETWEEN %s AND %s"
+        params = (date_from or date.min, date_to or date.max)
+        rows = await ProductionRollupService._refresh(where, params)
+        logger.info(f"✅ Сводка выработки пересобрана: {rows} строк за {time.monotonic() - started:.2f} сек")
+        return rows
+
+    @staticmethod
+    def rebuild_sync(cursor) -> int:
+        """[БЛОКИРУЮЩАЯ] Полная пересборка на курсоре psycopg2 - в транзакции импорта/восстановления"""
+        cursor.execute(_DELETE_SQL.format(where="TRUE"))
+        cursor.execute(_INSERT_SQL.format(where="TRUE"))
+        return cursor.rowcount
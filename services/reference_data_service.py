@@ -0,0 +1,188 @@
+# services/reference_data_service.py
+
+import asyncio
+import logging
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from config.settings import REFERENCE_CACHE_TTL_SECONDS
+from database.queries import db_query
+
+logger = logging.getLogger(__name__)
+
+def _to_int(value) -> Optional[int]:
+    """id из callback_data приходят строкой"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+class ReferenceDataService:
+    """
+    In-memory кэш справочников: дисциплины, объекты строительства, виды работ, роли персонала.
+    Снимок загружается целиком и живет до invalidate() (импорт справочников, правки админа,
+    восстановление БД) или до истечения REFERENCE_CACHE_TTL_SECONDS - так другие экземпляры
+    бота тоже увидят изменения.
+    """
+
+    _snapshot: Optional[Dict[str, Any]] = None
+    _loaded_at: float = 0.0
+    # Номер версии справочников: растет при каждом сбросе, загрузка старой версии не сохраняется
+    _version: int = 0
+    _lock: Optional[asyncio.Lock] = None
+
+    @staticmethod
+    def invalidate() -> None:
+        """Сбрасывает кэш. Можно вызывать из потоков пула (импорт через psycopg2)."""
+        ReferenceDataService._version += 1
+        ReferenceDataService._snapshot = None
+        logger.info(f"Кэш справочников сброшен (версия {ReferenceDataService._version})")
+
+    @staticmethod
+    def get_version() -> int:
+        return ReferenceDataService._version
+
+    @staticmethod
+    async def _load() -> Optional[Dict[str, Any]]:
+        disciplines = await db_query("SELECT id, name FROM disciplines ORDER BY name")
+        objects = await db_query("SELECT id, name FROM construction_objects ORDER BY display_order, name")
+        work_types = await db_query("""
+            SELECT id, name, discipline_id, unit_of_measure, norm_per_unit
+            FROM work_types ORDER BY display_order, name
+        """)
+        roles = await db_query("""
+            SELECT id, role_name, discipline_id, category
+            FROM personnel_roles ORDER BY display_order, role_name
+        """)
+        if disciplines is None or objects is None or work_types is None or roles is None:
+            return None
+
+        snapshot = {
+            'disciplines': [{'id': d_id, 'name': name} for d_id, name in disciplines],
+            'discipline_by_id': {d_id: name for d_id, name in disciplines},
+            'discipline_by_name': {name: d_id for d_id, name in disciplines},
+            'objects': [(o_id, name) for o_id, name in objects],
+            'object_by_id': {o_id: name for o_id, name in objects},
+            'work_type_by_id': {},
+            'work_types_by_discipline': {},
+            'role_by_id': {},
+            'role_id_by_name': {},
+            'roles_by_discipline': {},
+        }
+        for w_id, name, discipline_id, unit, norm in work_types:
+            work_type = {
+                'id': w_id, 'name': name, 'discipline_id': discipline_id,
+                'unit_of_measure': unit, 'norm_per_unit': norm
+            }
+            snapshot['work_type_by_id'][w_id] = work_type
+            snapshot['work_types_by_discipline'].setdefault(discipline_id, []).append(work_type)
+        for r_id, name, discipline_id, category in roles:
+            role = {
+                'id': r_id, 'name': name, 'discipline_id': discipline_id, 'category': category,
+                'discipline': snapshot['discipline_by_id'].get(discipline_id)
+            }
+            snapshot['role_by_id'][r_id] = role
+            snapshot['role_id_by_name'].setdefault(name, r_id)
+            snapshot['roles_by_discipline'].setdefault(discipline_id, []).append(role)
+        return snapshot
+
+    @staticmethod
+    async def _get_snapshot() -> Dict[str, Any]:
+        snapshot = ReferenceDataService._snapshot
+        if snapshot is not None and time.monotonic() - ReferenceDataService._loaded_at < REFERENCE_CACHE_TTL_SECONDS:
+            return snapshot
+
+        if ReferenceDataService._lock is None:
+            ReferenceDataService._lock = asyncio.Lock()
+        async with ReferenceDataService._lock:
+            # Пока ждали блокировку, справочники мог загрузить другой обработчик
+            snapshot = ReferenceDataService._snapshot
+            if snapshot is not None and time.monotonic() - ReferenceDataService._loaded_at < REFERENCE_CACHE_TTL_SECONDS:
+                return snapshot
+
+            version = ReferenceDataService._version
+            snapshot = await ReferenceDataService._load()
+            if snapshot is None:
+                logger.error("Не удалось загрузить справочники")
+                # Отдаем устаревший снимок, если он есть, иначе пустой (без кэширования)
+                return ReferenceDataService._snapshot or ReferenceDataService._empty()
+
+            # Если во время загрузки справочники сбросили, снимок мог прочитать старые данные
+            if version == ReferenceDataService._version:
+                ReferenceDataService._snapshot = snapshot
+                ReferenceDataService._loaded_at = time.monotonic()
+                logger.debug(
+                    f"Справочники загружены (версия {version}): дисциплин {len(snapshot['disciplines'])}, "
+                    f"объектов {len(snapshot['objects'])}, видов работ {len(snapshot['work_type_by_id'])}"
+                )
+            return snapshot
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {
+            'disciplines': [], 'discipline_by_id': {}, 'discipline_by_name': {},
+            'objects': [], 'object_by_id': {},
+            'work_type_by_id': {}, 'work_types_by_discipline': {},
+            'role_by_id': {}, 'role_id_by_name': {}, 'roles_by_discipline': {},
+        }
+
+    @staticmethod
+    async def load_all() -> bool:
+        """Загружает справочники заранее (при старте бота)"""
+        snapshot = await ReferenceDataService._get_snapshot()
+        return bool(snapshot['disciplines'] or snapshot['objects'])
+
+    # --- Дисциплины ---
+
+    @staticmethod
+    async def get_disciplines() -> List[Dict[str, Any]]:
+        """Все дисциплины по алфавиту: [{'id', 'name'}]"""
+        return list((await ReferenceDataService._get_snapshot())['disciplines'])
+
+    @staticmethod
+    async def get_discipline_name(discipline_id) -> Optional[str]:
+        snapshot = await ReferenceDataService._get_snapshot()
+        return snapshot['discipline_by_id'].get(_to_int(discipline_id))
+
+    @staticmethod
+    async def get_discipline_id(discipline_name: str) -> Optional[int]:
+        snapshot = await ReferenceDataService._get_snapshot()
+        return snapshot['discipline_by_name'].get(discipline_name)
+
+    # --- Объекты строительства ---
+
+    @staticmethod
+    async def get_construction_objects() -> List[Tuple[int, str]]:
+        """Объекты в порядке display_order: [(id, name)]"""
+        return list((await ReferenceDataService._get_snapshot())['objects'])
+
+    @staticmethod
+    async def get_construction_object_name(object_id) -> Optional[str]:
+        snapshot = await ReferenceDataService._get_snapshot()
+        return snapshot['object_by_id'].get(_to_int(object_id))
+
+    # --- Виды работ ---
+
+    @staticmethod
+    async def get_work_types(discipline_id) -> List[Dict[str, Any]]:
+        """Виды работ дисциплины: [{'id', 'name', 'discipline_id', 'unit_of_measure', 'norm_per_unit'}]"""
+        snapshot = await ReferenceDataService._get_snapshot()
+        return list(snapshot['work_types_by_discipline'].get(_to_int(discipline_id), []))
+
+    @staticmethod
+    async def get_work_type(work_type_id) -> Optional[Dict[str, Any]]:
+        snapshot = await ReferenceDataService._get_snapshot()
+        return snapshot['work_type_by_id'].get(_to_int(work_type_id))
+
+    # --- Роли персонала ---
+
+    @staticmethod
+    async def get_personnel_roles(discipline_id) -> List[Dict[str, Any]]:
+        """Роли дисциплины: [{'id', 'name', 'discipline_id', 'category', 'discipline'}]"""
+        snapshot = await ReferenceDataService._get_snapshot()
+        return list(snapshot['roles_by_discipline'].get(_to_int(discipline_id), []))
+
+    @staticmethod
+    async def get_role_id_map() -> Dict[str, int]:
+        """role_name -> id"""
+        return dict((await ReferenceDataService._get_snapshot())['role_id_by_name'])
@@ -1,15 +1,81 @@
 # services/roster_service.py - ИСПРАВЛЕНИЯ
 
+import asyncio
 import logging
+import time
 from datetime import date
-from typing import Dict, Any, Optional, List
-from database.queries import db_query, db_execute
+from typing import Dict, Any, Optional, List, Set
+from config.settings import ROSTER_STATUS_TTL_SECONDS
+from database.queries import db_query, db_execute, db_transaction
+from services.reference_data_service import ReferenceDataService
+from services.production_rollup_service import ProductionRollupService
+from utils.dates import local_today
 
 logger = logging.getLogger(__name__)
 
 class RosterService:
     """Сервис для управления табелями учета рабочего времени"""
     
+    # Бригадиры, подавшие табель сегодня: главное меню узнает статус без запроса к БД.
+    # Набор пустеет со сменой даты, save_roster/reset_roster правят его сразу, а раз в
+    # ROSTER_STATUS_TTL_SECONDS он перечитывается целиком - так видны табели, поданные через другие экземпляры бота
+    _submitted: Set[str] = set()
+    _submitted_date: Optional[date] = None
+    _submitted_loaded_at: float = 0.0
+    # Растет при каждой локальной правке: перечитанный во время правки набор не затирает ее
+    _submitted_version: int = 0
+    _submitted_lock: Optional[asyncio.Lock] = None
+    
+    @staticmethod
+    def _roll_submitted_day() -> None:
+        """В полночь по BOT_TIMEZONE набор поданных табелей очищается (проверяется при каждом обращении)"""
+        today = local_today()
+        if RosterService._submitted_date != today:
+            RosterService._submitted = set()
+            RosterService._submitted_date = today
+            RosterService._submitted_loaded_at = 0.0
+    
+    @staticmethod
+    def _mark_submitted(user_id: str, submitted: bool) -> None:
+        RosterService._roll_submitted_day()
+        RosterService._submitted_version += 1
+        if submitted:
+            RosterService._submitted.add(str(user_id))
+        else:
+            RosterService._submitted.discard(str(user_id))
+    
+    @staticmethod
+    async def load_submitted_today() -> bool:
+        """Перечитывает из БД, кто подал табель сегодня (один запрос на всех бригадиров)"""
+        RosterService._roll_submitted_day()
+        today = RosterService._submitted_date
+        version = RosterService._submitted_version
+        rows = await db_query("SELECT brigade_user_id FROM daily_rosters WHERE roster_date = %s", (today,))
+        if rows is None or RosterService._submitted_date != today:
+            return False
+        
+        loaded = {str(row[0]) for row in rows}
+        if version == RosterService._submitted_version:
+            RosterService._submitted = loaded
+            RosterService._submitted_loaded_at = time.monotonic()
+        else:
+            # Пока читали, здесь сохранили или сбросили табель - не теряем правку, перечитаем в следующий раз
+            RosterService._submitted |= loaded
+        return True
+    
+    @staticmethod
+    async def is_submitted_today(user_id: str) -> bool:
+        """Подал ли бригадир табель сегодня (из памяти; БД - не чаще раза в ROSTER_STATUS_TTL_SECONDS)"""
+        RosterService._roll_submitted_day()
+        if time.monotonic() - RosterService._submitted_loaded_at >= ROSTER_STATUS_TTL_SECONDS:
+            if RosterService._submitted_lock is None:
+                RosterService._submitted_lock = asyncio.Lock()
+            async with RosterService._submitted_lock:
+                # Пока ждали блокировку, набор мог перечитать другой обработчик
+                if time.monotonic() - RosterService._submitted_loaded_at >= ROSTER_STATUS_TTL_SECONDS:
+                    await RosterService.load_submitted_today()
+        return str(user_id) in RosterService._submitted
+    
     @staticmethod
     async def get_available_roles(user_id: str) -> List[Dict[str, Any]]:
         """Получает роли персонала для дисциплины бригадира"""
@@ -30,25 +96,19 @@ class RosterService:
                 return []
             
             # Получаем роли для этой дисциплины
-            roles_raw = await db_query("""
-                SELECT pr.id, pr.role_name, d.name as discipline_name
-                FROM personnel_roles pr
-                JOIN disciplines d ON pr.discipline_id = d.id
-                WHERE pr.discipline_id = %s
-                ORDER BY pr.display_order, pr.role_name
-            """, (discipline_id,))
+            roles = await ReferenceDataService.get_personnel_roles(discipline_id)
             
-            if not roles_raw:
+            if not roles:
                 logger.warning(f"Роли для дисциплины {discipline_id} не найдены")
                 return []
             
             return [
                 {
-                    'id': role_id, 
-                    'name': role_name,
-                    'discipline': discipline_name
+                    'id': role['id'], 
+                    'name': role['name'],
+                    'discipline': role['discipline']
                 } 
-                for role_id, role_name, discipline_name in roles_raw
+                for role in roles
             ]
             
         except Exception as e:
@@ -111,10 +171,10 @@ class RosterService:
     async def check_roster_safety(user_id: str, total_people_new: int, brigade_name: str) -> Dict[str, Any]:
         """Проверяет безопасность сохранения табеля"""
         try:
-            today_str = date.today().strftime('%Y-%m-%d')
+            today_str = local_today().strftime('%Y-%m-%d')
             
             assigned_info = await db_query("""
-                SELECT SUM(CAST(report_data->>'people_count' AS INTEGER)) 
+                SELECT SUM(people_count)::integer
                 FROM reports 
                 WHERE brigade_name = %s AND report_date = %s
             """, (brigade_name, today_str))
@@ -141,40 +201,55 @@ class RosterService:
             }
     
     @staticmethod
-    async def save_roster(user_id: str, roster_summary: Dict[str, Any]) -> bool:
-        """Сохраняет табель в БД"""
+    async def _save_roster_in(tx, user_id: str, roster_summary: Dict[str, Any],
+                              roles: List[Dict[str, Any]], roster_date: date) -> int:
+        """Табель и его детализация внутри открытой транзакции. Возвращает id табеля."""
+        # Повторная подача за день обновляет ту же строку (UNIQUE brigade_user_id, roster_date)
+        roster_id = await tx.query_single("""
+            INSERT INTO daily_rosters (roster_date, brigade_user_id, total_personnel)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (brigade_user_id, roster_date) DO UPDATE SET
+                total_personnel = EXCLUDED.total_personnel,
+                created_at = NOW()
+            RETURNING id
+        """, (roster_date, user_id, roster_summary['total']))
+
+        # Имена ролей сопоставляются внутри дисциплины бригадира: общие имена есть в нескольких дисциплинах
+        role_ids = {role['name']: role['id'] for role in roles}
+        details = [
+            (role_ids[role_name], count)
+            for role_name, count in roster_summary.get('details', {}).items()
+            if role_name in role_ids
+        ]
+        missing = set(roster_summary.get('details', {})) - set(role_ids)
+        if missing:
+            logger.warning(f"Роли {sorted(missing)} не найдены в дисциплине бригадира {user_id}, пропущены")
+
+        await tx.execute("DELETE FROM daily_roster_details WHERE roster_id = %s", (roster_id,))
+        if details:
+            await tx.execute("""
+                INSERT INTO daily_roster_details (roster_id, role_id, personnel_count)
+                SELECT %s, role_id, personnel_count
+                FROM unnest(%s::int[], %s::int[]) AS d(role_id, personnel_count)
+            """, (roster_id, [role_id for role_id, _ in details], [count for _, count in details]))
+        return roster_id
+
+    @staticmethod
+    async def save_roster(user_id: str, roster_summary: Dict[str, Any],
+                          roles: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """
+        Сохраняет табель в БД одной транзакцией: табель и детализация появляются только вместе.
+        roles - роли дисциплины бригадира (get_available_roles), если они уже получены.
+        """
         try:
-            today_str = date.today().strftime('%Y-%m-%d')
-            total_people_new = roster_summary['total']
+            # В транзакции нет запасного пути через psycopg2 - дата передается объектом date
+            today = local_today()
+            if roles is None:
+                roles = await RosterService.get_available_roles(user_id)
             
-            # Удаляем старый табель
-            await db_execute("DELETE FROM daily_rosters WHERE brigade_user_id = %s AND roster_date = %s", (user_id, today_str))
-            
-            # FIXED: Используем правильное поле total_personnel
-            roster_id_raw = await db_query(
-                "INSERT INTO daily_rosters (roster_date, brigade_user_id, total_personnel) VALUES (%s, %s, %s) RETURNING id",
-                (today_str, user_id, total_people_new)
-            )
-            
-            if not roster_id_raw:
-                logger.error("Не удалось создать запись в daily_rosters")
-                return False
-            
-            roster_id = roster_id_raw[0][0]
-            
-            # Сохраняем детализацию
-            roles_map_raw = await db_query("SELECT id, role_name FROM personnel_roles")
-            roles_map = {name: role_id for role_id, name in roles_map_raw} if roles_map_raw else {}
-            
-            details_to_save = roster_summary.get('details', {})
-            for role_name, count in details_to_save.items():
-                role_id = roles_map.get(role_name)
-                if role_id:
-                    # FIXED: Используем правильное поле personnel_count
-                    await db_execute(
-                        "INSERT INTO daily_roster_details (roster_id, role_id, personnel_count) VALUES (%s, %s, %s)",
-                        (roster_id, role_id, count)
-                    )
+            async with db_transaction() as tx:
+                roster_id = await RosterService._save_roster_in(tx, user_id, roster_summary, roles, today)
+            RosterService._mark_submitted(user_id, True)
             
             logger.info(f"✅ Табель для пользователя {user_id} успешно сохранен (ID: {roster_id})")
             return True
@@ -184,16 +259,23 @@ class RosterService:
             return False
     
     @staticmethod
-    async def force_save_with_reports_deletion(user_id: str, roster_summary: Dict[str, Any], brigade_name: str) -> bool:
-        """Принудительно сохраняет табель, удаляя отчеты за день"""
+    async def force_save_with_reports_deletion(user_id: str, roster_summary: Dict[str, Any], brigade_name: str,
+                                               roles: Optional[List[Dict[str, Any]]] = None) -> bool:
+        """Принудительно сохраняет табель, удаляя отчеты за день (все в одной транзакции)"""
         try:
-            today_str = date.today().strftime('%Y-%m-%d')
+            today = local_today()
+            if roles is None:
+                roles = await RosterService.get_available_roles(user_id)
             
-            # Удаляем отчеты за день
-            await db_execute("DELETE FROM reports WHERE brigade_name = %s AND report_date = %s", (brigade_name, today_str))
+            async with db_transaction() as tx:
+                # Удаляем отчеты за день и сразу пересчитываем сводку выработки бригады
+                await tx.execute("DELETE FROM reports WHERE brigade_name = %s AND report_date = %s", (brigade_name, today))
+                await ProductionRollupService.refresh_brigade_day_in(tx, brigade_name, today)
+                roster_id = await RosterService._save_roster_in(tx, user_id, roster_summary, roles, today)
+            RosterService._mark_submitted(user_id, True)
             
-            # Сохраняем табель
-            return await RosterService.save_roster(user_id, roster_summary)
+            logger.info(f"✅ Табель для пользователя {user_id} принудительно сохранен (ID: {roster_id}), отчеты бригады {brigade_name} за день удалены")
+            return True
             
         except Exception as e:
             logger.error(f"Ошибка принудительного сохранения табеля: {e}")
@@ -203,7 +285,7 @@ class RosterService:
     async def get_roster_status(user_id: str) -> Dict[str, Any]:
         """Проверяет статус табеля на сегодня"""
         try:
-            today_str = date.today().strftime('%Y-%m-%d')
+            today_str = local_today().strftime('%Y-%m-%d')
             
             roster_info = await db_query("""
                 SELECT dr.id, dr.total_personnel, dr.roster_date
@@ -242,9 +324,10 @@ class RosterService:
     async def reset_roster(user_id: str) -> bool:
         """Удаляет табель на сегодня (для админов)"""
         try:
-            today_str = date.today().strftime('%Y-%m-%d')
+            today_str = local_today().strftime('%Y-%m-%d')
             
             deleted_count = await db_execute("DELETE FROM daily_rosters WHERE brigade_user_id = %s AND roster_date = %s", (user_id, today_str))
+            RosterService._mark_submitted(user_id, False)
             
             if deleted_count:
                 logger.info(f"Табель для пользователя {user_id} на {today_str} успешно удален")
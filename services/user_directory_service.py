@@ -0,0 +1,178 @@
+# services/user_directory_service.py
+
+import logging
+import time
+from typing import Dict, Any, Optional, Tuple
+
+from config.settings import USER_DIRECTORY_MISS_TTL_SECONDS, USER_DIRECTORY_TTL_SECONDS
+from database.queries import db_query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANGUAGE = 'ru'
+
+# Все таблицы ролей одним запросом. priority повторяет порядок поиска в UserService.get_user_info:
+# первая найденная таблица определяет role_table, имя и дисциплину пользователя.
+_DIRECTORY_QUERY = """
+    SELECT u.user_id, u.role_table, u.first_name, u.last_name, u.full_name,
+           u.phone_number, u.language_code, u.discipline_id, d.name AS discipline_name
+    FROM (
+        SELECT 1 AS priority, 'admins' AS role_table, user_id, first_name, last_name,
+               NULL::text AS full_name, phone_number, language_code, NULL::integer AS discipline_id
+        FROM admins
+        UNION ALL
+        SELECT 2, 'managers', user_id, first_name, last_name, NULL, phone_number, language_code, discipline
+        FROM managers
+        UNION ALL
+        SELECT 3, 'brigades', user_id, first_name, last_name, NULL, phone_number, language_code, discipline_id
+        FROM brigades
+        UNION ALL
+        SELECT 4, 'pto', user_id, first_name, last_name, NULL, phone_number, language_code, discipline_id
+        FROM pto
+        UNION ALL
+        SELECT 5, 'supervisors', user_id, NULL, NULL, supervisor_name, phone_number, language_code, discipline_id
+        FROM supervisors
+        UNION ALL
+        SELECT 6, 'masters', user_id, NULL, NULL, master_name, phone_number, language_code, discipline_id
+        FROM masters
+        UNION ALL
+        SELECT 7, 'kiok', user_id, NULL, NULL, kiok_name, phone_number, language_code, discipline_id
+        FROM kiok
+    ) u
+    LEFT JOIN disciplines d ON u.discipline_id = d.id
+    {where}
+    ORDER BY u.priority
+"""
+
+class UserDirectoryService:
+    """
+    In-memory справочник пользователей: user_id -> язык, имя, таблица роли, дисциплина.
+    Загружается целиком при старте, дальше обновляется сервисами, которые меняют пользователей.
+    Изменения с других экземпляров бота видны через USER_DIRECTORY_TTL_SECONDS: запись старше
+    перечитывается. Промах тоже идет в БД, но не чаще раза в USER_DIRECTORY_MISS_TTL_SECONDS.
+    """
+
+    _users: Dict[str, Dict[str, Any]] = {}
+    # user_id -> time.monotonic() последнего чтения из БД (и для найденных, и для отсутствующих)
+    _read_at: Dict[str, float] = {}
+    _loaded: bool = False
+
+    @staticmethod
+    def _build_entries(rows) -> Dict[str, Dict[str, Any]]:
+        """Собирает записи справочника из строк запроса (строки отсортированы по priority)."""
+        entries = {}
+        for row in rows:
+            user_id = str(row['user_id'])
+            entry = entries.get(user_id)
+            if entry:
+                # Пользователь есть в нескольких таблицах - берем язык из первой, где он задан
+                if not entry['language_code'] and row['language_code']:
+                    entry['language_code'] = row['language_code']
+                continue
+
+            if row['full_name'] is not None:
+                full_name = row['full_name'] or ''
+                name_parts = full_name.split(' ', 1)
+                first_name = name_parts[0] if name_parts else ''
+                last_name = name_parts[1] if len(name_parts) > 1 else ''
+            else:
+                first_name = row['first_name'] or ''
+                last_name = row['last_name'] or ''
+                full_name = f"{first_name} {last_name}".strip()
+
+            entries[user_id] = {
+                'user_id': user_id,
+                'role_table': row['role_table'],
+                'first_name': first_name,
+                'last_name': last_name,
+                'full_name': full_name,
+                'phone_number': row['phone_number'],
+                'language_code': row['language_code'],
+                'discipline_id': row['discipline_id'],
+                'discipline_name': row['discipline_name'],
+            }
+        return entries
+
+    @staticmethod
+    async def load_all() -> bool:
+        """Загружает всех пользователей одним запросом (при старте и после восстановления БД)."""
+        rows = await db_query(_DIRECTORY_QUERY.format(where=""), as_dict=True)
+        if rows is None:
+            logger.error("Не удалось загрузить справочник пользователей")
+            return False
+
+        users = UserDirectoryService._build_entries(rows)
+        now = time.monotonic()
+        UserDirectoryService._users = users
+        UserDirectoryService._read_at = {user_id: now for user_id in users}
+        UserDirectoryService._loaded = True
+        logger.info(f"✅ Справочник пользователей загружен: {len(UserDirectoryService._users)} чел.")
+        return True
+
+    @staticmethod
+    async def refresh_user(user_id: str) -> Optional[Dict[str, Any]]:
+        """Перечитывает одного пользователя из БД (после создания, удаления или смены роли)."""
+        user_id = str(user_id)
+        rows = await db_query(_DIRECTORY_QUERY.format(where="WHERE u.user_id = %s"), (user_id,), as_dict=True)
+        if rows is None:
+            # Не смогли перечитать - убираем запись, чтобы не отдавать устаревшие данные
+            UserDirectoryService._users.pop(user_id, None)
+            UserDirectoryService._read_at.pop(user_id, None)
+            return None
+
+        entry = UserDirectoryService._build_entries(rows).get(user_id)
+        UserDirectoryService._read_at[user_id] = time.monotonic()
+        if entry:
+            UserDirectoryService._users[user_id] = entry
+        else:
+            UserDirectoryService._users.pop(user_id, None)
+        return entry
+
+    @staticmethod
+    def set_language(user_id: str, language_code: str) -> None:
+        """Write-through смены языка (без запроса к БД)."""
+        entry = UserDirectoryService._users.get(str(user_id))
+        if entry:
+            entry['language_code'] = language_code
+
+    @staticmethod
+    async def get_user(user_id: str) -> Optional[Dict[str, Any]]:
+        """Возвращает запись пользователя из памяти; устаревшую запись или промах перечитывает из БД."""
+        user_id = str(user_id)
+        entry = UserDirectoryService._users.get(user_id)
+        read_at = UserDirectoryService._read_at.get(user_id)
+        ttl = USER_DIRECTORY_TTL_SECONDS if entry else USER_DIRECTORY_MISS_TTL_SECONDS
+        if read_at is not None and time.monotonic() - read_at < ttl:
+            return entry
+        return await UserDirectoryService.refresh_user(user_id)
+
+    @staticmethod
+    def get_user_cached(user_id: str) -> Optional[Dict[str, Any]]:
+        """Возвращает запись пользователя только из памяти (для синхронного кода)."""
+        return UserDirectoryService._users.get(str(user_id))
+
+    @staticmethod
+    def is_loaded() -> bool:
+        return UserDirectoryService._loaded
+
+    @staticmethod
+    async def get_language(user_id: str) -> str:
+        entry = await UserDirectoryService.get_user(user_id)
+        return (entry and entry['language_code']) or DEFAULT_LANGUAGE
+
+    @staticmethod
+    async def get_display_name(user_id: str) -> Optional[str]:
+        entry = await UserDirectoryService.get_user(user_id)
+        return entry['full_name'] if entry else None
+
+    @staticmethod
+    async def get_role_table(user_id: str) -> Optional[str]:
+        entry = await UserDirectoryService.get_user(user_id)
+        return entry['role_table'] if entry else None
+
+    @staticmethod
+    async def get_discipline(user_id: str) -> Tuple[Optional[int], Optional[str]]:
+        entry = await UserDirectoryService.get_user(user_id)
+        if not entry:
+            return None, None
+        return entry['discipline_id'], entry['discipline_name']
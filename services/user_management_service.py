@@ -7,10 +7,20 @@ from telegram.constants import ParseMode
 
 from database.queries import db_query, db_execute
 from utils.localization import get_user_language, get_text
+from services.user_directory_service import UserDirectoryService
 from config.settings import OWNER_ID
+from utils.constants import USER_ROLES
+from utils.pagination import FIRST_PAGE, parse_page_token, keyset_sql, finish_page
 
 logger = logging.getLogger(__name__)
 
+async def _on_user_changed(user_id: str) -> None:
+    """Сбрасывает кэш ролей и обновляет справочник пользователей после изменения пользователя"""
+    # Импортируем здесь для избежания циклических импортов
+    from bot.middleware.security import invalidate_user_role
+    invalidate_user_role(user_id)
+    await UserDirectoryService.refresh_user(user_id)
+
 class UserManagementService:
     """Сервис для управления пользователями"""
 
@@ -175,26 +185,28 @@ class UserManagementService:
         return bool(admin_data)
     
     @staticmethod
-    async def list_users_with_pagination(query, role: str, page: int) -> None:
-        """Отображает список пользователей с пагинацией"""
+    async def list_users_with_pagination(query, role: str, page: str) -> None:
+        """Отображает страницу списка пользователей (keyset-курсор по user_id в callback_data)"""
         try:
-            # Определяем смещение для пагинации
-            offset = (page - 1) * UserManagementService.USERS_PER_PAGE
-            
-            # Получаем общее количество пользователей в роли
-            total_users = db_query(f"SELECT COUNT(*) FROM {role}")[0][0]
-            
-            # Получаем данные пользователей для текущей страницы
-            users = db_query(
-                f"SELECT user_id, first_name, last_name FROM {role} ORDER BY last_name, first_name LIMIT %s OFFSET %s",
-                (UserManagementService.USERS_PER_PAGE, offset)
+            if role not in USER_ROLES:
+                raise ValueError(f"неизвестная роль {role}")
+
+            # Сортировка совпадает с индексом idx_{role}_name_order
+            sort_key = "COALESCE(last_name, ''), COALESCE(first_name, ''), user_id"
+            forward, anchor = parse_page_token(page)
+            condition, order = keyset_sql(
+                sort_key, f"SELECT {sort_key} FROM {role} WHERE user_id = %s", forward, anchor
+            )
+            users = await db_query(
+                f"SELECT user_id, first_name, last_name FROM {role} WHERE {condition} {order} LIMIT %s",
+                ((anchor,) if anchor is not None else ()) + (UserManagementService.USERS_PER_PAGE + 1,)
             )
             
             if not users:
-                # Если пользователи не найдены или страница пуста
-                if page > 1:
+                # Если пользователи не найдены или курсор устарел (пользователя удалили)
+                if anchor is not None:
                     # Возвращаемся на первую страницу
-                    await UserManagementService.list_users_with_pagination(query, role, 1)
+                    await UserManagementService.list_users_with_pagination(query, role, FIRST_PAGE)
                     return
                 else:
                     await query.edit_message_text(
@@ -204,18 +216,18 @@ class UserManagementService:
                         ]])
                     )
                     return
+
+            users, prev_page, next_page = finish_page(
+                users, UserManagementService.USERS_PER_PAGE, forward, anchor, key=lambda user: user[0]
+            )
             
             # Формируем текст со списком пользователей
             user_lines = [f"📋 **Список {UserManagementService.get_role_display_name(role)}ов:**\n"]
             
-            for i, user in enumerate(users, 1):
+            for user in users:
                 user_id, first_name, last_name = user
                 full_name = f"{first_name or ''} {last_name or ''}".strip() or "Без имени"
-                user_lines.append(f"{offset + i}. {full_name}")
-            
-            # Добавляем информацию о пагинации
-            max_page = (total_users + UserManagementService.USERS_PER_PAGE - 1) // UserManagementService.USERS_PER_PAGE
-            user_lines.append(f"\nСтраница {page} из {max_page}")
+                user_lines.append(f"• {full_name}")
             
             # Формируем клавиатуру
             keyboard = []
@@ -231,11 +243,11 @@ class UserManagementService:
             # Кнопки навигации
             nav_buttons = []
             
-            if page > 1:
-                nav_buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"list_users_{role}_{page-1}"))
+            if prev_page:
+                nav_buttons.append(InlineKeyboardButton("⬅️ Назад", callback_data=f"list_users_{role}_{prev_page}"))
             
-            if page < max_page:
-                nav_buttons.append(InlineKeyboardButton("➡️ Вперед", callback_data=f"list_users_{role}_{page+1}"))
+            if next_page:
+                nav_buttons.append(InlineKeyboardButton("➡️ Вперед", callback_data=f"list_users_{role}_{next_page}"))
             
             if nav_buttons:
                 keyboard.append(nav_buttons)
@@ -262,7 +274,8 @@ class UserManagementService:
     async def delete_user(role: str, user_id: str) -> bool:
         """Удаляет пользователя из указанной роли"""
         try:
-            result = db_execute(f"DELETE FROM {role} WHERE user_id = %s", (user_id,))
+            result = await db_execute(f"DELETE FROM {role} WHERE user_id = %s", (user_id,))
+            await _on_user_changed(user_id)
             logger.info(f"Пользователь {user_id} удален из роли {role}.")
             return True
         except Exception as e:
@@ -272,24 +285,17 @@ class UserManagementService:
     @staticmethod
     async def reset_roster(user_id: str) -> bool:
         """Сбрасывает сегодняшний табель для пользователя"""
-        from datetime import date
-        
-        try:
-            today_str = date.today().strftime('%Y-%m-%d')
-            db_execute("DELETE FROM daily_rosters WHERE brigade_user_id = %s AND roster_date = %s", 
-                      (user_id, today_str))
-            logger.info(f"Табель на {today_str} для пользователя {user_id} сброшен.")
-            return True
-        except Exception as e:
-            logger.error(f"Ошибка при сбросе табеля для пользователя {user_id}: {e}")
-            return False
+        # Через RosterService: он же обновляет статус табеля в главном меню
+        from services.roster_service import RosterService
+        return await RosterService.reset_roster(user_id)
     
     @staticmethod
     async def change_discipline(role: str, user_id: str, discipline_id: int) -> bool:
         """Изменяет дисциплину пользователя"""
         try:
-            db_execute(f"UPDATE {role} SET discipline = %s WHERE user_id = %s", 
+            await db_execute(f"UPDATE {role} SET discipline = %s WHERE user_id = %s", 
                       (discipline_id, user_id))
+            await _on_user_changed(user_id)
             logger.info(f"Для пользователя {user_id} в роли {role} изменена дисциплина на {discipline_id}.")
             return True
         except Exception as e:
@@ -302,16 +308,17 @@ class UserManagementService:
         try:
             if level == 1:
                 # Для уровня 1 дисциплина не нужна
-                db_execute("UPDATE managers SET level = %s, discipline = NULL WHERE user_id = %s", 
+                await db_execute("UPDATE managers SET level = %s, discipline = NULL WHERE user_id = %s", 
                           (level, user_id))
             else:
                 # Для уровня 2 и выше должна быть указана дисциплина
                 if discipline_id is None:
                     return False
                 
-                db_execute("UPDATE managers SET level = %s, discipline = %s WHERE user_id = %s", 
+                await db_execute("UPDATE managers SET level = %s, discipline = %s WHERE user_id = %s", 
                           (level, discipline_id, user_id))
             
+            await _on_user_changed(user_id)
             logger.info(f"Для менеджера {user_id} изменен уровень на {level}.")
             return True
         except Exception as e:
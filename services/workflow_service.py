@@ -3,13 +3,18 @@
 import logging
 import json
 import os
+import time
 from datetime import datetime
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from enum import Enum
-import asyncio
-from functools import partial
 
-from database.queries import db_query, db_execute, db_query_single
+from config.settings import REPORTS_PER_PAGE, PENDING_COUNT_CACHE_TTL_SECONDS
+from database.queries import db_query, db_query_single
+from services.domain_event_service import (
+    DomainEventService, REPORT_CREATED, REPORT_SUBMITTED, MASTER_APPROVED, KIOK_APPROVED, REPORT_REJECTED
+)
+from utils.metrics import run_in_executor
+from utils.pagination import FIRST_PAGE, parse_page_token, keyset_sql, finish_page
 
 logger = logging.getLogger(__name__)
 
@@ -27,9 +32,77 @@ def _save_file_sync(file_data: bytes, file_path: str):
     with open(file_path, 'wb') as f:
         f.write(file_data)
 
+def _to_number(value) -> Optional[float]:
+    """people_count/volume для числовых колонок reports (None, если значение не число)"""
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+# Кто может выполнить переход: таблица роли и условие прав исполнителя (a) на отчет (r)
+_TRANSITION_ACTORS = {
+    'supervisor': ("supervisors", "r.supervisor_id = a.user_id"),
+    'master': ("masters", "a.can_approve_reports = true AND r.discipline_id = a.discipline_id"),
+    'kiok': ("kiok", "r.discipline_id = a.discipline_id"),
+}
+
 class WorkflowService:
     """Сервис для управления жизненным циклом отчетов"""
     
+    # (role, user_id) -> (время подсчета, размер очереди) для кнопок главного меню
+    _pending_counts: Dict[Tuple[str, str], Tuple[float, int]] = {}
+    
+    @staticmethod
+    async def _transition(report_ids: List[int], actor_id: str, role: str,
+                          from_status: WorkflowStatus, to_status: WorkflowStatus, event: str,
+                          assignments: str = "", params: tuple = (),
+                          metadata: Optional[Dict[str, Any]] = None,
+                          details: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Переход статуса одним SQL-запросом: права исполнителя и текущий статус проверяются в WHERE,
+        metadata дописывается в report_data через ||, запись в report_transitions и доменное событие event
+        (outbox domain_events) делаются в том же запросе - побочные эффекты выполнит диспетчер событий.
+        assignments/params - дополнительные "колонка = %s" для SET.
+        Возвращает обновленные строки reports; отчеты в другом статусе или чужой дисциплины пропускаются.
+        """
+        if not report_ids:
+            return []
+        table, guard = _TRANSITION_ACTORS[role]
+        set_sql = "workflow_status = %s" + (f", {assignments}" if assignments else "")
+        set_params = (to_status.value,) + params
+        if metadata:
+            set_sql += ", report_data = COALESCE(r.report_data, '{}'::jsonb) || %s::jsonb"
+            set_params += (json.dumps(metadata),)
+
+        rows = await db_query(f"""
+            WITH changed AS (
+                UPDATE reports r
+                SET {set_sql}
+                FROM {table} a
+                WHERE a.user_id = %s AND {guard}
+                  AND r.id = ANY(%s) AND r.workflow_status = %s
+                RETURNING r.*
+            ), audit AS (
+                INSERT INTO report_transitions (report_id, from_status, to_status, actor_id, actor_role, details)
+                SELECT id, %s, %s, %s, %s, %s::jsonb FROM changed
+            ), events AS (
+                INSERT INTO domain_events (event_type, report_id, payload)
+                SELECT %s, id, jsonb_build_object('discipline_id', discipline_id) || %s::jsonb FROM changed
+            )
+            SELECT * FROM changed
+        """, set_params + (
+            actor_id, list(report_ids), from_status.value,
+            from_status.value, to_status.value, actor_id, role, json.dumps(details or {}),
+            event, json.dumps({'actor_id': actor_id, 'role': role, **(details or {})})
+        ), as_dict=True)
+        if rows is None:
+            raise RuntimeError(f"переход {from_status.value} -> {to_status.value} не выполнен")
+        if rows:
+            # Очередь исполнителя изменилась - счетчик на его кнопке меню пересчитается
+            WorkflowService._pending_counts.pop((role, actor_id), None)
+            DomainEventService.wake()
+        return rows
+    
     @staticmethod
     async def create_report(
         supervisor_id: str,
@@ -38,15 +111,23 @@ class WorkflowService:
     ) -> Optional[int]:
         """Создает новый отчет с использованием discipline_id."""
         try:
-            # FIXED: Правильный INSERT запрос
+            # Отчет и событие report_created (уведомления мастерам) - одним запросом
             insert_query = """
-                INSERT INTO reports (
-                    supervisor_id, report_date, brigade_name, corpus_name, 
-                    discipline_id, work_type_name, workflow_status, report_data
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s) 
-                RETURNING id
+                WITH created AS (
+                    INSERT INTO reports (
+                        supervisor_id, report_date, brigade_name, corpus_name, 
+                        discipline_id, work_type_name, workflow_status, report_data,
+                        people_count, volume
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) 
+                    RETURNING id, discipline_id
+                ), events AS (
+                    INSERT INTO domain_events (event_type, report_id, payload)
+                    SELECT %s, id, jsonb_build_object('discipline_id', discipline_id, 'actor_id', %s::text) FROM created
+                )
+                SELECT id FROM created
             """
             
+            # Числа, по которым считается выработка, - в отдельных колонках; report_data - прочие детали
             params = (
                 supervisor_id,
                 report_data.get('report_date'),
@@ -55,13 +136,18 @@ class WorkflowService:
                 discipline_id,
                 report_data.get('work_type_name'),
                 WorkflowStatus.PENDING_MASTER.value,
-                json.dumps(report_data.get('details', {}))
+                json.dumps(report_data.get('details', {})),
+                _to_number(report_data.get('people_count')),
+                _to_number(report_data.get('volume')),
+                REPORT_CREATED,
+                supervisor_id
             )
             
             result = await db_query(insert_query, params)
             report_id = result[0][0] if result else None
             
             if report_id:
+                DomainEventService.wake()
                 logger.info(f"✅ Супервайзер {supervisor_id} создал отчет ID: {report_id}")
                 return report_id
             
@@ -107,241 +193,250 @@ class WorkflowService:
     async def submit_to_master(report_id: int, supervisor_id: str) -> bool:
         """Отправляет отчет мастеру на подтверждение"""
         try:
-            # Проверяем, что отчет принадлежит супервайзеру
-            check_query = "SELECT id FROM reports WHERE id = %s AND supervisor_id = %s AND workflow_status = %s"
-            if not await db_query(check_query, (report_id, supervisor_id, WorkflowStatus.DRAFT.value)):
-                return False
-            
-            # Обновляем статус
-            update_query = """
-                UPDATE reports 
-                SET workflow_status = %s, supervisor_signed_at = NOW() 
-                WHERE id = %s
-            """
-            
-            return await db_execute(update_query, (WorkflowStatus.PENDING_MASTER.value, report_id))
+            # Отчет должен принадлежать супервайзеру и быть черновиком - проверяется в самом UPDATE
+            return bool(await WorkflowService._transition(
+                [report_id], supervisor_id, 'supervisor',
+                WorkflowStatus.DRAFT, WorkflowStatus.PENDING_MASTER, REPORT_SUBMITTED,
+                "supervisor_signed_at = NOW()"
+            ))
             
         except Exception as e:
             logger.error(f"Ошибка отправки отчета мастеру: {e}")
             return False
     
     @staticmethod
-    async def master_approve(report_id: int, master_id: str, signature_path: Optional[str] = None) -> bool:
-        """Мастер подтверждает отчет"""
+    async def master_approve_many(report_ids: List[int], master_id: str,
+                                  signature_path: Optional[str] = None) -> List[int]:
+        """
+        Мастер подтверждает несколько отчетов одним UPDATE.
+        Права и дисциплина мастера проверяются в том же запросе; возвращает id реально подтвержденных
+        (отчеты, которые уже обработал другой мастер, просто не попадают в список).
+        """
+        if not report_ids:
+            return []
         try:
-            # Проверяем права мастера
-            master_check = await db_query(
-                "SELECT discipline_id FROM masters WHERE user_id = %s AND can_approve_reports = true",
-                (master_id,)
+            rows = await WorkflowService._transition(
+                report_ids, master_id, 'master',
+                WorkflowStatus.PENDING_MASTER, WorkflowStatus.PENDING_KIOK, MASTER_APPROVED,
+                "master_id = a.user_id, master_signed_at = NOW(), master_signature_path = %s",
+                (signature_path,)
             )
-            if not master_check:
-                logger.warning(f"Мастер {master_id} не имеет прав на подтверждение")
-                return False
-            
-            # Обновляем отчет
-            update_query = """
-                UPDATE reports 
-                SET workflow_status = %s, master_id = %s, master_signed_at = NOW(), master_signature_path = %s
-                WHERE id = %s AND workflow_status = %s
-            """
-            
-            success = await db_execute(update_query, (
-                WorkflowStatus.PENDING_KIOK.value, master_id, signature_path, 
-                report_id, WorkflowStatus.PENDING_MASTER.value
-            ))
-            
-            if success:
-                logger.info(f"Отчет {report_id} подтвержден мастером {master_id}")
-            
-            return success
-            
+            approved = [row['id'] for row in rows]
+            logger.info(f"Мастер {master_id} подтвердил отчеты {approved} (запрошено {len(report_ids)})")
+            return approved
+
         except Exception as e:
             logger.error(f"Ошибка подтверждения мастером: {e}")
-            return False
+            return []
+
+    @staticmethod
+    async def master_approve(report_id: int, master_id: str, signature_path: Optional[str] = None) -> bool:
+        """Мастер подтверждает отчет"""
+        return bool(await WorkflowService.master_approve_many([report_id], master_id, signature_path))
     
     @staticmethod
-    async def master_reject(report_id: int, master_id: str, reason: str) -> bool:
-        """Мастер отклоняет отчет"""
+    async def master_reject(report_id: int, master_id: str, reason: str) -> Optional[Dict[str, Any]]:
+        """Мастер отклоняет отчет. Возвращает обновленный отчет (None - уже обработан или нет прав)"""
         try:
-            # FIXED: Правильно получаем и обрабатываем JSON данные
-            report_data_raw = await db_query("SELECT report_data FROM reports WHERE id = %s", (report_id,))
-            if report_data_raw:
-                current_data = report_data_raw[0][0] or "{}"
-                
-                # Парсим JSON если это строка
-                if isinstance(current_data, str):
-                    try:
-                        data = json.loads(current_data)
-                    except json.JSONDecodeError:
-                        data = {}
-                else:
-                    data = current_data or {}
-                
-                # Добавляем информацию об отклонении
-                data['master_rejection_reason'] = reason
-                data['master_rejected_at'] = datetime.now().isoformat()
-                
-                update_query = """
-                    UPDATE reports 
-                    SET workflow_status = %s, master_id = %s, master_signed_at = NOW(), report_data = %s
-                    WHERE id = %s AND workflow_status = %s
-                """
-                
-                return await db_execute(update_query, (
-                    WorkflowStatus.REJECTED.value, master_id, json.dumps(data),
-                    report_id, WorkflowStatus.PENDING_MASTER.value
-                ))
+            rows = await WorkflowService._transition(
+                [report_id], master_id, 'master',
+                WorkflowStatus.PENDING_MASTER, WorkflowStatus.REJECTED, REPORT_REJECTED,
+                "master_id = a.user_id, master_signed_at = NOW()",
+                metadata={
+                    'master_rejection_reason': reason,
+                    'master_rejected_at': datetime.now().isoformat()
+                },
+                details={'reason': reason}
+            )
+            if rows:
+                logger.info(f"Отчет {report_id} отклонен мастером {master_id}")
+                return rows[0]
             
         except Exception as e:
             logger.error(f"Ошибка отклонения мастером: {e}")
         
-        return False
+        return None
 
     @staticmethod
-    async def kiok_approve(report_id: int, kiok_id: str, inspection_number: str, 
-                notes: str = "", attachments: List[str] = None) -> bool:
-        """КИОК согласовывает отчет с номером инспекции (фото опционально)"""
+    async def kiok_approve_many(report_ids: List[int], kiok_id: str, inspection_number: str,
+                                notes: str = "", attachments: List[str] = None) -> List[int]:
+        """
+        КИОК согласовывает несколько отчетов одним UPDATE с общим номером инспекции.
+        Возвращает id согласованных отчетов; сводка выработки пересчитывается подписчиком события один раз на пачку.
+        """
+        if not report_ids:
+            return []
         try:
-            update_query = """
-                UPDATE reports 
-                SET workflow_status = %s, 
-                    kiok_id = %s, 
-                    kiok_signed_at = NOW(), 
-                    kiok_inspection_number = %s, 
-                    kiok_notes = %s,
-                    kiok_attachments = %s
-                WHERE id = %s AND workflow_status = %s
-            """
-        
-            success = await db_execute(update_query, (
-                WorkflowStatus.APPROVED.value, 
-                kiok_id, 
-                inspection_number,
-                notes,
-                json.dumps(attachments or []),
-                report_id, 
-                WorkflowStatus.PENDING_KIOK.value
-            ))
-        
-            if success:
-                logger.info(f"✅ КИОК {kiok_id} согласовал отчет {report_id} с номером инспекции {inspection_number}")
-        
-            return success
-        
+            rows = await WorkflowService._transition(
+                report_ids, kiok_id, 'kiok',
+                WorkflowStatus.PENDING_KIOK, WorkflowStatus.APPROVED, KIOK_APPROVED,
+                "kiok_id = a.user_id, kiok_signed_at = NOW(), kiok_inspection_number = %s, "
+                "kiok_notes = %s, kiok_attachments = %s",
+                (inspection_number, notes, json.dumps(attachments or [])),
+                details={'inspection_number': inspection_number}
+            )
+            approved = [row['id'] for row in rows]
+
+            if approved:
+                # Сводку выработки пересчитает подписчик события kiok_approved
+                logger.info(f"✅ КИОК {kiok_id} согласовал отчеты {approved} с номером инспекции {inspection_number}")
+
+            return approved
+
         except Exception as e:
             logger.error(f"❌ Ошибка согласования КИОК: {e}")
-            return False
+            return []
+
+    @staticmethod
+    async def kiok_approve(report_id: int, kiok_id: str, inspection_number: str, 
+                notes: str = "", attachments: List[str] = None) -> bool:
+        """КИОК согласовывает отчет с номером инспекции (фото опционально)"""
+        return bool(await WorkflowService.kiok_approve_many(
+            [report_id], kiok_id, inspection_number, notes, attachments
+        ))
     
     @staticmethod
     async def kiok_reject(report_id: int, kiok_id: str, reason: str, 
-                remark_file_path: str = None, attachments: List[str] = None) -> bool:
-        """КИОК отклоняет отчет с замечаниями (может быть файл с фото внутри)"""
+                remark_file_path: str = None, attachments: List[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        КИОК отклоняет отчет с замечаниями (может быть файл с фото внутри).
+        Возвращает обновленный отчет (None - уже обработан или нет прав)
+        """
         try:
-            update_query = """
-                UPDATE reports 
-                SET workflow_status = %s, 
-                    kiok_id = %s, 
-                    kiok_signed_at = NOW(),
-                    kiok_notes = %s,
-                    kiok_remark_document = %s, 
-                    kiok_attachments = %s
-                WHERE id = %s AND workflow_status = %s
-            """
-        
-            # FIXED: Правильно обрабатываем JSON данные
-            report_data_raw = await db_query("SELECT report_data FROM reports WHERE id = %s", (report_id,))
-            if report_data_raw:
-                current_data = report_data_raw[0][0] or "{}"
-                
-                # Парсим JSON если это строка
-                if isinstance(current_data, str):
-                    try:
-                        data = json.loads(current_data)
-                    except json.JSONDecodeError:
-                        data = {}
-                else:
-                    data = current_data or {}
-                
-                # Добавляем детальную причину в report_data
-                data['kiok_rejection'] = {
+            rows = await WorkflowService._transition(
+                [report_id], kiok_id, 'kiok',
+                WorkflowStatus.PENDING_KIOK, WorkflowStatus.REJECTED, REPORT_REJECTED,
+                "kiok_id = a.user_id, kiok_signed_at = NOW(), kiok_notes = %s, "
+                "kiok_remark_document = %s, kiok_attachments = %s",
+                (reason, remark_file_path, json.dumps(attachments or [])),
+                # Детальная причина - в report_data, тем же запросом
+                metadata={'kiok_rejection': {
                     'reason': reason,
                     'rejected_at': datetime.now().isoformat(),
                     'kiok_id': kiok_id,
                     'has_remark_file': bool(remark_file_path),
                     'attachments_count': len(attachments or [])
-                }
-            
-                await db_execute("UPDATE reports SET report_data = %s WHERE id = %s", 
-                                (json.dumps(data), report_id))
-        
-            success = await db_execute(update_query, (
-                WorkflowStatus.REJECTED.value, 
-                kiok_id, 
-                reason,
-                remark_file_path,
-                json.dumps(attachments or []),
-                report_id, 
-                WorkflowStatus.PENDING_KIOK.value
-            ))
-        
-            if success:
+                }},
+                details={'reason': reason}
+            )
+            if rows:
                 logger.info(f"✅ КИОК {kiok_id} отклонил отчет {report_id} с замечаниями")
-        
-            return success
+                return rows[0]
         
         except Exception as e:
             logger.error(f"❌ Ошибка отклонения КИОК: {e}")
-            return False
+        
+        return None
     
     @staticmethod
-    async def get_pending_reports_for_master(master_id: str) -> List[Dict[str, Any]]:
-        """Получает отчеты, ожидающие подтверждения мастера, по discipline_id."""
+    async def _get_user_discipline_id(table: str, user_id: str) -> Optional[int]:
+        """discipline_id мастера/КИОК (table - masters или kiok)"""
+        return await db_query_single(f"SELECT discipline_id FROM {table} WHERE user_id = %s", (user_id,))
+
+    @staticmethod
+    async def _get_reports_page(where: str, params: tuple, sort_key: str, page: str,
+                                limit: int, descending: bool = False) -> Dict[str, Any]:
+        """Страница отчетов по keyset-курсору: {'reports', 'prev', 'next'}"""
+        forward, anchor = parse_page_token(page)
+        condition, order = keyset_sql(
+            sort_key, f"SELECT {sort_key} FROM reports WHERE id = %s", forward, anchor, descending
+        )
+        query = f"""
+            SELECT id, supervisor_id, report_date, brigade_name, corpus_name, work_type_name, workflow_status
+            FROM reports
+            WHERE {where} AND {condition}
+            {order}
+            LIMIT %s
+        """
+        anchor_params = (int(anchor),) if anchor is not None else ()
+        rows = await db_query(query, params + anchor_params + (limit + 1,), as_dict=True) or []
+        if not rows and anchor is not None:
+            # Якорь удалили или страница опустела - показываем начало списка
+            return await WorkflowService._get_reports_page(where, params, sort_key, FIRST_PAGE, limit, descending)
+
+        reports, prev_page, next_page = finish_page(rows, limit, forward, anchor)
+        return {'reports': reports, 'prev': prev_page, 'next': next_page}
+
+    @staticmethod
+    async def _get_pending_page(table: str, user_id: str, status: WorkflowStatus, order_column: str,
+                                page: str, limit: int) -> Dict[str, Any]:
+        empty = {'reports': [], 'prev': None, 'next': None}
+        discipline_id = await WorkflowService._get_user_discipline_id(table, user_id)
+        if not discipline_id:
+            return empty
+        # Сортировка совпадает с частичными индексами idx_reports_master_queue / idx_reports_kiok_queue
+        return await WorkflowService._get_reports_page(
+            "workflow_status = %s AND discipline_id = %s", (status.value, discipline_id),
+            f"{order_column}, id", page, limit
+        )
+
+    @staticmethod
+    async def get_pending_reports_for_master(master_id: str, page: str = FIRST_PAGE,
+                                             limit: int = REPORTS_PER_PAGE) -> Dict[str, Any]:
+        """Страница отчетов, ожидающих подтверждения мастера, по discipline_id: {'reports', 'prev', 'next'}"""
         try:
-            # CHANGED: Запрос теперь напрямую использует discipline_id мастера
-            master_info = await db_query("SELECT discipline_id FROM masters WHERE user_id = %s", (master_id,))
-            if not master_info or not master_info[0][0]:
-                return []
-            
-            discipline_id = master_info[0][0]
-            
-            query = """
-                SELECT id, supervisor_id, report_date, brigade_name, corpus_name, work_type_name
-                FROM reports 
-                WHERE workflow_status = %s AND discipline_id = %s
-                ORDER BY created_at ASC
-            """
-            
-            results = await db_query(query, (WorkflowStatus.PENDING_MASTER.value, discipline_id), as_dict=True)
-            return results if results else []
-            
+            return await WorkflowService._get_pending_page(
+                "masters", master_id, WorkflowStatus.PENDING_MASTER, "created_at", page, limit
+            )
         except Exception as e:
             logger.error(f"Ошибка получения отчетов для мастера: {e}")
-            return []
-    
+            return {'reports': [], 'prev': None, 'next': None}
+
     @staticmethod
-    async def get_pending_reports_for_kiok(kiok_id: str) -> List[Dict[str, Any]]:
-        """Получает отчеты, ожидающие согласования КИОК, по discipline_id."""
+    async def get_pending_reports_for_kiok(kiok_id: str, page: str = FIRST_PAGE,
+                                           limit: int = REPORTS_PER_PAGE) -> Dict[str, Any]:
+        """Страница отчетов, ожидающих согласования КИОК, по discipline_id: {'reports', 'prev', 'next'}"""
         try:
-            # CHANGED: Запрос теперь напрямую использует discipline_id КИОК
-            kiok_info = await db_query("SELECT discipline_id FROM kiok WHERE user_id = %s", (kiok_id,))
-            if not kiok_info or not kiok_info[0][0]:
-                return []
-            
-            discipline_id = kiok_info[0][0]
-            
-            query = """
-                SELECT id, supervisor_id, report_date, brigade_name, corpus_name, work_type_name
-                FROM reports 
-                WHERE workflow_status = %s AND discipline_id = %s
-                ORDER BY master_signed_at ASC
-            """
-            
-            results = await db_query(query, (WorkflowStatus.PENDING_KIOK.value, discipline_id), as_dict=True)
-            return results if results else []
-            
+            return await WorkflowService._get_pending_page(
+                "kiok", kiok_id, WorkflowStatus.PENDING_KIOK, "master_signed_at", page, limit
+            )
         except Exception as e:
             logger.error(f"Ошибка получения отчетов для КИОК: {e}")
-            return []
+            return {'reports': [], 'prev': None, 'next': None}
+
+    @staticmethod
+    async def count_pending_reports(role: str, user_id: str) -> int:
+        """Размер очереди мастера (role='master') или КИОК (role='kiok') - счетчик на кнопке меню"""
+        table, status = ("masters", WorkflowStatus.PENDING_MASTER) if role == 'master' \
+            else ("kiok", WorkflowStatus.PENDING_KIOK)
+        try:
+            discipline_id = await WorkflowService._get_user_discipline_id(table, user_id)
+            if not discipline_id:
+                return 0
+            count = await db_query_single(
+                "SELECT COUNT(*) FROM reports WHERE workflow_status = %s AND discipline_id = %s",
+                (status.value, discipline_id)
+            )
+            return count or 0
+        except Exception as e:
+            logger.error(f"Ошибка подсчета очереди {role} для {user_id}: {e}")
+            return 0
+
+    @staticmethod
+    async def get_cached_pending_count(role: str, user_id: str) -> int:
+        """
+        Размер очереди для кнопки главного меню: из памяти, пересчет не чаще раза в PENDING_COUNT_CACHE_TTL_SECONDS.
+        Экран самой очереди считает заново (count_pending_reports).
+        """
+        key = (role, user_id)
+        cached = WorkflowService._pending_counts.get(key)
+        if cached and time.monotonic() - cached[0] < PENDING_COUNT_CACHE_TTL_SECONDS:
+            return cached[1]
+        count = await WorkflowService.count_pending_reports(role, user_id)
+        WorkflowService._pending_counts[key] = (time.monotonic(), count)
+        return count
+
+    @staticmethod
+    async def get_supervisor_reports(supervisor_id: str, page: str = FIRST_PAGE,
+                                     limit: int = REPORTS_PER_PAGE) -> Dict[str, Any]:
+        """История отчетов супервайзера, новые сверху: {'reports', 'prev', 'next'}"""
+        try:
+            return await WorkflowService._get_reports_page(
+                "supervisor_id = %s", (supervisor_id,), "created_at, id", page, limit, descending=True
+            )
+        except Exception as e:
+            logger.error(f"Ошибка получения истории отчетов супервайзера {supervisor_id}: {e}")
+            return {'reports': [], 'prev': None, 'next': None}
 
     @staticmethod
     async def can_user_approve_report(user_id: str, report_id: int, role: str) -> bool:
@@ -394,9 +489,7 @@ class WorkflowService:
             file_path = os.path.join(attachments_dir, safe_filename)
             
             # FIXED: Выполняем блокирующую операцию в отдельном потоке
-            loop = asyncio.get_running_loop()
-            func = partial(_save_file_sync, file_data, file_path)
-            await loop.run_in_executor(None, func)
+            await run_in_executor(_save_file_sync, file_data, file_path, pool='files')
             
             logger.info(f"✅ Сохранено вложение {attachment_type}: {file_path}")
             return file_path
@@ -0,0 +1,75 @@
+# tests/conftest.py
+
+"""
+Общие фикстуры тестов.
+
+Тесты с БД идут только на отдельной базе из TEST_DATABASE_URL (не из .env): схема public
+пересоздается с нуля, данные меняются. Без переменной такие тесты пропускаются.
+
+    TEST_DATABASE_URL=postgresql://postgres@127.0.0.1:5432/bot_test python -m pytest -q
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+# Переменные для config.settings - до первого импорта модулей бота
+os.environ.update({
+    'DATABASE_URL': TEST_DATABASE_URL or 'postgresql://test@127.0.0.1:1/test',
+    'TOKEN': '100000001:TEST-TOKEN',
+    'WEB_APP_URL': 'https://test.invalid',
+    'BOT_MODE': 'polling',
+    'METRICS_PORT': '0',
+})
+
+# Таблицы с тестовыми данными; справочники миграции 4 (дисциплины, роли персонала) не трогаем
+_DATA_TABLES = (
+    'domain_events', 'report_transitions', 'reports', 'daily_production_rollup',
+    'supervisors', 'masters', 'kiok', 'bot_persistence', 'daily_rosters', 'scheduled_notifications',
+)
+
+@pytest.fixture(scope='session')
+def loop():
+    """Один event loop на все тесты: к нему привязан пул asyncpg"""
+    loop = asyncio.new_event_loop()
+    yield loop
+    from database.connection import db_manager
+    loop.run_until_complete(db_manager.close())
+    loop.close()
+
+@pytest.fixture(scope='session')
+def run(loop):
+    """run(coroutine) - выполнить корутину в общем event loop"""
+    return loop.run_until_complete
+
+@pytest.fixture(scope='session')
+def migrated_db(run):
+    """Пустая схема с примененными миграциями (один раз на прогон)"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL не задан")
+    from database.queries import db_execute
+    from database.migrations import run_all_migrations
+
+    run(db_execute("DROP SCHEMA public CASCADE"))
+    run(db_execute("CREATE SCHEMA public"))
+    assert run(run_all_migrations())
+    return TEST_DATABASE_URL
+
+@pytest.fixture
+def db(run, migrated_db):
+    """БД без данных предыдущего теста"""
+    from database.queries import db_execute
+    run(db_execute(f"TRUNCATE {', '.join(_DATA_TABLES)} RESTART IDENTITY CASCADE"))
+    return migrated_db
+
+@pytest.fixture
+def discipline_id(run, db):
+    """id одной из дисциплин, засеянных миграцией"""
+    from database.queries import db_query_single
+    return run(db_query_single("SELECT MIN(id) FROM disciplines"))
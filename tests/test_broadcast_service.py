@@ -0,0 +1,43 @@
+# tests/test_broadcast_service.py
+
+import pytest
+from telegram.error import Forbidden, NetworkError, TimedOut
+
+import services.broadcast_service as broadcast_module
+from services.broadcast_service import BroadcastService
+
+class FlakyBot:
+    """send_message падает ошибками из списка по очереди, потом отправляет"""
+
+    def __init__(self, *errors):
+        self.errors, self.calls = list(errors), 0
+
+    async def send_message(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+
+@pytest.fixture(autouse=True)
+def no_delays(monkeypatch):
+    monkeypatch.setattr(broadcast_module, '_BACKOFF_BASE_SECONDS', 0)
+    monkeypatch.setattr(broadcast_module, 'BROADCAST_PER_CHAT_INTERVAL_SECONDS', 0)
+
+def send(run, bot):
+    return run(BroadcastService.send_bulk(bot, [{'key': 1, 'chat_id': '42', 'text': 'test'}]))
+
+def test_network_error_is_retried(run):
+    bot = FlakyBot(NetworkError("connection reset"))
+    summary = send(run, bot)
+    assert bot.calls == 2
+    assert (summary['sent'], summary['retries'], summary['delivered']) == (1, 1, [1])
+
+def test_timeout_is_not_retried(run):
+    bot = FlakyBot(TimedOut())
+    summary = send(run, bot)
+    assert bot.calls == 1
+    assert (summary['sent'], summary['timed_out'], summary['uncertain'], summary['failures']) == (0, 1, [1], [])
+
+def test_blocked_chat_is_permanent_failure(run):
+    summary = send(run, FlakyBot(Forbidden("bot was blocked by the user")))
+    assert summary['blocked'] == 1
+    assert summary['failures'][0]['permanent'] is True
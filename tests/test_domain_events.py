@@ -0,0 +1,184 @@
+# tests/test_domain_events.py
+
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import Forbidden, TimedOut
+
+from database.queries import db_execute, db_query
+from services import event_subscribers
+from services.domain_event_service import DomainEventService, MASTER_APPROVED
+from services.workflow_service import WorkflowService
+
+EVENT_TYPE = 'test_event'
+
+@pytest.fixture
+def subscribers():
+    """Подписчики регистрируются в тесте и снимаются после него"""
+    saved = dict(DomainEventService._subscribers)
+    DomainEventService._subscribers.clear()
+    yield DomainEventService
+    DomainEventService._subscribers.clear()
+    DomainEventService._subscribers.update(saved)
+
+def add_events(run, count, event_type=EVENT_TYPE):
+    for report_id in range(1, count + 1):
+        run(db_execute("INSERT INTO domain_events (event_type, report_id) VALUES (%s, %s)", (event_type, report_id)))
+
+def state(run):
+    return run(db_query(
+        "SELECT id, status, attempts, done_subscribers FROM domain_events ORDER BY id", as_dict=True
+    ))
+
+def make_due(run):
+    """Снимает backoff, чтобы повтор был доступен сразу"""
+    run(db_execute("UPDATE domain_events SET available_at = NOW()"))
+
+class Recorder:
+    """Подписчик, который запоминает вызовы и возвращает заданный результат"""
+
+    def __init__(self, result=None, error=None):
+        self.calls, self.result, self.error = [], result, error
+
+    async def __call__(self, context, events):
+        self.calls.append([event['id'] for event in events])
+        if self.error:
+            raise self.error
+        return self.result
+
+def test_successful_subscribers_mark_events_done(run, db, subscribers):
+    add_events(run, 2)
+    first, second = Recorder(), Recorder()
+    subscribers.subscribe(EVENT_TYPE, 'first', first)
+    subscribers.subscribe(EVENT_TYPE, 'second', second)
+
+    assert run(DomainEventService.dispatch_pending(None)) == 2
+    assert first.calls == second.calls == [[1, 2]]
+    assert {row['status'] for row in state(run)} == {'done'}
+    assert run(DomainEventService.dispatch_pending(None)) == 0
+
+def test_raising_subscriber_retries_batch_without_repeating_others(run, db, subscribers):
+    add_events(run, 2)
+    ok, failing = Recorder(), Recorder(error=RuntimeError("нет связи"))
+    subscribers.subscribe(EVENT_TYPE, 'ok', ok)
+    subscribers.subscribe(EVENT_TYPE, 'failing', failing)
+
+    run(DomainEventService.dispatch_pending(None))
+    assert [(row['status'], row['attempts'], row['done_subscribers']) for row in state(run)] == \
+        [('pending', 1, ['ok'])] * 2
+    # До окончания backoff событие не забирается
+    assert run(DomainEventService.dispatch_pending(None)) == 0
+
+    failing.error = None
+    make_due(run)
+    run(DomainEventService.dispatch_pending(None))
+    assert ok.calls == [[1, 2]]
+    assert failing.calls == [[1, 2], [1, 2]]
+    assert [(row['status'], row['attempts']) for row in state(run)] == [('done', 2)] * 2
+
+def test_returned_ids_retry_only_those_events(run, db, subscribers):
+    add_events(run, 3)
+    partial = Recorder(result=[2])
+    subscribers.subscribe(EVENT_TYPE, 'partial', partial)
+
+    run(DomainEventService.dispatch_pending(None))
+    assert [(row['status'], row['done_subscribers']) for row in state(run)] == \
+        [('done', ['partial']), ('pending', []), ('done', ['partial'])]
+
+    partial.result = None
+    make_due(run)
+    run(DomainEventService.dispatch_pending(None))
+    assert partial.calls == [[1, 2, 3], [2]]
+    assert {row['status'] for row in state(run)} == {'done'}
+
+def test_finished_subscribers_survive_replica_crash(run, db, subscribers):
+    add_events(run, 2)
+    ok, crashing = Recorder(), Recorder(error=SystemExit())
+    subscribers.subscribe(EVENT_TYPE, 'ok', ok)
+    subscribers.subscribe(EVENT_TYPE, 'crashing', crashing)
+
+    # Реплика упала на втором подписчике - события остались в processing
+    with pytest.raises(SystemExit):
+        run(DomainEventService.dispatch_pending(None))
+    assert [(row['status'], row['done_subscribers']) for row in state(run)] == [('processing', ['ok'])] * 2
+
+    # Lease истек, другая реплика доставляет события заново
+    crashing.error = None
+    run(db_execute("UPDATE domain_events SET locked_at = NOW() - INTERVAL '1 day'"))
+    run(DomainEventService.dispatch_pending(None))
+    assert ok.calls == [[1, 2]]
+    assert crashing.calls == [[1, 2], [1, 2]]
+    assert {row['status'] for row in state(run)} == {'done'}
+
+def test_event_becomes_dead_after_max_attempts(run, db, subscribers, monkeypatch):
+    import services.domain_event_service as domain_event_service
+    monkeypatch.setattr(domain_event_service, 'DOMAIN_EVENTS_MAX_ATTEMPTS', 2)
+    add_events(run, 1)
+    subscribers.subscribe(EVENT_TYPE, 'failing', Recorder(error=RuntimeError("ошибка")))
+
+    run(DomainEventService.dispatch_pending(None))
+    make_due(run)
+    run(DomainEventService.dispatch_pending(None))
+    assert [(row['status'], row['attempts']) for row in state(run)] == [('dead', 2)]
+
+class FakeBot:
+    """Бот, у которого send_message падает с заданной ошибкой (для всех чатов или только для failing_chats)"""
+
+    def __init__(self, error=None, failing_chats=None):
+        self.error, self.failing_chats, self.sent = error, failing_chats, []
+
+    async def send_message(self, **kwargs):
+        if self.error and (self.failing_chats is None or kwargs['chat_id'] in self.failing_chats):
+            raise self.error
+        self.sent.append(kwargs)
+
+@pytest.fixture
+def master_approved_report(run, db, discipline_id):
+    """Отчет, подтвержденный мастером, и КИОК его дисциплины"""
+    run(db_execute("INSERT INTO supervisors (user_id, supervisor_name, discipline_id) VALUES ('1001', 'Супервайзер', %s)",
+                   (discipline_id,)))
+    run(db_execute("INSERT INTO masters (user_id, master_name, discipline_id) VALUES ('2001', 'Мастер', %s)",
+                   (discipline_id,)))
+    run(db_execute("INSERT INTO kiok (user_id, kiok_name, discipline_id) VALUES ('3001', 'КИОК', %s)",
+                   (discipline_id,)))
+    report_id = run(WorkflowService.create_report('1001', discipline_id, {
+        'report_date': '2026-10-01', 'brigade_name': 'Бригада 1', 'corpus_name': 'Корпус 1', 'work_type_name': 'Сварка'
+    }))
+    assert run(WorkflowService.master_approve_many([report_id], '2001')) == [report_id]
+    run(db_execute("UPDATE domain_events SET status = 'done' WHERE event_type <> %s", (MASTER_APPROVED,)))
+    return report_id
+
+@pytest.mark.parametrize('error, status', [
+    (None, 'done'),
+    (TimedOut(), 'pending'),
+    (Forbidden("bot was blocked by the user"), 'done'),
+])
+def test_notify_kiok_failure_is_retried(run, subscribers, master_approved_report, error, status):
+    subscribers.subscribe(MASTER_APPROVED, 'notify_kiok', event_subscribers.notify_kiok)
+    bot = FakeBot(error)
+
+    run(DomainEventService.dispatch_pending(SimpleNamespace(bot=bot)))
+    rows = run(db_query("SELECT status FROM domain_events WHERE event_type = %s", (MASTER_APPROVED,)))
+    assert rows == [(status,)]
+    if error is None:
+        assert bot.sent[0]['chat_id'] == '3001'
+
+def test_notify_kiok_is_done_when_any_kiok_received(run, subscribers, master_approved_report, discipline_id):
+    run(db_execute("INSERT INTO kiok (user_id, kiok_name, discipline_id) VALUES ('3002', 'КИОК 2', %s)",
+                   (discipline_id,)))
+    run(db_execute("INSERT INTO masters (user_id, master_name, discipline_id) VALUES ('2002', 'Мастер 2', %s)",
+                   (discipline_id,)))
+    report_id = run(WorkflowService.create_report('1001', discipline_id, {
+        'report_date': '2026-10-01', 'brigade_name': 'Бригада 2', 'corpus_name': 'Корпус 1', 'work_type_name': 'Сварка'
+    }))
+    assert run(WorkflowService.master_approve_many([report_id], '2002')) == [report_id]
+    run(db_execute("UPDATE domain_events SET status = 'done' WHERE event_type <> %s", (MASTER_APPROVED,)))
+    subscribers.subscribe(MASTER_APPROVED, 'notify_kiok', event_subscribers.notify_kiok)
+    # Второму КИОК не дошло из-за временной ошибки - первому повторно не отправляем
+    bot = FakeBot(TimedOut(), failing_chats={'3002'})
+
+    run(DomainEventService.dispatch_pending(SimpleNamespace(bot=bot)))
+    rows = run(db_query("SELECT status FROM domain_events WHERE event_type = %s ORDER BY id", (MASTER_APPROVED,)))
+    assert rows == [('done',), ('done',)]
+    assert [message['chat_id'] for message in bot.sent] == ['3001']
+    assert 'Мастер, Мастер 2' in bot.sent[0]['text']
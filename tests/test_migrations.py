@@ -0,0 +1,46 @@
+# tests/test_migrations.py
+
+import json
+
+from database.migrations import LATEST_SCHEMA_VERSION, MIGRATIONS, get_schema_version, run_all_migrations
+from database.queries import db_execute, db_query, db_query_single
+
+def schema_versions(run):
+    return [row[0] for row in run(db_query("SELECT version FROM schema_version ORDER BY version"))]
+
+def test_all_steps_are_applied(run, db):
+    assert [version for version, _description, _step in MIGRATIONS] == list(range(1, LATEST_SCHEMA_VERSION + 1))
+    assert run(get_schema_version()) == LATEST_SCHEMA_VERSION
+    assert schema_versions(run) == list(range(1, LATEST_SCHEMA_VERSION + 1))
+
+def test_rerun_is_noop(run, db):
+    disciplines = run(db_query_single("SELECT COUNT(*) FROM disciplines"))
+    assert run(run_all_migrations())
+    assert schema_versions(run) == list(range(1, LATEST_SCHEMA_VERSION + 1))
+    assert run(db_query_single("SELECT COUNT(*) FROM disciplines")) == disciplines
+
+def test_steps_are_idempotent(run, db):
+    # Шаги можно повторить поверх уже созданной схемы (например, после частично восстановленного бэкапа)
+    disciplines = run(db_query_single("SELECT COUNT(*) FROM disciplines"))
+    run(db_execute("DELETE FROM schema_version"))
+    assert run(run_all_migrations())
+    assert run(get_schema_version()) == LATEST_SCHEMA_VERSION
+    assert run(db_query_single("SELECT COUNT(*) FROM disciplines")) == disciplines
+
+def test_upgrade_from_report_data_fills_columns_and_rollup(run, db, discipline_id):
+    # БД до шага 7: сводки нет, числа отчетов только в report_data
+    run(db_execute("INSERT INTO supervisors (user_id, supervisor_name, discipline_id) VALUES ('1001', 'С', %s)",
+                   (discipline_id,)))
+    run(db_execute("""
+        INSERT INTO reports (supervisor_id, discipline_id, report_date, brigade_name, corpus_name, work_type_name,
+                             workflow_status, report_data)
+        VALUES ('1001', %s, '2026-10-01', 'Бригада 1', 'Корпус 1', 'Сварка', 'approved', %s)
+    """, (discipline_id, json.dumps({'people_count': '4', 'volume': '2,5'}))))
+    run(db_execute("DROP TABLE daily_production_rollup"))
+    run(db_execute("DELETE FROM schema_version WHERE version >= 7"))
+
+    assert run(run_all_migrations())
+    assert run(db_query("SELECT people_count, volume FROM reports")) == [(4, 2.5)]
+    assert run(db_query(
+        "SELECT brigade_name, report_count, people_count, volume FROM daily_production_rollup"
+    )) == [('Бригада 1', 1, 4, 2.5)]
@@ -0,0 +1,20 @@
+# tests/test_notification_queue.py
+
+from datetime import date
+
+import services.notification_queue_service as queue_module
+from database.queries import db_execute
+from services.notification_queue_service import NotificationQueueService
+
+def test_roster_reminder_is_cancelled_by_roster_of_bot_day(run, db, monkeypatch):
+    # "Сегодня" по часовому поясу бота может не совпадать с датой сервера
+    bot_day = date(2026, 10, 18)
+    monkeypatch.setattr(queue_module, 'local_today', lambda: bot_day)
+    run(db_execute("INSERT INTO daily_rosters (brigade_user_id, roster_date) VALUES ('4001', %s)", (bot_day,)))
+    jobs = [
+        {'id': 1, 'notification_type': 'roster_reminder', 'user_id': '4001'},
+        {'id': 2, 'notification_type': 'roster_reminder', 'user_id': '4002'},
+        {'id': 3, 'notification_type': 'pending_report_reminder', 'user_id': '4001'},
+    ]
+
+    assert [job['id'] for job in run(NotificationQueueService._filter_obsolete(jobs))] == [2, 3]
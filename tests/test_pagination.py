@@ -0,0 +1,129 @@
+# tests/test_pagination.py
+
+import json
+
+import pytest
+
+import services.workflow_service as workflow_module
+from database.queries import db_execute, db_query_single
+from services.workflow_service import WorkflowService
+from utils.pagination import FIRST_PAGE, finish_page, keyset_sql, parse_page_token
+
+def rows(*ids):
+    return [{'id': row_id} for row_id in ids]
+
+def test_parse_page_token():
+    assert parse_page_token(FIRST_PAGE) == (True, None)
+    assert parse_page_token('a15') == (True, '15')
+    assert parse_page_token('b15') == (False, '15')
+    assert parse_page_token('a') == (True, None)
+
+def test_keyset_sql_directions():
+    assert keyset_sql("created_at, id", "ANCHOR", True, None) == ("TRUE", "ORDER BY created_at ASC, id ASC")
+    assert keyset_sql("created_at, id", "ANCHOR", True, '5') == \
+        ("(created_at, id) > (ANCHOR)", "ORDER BY created_at ASC, id ASC")
+    assert keyset_sql("created_at, id", "ANCHOR", False, '5') == \
+        ("(created_at, id) < (ANCHOR)", "ORDER BY created_at DESC, id DESC")
+    assert keyset_sql("created_at, id", "ANCHOR", True, '5', descending=True) == \
+        ("(created_at, id) < (ANCHOR)", "ORDER BY created_at DESC, id DESC")
+
+def test_keyset_sql_keeps_expressions_with_commas():
+    _condition, order = keyset_sql("COALESCE(last_name, ''), COALESCE(first_name, ''), user_id", "A", True, None)
+    assert order == "ORDER BY COALESCE(last_name, '') ASC, COALESCE(first_name, '') ASC, user_id ASC"
+
+def test_finish_page_forward():
+    # Первая страница: назад нельзя, дальше есть
+    assert finish_page(rows(1, 2, 3, 4), 3, True, None) == (rows(1, 2, 3), None, 'a3')
+    # Средняя страница
+    assert finish_page(rows(4, 5, 6, 7), 3, True, '3') == (rows(4, 5, 6), 'b4', 'a6')
+    # Последняя страница
+    assert finish_page(rows(7), 3, True, '6') == (rows(7), 'b7', None)
+
+def test_finish_page_backward():
+    # Запрос назад возвращает строки в обратном порядке; страница показывается в прямом
+    assert finish_page(rows(6, 5, 4, 3), 3, False, '7') == (rows(4, 5, 6), 'b4', 'a6')
+    # Дошли до начала
+    assert finish_page(rows(3, 2, 1), 3, False, '4') == (rows(1, 2, 3), None, 'a3')
+
+def test_finish_page_empty():
+    assert finish_page([], 3, True, '5') == ([], None, None)
+
+def test_master_queue_pages_both_directions(run, db, discipline_id):
+    run(db_execute("INSERT INTO supervisors (user_id, supervisor_name, discipline_id) VALUES ('1001', 'С', %s)",
+                   (discipline_id,)))
+    run(db_execute("INSERT INTO masters (user_id, master_name, discipline_id) VALUES ('2001', 'М', %s)",
+                   (discipline_id,)))
+    report_ids = [
+        run(WorkflowService.create_report('1001', discipline_id, {
+            'report_date': '2026-10-01', 'brigade_name': f"Бригада {i}", 'corpus_name': 'Корпус 1',
+            'work_type_name': 'Сварка'
+        }))
+        for i in range(7)
+    ]
+
+    def page(token):
+        result = run(WorkflowService.get_pending_reports_for_master('2001', token, limit=3))
+        return [report['id'] for report in result['reports']], result['prev'], result['next']
+
+    first, prev, next_token = page(FIRST_PAGE)
+    assert (first, prev) == (report_ids[:3], None)
+    second, prev, next_token = page(next_token)
+    assert second == report_ids[3:6]
+    third, third_prev, next_token = page(next_token)
+    assert (third, next_token) == (report_ids[6:], None)
+
+    back, prev, _ = page(third_prev)
+    assert back == report_ids[3:6]
+    back, prev, next_token = page(prev)
+    assert (back, prev) == (report_ids[:3], None)
+    assert page(next_token)[0] == report_ids[3:6]
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+@pytest.fixture
+def seeded_reports(run, db, discipline_id):
+    """Много отчетов: на маленькой таблице планировщик выбрал бы seq scan и без индекса"""
+    run(db_execute("INSERT INTO supervisors (user_id, supervisor_name, discipline_id) VALUES ('1001', 'С', %s)",
+                   (discipline_id,)))
+    run(db_execute("INSERT INTO masters (user_id, master_name, discipline_id) VALUES ('2001', 'М', %s)",
+                   (discipline_id,)))
+    run(db_execute("""
+        INSERT INTO reports (supervisor_id, created_at, report_date, brigade_name, corpus_name, discipline_id,
+                             work_type_name, workflow_status)
+        SELECT CASE WHEN g %% 10 = 0 THEN '1001' END, NOW() - g * INTERVAL '1 minute', CURRENT_DATE,
+               'Бригада ' || (g %% 50), 'Корпус 1',
+               CASE WHEN g %% 4 = 0 THEN %s ELSE (SELECT MAX(id) FROM disciplines) END, 'Сварка',
+               CASE WHEN g %% 20 = 0 THEN 'pending_master' ELSE 'approved' END
+        FROM generate_series(1, 20000) AS g
+    """, (discipline_id,)))
+    run(db_execute("ANALYZE reports"))
+
+@pytest.mark.parametrize('fetch_page, indexes', [
+    (lambda token: WorkflowService.get_pending_reports_for_master('2001', token, limit=5),
+     {'idx_reports_master_queue', 'idx_reports_pending_master_created'}),
+    (lambda token: WorkflowService.get_supervisor_reports('1001', token, limit=5),
+     {'idx_reports_supervisor_created'}),
+])
+def test_page_query_reads_index_range_without_sort(run, seeded_reports, monkeypatch, fetch_page, indexes):
+    # Запросы страниц перехватываются, и для каждого смотрим план с теми же параметрами
+    captured = []
+    original = workflow_module.db_query
+
+    async def capturing_db_query(query, params=(), as_dict=False):
+        captured.append((query, params))
+        return await original(query, params, as_dict)
+
+    monkeypatch.setattr(workflow_module, 'db_query', capturing_db_query)
+    first = run(fetch_page(FIRST_PAGE))
+    second = run(fetch_page(first['next']))
+    run(fetch_page(second['prev']))
+    assert len(captured) == 3
+
+    for query, params in captured:
+        plan = run(db_query_single(f"EXPLAIN (FORMAT JSON) {query}", params))
+        nodes = list(plan_nodes((json.loads(plan) if isinstance(plan, str) else plan)[0]['Plan']))
+        assert not [node for node in nodes if node['Node Type'] == 'Sort'], query
+        assert indexes & {node.get('Index Name') for node in nodes}, query
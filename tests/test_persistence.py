@@ -0,0 +1,111 @@
+# tests/test_persistence.py
+
+import json
+import pickle
+from collections import defaultdict
+from types import MappingProxyType, SimpleNamespace
+
+import pytest
+from telegram.ext import CommandHandler, ConversationHandler
+from telegram.ext._utils.trackingdict import TrackingDict
+
+import database.persistence as persistence_module
+from database.queries import db_execute, db_query_single
+from database.persistence import PostgresPersistence
+
+def make_replica():
+    """Реплика бота: своя persistence, bot_data, user_data и персистентный ConversationHandler"""
+    conversation = ConversationHandler(
+        entry_points=[CommandHandler('start', lambda update, context: None)], states={}, fallbacks=[],
+        name='report_conversation', persistent=True
+    )
+    # Так словарь состояний выглядит после Application.initialize()
+    conversation._conversations = TrackingDict()
+    application = SimpleNamespace(
+        bot_data={}, user_data=MappingProxyType(defaultdict(dict)), handlers={0: [conversation]}
+    )
+    return PostgresPersistence(), application, conversation._conversations
+
+@pytest.fixture
+def replicas(run, db):
+    first, second = make_replica(), make_replica()
+    for persistence, _application, _states in (first, second):
+        run(persistence.get_bot_data())
+        run(persistence.get_user_data())
+        run(persistence.get_conversations('report_conversation'))
+    return first, second
+
+@pytest.fixture
+def queries(monkeypatch):
+    """Счетчик чтений строк bot_persistence (проверка MAX(version) идет отдельно)"""
+    calls = []
+    original = persistence_module.db_query
+
+    async def counting_db_query(query, *args, **kwargs):
+        calls.append(query)
+        return await original(query, *args, **kwargs)
+
+    monkeypatch.setattr(persistence_module, 'db_query', counting_db_query)
+    return calls
+
+def test_changes_of_other_replica_are_applied(run, replicas):
+    (writer, _, _), (reader, application, states) = replicas
+    run(writer.update_bot_data({'maintenance': True}))
+    run(writer.update_user_data(42, {'lang': 'uz'}))
+    run(writer.update_conversation('report_conversation', (42,), 3))
+
+    run(reader.sync(application))
+    assert application.bot_data == {'maintenance': True}
+    assert application.user_data[42] == {'lang': 'uz'}
+    assert states[(42,)] == 3
+    # Чужое состояние не отмечено как измененное - PTB не запишет его обратно
+    assert states.pop_accessed_write_items() == []
+
+    run(writer.update_conversation('report_conversation', (42,), None))
+    run(writer.update_bot_data({}))
+    run(reader.sync(application))
+    assert (42,) not in states
+    assert application.bot_data == {}
+
+def test_unchanged_version_reads_no_rows(run, replicas, queries):
+    (writer, _, _), (reader, application, _) = replicas
+    run(reader.sync(application))
+    assert queries == []
+
+    run(writer.update_user_data(7, {'step': 1}))
+    queries.clear()
+    run(reader.sync(application))
+    # Свежая строка перечитывается, пока не выйдет из окна перекрытия
+    run(reader.sync(application))
+    assert len(queries) == 2
+    assert application.user_data[7] == {'step': 1}
+
+    run(db_execute("UPDATE bot_persistence SET updated_at = NOW() - INTERVAL '1 hour'"))
+    run(reader.sync(application))
+    queries.clear()
+    run(reader.sync(application))
+    assert queries == []
+
+def test_row_committed_with_lower_version_is_not_lost(run, replicas):
+    (writer, _, _), (reader, application, states) = replicas
+    # Реплика A взяла версию, но закоммитила позже, чем реплика B - свою, большую
+    delayed_version = run(db_query_single("SELECT nextval('bot_persistence_version_seq')"))
+    run(writer.update_user_data(1, {'replica': 'B'}))
+    run(reader.sync(application))
+    assert application.user_data[1] == {'replica': 'B'}
+
+    run(db_execute(
+        "INSERT INTO bot_persistence (kind, key, data, version, updated_at) VALUES (%s, %s, %s, %s, NOW())",
+        ('conversation:report_conversation', json.dumps([2]), pickle.dumps(4), delayed_version)
+    ))
+    run(reader.sync(application))
+    assert states[(2,)] == 4
+
+def test_own_writes_do_not_overwrite_newer_memory_state(run, replicas):
+    (persistence, application, states), _ = replicas
+    run(persistence.update_conversation('report_conversation', (5,), 1))
+    # Шаг разговора сменился после последнего сброса в БД
+    states.update_no_track({(5,): 2})
+
+    run(persistence.sync(application))
+    assert states[(5,)] == 2
@@ -0,0 +1,39 @@
+# tests/test_queries.py
+
+import logging
+
+import pytest
+
+from database.queries import _to_asyncpg_query, db_query, db_query_single
+
+def test_placeholders_are_numbered():
+    query = "SELECT * FROM reports WHERE id = %s AND workflow_status = ANY(%s)"
+    assert _to_asyncpg_query(query, (1, ['a'])) == "SELECT * FROM reports WHERE id = $1 AND workflow_status = ANY($2)"
+
+def test_query_without_params_is_unchanged():
+    # psycopg2 без параметров тоже не трогает '%'
+    query = "SELECT 'a%b', 'c%%d', 10 % 3"
+    assert _to_asyncpg_query(query, ()) == query
+
+def test_double_percent_collapses_everywhere_like_psycopg2():
+    query = "SELECT 'a%%b' || %s, 10 %% 3 FROM t WHERE name LIKE 'x%%'"
+    assert _to_asyncpg_query(query, ('z',)) == "SELECT 'a%b' || $1, 10 % 3 FROM t WHERE name LIKE 'x%'"
+
+def test_placeholder_inside_literal_is_substituted_like_psycopg2():
+    assert _to_asyncpg_query("SELECT '%s', %s", (1, 2)) == "SELECT '$1', $2"
+
+@pytest.mark.parametrize('query', ["SELECT 'a%b', %s", "SELECT %d", "SELECT %s, 5 %"])
+def test_unsupported_percent_is_rejected(query):
+    with pytest.raises(ValueError):
+        _to_asyncpg_query(query, (1,))
+
+def test_literal_with_params_matches_psycopg2(run, db):
+    rows = run(db_query("SELECT 'a%%b', %s::int", (5,)))
+    assert rows == [('a%b', 5)]
+
+def test_argument_fallback_is_logged(run, db, caplog):
+    # asyncpg не кодирует str в int - запрос выполняется через psycopg2, и это видно в логе
+    with caplog.at_level(logging.WARNING, logger='database.queries'):
+        assert run(db_query_single("SELECT %s::int + 1", ('41',))) == 42
+    assert any('psycopg2' in record.getMessage() and 'SELECT %s::int + 1' in record.getMessage()
+               for record in caplog.records)
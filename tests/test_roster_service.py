@@ -0,0 +1,21 @@
+# tests/test_roster_service.py
+
+from datetime import date
+
+import services.roster_service as roster_module
+from services.roster_service import RosterService
+
+def test_submitted_set_rolls_over_on_bot_day(monkeypatch):
+    # Смена дня - по часовому поясу бота, а не сервера
+    bot_day = date(2026, 10, 17)
+    monkeypatch.setattr(roster_module, 'local_today', lambda: bot_day)
+    monkeypatch.setattr(RosterService, '_submitted', {'4001'})
+    monkeypatch.setattr(RosterService, '_submitted_date', bot_day)
+    monkeypatch.setattr(RosterService, '_submitted_loaded_at', 0.0)
+
+    RosterService._roll_submitted_day()
+    assert RosterService._submitted == {'4001'}
+
+    bot_day = date(2026, 10, 18)
+    RosterService._roll_submitted_day()
+    assert (RosterService._submitted, RosterService._submitted_date) == (set(), date(2026, 10, 18))
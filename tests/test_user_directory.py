@@ -0,0 +1,39 @@
+# tests/test_user_directory.py
+
+import pytest
+
+import services.user_directory_service as directory_module
+from database.queries import db_execute
+from services.user_directory_service import UserDirectoryService
+
+@pytest.fixture
+def directory(run, db, discipline_id, monkeypatch):
+    """Справочник загружен при старте, в нем один мастер"""
+    monkeypatch.setattr(UserDirectoryService, '_users', {})
+    monkeypatch.setattr(UserDirectoryService, '_read_at', {})
+    monkeypatch.setattr(UserDirectoryService, '_loaded', False)
+    run(db_execute("INSERT INTO masters (user_id, master_name, discipline_id, language_code) VALUES ('2001', 'М', %s, 'ru')",
+                   (discipline_id,)))
+    assert run(UserDirectoryService.load_all())
+    return discipline_id
+
+def test_user_added_by_other_replica_is_found(run, directory):
+    # Пользователь добавлен другим экземпляром бота уже после загрузки справочника
+    run(db_execute("INSERT INTO kiok (user_id, kiok_name, discipline_id) VALUES ('3001', 'К', %s)", (directory,)))
+    assert run(UserDirectoryService.get_role_table('3001')) == 'kiok'
+
+def test_miss_is_cached_briefly(run, directory, monkeypatch):
+    assert run(UserDirectoryService.get_user('3001')) is None
+    run(db_execute("INSERT INTO kiok (user_id, kiok_name, discipline_id) VALUES ('3001', 'К', %s)", (directory,)))
+    assert run(UserDirectoryService.get_user('3001')) is None
+
+    monkeypatch.setattr(directory_module, 'USER_DIRECTORY_MISS_TTL_SECONDS', 0)
+    assert run(UserDirectoryService.get_role_table('3001')) == 'kiok'
+
+def test_stale_entry_is_reread(run, directory, monkeypatch):
+    # Язык сменили через другой экземпляр бота: до истечения TTL виден старый
+    run(db_execute("UPDATE masters SET language_code = 'uz' WHERE user_id = '2001'"))
+    assert run(UserDirectoryService.get_language('2001')) == 'ru'
+
+    monkeypatch.setattr(directory_module, 'USER_DIRECTORY_TTL_SECONDS', 0)
+    assert run(UserDirectoryService.get_language('2001')) == 'uz'
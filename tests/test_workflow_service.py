@@ -0,0 +1,104 @@
+# tests/test_workflow_service.py
+
+import pytest
+
+from database.queries import db_execute, db_query, db_query_single
+from services.workflow_service import WorkflowService
+
+SUPERVISOR, MASTER, KIOK = '1001', '2001', '3001'
+
+@pytest.fixture
+def staff(run, db, discipline_id):
+    """Супервайзер, мастер и КИОК одной дисциплины"""
+    run(db_execute("INSERT INTO supervisors (user_id, supervisor_name, discipline_id) VALUES (%s, %s, %s)",
+                   (SUPERVISOR, 'Супервайзер', discipline_id)))
+    run(db_execute("INSERT INTO masters (user_id, master_name, discipline_id) VALUES (%s, %s, %s)",
+                   (MASTER, 'Мастер', discipline_id)))
+    run(db_execute("INSERT INTO kiok (user_id, kiok_name, discipline_id) VALUES (%s, %s, %s)",
+                   (KIOK, 'КИОК', discipline_id)))
+    return discipline_id
+
+def create_report(run, discipline_id, brigade='Бригада 1'):
+    return run(WorkflowService.create_report(SUPERVISOR, discipline_id, {
+        'report_date': '2026-10-01', 'brigade_name': brigade, 'corpus_name': 'Корпус 1',
+        'work_type_name': 'Сварка', 'people_count': '5', 'volume': '12.5', 'details': {'pipe_diameter': 100}
+    }))
+
+def events(run, event_type):
+    return run(db_query(
+        "SELECT report_id, payload, status FROM domain_events WHERE event_type = %s ORDER BY report_id",
+        (event_type,), as_dict=True
+    ))
+
+def test_create_report_writes_report_and_event(run, staff):
+    report_id = create_report(run, staff)
+    assert report_id
+
+    report = run(db_query("SELECT * FROM reports WHERE id = %s", (report_id,), as_dict=True))[0]
+    assert report['workflow_status'] == 'pending_master'
+    assert report['supervisor_id'] == SUPERVISOR
+    assert (report['people_count'], report['volume']) == (5, 12.5)
+
+    created = events(run, 'report_created')
+    assert [event['report_id'] for event in created] == [report_id]
+    assert created[0]['payload'] == {'discipline_id': staff, 'actor_id': SUPERVISOR}
+    assert created[0]['status'] == 'pending'
+
+def test_master_batch_approval_skips_foreign_and_processed_reports(run, staff):
+    own = [create_report(run, staff, f"Бригада {i}") for i in range(3)]
+    other_discipline = run(db_query_single("SELECT MAX(id) FROM disciplines"))
+    assert other_discipline != staff
+    foreign = create_report(run, other_discipline)
+
+    approved = run(WorkflowService.master_approve_many(own + [foreign], MASTER))
+    assert sorted(approved) == own
+
+    rows = run(db_query("SELECT id, workflow_status, master_id FROM reports WHERE id = ANY(%s) ORDER BY id",
+                        (own + [foreign],)))
+    assert rows == [(report_id, 'pending_kiok', MASTER) for report_id in own] + [(foreign, 'pending_master', None)]
+    assert [event['report_id'] for event in events(run, 'master_approved')] == own
+    assert run(db_query_single(
+        "SELECT COUNT(*) FROM report_transitions WHERE to_status = 'pending_kiok' AND actor_id = %s", (MASTER,)
+    )) == 3
+
+    # Повторное подтверждение уже обработанных отчетов ничего не меняет
+    assert run(WorkflowService.master_approve_many(own, MASTER)) == []
+
+def test_master_reject_returns_report_and_records_reason(run, staff):
+    report_id = create_report(run, staff)
+
+    report = run(WorkflowService.master_reject(report_id, MASTER, 'Нет фото'))
+    assert report['id'] == report_id
+    assert report['workflow_status'] == 'rejected'
+    assert report['report_data']['master_rejection_reason'] == 'Нет фото'
+
+    rejected = events(run, 'report_rejected')
+    assert rejected[0]['payload']['reason'] == 'Нет фото'
+    assert rejected[0]['payload']['actor_id'] == MASTER
+    # Отклоненный отчет нельзя подтвердить
+    assert run(WorkflowService.master_approve_many([report_id], MASTER)) == []
+
+def test_kiok_batch_approval_after_master(run, staff):
+    report_ids = [create_report(run, staff, f"Бригада {i}") for i in range(2)]
+    # До подтверждения мастером КИОК согласовать не может
+    assert run(WorkflowService.kiok_approve_many(report_ids, KIOK, 'INS-1')) == []
+
+    run(WorkflowService.master_approve_many(report_ids, MASTER))
+    approved = run(WorkflowService.kiok_approve_many(report_ids, KIOK, 'INS-1'))
+    assert sorted(approved) == report_ids
+
+    rows = run(db_query("SELECT workflow_status, kiok_id, kiok_inspection_number FROM reports WHERE id = ANY(%s)",
+                        (report_ids,)))
+    assert set(rows) == {('approved', KIOK, 'INS-1')}
+    assert [event['payload']['inspection_number'] for event in events(run, 'kiok_approved')] == ['INS-1', 'INS-1']
+
+def test_kiok_reject_merges_report_data(run, staff):
+    report_id = create_report(run, staff)
+    run(WorkflowService.master_approve_many([report_id], MASTER))
+
+    report = run(WorkflowService.kiok_reject(report_id, KIOK, 'Замечания'))
+    assert report['workflow_status'] == 'rejected'
+    assert report['kiok_notes'] == 'Замечания'
+    # Старые поля report_data сохраняются, причина дописывается
+    assert report['report_data']['pipe_diameter'] == 100
+    assert report['report_data']['kiok_rejection']['reason'] == 'Замечания'
@@ -1,29 +1,92 @@
 """
 Утилиты для работы с чатом (финальная, универсальная версия)
+
+Старые сообщения бота удаляются в фоне после ответа пользователю: id копятся по чату,
+одна задача на чат забирает их пачками до CHAT_CLEANUP_BATCH_SIZE (deleteMessages)
+и повторяет пачку при сетевых сбоях и RetryAfter.
 """
 
+import asyncio
 import logging
+from typing import Dict, Iterable, Set
 from telegram import Update, Message
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
 from telegram.ext import ContextTypes
 from functools import wraps
 
+from config.settings import (
+    CHAT_CLEANUP_BATCH_SIZE, CHAT_TRACKED_MESSAGES_MAX, CHAT_CLEANUP_MAX_ATTEMPTS, CHAT_CLEANUP_RETRY_SECONDS
+)
+
 logger = logging.getLogger(__name__)
 
-async def clean_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
-    """
-    Удаляет все сообщения, помеченные для очистки. 
-    Теперь это самостоятельная функция, которую можно вызывать вручную.
-    """
-    message_ids = context.user_data.pop('tracked_messages', [])
-    if not message_ids:
-        return
+# chat_id -> id сообщений, ожидающих удаления; chat_id -> задача, которая их удаляет
+_pending_deletes: Dict[int, Set[int]] = {}
+_cleanup_tasks: Dict[int, asyncio.Task] = {}
 
+async def _delete_batch(bot, chat_id: int, message_ids: list) -> None:
+    if hasattr(bot, 'delete_messages'):
+        await bot.delete_messages(chat_id=chat_id, message_ids=message_ids)
+        return
+    # Старый python-telegram-bot без deleteMessages
     for message_id in message_ids:
         try:
-            await context.bot.delete_message(chat_id=chat_id, message_id=message_id)
-        except Exception:
+            await bot.delete_message(chat_id=chat_id, message_id=message_id)
+        except BadRequest:
             pass
-    logger.debug(f"Очищено {len(message_ids)} сообщений в чате {chat_id}")
+
+async def _cleanup_worker(bot, chat_id: int) -> None:
+    """Удаляет все накопленные для чата сообщения; новые id, пришедшие по ходу, забирает тем же циклом"""
+    attempt = 0
+    try:
+        while _pending_deletes.get(chat_id):
+            message_ids = sorted(_pending_deletes.pop(chat_id))
+            failed = []
+            for start in range(0, len(message_ids), CHAT_CLEANUP_BATCH_SIZE):
+                batch = message_ids[start:start + CHAT_CLEANUP_BATCH_SIZE]
+                try:
+                    await _delete_batch(bot, chat_id, batch)
+                except RetryAfter as e:
+                    failed.extend(batch)
+                    await asyncio.sleep(e.retry_after)
+                except BadRequest as e:
+                    # Сообщения старше 48 часов или уже удалены - повтор не поможет
+                    logger.debug(f"Не удалось удалить сообщения в чате {chat_id}: {e}")
+                except NetworkError:
+                    failed.extend(batch)
+                except TelegramError as e:
+                    logger.debug(f"Очистка чата {chat_id} пропущена: {e}")
+
+            if failed:
+                attempt += 1
+                if attempt < CHAT_CLEANUP_MAX_ATTEMPTS:
+                    _pending_deletes.setdefault(chat_id, set()).update(failed)
+                    await asyncio.sleep(CHAT_CLEANUP_RETRY_SECONDS * attempt)
+                else:
+                    logger.warning(f"⚠️ Не удалось удалить {len(failed)} сообщений в чате {chat_id} за {attempt} попыток")
+            else:
+                logger.debug(f"Очищено {len(message_ids)} сообщений в чате {chat_id}")
+    finally:
+        _cleanup_tasks.pop(chat_id, None)
+
+def schedule_cleanup(context: ContextTypes.DEFAULT_TYPE, chat_id: int, message_ids: Iterable[int]) -> None:
+    """Ставит сообщения на удаление в фоне; все вызовы по одному чату обслуживает одна задача"""
+    message_ids = set(message_ids)
+    if not message_ids:
+        return
+    _pending_deletes.setdefault(chat_id, set()).update(message_ids)
+    if chat_id not in _cleanup_tasks:
+        _cleanup_tasks[chat_id] = context.application.create_task(
+            _cleanup_worker(context.bot, chat_id), name=f"chat_cleanup:{chat_id}"
+        )
+
+async def clean_chat(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
+    """
+    Удаляет все сообщения, помеченные для очистки.
+    Теперь это самостоятельная функция, которую можно вызывать вручную.
+    Удаление идет в фоне - вызов не ждет Telegram.
+    """
+    schedule_cleanup(context, chat_id, context.user_data.pop('tracked_messages', []))
 
 async def track_message(context: ContextTypes.DEFAULT_TYPE, message: Message):
     """
@@ -33,22 +96,42 @@ async def track_message(context: ContextTypes.DEFAULT_TYPE, message: Message):
     if 'tracked_messages' not in context.user_data:
         context.user_data['tracked_messages'] = []
     if message and hasattr(message, 'message_id'):
-        context.user_data['tracked_messages'].append(message.message_id)
+        tracked = context.user_data['tracked_messages']
+        tracked.append(message.message_id)
+        if len(tracked) > CHAT_TRACKED_MESSAGES_MAX:
+            # Список не растет бесконечно: самые старые удаляем сразу
+            overflow = len(tracked) - CHAT_TRACKED_MESSAGES_MAX
+            schedule_cleanup(context, message.chat_id, tracked[:overflow])
+            del tracked[:overflow]
 
 def auto_clean(func):
     """
     Декоратор для простых обработчиков кнопок (CallbackQueryHandler).
     Автоматически чистит чат и отслеживает новое сообщение.
+    Старые сообщения удаляются в фоне после ответа, поэтому время ответа от их числа не зависит.
     """
     @wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         chat_id = update.effective_chat.id
-        await clean_chat(context, chat_id)
-        
-        result_message = await func(update, context, *args, **kwargs)
-        
+        previous_messages = context.user_data.pop('tracked_messages', [])
+        result_message = None
+        try:
+            result_message = await func(update, context, *args, **kwargs)
+        finally:
+            # Сообщение с нажатой кнопкой и ответ (часто это одно и то же отредактированное сообщение) не трогаем
+            keep = set()
+            if update.callback_query and update.callback_query.message:
+                keep.add(update.callback_query.message.message_id)
+            if hasattr(result_message, 'message_id'):
+                keep.add(result_message.message_id)
+            schedule_cleanup(context, chat_id, [mid for mid in previous_messages if mid not in keep])
+
         if result_message:
             await track_message(context, result_message)
-        
+        # Нажатое сообщение, если ответ пришел новым, уберем при следующей очистке
+        for message_id in previous_messages:
+            if message_id in keep and message_id != getattr(result_message, 'message_id', None):
+                context.user_data.setdefault('tracked_messages', []).append(message_id)
+
         return result_message
-    return wrapper
\ No newline at end of file
+    return wrapper
@@ -0,0 +1,17 @@
+# utils/dates.py
+
+"""Дата и время по часовому поясу бота (BOT_TIMEZONE), а не сервера - как у планировщика."""
+
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+from config.settings import BOT_TIMEZONE
+
+BOT_TZ = ZoneInfo(BOT_TIMEZONE)
+
+def local_now() -> datetime:
+    return datetime.now(BOT_TZ)
+
+def local_today() -> date:
+    """Сегодняшняя дата для табелей и ежедневных напоминаний"""
+    return local_now().date()
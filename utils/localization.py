@@ -1,4 +1,4 @@
-from database.queries import db_query, db_execute
+from services.user_directory_service import UserDirectoryService
 
 # Переводы интерфейса
 TRANSLATIONS = {
@@ -67,6 +67,23 @@ TRANSLATIONS = {
         'roster_dangerous_save_warning': '⚠️ Новый табель: {new_total}, назначено: {assigned}',
         'roster_force_save_button': '⚠️ Сохранить принудительно',
         'roster_force_saved_success': '✅ Табель принудительно сохранен',
+        'kiok_pending_reports_page_title': "🔍 Отчеты для проверки",
+        'batch_no_permission': "❌ У вас нет прав для этой очереди",
+
+        # Пакетное согласование
+        'kiok_new_reports_batch_notification': "🔔 Новые отчеты для проверки: {count}\n✅ Подтвердил: {master}\n\n{reports}",
+        'batch_more_reports': "... и еще {count}",
+        'kiok_open_queue_button': "🔍 Открыть очередь",
+        'batch_select_page_button': "☑️ Выбрать все на странице",
+        'batch_clear_button': "✖️ Снять выбор",
+        'batch_limit_reached': "Можно отметить не больше {limit} отчетов",
+        'batch_nothing_selected': "Отметьте отчеты в списке",
+        'master_batch_approve_button': "✅ Подтвердить выбранные ({count})",
+        'master_batch_approval_success': "✅ Подтверждено отчетов: {count}, отправлены в КИОК.",
+        'kiok_batch_approve_button': "✅ Согласовать выбранные ({count})",
+        'kiok_batch_inspection_number_prompt': "📝 Введите номер проверки для выбранных отчетов ({count} шт.):",
+        'kiok_batch_approval_success': "✅ Согласовано отчетов: {count} (№{inspection_number})",
+        'batch_approval_skipped': "⚠️ Пропущено {count}: уже обработаны или недоступны.",
         
     },
     
@@ -134,6 +151,23 @@ TRANSLATIONS = {
         'roster_dangerous_save_warning': '⚠️ New roster: {new_total}, assigned: {assigned}',
         'roster_force_save_button': '⚠️ Force Save',
         'roster_force_saved_success': '✅ Roster force-saved',
+        'kiok_pending_reports_page_title': "🔍 Reports for inspection",
+        'batch_no_permission': "❌ You have no access to this queue",
+
+        # Batch approval
+        'kiok_new_reports_batch_notification': "🔔 New reports to review: {count}\n✅ Approved by: {master}\n\n{reports}",
+        'batch_more_reports': "... and {count} more",
+        'kiok_open_queue_button': "🔍 Open queue",
+        'batch_select_page_button': "☑️ Select all on page",
+        'batch_clear_button': "✖️ Clear selection",
+        'batch_limit_reached': "You can select at most {limit} reports",
+        'batch_nothing_selected': "Select reports in the list",
+        'master_batch_approve_button': "✅ Approve selected ({count})",
+        'master_batch_approval_success': "✅ Reports approved: {count}, sent to QC.",
+        'kiok_batch_approve_button': "✅ Approve selected ({count})",
+        'kiok_batch_inspection_number_prompt': "📝 Enter the inspection number for the selected reports ({count}):",
+        'kiok_batch_approval_success': "✅ Reports approved: {count} (No. {inspection_number})",
+        'batch_approval_skipped': "⚠️ Skipped {count}: already processed or unavailable.",
         
     },
     
@@ -201,6 +235,23 @@ TRANSLATIONS = {
         'roster_dangerous_save_warning': '⚠️ Yangi tabel: {new_total}, biriktirilgan: {assigned}',
         'roster_force_save_button': '⚠️ Majburan saqlash',
         'roster_force_saved_success': '✅ Tabel majburan saqlandi',
+        'kiok_pending_reports_page_title': "🔍 Tekshirish uchun hisobotlar",
+        'batch_no_permission': "❌ Bu navbat uchun sizda huquq yo'q",
+
+        # Hisobotlarni to'plab tasdiqlash
+        'kiok_new_reports_batch_notification': "🔔 Tekshirish uchun yangi hisobotlar: {count}\n✅ Tasdiqlagan: {master}\n\n{reports}",
+        'batch_more_reports': "... yana {count} ta",
+        'kiok_open_queue_button': "🔍 Navbatni ochish",
+        'batch_select_page_button': "☑️ Sahifadagi hammasini tanlash",
+        'batch_clear_button': "✖️ Tanlovni bekor qilish",
+        'batch_limit_reached': "Ko'pi bilan {limit} ta hisobot tanlash mumkin",
+        'batch_nothing_selected': "Ro'yxatdan hisobotlarni tanlang",
+        'master_batch_approve_button': "✅ Tanlanganlarni tasdiqlash ({count})",
+        'master_batch_approval_success': "✅ Tasdiqlangan hisobotlar: {count}, KIOKga yuborildi.",
+        'kiok_batch_approve_button': "✅ Tanlanganlarni kelishish ({count})",
+        'kiok_batch_inspection_number_prompt': "📝 Tanlangan hisobotlar uchun tekshiruv raqamini kiriting ({count} ta):",
+        'kiok_batch_approval_success': "✅ Kelishilgan hisobotlar: {count} (№{inspection_number})",
+        'batch_approval_skipped': "⚠️ {count} tasi o'tkazib yuborildi: allaqachon ko'rib chiqilgan yoki mavjud emas.",
     
     
     
@@ -285,22 +336,20 @@ def get_data_translation(original_text: str, lang_code: str = 'ru') -> str:
     return DATA_TRANSLATIONS.get(cleaned_text, {}).get(lang_code, cleaned_text)
 
 async def get_user_language(user_id: str) -> str:
-    """Асинхронно получает язык пользователя из любой таблицы ролей."""
-    tables = ['admins', 'managers', 'supervisors', 'masters', 'brigades', 'pto', 'kiok']
-    for table in tables:
-        lang_code_raw = await db_query(f"SELECT language_code FROM {table} WHERE user_id = %s", (user_id,))
-        if lang_code_raw and lang_code_raw[0] and lang_code_raw[0][0]:
-            return lang_code_raw[0][0]
-    return 'ru'
+    """Асинхронно получает язык пользователя из справочника пользователей."""
+    return await UserDirectoryService.get_language(user_id)
 
 async def update_user_language(user_id: str, lang_code: str):
     """Асинхронно обновляет язык пользователя во всех таблицах."""
-    tables = ['admins', 'managers', 'supervisors', 'masters', 'brigades', 'pto', 'kiok']
-    for table in tables:
-        await db_execute(f"UPDATE {table} SET language_code = %s WHERE user_id = %s", (lang_code, user_id))
+    from services.user_service import UserService
+    await UserService.update_user_language(user_id, lang_code)
 
 def get_user_language_sync(user_id: str) -> str:
-    """Синхронно получает язык пользователя из любой таблицы ролей."""
+    """Синхронно получает язык пользователя (из справочника, до его загрузки - из БД)."""
+    entry = UserDirectoryService.get_user_cached(user_id)
+    if entry or UserDirectoryService.is_loaded():
+        return (entry and entry['language_code']) or DEFAULT_LANGUAGE
+
     from database.queries import db_query_sync
     tables = ['admins', 'managers', 'supervisors', 'masters', 'brigades', 'pto', 'kiok']
     for table in tables:
@@ -0,0 +1,171 @@
+# utils/logging_setup.py
+
+"""
+Логирование без записи на диск в потоке event loop.
+
+Все логгеры пишут в QueueHandler (только кладет запись в очередь), а файл и консоль
+обслуживает QueueListener в отдельном потоке. Файл - JSON-строки с ротацией по размеру,
+в каждой записи контекст апдейта (update_id, user_id, handler), если лог пишется при его обработке.
+Частые записи с одного места в коде прореживаются: не больше LOG_SAMPLE_BURST за окно.
+"""
+
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional, Tuple
+
+from config.settings import (
+    LOG_LEVEL, LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_LEVELS,
+    LOG_SAMPLE_WINDOW_SECONDS, LOG_SAMPLE_BURST
+)
+
+CONTEXT_FIELDS = ('update_id', 'user_id', 'handler')
+CONSOLE_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Контекст текущего апдейта; у каждой задачи asyncio своя копия
+_log_context: contextvars.ContextVar[Dict[str, object]] = contextvars.ContextVar('log_context', default={})
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_EXC_FORMATTER = logging.Formatter()
+
+@contextmanager
+def log_context(**fields) -> Iterator[None]:
+    """Добавляет поля ко всем записям лога внутри блока (и в задачах, созданных из него)"""
+    token = _log_context.set({**_log_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+class ContextFilter(logging.Filter):
+    """Переносит контекст апдейта в запись - до того, как она уйдет в другой поток"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _log_context.get()
+        for field in CONTEXT_FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, context.get(field))
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    Прореживает частые записи: с одной строки кода - не больше burst за window секунд.
+    Сколько записей пропущено, видно в поле suppressed первой записи следующего окна.
+    """
+
+    def __init__(self, window: float, burst: int, max_level: int = logging.ERROR):
+        super().__init__()
+        self._window = window
+        self._burst = burst
+        self._max_level = max_level
+        # (файл, строка) -> (начало окна, записано в окне, пропущено)
+        self._sites: Dict[Tuple[str, int], Tuple[float, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= self._max_level:
+            return True
+        site = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            started, written, suppressed = self._sites.get(site, (now, 0, 0))
+            if now - started >= self._window:
+                started, written = now, 0
+            if written >= self._burst:
+                self._sites[site] = (started, written, suppressed + 1)
+                return False
+            self._sites[site] = (started, written + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS + ('suppressed',):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler, который не вклеивает traceback в текст: JSON получает его отдельным полем"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+def _parse_levels(spec: str) -> Dict[str, str]:
+    """'httpx=WARNING,apscheduler=ERROR' -> {'httpx': 'WARNING', 'apscheduler': 'ERROR'}"""
+    levels = {}
+    for item in spec.split(','):
+        name, _, level = item.partition('=')
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+def setup_logging() -> logging.handlers.QueueListener:
+    """Настраивает корневой логгер: очередь в потоке event loop, файл и консоль - в потоке QueueListener"""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    # Фильтры работают в потоке, где пишется лог: там еще виден контекст апдейта
+    queue_handler.addFilter(ContextFilter())
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_WINDOW_SECONDS, LOG_SAMPLE_BURST))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL.upper())
+    for name, level in _parse_levels(LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _listener.start()
+    # Дописываем оставшиеся в очереди записи при выходе
+    atexit.register(stop_logging)
+    return _listener
+
+def stop_logging() -> None:
+    """Останавливает поток записи, предварительно выгрузив очередь"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
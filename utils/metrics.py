@@ -0,0 +1,210 @@
+# utils/metrics.py
+
+"""
+Метрики производительности в памяти процесса: гистограммы задержек и счетчики.
+
+Пишут их обработчики апдейтов (bot/middleware/metrics.py), database/queries.py,
+пул потоков (run_in_executor) и HTTP-клиент Bot API. Читают - эндпоинт Prometheus
+(services/metrics_server.py) и админская команда /perf.
+"""
+
+import asyncio
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Корзины задержек в секундах и числа запросов к БД на один апдейт
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+HANDLER_SECONDS = 'bot_handler_seconds'
+HANDLER_ERRORS = 'bot_handler_errors_total'
+DB_CALLS_PER_UPDATE = 'bot_db_calls_per_update'
+DB_QUERY_SECONDS = 'bot_db_query_seconds'
+DB_POOL_WAIT_SECONDS = 'bot_db_pool_wait_seconds'
+EXECUTOR_WAIT_SECONDS = 'bot_executor_wait_seconds'
+EXECUTOR_RUN_SECONDS = 'bot_executor_run_seconds'
+TELEGRAM_API_SECONDS = 'bot_telegram_api_seconds'
+TELEGRAM_API_ERRORS = 'bot_telegram_api_errors_total'
+UPDATE_WAIT_SECONDS = 'bot_update_wait_seconds'
+UPDATES_DROPPED = 'bot_updates_dropped_total'
+
+# имя -> (тип, описание, корзины)
+_METRICS = {
+    HANDLER_SECONDS: ('histogram', 'Время обработки апдейта по обработчику', LATENCY_BUCKETS),
+    HANDLER_ERRORS: ('counter', 'Апдейты, завершившиеся исключением', None),
+    DB_CALLS_PER_UPDATE: ('histogram', 'Число запросов к БД за один апдейт', COUNT_BUCKETS),
+    DB_QUERY_SECONDS: ('histogram', 'Время запроса к БД', LATENCY_BUCKETS),
+    DB_POOL_WAIT_SECONDS: ('histogram', 'Ожидание свободного соединения пула БД', LATENCY_BUCKETS),
+    EXECUTOR_WAIT_SECONDS: ('histogram', 'Ожидание в очереди пула потоков', LATENCY_BUCKETS),
+    EXECUTOR_RUN_SECONDS: ('histogram', 'Выполнение задачи в пуле потоков', LATENCY_BUCKETS),
+    TELEGRAM_API_SECONDS: ('histogram', 'Время запроса к Telegram Bot API', LATENCY_BUCKETS),
+    TELEGRAM_API_ERRORS: ('counter', 'Неудачные запросы к Telegram Bot API', None),
+    UPDATE_WAIT_SECONDS: ('histogram', 'Ожидание апдейта в очереди пользователя и общего лимита', LATENCY_BUCKETS),
+    UPDATES_DROPPED: ('counter', 'Апдейты, отброшенные из-за переполнения очереди пользователя', None),
+}
+
+# Защита от взрыва числа серий (произвольные callback_data): лишние метки сворачиваются в 'other'
+MAX_SERIES_PER_METRIC = 300
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Кумулятивная гистограмма в стиле Prometheus + максимум"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count', 'max')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина - +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины (точность - ширина корзины)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for index, bucket_count in enumerate(self.counts):
+            upper = min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+            if bucket_count and seen + bucket_count >= rank:
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = upper
+        return self.max
+
+    def copy(self) -> 'Histogram':
+        clone = Histogram(self.buckets)
+        clone.counts = list(self.counts)
+        clone.sum, clone.count, clone.max = self.sum, self.count, self.max
+        return clone
+
+_lock = threading.Lock()
+_series: Dict[str, Dict[LabelKey, Any]] = {name: {} for name in _METRICS}
+
+def _label_key(name: str, labels: Dict[str, str]) -> LabelKey:
+    key = tuple(sorted((label, str(value)) for label, value in labels.items()))
+    series = _series[name]
+    if key not in series and len(series) >= MAX_SERIES_PER_METRIC:
+        key = tuple((label, 'other') for label, _ in key)
+    return key
+
+def observe(name: str, value: float, **labels) -> None:
+    """Добавляет наблюдение в гистограмму. Безопасно вызывать из потоков пула."""
+    with _lock:
+        key = _label_key(name, labels)
+        histogram = _series[name].get(key)
+        if histogram is None:
+            histogram = _series[name][key] = Histogram(_METRICS[name][2])
+        histogram.observe(value)
+
+def inc(name: str, amount: float = 1, **labels) -> None:
+    """Увеличивает счетчик"""
+    with _lock:
+        key = _label_key(name, labels)
+        _series[name][key] = _series[name].get(key, 0) + amount
+
+def snapshot(name: str) -> List[Tuple[Dict[str, str], Any]]:
+    """Копия серий метрики: [(метки, Histogram или число)]"""
+    with _lock:
+        return [
+            (dict(key), value.copy() if isinstance(value, Histogram) else value)
+            for key, value in _series[name].items()
+        ]
+
+def reset() -> None:
+    """Обнуляет все метрики (команда /perf reset)"""
+    with _lock:
+        for series in _series.values():
+            series.clear()
+
+def _format_labels(labels: Dict[str, str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels.items()) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = []
+    for label, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        escaped.append(f'{label}="{value}"')
+    return '{' + ','.join(escaped) + '}'
+
+def render_prometheus() -> str:
+    """Все метрики в текстовом формате Prometheus 0.0.4"""
+    lines = []
+    for name, (kind, description, _) in _METRICS.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in snapshot(name):
+            if kind == 'counter':
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            cumulative = 0
+            for index, bucket_count in enumerate(value.counts):
+                cumulative += bucket_count
+                le = repr(float(value.buckets[index])) if index < len(value.buckets) else '+Inf'
+                lines.append(f"{name}_bucket{_format_labels(labels, ('le', le))} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {value.sum}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value.count}")
+    return '\n'.join(lines) + '\n'
+
+# --- Учет запросов к БД в рамках одного апдейта (поиск N+1) ---
+
+_update_stats: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    'update_stats', default=None
+)
+
+@contextmanager
+def track_update() -> Iterator[Dict[str, float]]:
+    """Считает запросы к БД, сделанные внутри блока (и в задачах, созданных из него)"""
+    stats = {'db_calls': 0, 'db_seconds': 0.0}
+    token = _update_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _update_stats.reset(token)
+
+def record_db_call(operation: str, seconds: float) -> None:
+    observe(DB_QUERY_SECONDS, seconds, operation=operation)
+    stats = _update_stats.get()
+    if stats is not None:
+        stats['db_calls'] += 1
+        stats['db_seconds'] += seconds
+
+@contextmanager
+def timed_db_call(operation: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_db_call(operation, time.perf_counter() - started)
+
+# --- Пул потоков ---
+
+def _timed_call(pool: str, submitted: float, func, args):
+    started = time.perf_counter()
+    observe(EXECUTOR_WAIT_SECONDS, started - submitted, pool=pool)
+    try:
+        return func(*args)
+    finally:
+        observe(EXECUTOR_RUN_SECONDS, time.perf_counter() - started, pool=pool)
+
+async def run_in_executor(func, *args, executor=None, pool: str = 'default'):
+    """loop.run_in_executor с учетом ожидания в очереди пула и времени выполнения"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, partial(_timed_call, pool, time.perf_counter(), func, args)
+    )
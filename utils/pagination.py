@@ -0,0 +1,74 @@
+# utils/pagination.py
+
+"""
+Keyset-пагинация для inline-списков (очереди согласования, пользователи, история отчетов).
+
+Курсор страницы - ключ строки-якоря в callback_data: 'a<ключ>' - строки после нее,
+'b<ключ>' - строки перед ней. Значения сортировки запрос берет у якоря по первичному ключу,
+поэтому любая страница стоит одного диапазонного чтения индекса, а не COUNT + OFFSET.
+"""
+
+from typing import Any, Callable, List, Optional, Tuple
+
+FIRST_PAGE = "1"
+
+def page_token(forward: bool, anchor: Any) -> str:
+    return f"{'a' if forward else 'b'}{anchor}"
+
+def parse_page_token(token: Optional[str]) -> Tuple[bool, Optional[str]]:
+    """'a<ключ>'/'b<ключ>' -> (вперед?, ключ якоря). Первая страница и мусор -> (True, None)."""
+    if token and token[0] in ('a', 'b') and len(token) > 1:
+        return token[0] == 'a', token[1:]
+    return True, None
+
+def _split_columns(sort_key: str) -> List[str]:
+    """'COALESCE(a, ''), b' -> ["COALESCE(a, '')", 'b'] (запятые внутри скобок не делят)"""
+    columns, depth, current = [], 0, []
+    for char in sort_key:
+        if char == ',' and depth == 0:
+            columns.append(''.join(current).strip())
+            current = []
+            continue
+        depth += (char == '(') - (char == ')')
+        current.append(char)
+    columns.append(''.join(current).strip())
+    return columns
+
+def keyset_sql(sort_key: str, anchor_sql: str, forward: bool, anchor: Optional[str],
+               descending: bool = False) -> Tuple[str, str]:
+    """
+    Условие и ORDER BY для страницы.
+    sort_key - колонки сортировки с уникальным хвостом, например "created_at, id";
+    anchor_sql - подзапрос, возвращающий эти колонки у якоря (с одним %s для ключа).
+    """
+    # Назад читаем в обратном порядке от якоря, а строки потом разворачиваем
+    reverse = descending == forward
+    # Направление у каждой колонки: ORDER BY (a, b) - сортировка по одному выражению-строке,
+    # ее PostgreSQL не сопоставляет с btree-индексом и сортирует всю выборку
+    direction = 'DESC' if reverse else 'ASC'
+    order = "ORDER BY " + ", ".join(f"{column} {direction}" for column in _split_columns(sort_key))
+    if anchor is None:
+        return "TRUE", order
+    return f"({sort_key}) {'<' if reverse else '>'} ({anchor_sql})", order
+
+def finish_page(rows: List[Any], limit: int, forward: bool, anchor: Optional[str],
+                key: Callable[[Any], Any] = lambda row: row['id']
+                ) -> Tuple[List[Any], Optional[str], Optional[str]]:
+    """
+    rows - результат запроса с LIMIT limit + 1.
+    Возвращает (строки страницы в порядке показа, курсор назад, курсор вперед).
+    """
+    has_more = len(rows) > limit
+    rows = list(rows[:limit])
+    if not rows:
+        return rows, None, None
+
+    if forward:
+        prev_token = page_token(False, key(rows[0])) if anchor is not None else None
+        next_token = page_token(True, key(rows[-1])) if has_more else None
+    else:
+        rows.reverse()
+        prev_token = page_token(False, key(rows[0])) if has_more else None
+        # Назад уходили со следующей страницы, значит она есть
+        next_token = page_token(True, key(rows[-1]))
+    return rows, prev_token, next_token